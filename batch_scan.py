@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Batch Scan - 無需 Excel 的資料夾公式索引工具
+
+Walks a directory tree, scans every .xlsx/.xlsm file by streaming its sheet
+XML in a pool of worker processes, and writes formulas, their types and the
+external links they contain into a SQLite database.
+
+Re-runs skip files whose (size, mtime) are unchanged and whose last scan
+succeeded, and drop files that no longer exist, so a nightly refresh only
+touches what changed (plus anything that failed before).
+
+Usage:
+    python batch_scan.py "\\\\server\\finance" --db finance_formulas.db
+    python batch_scan.py D:\\Models --workers 8 --force
+
+Example query - which workbooks reference Q3_Forecast.xlsx:
+    SELECT DISTINCT f.path FROM external_links e JOIN files f ON f.id = e.file_id
+    WHERE e.target_file = 'Q3_Forecast.xlsx' COLLATE NOCASE;
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from core.formula_tokenizer import iter_reference_tokens
+from core.xlsx_stream_scanner import get_sheet_names, iter_sheet_formulas, _external_target_to_path
+
+SCANNABLE_EXTENSIONS = ('.xlsx', '.xlsm')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    scanned_at REAL NOT NULL,
+    formula_count INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS formulas (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    sheet TEXT NOT NULL,
+    address TEXT NOT NULL,
+    formula TEXT NOT NULL,
+    formula_type TEXT NOT NULL,
+    display_value TEXT
+);
+CREATE TABLE IF NOT EXISTS external_links (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    sheet TEXT NOT NULL,
+    address TEXT NOT NULL,
+    target_path TEXT,
+    target_file TEXT NOT NULL,
+    target_sheet TEXT,
+    target_range TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_formulas_file ON formulas(file_id);
+CREATE INDEX IF NOT EXISTS idx_formulas_type ON formulas(formula_type);
+CREATE INDEX IF NOT EXISTS idx_external_links_file ON external_links(file_id);
+CREATE INDEX IF NOT EXISTS idx_external_links_target ON external_links(target_file COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_external_links_target_path ON external_links(target_path COLLATE NOCASE);
+"""
+
+
+def parse_external_links(formula, workbook_path):
+    """
+    Extract external references from a formula.
+
+    Uses the formula tokenizer, so quoted and unquoted prefixes, whole-row and
+    whole-column targets and structured references are read the same way as
+    everywhere else. Target paths without a directory are resolved against
+    the folder of the workbook that contains the formula.
+
+    Args:
+        formula (str): Formula text
+        workbook_path (str): Workbook the formula belongs to
+
+    Returns:
+        list: [(target_path, target_file, target_sheet, target_range), ...]
+    """
+    links = []
+    for token in iter_reference_tokens(formula):
+        if token.workbook is None:
+            continue
+        target_path = _external_target_to_path(token.directory + token.workbook, workbook_path)
+        links.append((target_path, token.workbook, token.sheet or None, token.address.replace('$', '')))
+    return links
+
+
+def find_workbooks(root_dir):
+    """Yield every scannable workbook under root_dir, skipping Office lock files."""
+    for dir_path, _dir_names, file_names in os.walk(root_dir):
+        for file_name in file_names:
+            if file_name.startswith('~$') or not file_name.lower().endswith(SCANNABLE_EXTENSIONS):
+                continue
+            yield os.path.normpath(os.path.join(dir_path, file_name))
+
+
+def scan_workbook_file(path, scan_mode='quick'):
+    """
+    Worker entry point: scan all sheets of one file.
+
+    Returns:
+        tuple: (path, formula_rows, link_rows, error) where formula_rows are
+        (sheet, address, formula, formula_type, display_value) and link_rows
+        are (sheet, address, target_path, target_file, target_sheet, target_range)
+    """
+    formula_rows = []
+    link_rows = []
+    try:
+        for sheet_name in get_sheet_names(path):
+            for formula_type, address, formula, display_val, _cell_text in iter_sheet_formulas(path, sheet_name, scan_mode):
+                formula_rows.append((sheet_name, address, formula, formula_type, display_val))
+                if formula_type == 'external link':
+                    for link in parse_external_links(formula, path):
+                        link_rows.append((sheet_name, address) + link)
+        return path, formula_rows, link_rows, None
+    except Exception as e:
+        return path, formula_rows, link_rows, f"{type(e).__name__}: {e}"
+
+
+def open_database(db_path):
+    connection = sqlite3.connect(db_path)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _store_result(connection, path, stat, formula_rows, link_rows, error):
+    """Replace one file's rows in a single transaction."""
+    with connection:
+        connection.execute("DELETE FROM files WHERE path = ?", (path,))
+        cursor = connection.execute(
+            "INSERT INTO files (path, size, mtime, scanned_at, formula_count, error) VALUES (?, ?, ?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime, time.time(), len(formula_rows), error)
+        )
+        file_id = cursor.lastrowid
+        connection.executemany(
+            "INSERT INTO formulas (file_id, sheet, address, formula, formula_type, display_value) VALUES (?, ?, ?, ?, ?, ?)",
+            ((file_id,) + row for row in formula_rows)
+        )
+        connection.executemany(
+            "INSERT INTO external_links (file_id, sheet, address, target_path, target_file, target_sheet, target_range) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((file_id,) + row for row in link_rows)
+        )
+
+
+def run_batch_scan(root_dir, db_path, workers=None, scan_mode='quick', force=False):
+    """
+    Scan a directory tree into the database.
+
+    Returns:
+        dict: Counts of scanned, skipped, failed and removed files
+    """
+    # Paths are stored absolute, so runs from different working directories agree
+    root_dir = os.path.abspath(root_dir)
+    connection = open_database(db_path)
+    indexed = connection.execute("SELECT path, size, mtime, error FROM files").fetchall()
+    # Files whose last scan failed are retried even if their size and mtime did not change
+    known = {path: (size, mtime) for path, size, mtime, error in indexed if error is None}
+
+    to_scan = {}
+    seen = set()
+    skipped = 0
+    for path in find_workbooks(root_dir):
+        seen.add(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if not force and known.get(path) == (stat.st_size, stat.st_mtime):
+            skipped += 1
+            continue
+        to_scan[path] = stat
+
+    # Files that disappeared from this tree since the last run
+    root_prefix = os.path.join(os.path.normpath(root_dir), '')
+    removed = [path for path, _size, _mtime, _error in indexed if path.startswith(root_prefix) and path not in seen]
+    with connection:
+        connection.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in removed))
+
+    print(f"{len(to_scan)} workbook(s) to scan, {skipped} unchanged, {len(removed)} removed")
+    scanned = failed = 0
+    start_time = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(scan_workbook_file, path, scan_mode): path for path in to_scan}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                _path, formula_rows, link_rows, error = future.result()
+            except Exception as e:
+                # A worker that died (BrokenProcessPool fails every pending file) or a
+                # result that could not be sent back: record the file as failed so the
+                # next run retries it
+                formula_rows, link_rows, error = [], [], f"{type(e).__name__}: {e}"
+            _store_result(connection, path, to_scan[path], formula_rows, link_rows, error)
+            scanned += 1
+            if error:
+                failed += 1
+                print(f"[{scanned}/{len(to_scan)}] FAILED {path}: {error}")
+            else:
+                print(f"[{scanned}/{len(to_scan)}] {path}: {len(formula_rows)} formulas, {len(link_rows)} external links")
+
+    connection.close()
+    print(f"Done in {time.time() - start_time:.1f} seconds")
+    return {'scanned': scanned, 'skipped': skipped, 'failed': failed, 'removed': len(removed)}
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Scan a folder of Excel workbooks into a SQLite formula index, without Excel.")
+    parser.add_argument("root", help="Directory to scan recursively")
+    parser.add_argument("--db", default="formula_index.db", help="SQLite database file (default: formula_index.db)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--mode", choices=("quick", "full"), default="quick", help="Scan mode (default: quick)")
+    parser.add_argument("--force", action="store_true", help="Rescan files even if size and mtime are unchanged")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        parser.error(f"Not a directory: {args.root}")
+    result = run_batch_scan(args.root, args.db, args.workers, args.mode, args.force)
+    return 1 if result['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,32 @@
 import re
 from utils.range_optimizer import smart_range_display
 
+def get_visible_rows(controller):
+    """Rows shown in the result tree, in tree order; FormulaTable row views when available."""
+    tree_items = controller.view.result_tree.get_children()
+    regions = getattr(controller, 'cell_regions', None)
+    if regions and all(item in regions for item in tree_items):
+        # Grouped view: one row per region, addressed by its ranges
+        return [regions[item].as_row() for item in tree_items]
+    table = controller.all_formulas
+    if hasattr(table, 'index_of'):
+        rows = []
+        for item in tree_items:
+            index = table.index_of(controller.cell_addresses.get(item))
+            if index is None:
+                break
+            rows.append(table[index])
+        else:
+            return rows
+    return [controller.view.result_tree.item(item, "values") for item in tree_items]
+
 def _get_summary_data(controller):
-    formulas_to_summarize = [controller.view.result_tree.item(item, "values") for item in controller.view.result_tree.get_children()]
-    is_filtered = len(formulas_to_summarize) != len(controller.all_formulas) if controller.all_formulas else True
+    formulas_to_summarize = get_visible_rows(controller)
+    visible_count = len(formulas_to_summarize)
+    regions = getattr(controller, 'cell_regions', None)
+    if regions:
+        visible_count = sum(len(regions[item]) for item in controller.view.result_tree.get_children() if item in regions)
+    is_filtered = visible_count != len(controller.all_formulas) if controller.all_formulas else True
     return formulas_to_summarize, is_filtered
 
 def get_unique_external_links(formulas_to_summarize, tree_columns):
@@ -0,0 +1,565 @@
+# -*- coding: utf-8 -*-
+"""
+Dependency Index Module
+
+One pass over every formula of a workbook (and optionally the workbooks it
+links to) builds two maps:
+
+- precedents: formula cell -> the references it reads
+- dependents: cell -> the formula cells that read it directly
+
+Range references are kept as rectangles, never expanded into cells. A
+"what depends on X" query is a dictionary lookup for single-cell references
+plus an R-tree lookup over the rectangles of X's sheet.
+
+Indexes are kept in memory per root workbook and are only handed out while
+the modification time and size of every indexed file are unchanged.
+"""
+
+import os
+import threading
+from collections import namedtuple, OrderedDict
+
+from core.formula_tokenizer import (
+    iter_reference_tokens, CELL, ROW_RANGE, COLUMN_RANGE, MAX_ROW, MAX_COLUMN
+)
+from core.xlsx_stream_scanner import get_sheet_names, iter_sheet_formulas
+from utils.spatial_index import RectangleIndex, LiveEntries
+
+# 需要 Excel 計算才知道真正引用的函數；索引只記錄其中的靜態引用
+DYNAMIC_FUNCTIONS = ('INDIRECT(', 'OFFSET(', 'INDEX(')
+
+# 串流掃描器只能讀 zip 格式的活頁簿
+INDEXABLE_EXTENSIONS = ('.xlsx', '.xlsm')
+
+MAX_CACHED_INDEXES = 8
+
+
+def workbook_key(workbook_path):
+    """Normalised workbook path used in index keys."""
+    return os.path.normcase(os.path.normpath(workbook_path.replace('\\', os.sep)))
+
+
+def cell_key(workbook_path, sheet_name, cell_address):
+    """Index key of a cell: (workbook key, lower-case sheet name, 'A1')."""
+    return (workbook_key(workbook_path), sheet_name.lower(), cell_address.replace('$', '').upper())
+
+
+def _column_number(letters):
+    number = 0
+    for char in letters.upper():
+        number = number * 26 + (ord(char) - 64)
+    return number
+
+
+def _column_letters(number):
+    letters = ''
+    while number > 0:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _split_cell(address):
+    address = address.replace('$', '').upper()
+    split = 0
+    while split < len(address) and address[split].isalpha():
+        split += 1
+    return int(address[split:]), _column_number(address[:split])
+
+
+def _rectangle(kind, address):
+    """(min_row, min_col, max_row, max_col) of a reference token's address."""
+    parts = address.replace('$', '').split(':')
+    if kind == ROW_RANGE:
+        return int(parts[0]), 1, int(parts[1]), MAX_COLUMN
+    if kind == COLUMN_RANGE:
+        return 1, _column_number(parts[0]), MAX_ROW, _column_number(parts[1])
+    first_row, first_col = _split_cell(parts[0])
+    if kind == CELL:
+        return first_row, first_col, first_row, first_col
+    last_row, last_col = _split_cell(parts[1])
+    return (min(first_row, last_row), min(first_col, last_col),
+            max(first_row, last_row), max(first_col, last_col))
+
+
+class IndexedReference(namedtuple('IndexedReference', 'workbook_path sheet_name min_row min_col max_row max_col kind')):
+    """
+    One reference of a formula, as a rectangle.
+
+    Attributes:
+        workbook_path (str): Workbook the reference points into
+        sheet_name (str): Sheet the reference points into
+        min_row, min_col, max_row, max_col (int): Rectangle, 1-based and inclusive
+        kind (str): Token kind (CELL, RANGE, ROW_RANGE or COLUMN_RANGE)
+    """
+
+    __slots__ = ()
+
+    @property
+    def is_cell(self):
+        return self.kind == CELL
+
+    @property
+    def cell_count(self):
+        return (self.max_row - self.min_row + 1) * (self.max_col - self.min_col + 1)
+
+    @property
+    def address(self):
+        """'B2', 'B2:D9', '3:5' or 'A:C'."""
+        if self.kind == ROW_RANGE:
+            return f"{self.min_row}:{self.max_row}"
+        if self.kind == COLUMN_RANGE:
+            return f"{_column_letters(self.min_col)}:{_column_letters(self.max_col)}"
+        first = f"{_column_letters(self.min_col)}{self.min_row}"
+        if self.kind == CELL:
+            return first
+        return f"{first}:{_column_letters(self.max_col)}{self.max_row}"
+
+    def contains(self, row, col):
+        return self.min_row <= row <= self.max_row and self.min_col <= col <= self.max_col
+
+    def iter_cells(self):
+        """Every cell address of the rectangle, row by row."""
+        for row in range(self.min_row, self.max_row + 1):
+            for col in range(self.min_col, self.max_col + 1):
+                yield f"{_column_letters(col)}{row}"
+
+
+class DependencyIndex:
+    """
+    Precedent and dependent maps of one or more workbooks.
+
+    Attributes:
+        root_workbook_path (str): Workbook the index was built for
+        workbook_paths (dict): Workbook key -> path of every indexed workbook
+        stamps (dict): Workbook key -> (mtime, size) when it was indexed
+        formulas (dict): Cell key -> (formula, display value) of every formula cell
+        precedents (dict): Cell key -> tuple of IndexedReference
+        dynamic_cells (set): Cell keys whose formula uses INDIRECT / OFFSET / INDEX
+    """
+
+    def __init__(self, root_workbook_path, folder=None):
+        self.root_workbook_path = root_workbook_path
+        self.folder = folder  # 資料夾索引：folder 內的檔案清單變動時也視為過期
+        self.workbook_paths = {}
+        self.stamps = {}
+        self.formulas = {}
+        self.precedents = {}
+        self.dynamic_cells = set()
+        self.sheet_names = {}  # (workbook key, lower-case sheet) -> sheet name as written in the workbook
+        # 反向索引的 payload 為 (依賴者的 cell key, (workbook_path, sheet_name, address))，key 只在建立索引時計算一次
+        self._cell_dependents = {}  # cell key -> list of payloads
+        self._range_dependents = {}  # (workbook key, lower-case sheet) -> RectangleIndex of payloads
+        self._range_positions = {}  # (workbook key, lower-case sheet) -> {dependent cell key: tree positions}
+        self._formula_cells = {}  # (workbook key, lower-case sheet) -> RectangleIndex of formula cells
+
+    def is_indexed(self, workbook_path):
+        return workbook_key(workbook_path) in self.stamps
+
+    def is_current(self):
+        """True while no indexed workbook has been modified since indexing."""
+        for key, stamp in self.stamps.items():
+            try:
+                stat = os.stat(self.workbook_paths[key])
+            except OSError:
+                return False
+            if (stat.st_mtime, stat.st_size) != stamp:
+                return False
+        if self.folder is not None:
+            folder_keys = {workbook_key(path) for path in list_indexable_workbooks(self.folder)}
+            if not folder_keys <= set(self.stamps):
+                return False
+        return True
+
+    def get_formula(self, workbook_path, sheet_name, cell_address):
+        """(formula, display value) of a formula cell, or None."""
+        return self.formulas.get(cell_key(workbook_path, sheet_name, cell_address))
+
+    def precedents_of(self, workbook_path, sheet_name, cell_address):
+        """
+        What a cell depends on
+
+        Returns:
+            tuple: IndexedReference records in formula order (empty for value cells)
+        """
+        return self.precedents.get(cell_key(workbook_path, sheet_name, cell_address), ())
+
+    def dependents_of(self, workbook_path, sheet_name, cell_address):
+        """
+        What depends on a cell directly, by single-cell or range reference
+
+        Returns:
+            list: (workbook_path, sheet_name, cell_address) of the dependent formula cells
+        """
+        key = cell_key(workbook_path, sheet_name, cell_address)
+        dependents = [dependent for _key, dependent in self._cell_dependents.get(key, ())]
+        rectangles = self._range_dependents.get(key[:2])
+        if rectangles:
+            row, col = _split_cell(key[2])
+            seen = set(dependents)
+            for _key, dependent in rectangles.containing(row, col):
+                if dependent not in seen:
+                    seen.add(dependent)
+                    dependents.append(dependent)
+        return dependents
+
+    def range_positions(self, sheet_key):
+        """Dependent cell key -> positions of its rectangles in the sheet's range index."""
+        positions = self._range_positions.get(sheet_key)
+        if positions is None:
+            positions = {}
+            rectangles = self._range_dependents.get(sheet_key)
+            if rectangles:
+                for position, (dependent_key, _dependent) in enumerate(rectangles.payloads_in_order()):
+                    positions.setdefault(dependent_key, []).append(position)
+            self._range_positions[sheet_key] = positions
+        return positions
+
+    def reads_cell(self, dependent_key, key, row, col):
+        """Number of the references of a formula cell that contain another cell."""
+        count = 0
+        for reference in self.precedents.get(dependent_key, ()):
+            if reference.contains(row, col) and reference.sheet_name.lower() == key[1] \
+                    and workbook_key(reference.workbook_path) == key[0]:
+                count += 1
+        return count
+
+    def formulas_in(self, workbook_path, sheet_name, rectangle):
+        """
+        Formula cells inside a rectangle
+
+        Args:
+            rectangle: (min_row, min_col, max_row, max_col)
+
+        Returns:
+            list: (cell_address, formula, display value), row by row
+        """
+        cells = self._formula_cells.get(cell_key(workbook_path, sheet_name, '')[:2])
+        if not cells:
+            return []
+        found = sorted(cells.overlapping(rectangle))
+        return [(address,) + self.formulas[cell_key(workbook_path, sheet_name, address)]
+                for _, _, address in found]
+
+    def add_formula(self, workbook_path, sheet_name, cell_address, formula, display_value=None):
+        """
+        Parse one formula into the forward and reverse maps
+
+        Args:
+            workbook_path: Workbook holding the formula
+            sheet_name: Sheet holding the formula
+            cell_address: Address of the formula cell (no sheet qualifier)
+            formula: Formula text, external references in full-path form
+            display_value: Cached value shown for the cell
+
+        Returns:
+            tuple: The formula's IndexedReference records
+        """
+        key = cell_key(workbook_path, sheet_name, cell_address)
+        dependent = (key, (workbook_path, sheet_name, key[2]))
+        self.formulas[key] = (formula, display_value)
+        row, col = _split_cell(key[2])
+        sheet_cells = self._formula_cells.get(key[:2])
+        if sheet_cells is None:
+            sheet_cells = self._formula_cells[key[:2]] = RectangleIndex()
+        sheet_cells.add((row, col, row, col), (row, col, key[2]))
+        if any(function in formula.upper() for function in DYNAMIC_FUNCTIONS):
+            self.dynamic_cells.add(key)
+
+        references = []
+        for token in iter_reference_tokens(formula):
+            if token.workbook is not None:
+                target_path = self._external_path(workbook_path, token.directory, token.workbook)
+            else:
+                target_path = workbook_path
+            target_sheet = token.sheet if token.sheet is not None else sheet_name
+            min_row, min_col, max_row, max_col = _rectangle(token.kind, token.address)
+            reference = IndexedReference(target_path, target_sheet, min_row, min_col, max_row, max_col, token.kind)
+            references.append(reference)
+
+            if token.kind == CELL:
+                target_key = cell_key(target_path, target_sheet, reference.address)
+                self._cell_dependents.setdefault(target_key, []).append(dependent)
+            else:
+                sheet_key = (workbook_key(target_path), target_sheet.lower())
+                rectangles = self._range_dependents.get(sheet_key)
+                if rectangles is None:
+                    rectangles = self._range_dependents[sheet_key] = RectangleIndex()
+                self._range_positions.pop(sheet_key, None)
+                rectangles.add((reference.min_row, reference.min_col, reference.max_row, reference.max_col), dependent)
+
+        references = tuple(references)
+        self.precedents[key] = references
+        return references
+
+    @staticmethod
+    def _external_path(workbook_path, directory, file_name):
+        if directory:
+            return directory.rstrip('\\/') + '\\' + file_name if '\\' in directory else os.path.join(directory, file_name)
+        if file_name.lower() == os.path.basename(workbook_path).lower():
+            return workbook_path
+        # 沒有路徑的外部連結：視為與本活頁簿同一資料夾
+        return os.path.join(os.path.dirname(workbook_path), file_name)
+
+    def add_workbook(self, workbook_path, progress_callback=None):
+        """
+        Index every formula of one workbook
+
+        Args:
+            workbook_path: Path to an .xlsx/.xlsm file
+            progress_callback: Optional callable(message)
+
+        Returns:
+            set: Paths of the external workbooks its formulas reference
+        """
+        key = workbook_key(workbook_path)
+        stat = os.stat(workbook_path)
+        self.workbook_paths[key] = workbook_path
+        self.stamps[key] = (stat.st_mtime, stat.st_size)
+
+        external_paths = set()
+        for sheet_name in get_sheet_names(workbook_path):
+            self.sheet_names[(key, sheet_name.lower())] = sheet_name
+            if progress_callback:
+                progress_callback(f"Indexing {os.path.basename(workbook_path)}!{sheet_name}...")
+            for _type, address, formula, display_value, _text in iter_sheet_formulas(workbook_path, sheet_name, scan_mode='quick'):
+                for reference in self.add_formula(workbook_path, sheet_name, address, formula, display_value):
+                    if workbook_key(reference.workbook_path) != key:
+                        external_paths.add(reference.workbook_path)
+        return external_paths
+
+    def get_stats(self):
+        """
+        Get index statistics
+
+        Returns:
+            dict: Counts of workbooks, formulas, references and range rectangles
+        """
+        return {
+            'workbooks': len(self.stamps),
+            'formula_cells': len(self.formulas),
+            'references': sum(len(references) for references in self.precedents.values()),
+            'referenced_cells': len(self._cell_dependents),
+            'range_rectangles': sum(len(rectangles) for rectangles in self._range_dependents.values()),
+            'dynamic_formulas': len(self.dynamic_cells)
+        }
+
+
+class DependentsSearch:
+    """
+    One downstream search over a DependencyIndex that lists each dependent once
+
+    Cells passed to expand() are finished: later queries skip them inside the
+    range index (see RectangleIndex.live_containing) and only count them, so
+    a query costs about the number of new dependents it returns rather than
+    the number of formulas that read the cell. Every reference to a queried
+    cell is either returned as a new dependent or counted as a repeat.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.expanded = set()  # cell keys
+        self._live = {}  # (workbook key, lower-case sheet) -> LiveEntries of its range index
+
+    def _live_entries(self, sheet_key):
+        live = self._live.get(sheet_key)
+        if live is None:
+            rectangles = self.index._range_dependents[sheet_key]
+            positions = self.index.range_positions(sheet_key)
+            live = self._live[sheet_key] = LiveEntries(len(rectangles))
+            for key in self.expanded:
+                for position in positions.get(key, ()):
+                    live.kill(position)
+        return live
+
+    def expand(self, key):
+        """Mark a cell (by cell key) as placed; later queries only count it."""
+        if key in self.expanded:
+            return
+        self.expanded.add(key)
+        for reference in self.index.precedents.get(key, ()):
+            if reference.is_cell:
+                continue
+            sheet_key = (workbook_key(reference.workbook_path), reference.sheet_name.lower())
+            live = self._live.get(sheet_key)
+            if live is not None:
+                for position in self.index.range_positions(sheet_key).get(key, ()):
+                    live.kill(position)
+
+    def dependents(self, key):
+        """
+        Dependents of a cell not expanded yet
+
+        Args:
+            key: Cell key of the queried cell
+
+        Returns:
+            tuple: (new, repeats) where new lists (cell key, (workbook_path,
+            sheet_name, address)) of the unexpanded dependents, each once,
+            and repeats counts the other references to the cell
+        """
+        new = []
+        seen = set()
+        repeats = 0
+        for payload in self.index._cell_dependents.get(key, ()):
+            if payload[0] in self.expanded or payload[0] in seen:
+                repeats += 1
+            else:
+                seen.add(payload[0])
+                new.append(payload)
+        rectangles = self.index._range_dependents.get(key[:2])
+        if rectangles:
+            row, col = _split_cell(key[2])
+            found, dead = rectangles.live_containing(row, col, self._live_entries(key[:2]))
+            repeats += dead
+            for _position, payload in found:
+                if payload[0] in seen:
+                    repeats += 1
+                else:
+                    seen.add(payload[0])
+                    new.append(payload)
+        return new, repeats
+
+
+def list_indexable_workbooks(folder):
+    """
+    Workbooks of a folder the index can read, in name order
+
+    Excel's '~$' lock files are skipped.
+    """
+    return [
+        os.path.join(folder, name) for name in sorted(os.listdir(folder))
+        if name.lower().endswith(INDEXABLE_EXTENSIONS) and not name.startswith('~$')
+        and os.path.isfile(os.path.join(folder, name))
+    ]
+
+
+def _remember_index(key, index):
+    with _index_lock:
+        _index_cache[key] = index
+        _index_cache.move_to_end(key)
+        while len(_index_cache) > MAX_CACHED_INDEXES:
+            _index_cache.popitem(last=False)
+
+
+def build_dependency_index(workbook_path, include_external=False, progress_callback=None):
+    """
+    Build the dependency index of a workbook
+
+    Args:
+        workbook_path: Path to the root .xlsx/.xlsm file
+        include_external: Also index (transitively) every linked workbook found on disk
+        progress_callback: Optional callable(message)
+
+    Returns:
+        DependencyIndex: The new index, also kept for get_dependency_index
+    """
+    index = DependencyIndex(workbook_path)
+    queue = [workbook_path]
+    while queue:
+        path = queue.pop(0)
+        if index.is_indexed(path):
+            continue
+        external_paths = index.add_workbook(path, progress_callback)
+        if include_external:
+            for external_path in sorted(external_paths):
+                if (external_path.lower().endswith(INDEXABLE_EXTENSIONS)
+                        and os.path.exists(external_path) and not index.is_indexed(external_path)):
+                    queue.append(external_path)
+
+    _remember_index(workbook_key(workbook_path), index)
+    return index
+
+
+def build_folder_dependency_index(folder, progress_callback=None):
+    """
+    Build one index over every workbook of a folder
+
+    Used for dependents queries: a cell's consumers can live in any workbook
+    next to it, not only in the workbooks it links to.
+
+    Args:
+        folder: Folder to scan (not recursive)
+        progress_callback: Optional callable(message)
+
+    Returns:
+        DependencyIndex: The new index, also kept for get_dependency_index(folder)
+    """
+    index = DependencyIndex(folder, folder=folder)
+    for path in list_indexable_workbooks(folder):
+        try:
+            index.add_workbook(path, progress_callback)
+        except Exception as e:
+            # 損壞或受保護的檔案不應讓整個資料夾索引失敗
+            if progress_callback:
+                progress_callback(f"Skipped {os.path.basename(path)}: {e}")
+    _remember_index(workbook_key(folder), index)
+    return index
+
+
+# root workbook key -> DependencyIndex
+_index_cache = OrderedDict()
+_index_lock = threading.RLock()
+
+
+def get_dependency_index(workbook_path):
+    """
+    Get the index built for a workbook (or folder), if it still matches the files on disk
+
+    Returns:
+        DependencyIndex or None: None if no index was built or any indexed file changed
+    """
+    key = workbook_key(workbook_path)
+    with _index_lock:
+        index = _index_cache.get(key)
+        if index is None:
+            return None
+        if not index.is_current():
+            del _index_cache[key]
+            return None
+        _index_cache.move_to_end(key)
+        return index
+
+
+def clear_dependency_indexes():
+    """
+    Drop every cached index
+    """
+    with _index_lock:
+        _index_cache.clear()
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import time
+
+    from openpyxl import Workbook
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    path = os.path.join(tempfile.mkdtemp(), "Model.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Calc"
+    inputs = wb.create_sheet("Inputs")
+    for row in range(1, rows + 1):
+        inputs[f"A{row}"] = row
+        ws[f"B{row}"] = f"=Inputs!A{row}*2"
+        ws[f"C{row}"] = f"=SUM(B$1:B{row})"
+    ws["D1"] = "=SUM(Inputs!A:A)"
+    wb.save(path)
+
+    start = time.time()
+    index = build_dependency_index(path)
+    print(f"Indexed {rows * 2 + 1} formulas in {time.time() - start:.2f}s: {index.get_stats()}")
+
+    precedents = index.precedents_of(path, "Calc", "C100")
+    dependents = index.dependents_of(path, "Inputs", "A5")
+    print(f"C100 reads {[r.address for r in precedents]}; Inputs!A5 feeds {[d[2] for d in dependents]}")
+    start = time.time()
+    for row in range(1, 1001):
+        index.dependents_of(path, "Inputs", f"A{row}")
+    print(f"1000 dependents queries on Inputs: {(time.time() - start) * 1000:.1f} ms")
+    print(f"Calc!B1 feeds {len(index.dependents_of(path, 'Calc', 'B1'))} cells through SUM(B$1:Bn) ranges")
+    print("Current:", get_dependency_index(path) is index)
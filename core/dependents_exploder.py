@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Dependents Exploder Module
+
+Traces a cell downstream: every formula, in its own workbook or any other
+workbook of the same folder, that reads it directly or through a chain of
+other formulas. Direct consumers come from a reverse-reference index of the
+folder (core.dependency_index), where range references are rectangles and a
+cell is matched by containment.
+
+Nodes use the same dictionary format as the precedents exploder, so the
+result goes through convert_tree_to_graph_data to GraphGenerator unchanged.
+A cell consumed by several formulas appears once, under the first formula
+that reaches it; every further reference only counts in the reading cell's
+'repeat_dependents'. Placed cells are skipped inside the index query
+(core.dependency_index.DependentsSearch) and counted from rectangle overlap
+without being listed, so running totals and cross-sheet fan-out grow both
+the result and the work about linearly instead of quadratically.
+"""
+
+import os
+
+from core.dependency_index import cell_key, get_dependency_index, build_folder_dependency_index, DependentsSearch
+from core.cycle_analysis import find_index_cycles, describe_cycle, mark_cycle_nodes
+from utils.spatial_index import cell_position
+
+
+def _display_addresses(workbook_path, sheet_name, cell_address):
+    filename = os.path.basename(workbook_path)
+    dir_path = os.path.dirname(workbook_path)
+    short_address = f"[{filename}]{sheet_name}!{cell_address}"
+    full_address = f"'{dir_path}\\[{filename}]{sheet_name}'!{cell_address}"
+    return short_address, full_address
+
+
+def _make_node(index, workbook_path, sheet_name, cell_address, depth, node_type=None, value=None, error=None, key=None):
+    """Node in the precedents exploder's format."""
+    short_address, full_address = _display_addresses(workbook_path, sheet_name, cell_address)
+    if key is None:
+        key = cell_key(workbook_path, sheet_name, cell_address)
+    indexed = index.formulas.get(key)
+    if indexed is not None:
+        formula, display_value = indexed
+    else:
+        formula, display_value = None, None
+    if node_type is None:
+        node_type = 'formula' if formula else 'value'
+    if value is None:
+        value = display_value if display_value is not None else 'N/A'
+    return {
+        'address': short_address,
+        'short_address': short_address,
+        'full_address': full_address,
+        'workbook_path': workbook_path,
+        'sheet_name': sheet_name,
+        'cell_address': cell_address,
+        'value': value,
+        'calculated_value': value,
+        'formula': formula,
+        'type': node_type,
+        'children': [],
+        'depth': depth,
+        'error': error,
+        'has_indirect': False,
+        'has_index': False,
+        'direction': 'dependents'
+    }
+
+
+def iter_dependent_levels(index, workbook_path, sheet_name, cell_address, max_depth=10, root_value=None):
+    """
+    Breadth-first dependents explosion that yields each level as soon as it is found
+
+    Args:
+        index: DependencyIndex covering the workbooks to search
+        workbook_path, sheet_name, cell_address: The cell to trace
+        max_depth: Levels below the root before a 'limit_reached' node is placed
+        root_value: Value shown for the root (value cells are not in the index)
+
+    Yields:
+        tuple: (depth, links) where links is a list of (parent_node, child_node).
+        The first item is (0, [(None, root_node)]). Each node is linked once,
+        so the result is a tree; a reference to a dependent already placed
+        elsewhere is not linked again but counted in the parent's
+        'repeat_dependents' (a formula that reads its parent twice counts
+        one link and one repeat). Those
+        counts for the nodes of level d are final once level d + 1 has been
+        yielded (a level with only repeats is yielded with no links).
+        Children lists fill up as later levels are yielded.
+    """
+    cell_address = cell_address.replace('$', '')
+    root_key = cell_key(workbook_path, sheet_name, cell_address)
+    root = _make_node(index, workbook_path, sheet_name, cell_address, 0, value=root_value, key=root_key)
+    yield 0, [(None, root)]
+
+    search = DependentsSearch(index)
+    search.expand(root_key)
+    # frontier: (node, cell key, path) where path is the chain (key, node, parent path) up to the root
+    frontier = [(root, root_key, (root_key, root, None))]
+    depth = 0
+    while frontier:
+        depth += 1
+        links = []
+        level_repeats = 0
+        next_frontier = []
+        for parent, parent_key, path in frontier:
+            dependents, repeats = search.dependents(parent_key)
+            for key, (dep_workbook, dep_sheet, dep_address) in dependents:
+                if depth > max_depth:
+                    child = _make_node(index, dep_workbook, dep_sheet, dep_address, depth,
+                                       node_type='limit_reached', value='Max depth reached',
+                                       error='Maximum recursion depth reached', key=key)
+                else:
+                    child = _make_node(index, dep_workbook, dep_sheet, dep_address, depth, key=key)
+                    next_frontier.append((child, key, (key, child, path)))
+                search.expand(key)
+                parent['children'].append(child)
+                links.append((parent, child))
+            if repeats:
+                # 已展開的儲存格只計數；其中路徑上的祖先（含自己）才是循環引用
+                row, col = cell_position(parent['cell_address'])
+                ancestor = path
+                while ancestor is not None and repeats:
+                    key, node, ancestor_path = ancestor
+                    if index.reads_cell(key, parent_key, row, col):
+                        child = _make_node(index, node['workbook_path'], node['sheet_name'], node['cell_address'], depth,
+                                           node_type='circular_ref', value='Circular reference',
+                                           error='Circular reference detected', key=key)
+                        parent['children'].append(child)
+                        links.append((parent, child))
+                        repeats -= 1
+                    ancestor = ancestor_path
+                if repeats:
+                    parent['repeat_dependents'] = parent.get('repeat_dependents', 0) + repeats
+                    level_repeats += repeats
+        if links or level_repeats:
+            yield depth, links
+        frontier = next_frontier
+
+
+def explode_dependents(index, workbook_path, sheet_name, cell_address, max_depth=10, root_value=None, level_callback=None):
+    """
+    Run a full dependents explosion
+
+    Args:
+        index: DependencyIndex covering the workbooks to search
+        workbook_path, sheet_name, cell_address: The cell to trace
+        max_depth: Maximum depth
+        root_value: Value shown for the root
+        level_callback: Optional callable(depth, links), called as each level is found
+
+    Returns:
+        tuple: (root_node, summary) with the same summary keys as the precedents exploder
+    """
+    root = None
+    for depth, links in iter_dependent_levels(index, workbook_path, sheet_name, cell_address, max_depth, root_value):
+        if depth == 0:
+            root = links[0][1]
+        if level_callback:
+            level_callback(depth, links)
+    return root, summarize_dependents(root, index)
+
+
+def iter_tree_nodes(root):
+    """Every node of a dependents tree."""
+    seen = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        yield node
+        stack.extend(node['children'])
+
+
+def summarize_dependents(root, index=None):
+    """
+    Summary of a dependents tree
+
+    'repeat_links' counts the references to cells already placed elsewhere,
+    which are not listed as nodes.
+
+    With the index, circular references are the cycles (strongly connected
+    components) of every indexed workbook, and tree nodes inside one get a
+    'cycle_id'. Without it, only the cycles met on explored paths are listed.
+    """
+    total_nodes = 0
+    type_counts = {}
+    circular = []
+    workbooks = set()
+    max_depth = 0
+    repeat_links = 0
+    for node in iter_tree_nodes(root):
+        total_nodes += 1
+        repeat_links += node.get('repeat_dependents', 0)
+        node_type = node.get('type', 'unknown')
+        type_counts[node_type] = type_counts.get(node_type, 0) + 1
+        if node_type == 'circular_ref':
+            circular.append(f"{node['workbook_path']}|{node['sheet_name']}|{node['cell_address']}")
+        workbooks.add(node['workbook_path'])
+        max_depth = max(max_depth, node.get('depth', 0))
+    summary = {
+        'total_nodes': total_nodes,
+        'max_depth': max_depth,
+        'type_distribution': type_counts,
+        'circular_references': len(circular),
+        'circular_ref_list': circular,
+        'path_circular_refs': circular,
+        'cycle_scope': None,
+        'dag_mode': False,
+        'repeat_links': repeat_links,
+        'direction': 'dependents',
+        'workbooks_touched': len(workbooks)
+    }
+    if index is not None:
+        cycles = find_index_cycles(index)
+        mark_cycle_nodes(iter_tree_nodes(root), cycles)
+        summary.update({
+            'circular_references': len(cycles),
+            'circular_ref_list': [describe_cycle(members) for members in cycles],
+            'cycles': cycles,
+            'cycle_scope': 'folder' if index.folder is not None else 'workbook'
+        })
+    return summary
+
+
+def get_folder_index(workbook_path, progress_callback=None):
+    """
+    Reverse-reference index of the folder holding a workbook, rebuilt when any file changed
+    """
+    folder = os.path.dirname(os.path.abspath(workbook_path))
+    index = get_dependency_index(folder)
+    if index is None:
+        index = build_folder_dependency_index(folder, progress_callback)
+    return index
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import time
+
+    from openpyxl import Workbook
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    folder = tempfile.mkdtemp()
+    inputs_path = os.path.join(folder, "Inputs.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Rates"
+    ws["B2"] = 0.05
+    ws["C2"] = "=B2*12"
+    wb.save(inputs_path)
+
+    model_path = os.path.join(folder, "Model.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Calc"
+    for row in range(1, rows + 1):
+        ws[f"A{row}"] = f"='{folder}{os.sep}[Inputs.xlsx]Rates'!$B$2*{row}"
+        ws[f"B{row}"] = f"=SUM(A$1:A{row})"
+    ws["C1"] = f"=MAX(B:B)"
+    wb.save(model_path)
+
+    start = time.time()
+    index = get_folder_index(inputs_path)
+    print(f"Indexed folder in {time.time() - start:.2f}s: {index.get_stats()}")
+
+    start = time.time()
+    root, summary = explode_dependents(
+        index, inputs_path, "Rates", "B2",
+        level_callback=lambda depth, links: print(f"  level {depth}: {len(links)} link(s)")
+    )
+    print(f"Dependents of Rates!B2 in {time.time() - start:.2f}s: {summary}")
+
+    # 規模測試：running total 的列數加倍，工作量也只應約加倍（重複引用只計數、不列出）
+    from core.dependency_index import DependencyIndex
+
+    def running_total_seconds(count):
+        book = os.path.join(folder, "Scaling.xlsx")
+        scaling_index = DependencyIndex(book)
+        for row in range(1, count + 1):
+            scaling_index.add_formula(book, "Calc", f"A{row}", f"=Rates!$B$2*{row}")
+            scaling_index.add_formula(book, "Calc", f"B{row}", f"=SUM(A$1:A{row})")
+        best = None
+        for _ in range(3):
+            start = time.perf_counter()
+            levels = list(iter_dependent_levels(scaling_index, book, "Rates", "B2"))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        root = levels[0][1][0][1]
+        assert sum(len(links) for _, links in levels) == 2 * count + 1
+        assert summarize_dependents(root)['repeat_links'] == count * (count + 1) // 2 - count
+        return best
+
+    small, large = running_total_seconds(rows), running_total_seconds(2 * rows)
+    print(f"Running total: {rows} rows {small:.3f}s, {2 * rows} rows {large:.3f}s (x{large / small:.1f})")
+    assert large / small < 3, "dependents enumeration no longer scales linearly"
@@ -6,12 +6,16 @@ import psutil
 import win32gui
 import win32process
 import win32con
-from core.formula_classifier import classify_formula_type
+from core.formula_area_reader import read_area_rows
+from core.models import FormulaTable
+from core.incremental_scanner import scan_with_state, incremental_rescan
+from core.xlsx_stream_scanner import scan_sheet_formulas, scan_workbook_formulas
 from core.worksheet_tree import apply_filter
+from utils.scan_cache import get_global_scan_cache
 import traceback
 
-def _get_formulas_from_excel(worksheet_com_obj, scan_range_com_obj, scan_mode, progress_update_callback):
-    all_formulas_local = []
+def _get_formulas_from_excel(worksheet_com_obj, scan_range_com_obj, scan_mode, progress_update_callback, bulk_read=True):
+    all_formulas_local = FormulaTable()
     formula_cells_found = 0
     
     try:
@@ -25,34 +29,15 @@ def _get_formulas_from_excel(worksheet_com_obj, scan_range_com_obj, scan_mode, p
         else:
             areas_to_process.append(formula_range)
             
-        total_cells_to_process = sum(area.Cells.Count for area in areas_to_process)
+        total_cells_to_process = sum(area.Count for area in areas_to_process)
         current_cell_count = 0
         
         for area in areas_to_process:
-            for cell in area.Cells:
+            # Bulk mode reads each area as 2-D arrays; per-cell mode is the fallback
+            for row in read_area_rows(area, scan_mode, bulk_read=bulk_read):
                 current_cell_count += 1
                 formula_cells_found += 1
-                
-                formula = ""
-                formula_type = "unknown"
-                cell_value = None
-                display_val = "Error"
-                cell_text = "Error"
-                cell_address = ""
-                
-                try:
-                    formula = cell.Formula
-                    formula_type = classify_formula_type(formula)
-                    cell_value = cell.Value
-                    display_val = str(cell_value)[:50] if cell_value is not None else "No Value"
-                    if scan_mode == 'quick':
-                        cell_text = "N/A (Quick Scan)"
-                    else:
-                        cell_text = str(cell.Text).strip()
-                    cell_address = cell.Address.replace('$', '')
-                    all_formulas_local.append((formula_type, cell_address, formula, display_val, cell_text))
-                except Exception as cell_processing_e:
-                    all_formulas_local.append((formula_type, cell_address if cell_address else "ERROR_ADDR", str(formula), str(display_val), f"ERROR: {cell_processing_e}"))
+                all_formulas_local.append(row)
                 
                 if current_cell_count % 100 == 0 or current_cell_count == total_cells_to_process:
                     progress_update_callback(current_cell_count, total_cells_to_process, formula_cells_found)
@@ -65,7 +50,7 @@ def _get_formulas_from_excel(worksheet_com_obj, scan_range_com_obj, scan_mode, p
             or 'Unable to get the' in str(e)
         )
         if no_formula_error:
-            return [], 0, 0 # Return empty list if no formulas found
+            return FormulaTable(), 0, 0 # Return empty table if no formulas found
         else:
             raise # Re-raise other exceptions
 
@@ -132,10 +117,14 @@ def refresh_data(controller, btn, scan_mode='full'):
         current_scan_range = controller.worksheet.UsedRange
         current_scan_range_str = current_scan_range.Address.replace('$', '')
         controller.view.range_label.config(text=f"Scanning: UsedRange ({current_scan_range_str})", foreground="black")
-        controller.all_formulas.clear()
+        is_selected_range_scan = getattr(controller, 'scanning_selected_range', False)
+        # Incremental mode patches the previous result, so it must not be cleared
+        incremental_requested = getattr(controller, 'incremental_scan', False) and not is_selected_range_scan
+        if not incremental_requested:
+            controller.all_formulas.clear()
+            controller.incremental_scan_state = None
         
         controller.view.progress_bar['value'] = 30
-        is_selected_range_scan = getattr(controller, 'scanning_selected_range', False)
         selected_address = getattr(controller, 'selected_scan_address', None)
         
         if is_selected_range_scan and selected_address:
@@ -156,6 +145,14 @@ def refresh_data(controller, btn, scan_mode='full'):
         controller.view.progress_label.config(text=f"Searching for formulas in Excel in {scan_info.lower()} {scan_range_str} (this may take a moment)...")
         controller.root.update_idletasks()
         
+        # The cache is keyed by the file on disk, which only matches a saved workbook
+        scan_cache = get_global_scan_cache() if getattr(controller, 'use_scan_cache', True) else None
+        try:
+            cache_usable = scan_cache is not None and bool(controller.workbook.Saved) and os.path.isfile(file_path)
+        except Exception:
+            cache_usable = False
+        cache_hit = False
+
         start_time = time.time()
         try:
             def progress_callback(current_cell_count, total_cells_to_process, formula_cells_found):
@@ -164,9 +161,53 @@ def refresh_data(controller, btn, scan_mode='full'):
                 controller.view.progress_label.config(text=f"Found {formula_cells_found} formulas. Processing {current_cell_count}/{total_cells_to_process} cells...")
                 controller.root.update_idletasks()
 
-            controller.all_formulas, formula_cells_found, total_cells_to_process = _get_formulas_from_excel(
-                controller.worksheet, scan_range, scan_mode, progress_callback
-            )
+            def incremental_progress(blocks_checked, total_blocks, changed_blocks):
+                progress = 30 + (blocks_checked / total_blocks) * 60
+                controller.view.progress_bar['value'] = min(int(progress), 90)
+                controller.view.progress_label.config(text=f"Incremental scan: {changed_blocks} changed of {blocks_checked}/{total_blocks} row blocks checked...")
+                controller.root.update_idletasks()
+
+            def fingerprint_scan_progress(blocks_read, total_blocks, formula_cells_found):
+                progress = 30 + (blocks_read / total_blocks) * 60
+                controller.view.progress_bar['value'] = min(int(progress), 90)
+                controller.view.progress_label.config(text=f"Found {formula_cells_found} formulas. Reading {blocks_read}/{total_blocks} row blocks...")
+                controller.root.update_idletasks()
+
+            changed_addresses = None
+            if incremental_requested:
+                changed_addresses, new_state = incremental_rescan(
+                    controller.worksheet, scan_range, getattr(controller, 'incremental_scan_state', None),
+                    controller.all_formulas, file_path, scan_mode, incremental_progress
+                )
+                if changed_addresses is not None:
+                    controller.incremental_scan_state = new_state
+
+            if changed_addresses is None and incremental_requested:
+                # One block-by-block read gives both the rows and the fingerprints for the next rescan
+                rows, controller.incremental_scan_state = scan_with_state(
+                    controller.worksheet, scan_range, file_path, scan_mode, fingerprint_scan_progress
+                )
+                controller.all_formulas = FormulaTable.from_rows(rows)
+                if cache_usable:
+                    scan_cache.put(file_path, controller.worksheet.Name, scan_range_str, scan_mode, controller.all_formulas)
+            elif changed_addresses is None:
+                cached_rows = None
+                if cache_usable:
+                    cached_rows = scan_cache.get(file_path, controller.worksheet.Name, scan_range_str, scan_mode)
+                if cached_rows is not None:
+                    cache_hit = True
+                    controller.all_formulas = FormulaTable.from_rows(cached_rows)
+                    controller.view.progress_label.config(text=f"Scan cache hit: loaded {len(cached_rows)} formulas (workbook unchanged since last scan)...")
+                    controller.root.update_idletasks()
+                else:
+                    controller.all_formulas, formula_cells_found, total_cells_to_process = _get_formulas_from_excel(
+                        controller.worksheet, scan_range, scan_mode, progress_callback,
+                        bulk_read=getattr(controller, 'use_bulk_scan', True)
+                    )
+                    if cache_usable:
+                        scan_cache.put(file_path, controller.worksheet.Name, scan_range_str, scan_mode, controller.all_formulas)
+            elif cache_usable and changed_addresses:
+                scan_cache.put(file_path, controller.worksheet.Name, scan_range_str, scan_mode, controller.all_formulas)
             
         except Exception as e:
             import traceback
@@ -178,6 +219,8 @@ def refresh_data(controller, btn, scan_mode='full'):
                 or 'Unable to get the' in str(e)
             )
             if no_formula_error:
+                controller.all_formulas.clear()
+                controller.incremental_scan_state = None
                 controller.view.progress_label.config(text=f"No formulas found in this worksheet's {scan_info.lower()} ({scan_range_str}).")
                 if hasattr(controller, 'scanning_selected_range'):
                     controller.scanning_selected_range = False
@@ -203,7 +246,11 @@ def refresh_data(controller, btn, scan_mode='full'):
         end_time = time.time()
         time_taken = end_time - start_time
         controller.view.progress_bar['value'] = 90
-        controller.view.progress_label.config(text=f"Found {len(controller.all_formulas)} formulas. Loading... (Scan took {time_taken:.2f} seconds)")
+        if changed_addresses is not None:
+            cache_note = f", incremental: {len(changed_addresses)} cells changed"
+        else:
+            cache_note = ", from scan cache" if cache_hit else ""
+        controller.view.progress_label.config(text=f"Found {len(controller.all_formulas)} formulas. Loading... (Scan took {time_taken:.2f} seconds{cache_note})")
         controller.root.update_idletasks()
 
         if hasattr(controller, 'original_user_selection') and controller.original_user_selection:
@@ -220,9 +267,9 @@ def refresh_data(controller, btn, scan_mode='full'):
         if hasattr(controller, 'original_user_count'):
             controller.original_user_count = None
             
-        apply_filter(controller)
+        apply_filter(controller, changed_addresses=changed_addresses)
         controller.view.progress_bar['value'] = 100
-        controller.view.progress_label.config(text=f"Completed: Found {len(controller.all_formulas)} formulas. (Total scan time: {time_taken:.2f} seconds)")
+        controller.view.progress_label.config(text=f"Completed: Found {len(controller.all_formulas)} formulas. (Total scan time: {time_taken:.2f} seconds{cache_note})")
         if btn is not None:
             btn.config(state='normal')
         if controller.view.formula_list_label:
@@ -246,4 +293,94 @@ def refresh_data(controller, btn, scan_mode='full'):
             btn.config(state='normal')
         controller.view.progress_bar['value'] = 0
         controller.view.progress_label.config(text="Connection Failed.")
-        return
\ No newline at end of file
+        return
+
+def refresh_data_from_file(controller, btn, workbook_path, sheet_name=None, scan_mode='full'):
+    """
+    Scan a worksheet straight from an xlsx/xlsm file, without Excel.
+
+    The result replaces controller.all_formulas exactly like refresh_data,
+    so filtering, summaries and explode work on files that are not open.
+    With sheet_name=None every worksheet is scanned in parallel worker
+    processes and addresses are qualified with their sheet ('Sheet1!A1').
+    """
+    if not controller.view.ui_initialized:
+        return
+
+    controller.clear_filter_inputs()
+
+    if btn is not None:
+        btn.config(state='disabled')
+    controller.view.progress_bar['value'] = 0
+    controller.view.progress_label.config(text=f"Opening {os.path.basename(workbook_path)} (offline)...")
+    controller.root.update_idletasks()
+
+    # No COM objects behind an offline scan
+    controller.xl = None
+    controller.workbook = None
+    controller.worksheet = None
+    controller.last_workbook_path = workbook_path
+    controller.last_worksheet_name = sheet_name
+    controller.incremental_scan_state = None
+
+    display_path = os.path.dirname(workbook_path)
+    max_path_display_length = 60
+    if len(display_path) > max_path_display_length:
+        truncated_path = "..." + display_path[-(max_path_display_length-3):]
+    else:
+        truncated_path = display_path
+    controller.view.file_label.config(text=os.path.basename(workbook_path), foreground="black")
+    controller.view.path_label.config(text=truncated_path, foreground="black")
+    if sheet_name is None:
+        controller.view.sheet_label.config(text="(All Worksheets)", foreground="black")
+        controller.view.range_label.config(text="Scanning: Entire Workbook (offline file read)", foreground="black")
+    else:
+        controller.view.sheet_label.config(text=sheet_name, foreground="black")
+        controller.view.range_label.config(text="Scanning: Full Worksheet (offline file read)", foreground="black")
+    controller.all_formulas.clear()
+    controller.view.progress_bar['value'] = 10
+    controller.root.update_idletasks()
+
+    start_time = time.time()
+    try:
+        def progress_callback(bytes_read, total_bytes, formula_cells_found):
+            progress = 10 + (bytes_read / total_bytes) * 80
+            controller.view.progress_bar['value'] = min(int(progress), 90)
+            controller.view.progress_label.config(text=f"Found {formula_cells_found} formulas. Reading sheet XML {bytes_read * 100 // total_bytes}%...")
+            controller.root.update_idletasks()
+
+        def sheet_progress_callback(done_sheet_name, sheets_done, total_sheets, formula_cells_found):
+            progress = 10 + (sheets_done / total_sheets) * 80
+            controller.view.progress_bar['value'] = min(int(progress), 90)
+            controller.view.progress_label.config(text=f"Found {formula_cells_found} formulas. Finished sheet '{done_sheet_name}' ({sheets_done}/{total_sheets})...")
+            controller.root.update_idletasks()
+
+        if sheet_name is None:
+            controller.all_formulas, formula_cells_found, total_cells_to_process = scan_workbook_formulas(
+                workbook_path, scan_mode, progress_update_callback=sheet_progress_callback
+            )
+        else:
+            controller.all_formulas, formula_cells_found, total_cells_to_process = scan_sheet_formulas(
+                workbook_path, sheet_name, scan_mode, progress_callback
+            )
+    except Exception as e:
+        err_detail = traceback.format_exc()
+        messagebox.showerror("Scan Error", f"An error occurred while reading formulas from the file: {e}\n\nTraceback:\n{err_detail}")
+        if btn is not None:
+            btn.config(state='normal')
+        controller.view.progress_bar['value'] = 0
+        controller.view.progress_label.config(text="Offline scan failed.")
+        return
+
+    time_taken = time.time() - start_time
+    apply_filter(controller)
+    controller.view.progress_bar['value'] = 100
+    controller.view.progress_label.config(text=f"Completed: Found {len(controller.all_formulas)} formulas. (Offline scan time: {time_taken:.2f} seconds)")
+    if btn is not None:
+        btn.config(state='normal')
+    if controller.view.formula_list_label:
+        total_count = len(controller.all_formulas)
+        if total_count == 0:
+            controller.view.formula_list_label.config(text="Formula List (No Formula Found)")
+        else:
+            controller.view.formula_list_label.config(text=f"Formula List ({total_count} records):")
@@ -0,0 +1,497 @@
+# -*- coding: utf-8 -*-
+"""
+Formula Area Reader Module
+
+This module turns one COM Range area (as returned by
+SpecialCells(xlCellTypeFormulas).Areas) into scan rows of the form
+(formula_type, address, formula, display_value, cell_text).
+
+The bulk reader pulls Area.Formula and Area.Value2 once per area as 2-D
+arrays and computes addresses locally, so a large area costs a handful of
+COM round-trips instead of four or five per cell. Only the attributes used
+here are touched (Row, Column, Count, Formula, Value2, Value, NumberFormat,
+ColumnWidth, Font.Size, Columns(i), Cells(r, c).Text), which keeps the
+readers testable against a plain Python stand-in for the COM range.
+
+COM has no array read for .Text, so full scans derive the display text
+locally wherever the column's format makes it predictable: strings,
+booleans and errors in General/Text columns, and numbers in General or one
+of the fixed formats in _FIXED_NUMBER_FORMATS. Numbers are only formatted
+locally when the text fits the column with a digit to spare, measured in
+default-font digits from the column's ColumnWidth and Font.Size (read once
+per column). Everything else still costs one Cells(r, c).Text call per
+cell: dates, currency and custom formats, columns with mixed formats,
+widths or fonts, fonts larger than the default, numbers that would be
+rounded to the column width or shown in scientific notation, and numbers
+whose text would not fit. Formats applied by conditional formatting are not
+seen by the local path.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from openpyxl.utils import get_column_letter
+
+from core.formula_classifier import classify_formula_type, classify_formula_types
+
+QUICK_SCAN_TEXT = "N/A (Quick Scan)"
+
+# COM returns Excel error values as these HRESULT-style integers
+EXCEL_ERROR_TEXT = {
+    -2146826281: "#DIV/0!",
+    -2146826246: "#N/A",
+    -2146826259: "#NAME?",
+    -2146826288: "#NULL!",
+    -2146826252: "#NUM!",
+    -2146826265: "#REF!",
+    -2146826273: "#VALUE!",
+}
+
+# Characters that may appear in a number format whose Value2 equals Value
+_PLAIN_NUMBER_FORMAT_CHARS = set("0#?,.%E+- ;")
+
+# Number formats formatted locally: format -> (decimals, thousands separator, percent)
+_FIXED_NUMBER_FORMATS = {
+    "0": (0, False, False),
+    "0.00": (2, False, False),
+    "#,##0": (0, True, False),
+    "#,##0.00": (2, True, False),
+    "0%": (0, False, True),
+    "0.00%": (2, False, True),
+}
+
+# General shows at most this many characters before rounding or switching to E notation
+GENERAL_MAX_CHARS = 11
+
+# Column widths are measured in digits of the default font
+DEFAULT_FONT_SIZE = 11
+
+
+def _as_2d(raw):
+    """
+    Normalise the result of a COM array read into a tuple of row tuples.
+
+    Args:
+        raw: Scalar (single cell) or tuple of tuples (multi-cell area)
+
+    Returns:
+        tuple: Row-major tuple of row tuples
+    """
+    if isinstance(raw, tuple):
+        if raw and isinstance(raw[0], tuple):
+            return raw
+        return (raw,)
+    return ((raw,),)
+
+
+def _is_plain_number_format(number_format):
+    """
+    Check whether Value2 gives the same Python value as Value for a format.
+
+    Dates, times and currency come back from .Value as datetime/Decimal
+    objects, so those columns must still be read through .Value.
+    """
+    if not isinstance(number_format, str):
+        return False
+    if number_format in ("General", "@"):
+        return True
+    return all(ch in _PLAIN_NUMBER_FORMAT_CHARS for ch in number_format)
+
+
+def _column_number_formats(area, column_count):
+    """
+    Get one number format per area column, or None where a column is mixed.
+
+    Area.NumberFormat returns None when the area is not uniform, in which
+    case each column is asked separately (one COM call per column).
+    """
+    area_format = area.NumberFormat
+    if isinstance(area_format, str):
+        return [area_format] * column_count
+    formats = []
+    for col_offset in range(column_count):
+        try:
+            column_format = area.Columns(col_offset + 1).NumberFormat
+        except Exception:
+            column_format = None
+        formats.append(column_format if isinstance(column_format, str) else None)
+    return formats
+
+
+def _text_width(com_range):
+    """
+    Number of characters a column's text may use, or None if unknown.
+
+    One digit of margin is kept for the narrower-or-wider glyphs and cell
+    padding that ColumnWidth does not account for.
+    """
+    try:
+        width = com_range.ColumnWidth
+        font_size = com_range.Font.Size
+    except Exception:
+        return None
+    if not isinstance(width, (int, float)) or not isinstance(font_size, (int, float)):
+        return None
+    if font_size > DEFAULT_FONT_SIZE:
+        return None
+    return int(width) - 1
+
+
+def _column_text_widths(area, number_formats):
+    """
+    Get the text width of each column whose numbers can be formatted locally.
+
+    The area is asked first; ColumnWidth and Font.Size return None when the
+    area is not uniform, in which case each wanted column is asked.
+    """
+    wanted = [number_format == "General" or number_format in _FIXED_NUMBER_FORMATS
+              for number_format in number_formats]
+    if not any(wanted):
+        return [None] * len(number_formats)
+    area_width = _text_width(area)
+    widths = []
+    for col_offset, want in enumerate(wanted):
+        if not want:
+            widths.append(None)
+        elif area_width is not None:
+            widths.append(area_width)
+        else:
+            try:
+                widths.append(_text_width(area.Columns(col_offset + 1)))
+            except Exception:
+                widths.append(None)
+    return widths
+
+
+def _round_half_up(value, decimals):
+    # Excel rounds its 15 significant digits half away from zero
+    rounded = Decimal(f"{value:.15g}").quantize(Decimal(1).scaleb(-decimals), rounding=ROUND_HALF_UP)
+    return rounded.copy_abs() if rounded.is_zero() else rounded
+
+
+def _format_number(value, number_format):
+    """
+    Format a number the way Excel displays it in a wide enough column.
+
+    Returns:
+        str or None: The text, or None if the format or value is not handled
+    """
+    if number_format == "General":
+        if value == 0:
+            return "0"
+        text = f"{value:.15g}"
+        if "e" in text:
+            return None
+        if len(text) > GENERAL_MAX_CHARS:
+            integer_digits = len(text.split(".")[0])
+            decimals = GENERAL_MAX_CHARS - integer_digits - 1
+            if "." not in text or decimals < 1:
+                return None
+            text = str(_round_half_up(value, decimals))
+            if "." in text:
+                text = text.rstrip("0").rstrip(".")
+        return text
+    decimals, thousands, percent = _FIXED_NUMBER_FORMATS[number_format]
+    rounded = _round_half_up(value * 100 if percent else value, decimals)
+    text = format(rounded, f"{',' if thousands else ''}.{decimals}f")
+    return text + "%" if percent else text
+
+
+def local_cell_text(value, number_format, text_width=None):
+    """
+    Derive the displayed text of a cell without asking Excel, when possible.
+
+    Strings, booleans, errors and empty results in General/Text formats are
+    displayed verbatim. Numbers in General or a fixed format are formatted
+    locally when the column's text width is known and the text fits it.
+
+    Args:
+        value: Value2 of the cell
+        number_format: Number format of the cell's column, or None if mixed
+        text_width (int): Characters that fit the column, or None if unknown
+
+    Returns:
+        str or None: The display text, or None if .Text must be read
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value not in EXCEL_ERROR_TEXT:
+        if text_width is None or not (number_format == "General" or number_format in _FIXED_NUMBER_FORMATS):
+            return None
+        text = _format_number(value, number_format)
+        return text if text is not None and len(text) <= text_width else None
+    if number_format not in ("General", "@"):
+        return None
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, int) and value in EXCEL_ERROR_TEXT:
+        return EXCEL_ERROR_TEXT[value]
+    return None
+
+
+def _display_value(cell_value):
+    return str(cell_value)[:50] if cell_value is not None else "No Value"
+
+
+def read_area_rows_bulk(area, scan_mode, formulas=None, values2=None, skip_constants=False):
+    """
+    Read all formula cells of one area with 2-D array reads.
+
+    Args:
+        area: COM Range area containing only formula cells
+        scan_mode (str): 'quick' skips .Text, anything else reads it
+        formulas: Optional Area.Formula array the caller has already read
+        values2: Optional Area.Value2 array the caller has already read
+        skip_constants (bool): Skip cells whose formula does not start with
+            '=', for areas that are not restricted to formula cells
+
+    Yields:
+        tuple: (formula_type, address, formula, display_value, cell_text)
+    """
+    first_row = area.Row
+    first_col = area.Column
+    formulas = _as_2d(area.Formula if formulas is None else formulas)
+    values2 = _as_2d(area.Value2 if values2 is None else values2)
+    column_count = len(formulas[0]) if formulas else 0
+
+    number_formats = _column_number_formats(area, column_count)
+    text_widths = [None] * column_count if scan_mode == 'quick' else _column_text_widths(area, number_formats)
+    com_values = {}
+    for col_offset, number_format in enumerate(number_formats):
+        if not _is_plain_number_format(number_format):
+            # One bulk .Value read for the column keeps datetime/currency fidelity
+            column_values = _as_2d(area.Columns(col_offset + 1).Value)
+            com_values[col_offset] = [row[0] for row in column_values]
+
+    column_letters = [get_column_letter(first_col + col_offset) for col_offset in range(column_count)]
+    # The whole Formula array is classified in one batch call, row-major
+    formula_types = classify_formula_types(formula for formula_row in formulas for formula in formula_row)
+
+    for row_offset, formula_row in enumerate(formulas):
+        row_number = str(first_row + row_offset)
+        value_row = values2[row_offset]
+        type_offset = row_offset * column_count
+        for col_offset, formula in enumerate(formula_row):
+            if skip_constants and not (isinstance(formula, str) and formula.startswith('=')):
+                continue
+            cell_address = column_letters[col_offset] + row_number
+            formula_type = formula_types[type_offset + col_offset]
+            if col_offset in com_values:
+                cell_value = com_values[col_offset][row_offset]
+            else:
+                cell_value = value_row[col_offset]
+            display_val = _display_value(cell_value)
+
+            if scan_mode == 'quick':
+                cell_text = QUICK_SCAN_TEXT
+            else:
+                cell_text = local_cell_text(value_row[col_offset], number_formats[col_offset], text_widths[col_offset])
+                if cell_text is None:
+                    try:
+                        cell_text = str(area.Cells(row_offset + 1, col_offset + 1).Text).strip()
+                    except Exception as cell_processing_e:
+                        yield (formula_type, cell_address, str(formula), str(display_val), f"ERROR: {cell_processing_e}")
+                        continue
+            yield (formula_type, cell_address, formula, display_val, cell_text)
+
+
+def read_area_rows_per_cell(area, scan_mode):
+    """
+    Read all formula cells of one area one cell at a time.
+
+    This is the original scan loop, kept as a fallback for areas the bulk
+    reader cannot handle.
+
+    Args:
+        area: COM Range area containing only formula cells
+        scan_mode (str): 'quick' skips .Text, anything else reads it
+
+    Yields:
+        tuple: (formula_type, address, formula, display_value, cell_text)
+    """
+    for cell in area.Cells:
+        formula = ""
+        formula_type = "unknown"
+        display_val = "Error"
+        cell_address = ""
+
+        try:
+            formula = cell.Formula
+            formula_type = classify_formula_type(formula)
+            cell_value = cell.Value
+            display_val = _display_value(cell_value)
+            if scan_mode == 'quick':
+                cell_text = QUICK_SCAN_TEXT
+            else:
+                cell_text = str(cell.Text).strip()
+            cell_address = cell.Address.replace('$', '')
+            yield (formula_type, cell_address, formula, display_val, cell_text)
+        except Exception as cell_processing_e:
+            yield (formula_type, cell_address if cell_address else "ERROR_ADDR", str(formula), str(display_val), f"ERROR: {cell_processing_e}")
+
+
+def read_area_rows(area, scan_mode, bulk_read=True):
+    """
+    Read one area, preferring the bulk reader and falling back per cell.
+
+    The bulk read is materialised before anything is yielded, so a COM
+    failure halfway through an area never produces duplicate rows.
+
+    Returns:
+        list: Scan rows for the area
+    """
+    if bulk_read:
+        try:
+            return list(read_area_rows_bulk(area, scan_mode))
+        except Exception as e:
+            print(f"Bulk area read failed, falling back to per-cell scan: {e}")
+    return list(read_area_rows_per_cell(area, scan_mode))
+
+
+if __name__ == "__main__":
+    import datetime
+
+    class _StandInCell:
+        """One cell of the stand-in area, read through the per-cell attributes."""
+
+        def __init__(self, area, row_offset, col_offset):
+            self.area = area
+            self.row_offset, self.col_offset = row_offset, col_offset
+
+        def _get(self, name):
+            self.area.calls[name] += 1
+            return self.area.cells[self.row_offset][self.col_offset][name]
+
+        Formula = property(lambda self: self._get('Formula'))
+        Value = property(lambda self: self._get('Value'))
+        Text = property(lambda self: self._get('Text'))
+
+        @property
+        def Address(self):
+            return f"${get_column_letter(self.area.Column + self.col_offset)}${self.area.Row + self.row_offset}"
+
+    class _StandInCells:
+        def __init__(self, area):
+            self.area = area
+
+        def __call__(self, row, col):
+            return _StandInCell(self.area, row - 1, col - 1)
+
+        def __iter__(self):
+            for row_offset, row in enumerate(self.area.cells):
+                for col_offset in range(len(row)):
+                    yield _StandInCell(self.area, row_offset, col_offset)
+
+    class _StandInArea:
+        """
+        Just enough of a COM Range area: array reads return a scalar for one
+        cell and a tuple of row tuples otherwise, as Excel does.
+        """
+
+        def __init__(self, first_row, first_col, cells, number_formats, calls=None, widths=None, font_sizes=None):
+            self.Row, self.Column = first_row, first_col
+            self.cells = cells
+            self.number_formats = number_formats
+            self.widths = widths or [8.43] * len(number_formats)
+            self.font_sizes = font_sizes or [11] * len(number_formats)
+            self.calls = calls if calls is not None else {name: 0 for name in ('Formula', 'Value2', 'Value', 'Text')}
+
+        def _array(self, name):
+            self.calls[name] += 1
+            rows = tuple(tuple(cell[name] for cell in row) for row in self.cells)
+            return rows[0][0] if len(rows) == 1 and len(rows[0]) == 1 else rows
+
+        Formula = property(lambda self: self._array('Formula'))
+        Value2 = property(lambda self: self._array('Value2'))
+        Value = property(lambda self: self._array('Value'))
+        Count = property(lambda self: sum(len(row) for row in self.cells))
+        Cells = property(lambda self: _StandInCells(self))
+
+        @staticmethod
+        def _uniform(values):
+            return values[0] if len(set(values)) == 1 else None
+
+        NumberFormat = property(lambda self: self._uniform(self.number_formats))
+        ColumnWidth = property(lambda self: self._uniform(self.widths))
+        Font = property(lambda self: type('Font', (), {'Size': self._uniform(self.font_sizes)}))
+
+        def Columns(self, index):
+            column = slice(index - 1, index)
+            return _StandInArea(self.Row, self.Column + index - 1, [(row[index - 1],) for row in self.cells],
+                                self.number_formats[column], self.calls, self.widths[column], self.font_sizes[column])
+
+    def cell(formula, value, text, value2=None):
+        return {'Formula': formula, 'Value': value, 'Value2': value if value2 is None else value2, 'Text': text}
+
+    def check(area, expected_rows, max_text_reads):
+        for scan_mode in ('full', 'quick'):
+            area.calls.update((name, 0) for name in area.calls)
+            bulk = list(read_area_rows_bulk(area, scan_mode))
+            bulk_calls = dict(area.calls)
+            per_cell = list(read_area_rows_per_cell(area, scan_mode))
+            # 批次讀取與逐格讀取的結果必須一致，且 Formula / Value2 各只讀一次
+            assert bulk == per_cell, (bulk, per_cell)
+            assert bulk_calls['Formula'] == 1 and bulk_calls['Value2'] == 1, bulk_calls
+            if scan_mode == 'quick':
+                assert bulk_calls['Text'] == 0 and all(row[4] == QUICK_SCAN_TEXT for row in bulk)
+            else:
+                assert [row[:4] for row in bulk] == [row[:4] for row in expected_rows], bulk
+                assert [row[4] for row in bulk] == [row[4] for row in expected_rows], bulk
+                assert bulk_calls['Text'] <= max_text_reads, bulk_calls
+
+    # 1x1：Formula / Value2 回傳純量
+    single = _StandInArea(4, 2, [[cell("=A4*2", 84, "84")]], ["General"])
+    check(single, [(classify_formula_type("=A4*2"), "B4", "=A4*2", "84", "84")], max_text_reads=0)
+
+    # 2-D 區域：字串、布林、錯誤值與放得下的數字都由本地推得顯示文字
+    grid = _StandInArea(2, 3, [
+        [cell("=A2&\"x\"", "1x", "1x"), cell("=A2>0", True, "TRUE")],
+        [cell("=1/0", -2146826281, "#DIV/0!"), cell("=SUM(A1:A3)", 6.5, "6.5")],
+    ], ["General", "General"])
+    check(grid, [
+        (classify_formula_type("=A2&\"x\""), "C2", "=A2&\"x\"", "1x", "1x"),
+        (classify_formula_type("=A2>0"), "D2", "=A2>0", "True", "TRUE"),
+        (classify_formula_type("=1/0"), "C3", "=1/0", "-2146826281", "#DIV/0!"),
+        (classify_formula_type("=SUM(A1:A3)"), "D3", "=SUM(A1:A3)", "6.5", "6.5"),
+    ], max_text_reads=0)
+
+    # 固定數字格式在本地格式化；欄寬不足、字型過大或需依欄寬捨入的數字才逐格讀 .Text
+    number_cells = [
+        ("0.00", 2.345, "2.35"), ("#,##0", -1234567.5, "-1,234,568"), ("0%", 0.125, "13%"),
+        ("0.00", -0.001, "0.00"), ("General", 1 / 3, "0.333333"), ("General", 123456.7890123, "123456.789"),
+        ("#,##0.00", 1234567.891, "########"), ("0.00%", 0.5, "50.00%"), ("General", 1e-9, "1E-09"),
+    ]
+    numbers = _StandInArea(1, 1, [[cell(f"=N{index}", value, text) for index, (_, value, text) in enumerate(number_cells)]],
+                           [number_format for number_format, _, _ in number_cells],
+                           widths=[8.43, 12, 8.43, 8.43, 8.43, 15, 8.43, 8.43, 8.43], font_sizes=[11] * 7 + [14, 11])
+    check(numbers, [
+        (classify_formula_type(f"=N{index}"), f"{get_column_letter(index + 1)}1", f"=N{index}", str(value), text)
+        for index, (_, value, text) in enumerate(number_cells)
+    ], max_text_reads=4)
+    numbers.calls.update((name, 0) for name in numbers.calls)
+    list(read_area_rows_bulk(numbers, 'full'))
+    assert numbers.calls['Text'] == 4, numbers.calls
+
+    # 陣列公式：每格的 Formula 都是同一條公式；日期欄位改讀 .Value 保留 datetime
+    array_formula = "=TRANSPOSE(A1:C1)"
+    dates = [datetime.datetime(2025, 1, day) for day in (1, 2, 3)]
+    array_area = _StandInArea(10, 5, [
+        [cell(array_formula, day, day.strftime("%Y-%m-%d"), value2=45657 + index), cell("=E10+1", index, str(index))]
+        for index, day in enumerate(dates)
+    ], ["yyyy-mm-dd", "General"])
+    check(array_area, [
+        row for index, day in enumerate(dates) for row in (
+            (classify_formula_type(array_formula), f"E{10 + index}", array_formula, str(day), day.strftime("%Y-%m-%d")),
+            (classify_formula_type("=E10+1"), f"F{10 + index}", "=E10+1", str(index), str(index)),
+        )
+    ], max_text_reads=6)
+    array_area.calls.update((name, 0) for name in array_area.calls)
+    list(read_area_rows_bulk(array_area, 'quick'))
+    assert array_area.calls['Value'] == 1, array_area.calls
+
+    # 呼叫者已讀好的陣列不再重讀；非公式儲存格可略過
+    mixed = _StandInArea(1, 1, [[cell("=B1", 1, "1"), cell(7, 7, "7")]], ["General", "General"])
+    rows = list(read_area_rows_bulk(mixed, 'quick', formulas=(("=B1", 7),), values2=((1, 7),), skip_constants=True))
+    assert [row[1] for row in rows] == ["A1"] and mixed.calls['Formula'] == 0 and mixed.calls['Value2'] == 0
+    print("formula_area_reader self-test passed")
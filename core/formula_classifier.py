@@ -1,5 +1,9 @@
 
-from .link_analyzer import is_external_link_regex_match
+from .link_analyzer import is_external_link_regex_match, EXTERNAL_LINK_PATTERN
+
+# 公式文字 -> 類型；填滿的區塊常重複同一條公式（絕對引用、常數公式）
+_TYPE_MEMO = {}
+MAX_MEMO_SIZE = 100000
 
 def classify_formula_type(formula):
     formula_str = str(formula)
@@ -14,4 +18,92 @@ def classify_formula_type(formula):
     if formula_str.startswith('='):
         return 'formula'
     
-    return 'formula'
\ No newline at end of file
+    return 'formula'
+
+def classify_formula_types(formulas):
+    """
+    Classify a column of formulas in one call.
+
+    Same result as classify_formula_type for every item, but the external
+    link regex is only run on formulas containing '[', and each distinct
+    formula text is classified once (memoised across calls).
+
+    Args:
+        formulas: Iterable of formula values (usually one row or column of Area.Formula)
+
+    Returns:
+        list: Formula type per item, in input order
+    """
+    memo = _TYPE_MEMO
+    search = EXTERNAL_LINK_PATTERN.search
+    types = []
+    append = types.append
+    for formula in formulas:
+        try:
+            formula_type = memo.get(formula)
+        except TypeError:
+            formula_type = None
+        if formula_type is None:
+            formula_str = str(formula)
+            if '[' in formula_str and search(formula_str):
+                formula_type = 'external link'
+            elif '!' in formula_str:
+                formula_type = 'local link'
+            else:
+                formula_type = 'formula'
+            if len(memo) >= MAX_MEMO_SIZE:
+                memo.clear()
+            try:
+                memo[formula] = formula_type
+            except TypeError:
+                pass
+        append(formula_type)
+    return types
+
+def clear_classification_memo():
+    _TYPE_MEMO.clear()
+
+
+if __name__ == "__main__":
+    import time
+
+    # 典型模型工作表：大量相對公式、一些重複的絕對公式與連結
+    formulas = []
+    for i in range(1, 100001):
+        formulas.append(f"=B{i}*C{i}")
+        formulas.append("=$A$1*12")
+        formulas.append(f"=Inputs!D{i}")
+        formulas.append(f"='C:\\Data\\[Budget.xlsx]Q{i % 4 + 1}'!$B${i % 50 + 1}")
+
+    import re
+
+    def classify_recompiling(formula):
+        """The classifier as it was: the link pattern compiled on every call."""
+        formula_str = str(formula)
+        if re.compile(r"\[([^\]]+?\.(?:xlsx|xls|xlsm|xlsb))\]", re.IGNORECASE).search(formula_str):
+            return 'external link'
+        return 'local link' if '!' in formula_str else 'formula'
+
+    start = time.perf_counter()
+    legacy = [classify_recompiling(formula) for formula in formulas]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single = [classify_formula_type(formula) for formula in formulas]
+    single_time = time.perf_counter() - start
+
+    clear_classification_memo()
+    start = time.perf_counter()
+    batch = classify_formula_types(formulas)
+    batch_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    classify_formula_types(formulas)
+    warm_time = time.perf_counter() - start
+
+    assert batch == single == legacy
+    print(f"{len(formulas)} formulas")
+    print(f"  recompiling regex per cell:     {legacy_time:.3f}s")
+    print(f"  classify_formula_type per cell: {single_time:.3f}s ({legacy_time / single_time:.1f}x)")
+    print(f"  classify_formula_types (cold):  {batch_time:.3f}s ({legacy_time / batch_time:.1f}x)")
+    print(f"  classify_formula_types (warm):  {warm_time:.3f}s ({legacy_time / warm_time:.1f}x)")
@@ -6,13 +6,14 @@ Created on Wed Jun 25 09:10:23 2025
 """
 
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 import win32com.client
 import re
 
 from ui.worksheet.controller import WorksheetController
 from ui.worksheet.view import WorksheetView
-from core.excel_scanner import refresh_data
+from core.excel_scanner import refresh_data, refresh_data_from_file
+from core.xlsx_stream_scanner import get_sheet_names
 import time
 from core.worksheet_tree import apply_filter
 
@@ -58,6 +59,9 @@ class ExcelFormulaComparator:
             command=self.toggle_scan_mode
         )
         self.mode_button.pack(side=tk.LEFT, padx=5)
+        self.incremental_var = tk.BooleanVar(value=False)
+        self.incremental_check = ttk.Checkbutton(first_row, text="Incremental", variable=self.incremental_var)
+        self.incremental_check.pack(side=tk.LEFT, padx=2)
         
         # Separator
         ttk.Label(first_row, text=" | ", font=("Arial", 10)).pack(side=tk.LEFT, padx=5)
@@ -68,6 +72,10 @@ class ExcelFormulaComparator:
         self.scan_full_button.pack(side=tk.LEFT, padx=2)
         self.scan_selected_button = ttk.Button(first_row, text="Selected Range", command=self.scan_worksheet_selected, style="Large.TButton")
         self.scan_selected_button.pack(side=tk.LEFT, padx=2)
+        self.scan_file_button = ttk.Button(first_row, text="File (Offline)...", command=self.scan_worksheet_file, style="Large.TButton")
+        self.scan_file_button.pack(side=tk.LEFT, padx=2)
+        self.scan_workbook_button = ttk.Button(first_row, text="Workbook (Offline)...", command=self.scan_workbook_file, style="Large.TButton")
+        self.scan_workbook_button.pack(side=tk.LEFT, padx=2)
         
         # Remove second row with Selection info
         
@@ -106,6 +114,7 @@ class ExcelFormulaComparator:
         mode = self.current_mode  # Use current_mode instead of mode_var
         controller = self._get_active_controller()
         self.update_selection_info(controller)
+        controller.incremental_scan = self.incremental_var.get()
         refresh_data(controller, self.scan_full_button, scan_mode=mode)
 
     def scan_worksheet_selected(self):
@@ -158,6 +167,68 @@ class ExcelFormulaComparator:
         except Exception as e:
             print("Error getting selection")
     
+    def scan_worksheet_file(self):
+        """Scan a worksheet read directly from an xlsx/xlsm file, without Excel"""
+        file_path = filedialog.askopenfilename(
+            title="Select a workbook to scan offline",
+            filetypes=[("Excel Workbook", "*.xlsx *.xlsm"), ("All Files", "*.*")]
+        )
+        if not file_path:
+            return
+
+        try:
+            sheet_names = get_sheet_names(file_path)
+        except Exception as e:
+            messagebox.showerror("Open Error", f"Could not read the workbook structure:\n{e}")
+            return
+        if not sheet_names:
+            messagebox.showwarning("Warning", "The workbook does not contain any worksheets.")
+            return
+
+        sheet_name = sheet_names[0] if len(sheet_names) == 1 else self._ask_sheet_name(sheet_names)
+        if not sheet_name:
+            return
+
+        controller = self._get_active_controller()
+        refresh_data_from_file(controller, self.scan_file_button, file_path, sheet_name, scan_mode=self.current_mode)
+
+    def scan_workbook_file(self):
+        """Scan every worksheet of an xlsx/xlsm file in parallel, without Excel"""
+        file_path = filedialog.askopenfilename(
+            title="Select a workbook to scan offline (all worksheets)",
+            filetypes=[("Excel Workbook", "*.xlsx *.xlsm"), ("All Files", "*.*")]
+        )
+        if not file_path:
+            return
+
+        controller = self._get_active_controller()
+        refresh_data_from_file(controller, self.scan_workbook_button, file_path, None, scan_mode=self.current_mode)
+
+    def _ask_sheet_name(self, sheet_names):
+        """Let the user pick one worksheet name; returns None when cancelled"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Select Worksheet")
+        dialog.transient(self.root)
+        dialog.grab_set()
+
+        ttk.Label(dialog, text="Worksheet:").pack(side=tk.TOP, anchor=tk.W, padx=10, pady=(10, 2))
+        sheet_var = tk.StringVar(value=sheet_names[0])
+        ttk.Combobox(dialog, textvariable=sheet_var, values=sheet_names, state="readonly", width=40).pack(padx=10, pady=2)
+
+        chosen = {'name': None}
+
+        def confirm():
+            chosen['name'] = sheet_var.get()
+            dialog.destroy()
+
+        button_row = ttk.Frame(dialog)
+        button_row.pack(pady=10)
+        ttk.Button(button_row, text="Scan", command=confirm).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_row, text="Cancel", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+
+        dialog.wait_window()
+        return chosen['name']
+
     def update_selection_info(self, controller):
         """Update selection info (now just prints to console since UI element removed)"""
         try:
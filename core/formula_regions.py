@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Formula Regions Module
+
+Model sheets are mostly copies of one relative formula filled across a
+block. This module turns every scanned A1 formula into a relative R1C1 key,
+groups the cells that share a key (per sheet and type), and compresses each
+group into rectangles, so "D5:D5004" can be shown, parsed and exploded once
+instead of 5000 times.
+"""
+
+import re
+
+from utils.shared_formula import FormulaTemplate
+from utils.range_optimizer import cells_to_rectangles, format_rectangle
+
+# 'B12' 或 'Sheet1!B12' / "'My Sheet'!B12"
+_ADDRESS_PATTERN = re.compile(r"^(.*!)?\$?([A-Za-z]{1,3})\$?(\d+)$")
+
+# Ranges listed in a region's address before it is shortened
+MAX_DISPLAY_RANGES = 4
+
+
+def _column_number(letters):
+    number = 0
+    for char in letters.upper():
+        number = number * 26 + (ord(char) - 64)
+    return number
+
+
+class FormulaRegion:
+    """
+    A group of cells holding the same relative formula.
+
+    Attributes:
+        key (str): Relative R1C1 form of the formula
+        prefix (str): Sheet qualifier of the cells ('' for single-sheet scans)
+        formula_type (str): Type of the representative cell
+        representative: Scan row of the first cell, used for parsing and explosion
+        cells (list): (row, col) of every cell in the region
+        rows (list): Scan rows of every cell, in scan order
+    """
+
+    __slots__ = ('key', 'prefix', 'formula_type', 'representative', 'cells', 'rows', '_rectangles')
+
+    def __init__(self, key, prefix, representative):
+        self.key = key
+        self.prefix = prefix
+        self.formula_type = representative[0]
+        self.representative = representative
+        self.cells = []
+        self.rows = []
+        self._rectangles = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def rectangles(self):
+        """Non-overlapping (min_row, min_col, max_row, max_col) rectangles covering the cells."""
+        if self._rectangles is None:
+            self._rectangles = cells_to_rectangles(self.cells)
+        return self._rectangles
+
+    @property
+    def ranges(self):
+        """The rectangles as A1 ranges, e.g. ['D5:D5004', 'F5:F5004']."""
+        return [format_rectangle(rectangle) for rectangle in self.rectangles]
+
+    @property
+    def representative_address(self):
+        return self.representative[1]
+
+    def display_address(self, max_ranges=MAX_DISPLAY_RANGES):
+        """Sheet-qualified ranges, shortened to max_ranges entries."""
+        ranges = self.ranges
+        shown = ", ".join(self.prefix + cell_range for cell_range in ranges[:max_ranges])
+        if len(ranges) > max_ranges:
+            shown += f", ... (+{len(ranges) - max_ranges} ranges)"
+        return shown
+
+    def as_row(self):
+        """
+        Scan row shown for the whole region: the representative's formula and
+        values, with the address replaced by the region's ranges.
+        """
+        formula_type, _address, formula, display_value, cell_text = self.representative
+        address = self.display_address()
+        if len(self.rows) > 1:
+            address = f"{address} ({len(self.rows)} cells)"
+        return (formula_type, address, formula, display_value, cell_text)
+
+    def __repr__(self):
+        return f"FormulaRegion({self.display_address()!r}, {self.key!r}, {len(self.rows)} cells)"
+
+
+def group_formula_regions(rows):
+    """
+    Group scan rows by (sheet, type, relative R1C1 formula).
+
+    Rows whose address is not a plain cell form a region of their own.
+    Filled blocks are cheap: the previous region's template is rendered at
+    the new cell first, and the formula is only compiled when that guess
+    does not match. Absolute-only formulas reuse their key for every copy.
+
+    Args:
+        rows: Iterable of (formula_type, address, formula, display_value, cell_text)
+
+    Returns:
+        list: FormulaRegion objects, ordered by their first cell in scan order
+    """
+    regions = {}
+    ordered = []
+    absolute_keys = {}  # formula text -> key, for formulas with no relative references
+    last_template = last_key = None
+    for row in rows:
+        formula_type, address, formula = row[0], row[1], row[2]
+        match = _ADDRESS_PATTERN.match(address)
+        if not match:
+            region = FormulaRegion(address, address, row)
+            region.rows.append(row)
+            ordered.append(region)
+            continue
+        prefix, letters, row_number = match.groups()
+        prefix = prefix or ''
+        cell = (int(row_number), _column_number(letters))
+
+        formula = str(formula)
+        key = absolute_keys.get(formula)
+        if key is None:
+            if last_template is not None and last_template.render(cell[0], cell[1]) == formula:
+                key = last_key
+            else:
+                template = FormulaTemplate(formula, cell[0], cell[1])
+                key = template.r1c1_key()
+                if template.has_relative_refs:
+                    last_template, last_key = template, key
+                else:
+                    absolute_keys[formula] = key
+
+        group_key = (prefix, formula_type, key)
+        region = regions.get(group_key)
+        if region is None:
+            region = regions[group_key] = FormulaRegion(key, prefix, row)
+            ordered.append(region)
+        region.cells.append(cell)
+        region.rows.append(row)
+    return ordered
+
+
+if __name__ == "__main__":
+    import time
+
+    sample = [('formula', f"D{i}", f"=B{i}*C{i}+$A$1", str(i), str(i)) for i in range(5, 5005)]
+    sample += [('formula', f"E{i}", f"=D{i}-D{i - 1}", str(i), str(i)) for i in range(6, 5005)]
+    sample += [('local link', "F2", "=Sheet2!A1", "1", "1"), ('local link', "G2", "=Sheet2!B1", "2", "2")]
+    for region in group_formula_regions(sample):
+        print(region, region.as_row()[1])
+
+    rows = [('formula', f"{col}{i}", f"={col}{i - 1}*2", "0", "0") for i in range(2, 100002) for col in "BCDE"]
+    start = time.time()
+    regions = group_formula_regions(rows)
+    print(f"Grouped {len(rows)} cells into {len(regions)} region(s) in {time.time() - start:.2f}s: {regions[0].ranges}")
@@ -89,15 +89,20 @@ class GraphGenerator:
                 "resolved_formula": self._safe_string(resolved_formula),
                 "short_resolved_formula": self._safe_string(short_resolved_formula),
                 "full_resolved_formula": self._safe_string(full_resolved_formula),
-                "has_dynamic_function": has_dynamic_function
+                "has_dynamic_function": has_dynamic_function,
+                "cycle_id": node.get("cycle_id")
             })
         
+        # 兩端屬於同一循環引用的邊與循環節點一起標紅
+        cycle_of = {node["id"]: node.get("cycle_id") for node in self.nodes_data}
         processed_edges = []
         for edge in self.edges_data:
+            cycle_id = cycle_of.get(edge[0])
             processed_edges.append({
                 "arrows": "to",
                 "from": self._safe_string(edge[0]),
-                "to": self._safe_string(edge[1])
+                "to": self._safe_string(edge[1]),
+                "in_cycle": cycle_id is not None and cycle_id == cycle_of.get(edge[1])
             })
             
         nodes_json = self._safe_json_encode(processed_nodes)
@@ -321,6 +326,11 @@ class GraphGenerator:
                             ctx.shadowOffsetY = 0;
                             ctx.strokeStyle = '#000000';
                             ctx.lineWidth = 4;
+                        } else if (edge.in_cycle) {
+                            ctx.shadowColor = 'transparent';
+                            ctx.shadowBlur = 0;
+                            ctx.strokeStyle = '#D62728';
+                            ctx.lineWidth = 2;
                         } else {
                             ctx.shadowColor = 'transparent';
                             ctx.shadowBlur = 0;
@@ -336,7 +346,7 @@ class GraphGenerator:
                         ctx.shadowColor = 'transparent';
                         ctx.shadowBlur = 0;
                         
-                        this.drawArrow(ctx, fromPos.x, fromPos.y, toPos.x, toPos.y, edge.from, edge.to, isHighlighted);
+                        this.drawArrow(ctx, fromPos.x, fromPos.y, toPos.x, toPos.y, edge.from, edge.to, isHighlighted, edge.in_cycle);
                     }
                 });
                 
@@ -384,6 +394,9 @@ class GraphGenerator:
                 if (isHighlighted) {
                     ctx.strokeStyle = '#000000';
                     ctx.lineWidth = 4;
+                } else if (node.cycle_id !== null && node.cycle_id !== undefined) {
+                    ctx.strokeStyle = '#D62728';
+                    ctx.lineWidth = 3;
                 } else {
                     ctx.strokeStyle = '#2B7CE9';
                     ctx.lineWidth = 1;
@@ -454,7 +467,7 @@ class GraphGenerator:
                 });
             };
             
-            Network.prototype.drawArrow = function(ctx, fromX, fromY, toX, toY, fromNodeId, toNodeId, isHighlighted) {
+            Network.prototype.drawArrow = function(ctx, fromX, fromY, toX, toY, fromNodeId, toNodeId, isHighlighted, inCycle) {
                 var angle = Math.atan2(toY - fromY, toX - fromX);
                 var length = 10;
                 
@@ -488,6 +501,9 @@ class GraphGenerator:
                 if (isHighlighted) {
                     ctx.strokeStyle = '#000000';
                     ctx.lineWidth = 4;
+                } else if (inCycle) {
+                    ctx.strokeStyle = '#D62728';
+                    ctx.lineWidth = 2;
                 } else {
                     ctx.strokeStyle = '#848484';
                     ctx.lineWidth = 1;
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental Scanner Module
+
+This module lets a rescan of the same worksheet skip the parts that did not
+change. The scan range is cut into blocks of ROW_BLOCK_SIZE rows; each block
+is fingerprinted from its Formula array and the Value2 array of the columns
+that hold formulas, so a block without formulas costs a single COM read and
+a wide data block only has its formula columns' values read. On a rescan
+only the blocks whose fingerprint changed are turned back into scan rows,
+and the previous result list is patched in place.
+
+Only changes to Formula and Value2 are detected. Edits that leave both
+alone, such as a new number format or a column width that changes the
+displayed .Text of a full scan, are not picked up until the next full scan.
+"""
+
+import re
+import hashlib
+
+from core.formula_area_reader import read_area_rows_bulk, _as_2d
+
+ROW_BLOCK_SIZE = 256
+
+_ROW_PATTERN = re.compile(r"\$?(\d+)$")
+
+
+class IncrementalScanState:
+    """
+    Fingerprints of one scan, used to decide which blocks a rescan must re-read.
+    """
+
+    def __init__(self, workbook_path, sheet_name, scan_mode, first_row, first_col, last_col,
+                 block_size=ROW_BLOCK_SIZE):
+        self.workbook_path = workbook_path
+        self.sheet_name = sheet_name
+        self.scan_mode = scan_mode
+        self.first_row = first_row
+        self.first_col = first_col
+        self.last_col = last_col
+        self.block_size = block_size
+        self.fingerprints = []
+        self.block_rows = []  # scan rows each block produced; the result list holds them in block order
+
+    def matches(self, workbook_path, sheet_name, scan_mode, first_row, first_col, last_col):
+        """Check whether a new scan lines up with this state's blocks."""
+        return (
+            self.workbook_path == workbook_path
+            and self.sheet_name == sheet_name
+            and self.scan_mode == scan_mode
+            and (self.first_row, self.first_col, self.last_col) == (first_row, first_col, last_col)
+        )
+
+    def block_of(self, address):
+        """Index of the block holding a cell address such as 'B12', or None."""
+        match = _ROW_PATTERN.search(address)
+        if not match:
+            return None
+        return (int(match.group(1)) - self.first_row) // self.block_size
+
+
+def _range_bounds(scan_range):
+    """Return (first_row, last_row, first_col, last_col) of a COM range."""
+    first_row = scan_range.Row
+    first_col = scan_range.Column
+    last_row = first_row + scan_range.Rows.Count - 1
+    last_col = first_col + scan_range.Columns.Count - 1
+    return first_row, last_row, first_col, last_col
+
+
+def _iter_blocks(worksheet, first_row, last_row, first_col, last_col, block_size):
+    """
+    Yield (block_index, fingerprint, value_range, formulas, values2) for each row block.
+
+    Formula is read for the whole block; Value2 only for the columns between
+    the first and last one holding a formula. value_range, formulas and
+    values2 cover those columns, ready for read_area_rows_bulk; value_range
+    is None for a block without formulas.
+    """
+    for block_index, block_first_row in enumerate(range(first_row, last_row + 1, block_size)):
+        block_last_row = min(block_first_row + block_size - 1, last_row)
+        block_formulas = _as_2d(worksheet.Range(
+            worksheet.Cells(block_first_row, first_col),
+            worksheet.Cells(block_last_row, last_col)
+        ).Formula)
+        formula_columns = [
+            col_offset for formula_row in block_formulas for col_offset, formula in enumerate(formula_row)
+            if isinstance(formula, str) and formula.startswith('=')
+        ]
+        if not formula_columns:
+            yield block_index, _fingerprint(block_formulas, None), None, (), ()
+            continue
+        low, high = min(formula_columns), max(formula_columns)
+        value_range = worksheet.Range(
+            worksheet.Cells(block_first_row, first_col + low),
+            worksheet.Cells(block_last_row, first_col + high)
+        )
+        values2 = _as_2d(value_range.Value2)
+        formulas = tuple(formula_row[low:high + 1] for formula_row in block_formulas)
+        yield block_index, _fingerprint(block_formulas, values2), value_range, formulas, values2
+
+
+def _fingerprint(formulas, values2):
+    return hashlib.blake2b(repr((formulas, values2)).encode('utf-8'), digest_size=16).digest()
+
+
+def _block_rows(value_range, formulas, values2, scan_mode):
+    if value_range is None:
+        return []
+    return list(read_area_rows_bulk(value_range, scan_mode, formulas=formulas, values2=values2, skip_constants=True))
+
+
+def scan_with_state(worksheet, scan_range, workbook_path, scan_mode, progress_update_callback=None,
+                    block_size=ROW_BLOCK_SIZE):
+    """
+    Full scan of a range that also fingerprints its blocks, from the same reads.
+
+    Args:
+        worksheet: COM Worksheet
+        scan_range: COM Range to scan
+        workbook_path (str): Workbook FullName
+        scan_mode (str): 'quick' or 'full'
+        progress_update_callback: Optional callable(blocks_read, total_blocks, formulas_found)
+        block_size (int): Rows per block
+
+    Returns:
+        tuple: (rows, state) where rows are the scan rows in block order and
+        state is the IncrementalScanState to pass to the next incremental_rescan
+    """
+    first_row, last_row, first_col, last_col = _range_bounds(scan_range)
+    state = IncrementalScanState(workbook_path, worksheet.Name, scan_mode, first_row, first_col, last_col, block_size)
+    total_blocks = (last_row - first_row) // block_size + 1
+    rows = []
+    for block_index, fingerprint, value_range, formulas, values2 in _iter_blocks(
+            worksheet, first_row, last_row, first_col, last_col, block_size):
+        state.fingerprints.append(fingerprint)
+        block_rows = _block_rows(value_range, formulas, values2, scan_mode)
+        state.block_rows.append(len(block_rows))
+        rows.extend(block_rows)
+        if progress_update_callback:
+            progress_update_callback(block_index + 1, total_blocks, len(rows))
+    return rows, state
+
+
+def incremental_rescan(worksheet, scan_range, previous_state, all_formulas, workbook_path, scan_mode,
+                       progress_update_callback=None):
+    """
+    Rebuild the rows of the changed blocks of a range and patch all_formulas in place.
+
+    Every block is fingerprinted again (its Formula array, plus Value2 of its
+    formula columns), so only Formula and Value2 changes are detected; only
+    blocks whose fingerprint changed are turned back into scan rows.
+
+    all_formulas holds the rows in block order (as scan_with_state and this
+    function leave it), so each changed block is one span that is replaced
+    in place; rows of blocks that did not exist before are appended. A
+    FormulaTable is patched with replace_rows, which only encodes the new
+    rows; a list with slice assignment.
+
+    Args:
+        worksheet: COM Worksheet
+        scan_range: COM Range being rescanned
+        previous_state (IncrementalScanState): State from the last scan
+        all_formulas (list): Rows of the last scan; patched in place
+        workbook_path (str): Workbook FullName
+        scan_mode (str): 'quick' or 'full'
+        progress_update_callback: Optional callable(blocks_checked, total_blocks, changed_blocks)
+
+    Returns:
+        tuple: (changed_addresses, new_state), or (None, None) when the range
+        or the rows no longer line up with the previous state and a full scan
+        is needed
+    """
+    first_row, last_row, first_col, last_col = _range_bounds(scan_range)
+    if previous_state is None or not previous_state.matches(
+            workbook_path, worksheet.Name, scan_mode, first_row, first_col, last_col):
+        return None, None
+    if len(all_formulas) != sum(previous_state.block_rows):
+        return None, None
+
+    block_size = previous_state.block_size
+    new_state = IncrementalScanState(workbook_path, worksheet.Name, scan_mode, first_row, first_col, last_col, block_size)
+    total_blocks = (last_row - first_row) // block_size + 1
+    new_rows_by_block = {}
+
+    for block_index, fingerprint, value_range, formulas, values2 in _iter_blocks(
+            worksheet, first_row, last_row, first_col, last_col, block_size):
+        new_state.fingerprints.append(fingerprint)
+        if block_index >= len(previous_state.fingerprints) or previous_state.fingerprints[block_index] != fingerprint:
+            new_rows_by_block[block_index] = _block_rows(value_range, formulas, values2, scan_mode)
+            new_state.block_rows.append(len(new_rows_by_block[block_index]))
+        else:
+            new_state.block_rows.append(previous_state.block_rows[block_index])
+        if progress_update_callback:
+            progress_update_callback(block_index + 1, total_blocks, len(new_rows_by_block))
+
+    # Blocks past the new last row disappeared with the range
+    changed_blocks = set(new_rows_by_block)
+    changed_blocks.update(range(total_blocks, len(previous_state.fingerprints)))
+    if not changed_blocks:
+        return set(), new_state
+
+    # Span of every old block in the result list; a span whose end rows fall
+    # in another block means the list was reordered since the last scan
+    spans = []
+    position = 0
+    for count in previous_state.block_rows:
+        spans.append((position, position + count))
+        position += count
+    old_changed = sorted(block_index for block_index in changed_blocks if block_index < len(spans))
+    for block_index in old_changed:
+        start, stop = spans[block_index]
+        if start < stop and not (previous_state.block_of(all_formulas[start][1])
+                                 == previous_state.block_of(all_formulas[stop - 1][1]) == block_index):
+            return None, None
+
+    old_rows = {}
+    for block_index in old_changed:
+        for index in range(*spans[block_index]):
+            row = tuple(all_formulas[index])
+            old_rows[row[1]] = row
+
+    replace_rows = getattr(all_formulas, 'replace_rows', None)
+
+    def splice(start, stop, rows):
+        if replace_rows is not None:
+            replace_rows(start, stop, rows)
+        else:
+            all_formulas[start:stop] = rows
+
+    # New blocks go after every old row, in order; old blocks are patched from
+    # the end so the spans before them stay valid
+    for block_index in sorted(changed_blocks - set(old_changed)):
+        splice(len(all_formulas), len(all_formulas), new_rows_by_block.get(block_index, []))
+    for block_index in reversed(old_changed):
+        splice(*spans[block_index], new_rows_by_block.get(block_index, []))
+
+    # Only cells whose row actually differs need to be redrawn
+    new_rows = {row[1]: tuple(row) for rows in new_rows_by_block.values() for row in rows}
+    changed_addresses = {
+        address for address in old_rows.keys() | new_rows.keys()
+        if old_rows.get(address) != new_rows.get(address)
+    }
+    return changed_addresses, new_state
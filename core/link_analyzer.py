@@ -9,6 +9,12 @@ including external references and local references.
 import re
 import os
 
+from core.formula_tokenizer import iter_reference_tokens, CELL, RANGE
+from utils.parse_cache import get_global_parse_cache
+
+# '[Book.xlsx]' 一類的外部活頁簿標記；模組載入時編譯一次
+EXTERNAL_LINK_PATTERN = re.compile(r"\[([^\]]+?\.(?:xlsx|xls|xlsm|xlsb))\]", re.IGNORECASE)
+
 
 def is_external_link_regex_match(formula_str):
     """
@@ -20,8 +26,11 @@ def is_external_link_regex_match(formula_str):
     Returns:
         bool: True if external link pattern is found, False otherwise
     """
-    external_link_pattern = re.compile(r"\[([^\]]+?\.(?:xlsx|xls|xlsm|xlsb))\]", re.IGNORECASE)
-    return bool(external_link_pattern.search(formula_str))
+    return bool(EXTERNAL_LINK_PATTERN.search(formula_str))
+
+
+def _parse_cell_and_range_tokens(formula_str, _workbook_path, _sheet_name):
+    return iter_reference_tokens(formula_str, (CELL, RANGE))
 
 
 def get_referenced_cell_values(
@@ -45,85 +54,29 @@ def get_referenced_cell_values(
         dict: Dictionary mapping reference addresses to their values
     """
     referenced_data = {}
-    processed_spans = []
-
-    def is_span_processed(start, end):
-        for p_start, p_end in processed_spans:
-            if start < p_end and end > p_start:
-                return True
-        return False
-
-    def add_processed_span(start, end):
-        processed_spans.append((start, end))
-
-    patterns = [
-        (
-            'external',
-            re.compile(
-                r"'?((?:[a-zA-Z]:\\)?[^']*)\[([^\]]+\.(?:xlsx|xls|xlsm|xlsb))\]([^']*)'?\s*!\s*(\$?[A-Z]{1,3}\$?\d{1,7}(?::\$?[A-Z]{1,3}\$?\d{1,7})?)",
-                re.IGNORECASE
-            )
-        ),
-        (
-            'local_quoted',
-            re.compile(
-                r"'([^']+)'!(\$?[A-Z]{1,3}\$?\d{1,7}(?::\$?[A-Z]{1,3}\$?\d{1,7})?)",
-                re.IGNORECASE
-            )
-        ),
-        (
-            'local_unquoted',
-            re.compile(
-                r"([a-zA-Z0-9_\u4e00-\u9fa5][a-zA-Z0-9_\s\.\u4e00-\u9fa5]{0,30})!(\$?[A-Z]{1,3}\$?\d{1,7}(?::\$?[A-Z]{1,3}\$?\d{1,7})?)",
-                re.IGNORECASE
-            )
-        ),
-        (
-            'current_range',
-            re.compile(
-                r"(?<![!'\[\]a-zA-Z0-9_\u4e00-\u9fa5])(\$?[A-Z]{1,3}\$?\d{1,7}:\s*\$?[A-Z]{1,3}\$?\d{1,7})(?![a-zA-Z0-9_])",
-                re.IGNORECASE
-            )
-        ),
-        (
-            'current_single',
-            re.compile(
-                r"(?<![!'\[\]a-zA-Z0-9_\u4e00-\u9fa5])(\$?[A-Z]{1,3}\$?\d{1,7})(?![a-zA-Z0-9_:\(])",
-                re.IGNORECASE
-            )
-        )
-    ]
-
-    all_matches = []
+
     # Normalize backslashes to handle cases with single or double backslashes
     normalized_formula_str = formula_str.replace('\\\\', '\\')
-    for p_type, pattern in patterns:
-        for match in pattern.finditer(normalized_formula_str):
-            all_matches.append({'type': p_type, 'match': match, 'span': match.span()})
-
-    all_matches.sort(key=lambda x: (x['span'][0], x['span'][1] - x['span'][0]))
-
-    for item in all_matches:
-        match = item['match']
-        m_type = item['type']
-        start, end = item['span']
-
-        if is_span_processed(start, end):
-            continue
-
+    # Tokens depend only on the formula text, so the parse is shared by every cell showing it
+    tokens = get_global_parse_cache().get_or_parse(
+        normalized_formula_str, None, None, _parse_cell_and_range_tokens, 'tokens'
+    )
+    for token in tokens:
+        cell_ref = token.address
         try:
-            if m_type == 'external':
-                dir_path, file_name, sheet_name, cell_ref = match.groups()
-                sheet_name = sheet_name.strip("'")
-                
+            if token.workbook is not None:
+                if not token.workbook.lower().endswith(('.xlsx', '.xls', '.xlsm', '.xlsb')):
+                    continue
+                dir_path, file_name, sheet_name = token.directory, token.workbook, token.sheet
+
                 full_file_path = os.path.join(dir_path, file_name)
                 if not dir_path and file_name.lower() == os.path.basename(current_workbook_path).lower():
                     full_file_path = current_workbook_path
-                
+
                 display_ref = f"[{os.path.basename(full_file_path)}]{sheet_name}!{cell_ref.replace('$', '')}"
                 display_ref_with_path = f"{full_file_path}|{display_ref}"
 
-                if ':' in cell_ref:
+                if token.kind == RANGE:
                     value = "(Range Reference)"
                 else:
                     value = read_external_cell_value_func(
@@ -132,16 +85,15 @@ def get_referenced_cell_values(
                 if display_ref_with_path not in referenced_data:
                     referenced_data[display_ref_with_path] = value
 
-            elif m_type in ('local_quoted', 'local_unquoted'):
-                sheet_name, cell_ref = match.groups()
-                sheet_name = sheet_name.strip("'")
-                
+            elif token.sheet is not None:
+                sheet_name = token.sheet
+
                 if sheet_name.lower().endswith(('.xlsx', '.xls', '.xlsm', '.xlsb')):
                     continue
 
                 display_ref = f"{sheet_name}!{cell_ref.replace('$', '')}"
-                
-                if ':' in cell_ref:
+
+                if token.kind == RANGE:
                     value = "(Range Reference)"
                 else:
                     target_sheet = find_matching_sheet_func(sheet_name, current_sheet_com_obj)
@@ -150,26 +102,23 @@ def get_referenced_cell_values(
                         value = f"Local: {cell_val if cell_val is not None else 'Empty'}"
                     else:
                         value = f"Local (Sheet '{sheet_name}' Not Found)"
-                
+
                 if display_ref not in referenced_data:
                     referenced_data[display_ref] = value
 
-            elif m_type in ('current_range', 'current_single'):
-                cell_ref = match.group(1)
+            else:
                 display_ref = f"{current_sheet_com_obj.Name}!{cell_ref.replace('$', '')}"
 
-                if ':' in cell_ref:
+                if token.kind == RANGE:
                     value = "(Range Reference)"
                 else:
                     cell_val = current_sheet_com_obj.Range(cell_ref).Value
                     value = f"Current: {cell_val if cell_val is not None else 'Empty'}"
-                
+
                 if display_ref not in referenced_data:
                     referenced_data[display_ref] = value
-
-            add_processed_span(start, end)
         except Exception as e:
-            print(f"ERROR: Could not process reference from match '{match.group(0)}': {e}")
+            print(f"ERROR: Could not process reference from match '{token.text}': {e}")
 
     return referenced_data
 
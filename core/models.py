@@ -1,8 +1,365 @@
+import re
+from array import array
+from collections.abc import MutableSequence, Sequence
 from dataclasses import dataclass
 
+from openpyxl.utils import get_column_letter
+
 @dataclass
 class FormulaData:
     """一個用來儲存單一儲存格公式資訊的資料類別。"""
     address: str
     formula: str
     value: any = None # 可選的儲存格值
+
+
+# 公式類型以一個 byte 儲存；未知類型會在表格內動態加入
+FORMULA_TYPES = ('formula', 'local link', 'external link', 'unknown')
+
+# 'B12' 或 'Sheet1!B12' / "'My Sheet'!B12"
+_ADDRESS_PATTERN = re.compile(r"^(.*!)?\$?([A-Z]{1,3})\$?(\d+)$")
+
+_COLUMN_LETTERS = {}
+_COLUMN_NUMBERS = {}
+
+
+def _column_letters(col):
+    letters = _COLUMN_LETTERS.get(col)
+    if letters is None:
+        letters = _COLUMN_LETTERS[col] = get_column_letter(col)
+    return letters
+
+
+class FormulaRow(Sequence):
+    """
+    FormulaTable 中一列的唯讀檢視（不複製資料）。
+
+    Behaves like the 5-tuple (formula_type, address, formula, display_value,
+    cell_text) it replaces: it can be indexed, unpacked and compared to tuples.
+    """
+
+    __slots__ = ('_table', 'index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self.index = index
+
+    def __len__(self):
+        return 5
+
+    def __getitem__(self, field):
+        if isinstance(field, slice):
+            return tuple(self)[field]
+        if field < 0:
+            field += 5
+        return self._table.field(self.index, field)
+
+    def __iter__(self):
+        table, index = self._table, self.index
+        yield table.type_of(index)
+        yield table.address_of(index)
+        strings = table._strings
+        yield strings[table._formulas[index]]
+        yield strings[table._results[index]]
+        yield strings[table._texts[index]]
+
+    def __eq__(self, other):
+        if isinstance(other, (tuple, list, FormulaRow)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return f"FormulaRow{tuple(self)!r}"
+
+
+class FormulaTable(MutableSequence):
+    """
+    以欄為單位儲存的公式列表，用來取代 5-tuple 的 list。
+
+    - address: sheet prefix id + row/column ints in array('I')
+    - formula / display_value / cell_text: ids into one interning table, so
+      repeated strings (and display_value == cell_text) are stored once
+    - formula_type: one byte per row
+    - interned strings get a lowercased copy (built once, on the first search)
+      so filtering never lowercases per keystroke
+
+    Indexing returns FormulaRow views, so code written for lists of tuples
+    keeps working unchanged.
+    """
+
+    def __init__(self, rows=None):
+        self._types = bytearray()
+        self._prefixes = array('I')
+        self._rows = array('I')
+        self._cols = array('I')
+        self._formulas = array('I')
+        self._results = array('I')
+        self._texts = array('I')
+        self._type_names = list(FORMULA_TYPES)
+        self._type_codes = {name: code for code, name in enumerate(self._type_names)}
+        self._strings = ['']
+        self._lower = ['']
+        self._string_ids = {'': 0}
+        self._address_index = None
+        if rows is not None:
+            self.extend(rows)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a table from an iterable of 5-tuples (or FormulaRow views)."""
+        return cls(rows)
+
+    # --- interning ---
+
+    def _intern(self, value):
+        if value.__class__ is not str:
+            value = str(value)
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return string_id
+
+    def _lowered(self):
+        """Pre-lowercased copy of the interning table, extended for strings added since the last search."""
+        lower = self._lower
+        if len(lower) < len(self._strings):
+            lower.extend(value.lower() for value in self._strings[len(lower):])
+        return lower
+
+    def _type_code(self, formula_type):
+        code = self._type_codes.get(formula_type)
+        if code is None:
+            code = self._type_codes[formula_type] = len(self._type_names)
+            self._type_names.append(formula_type)
+        return code
+
+    def _encode(self, row):
+        formula_type, address, formula, result, text = row
+        match = _ADDRESS_PATTERN.match(address)
+        if match:
+            prefix, letters, row_number = match.groups()
+            prefix_id = self._intern(prefix) if prefix else 0
+            row_number = int(row_number)
+            col_number = _COLUMN_NUMBERS.get(letters)
+            if col_number is None:
+                col_number = 0
+                for char in letters:
+                    col_number = col_number * 26 + (ord(char) - 64)
+                _COLUMN_NUMBERS[letters] = col_number
+        else:
+            # Not a plain cell address (e.g. 'ERROR_ADDR'): keep it verbatim
+            prefix_id, row_number, col_number = self._intern(address), 0, 0
+        type_code = self._type_codes.get(formula_type)
+        if type_code is None:
+            type_code = self._type_code(formula_type)
+        # Inline dictionary hits; only new strings go through _intern
+        string_ids = self._string_ids
+        formula_id = string_ids.get(formula)
+        if formula_id is None:
+            formula_id = self._intern(formula)
+        result_id = string_ids.get(result)
+        if result_id is None:
+            result_id = self._intern(result)
+        text_id = string_ids.get(text)
+        if text_id is None:
+            text_id = self._intern(text)
+        return (type_code, prefix_id, row_number, col_number, formula_id, result_id, text_id)
+
+    # --- field access ---
+
+    def type_of(self, index):
+        return self._type_names[self._types[index]]
+
+    def address_of(self, index):
+        prefix = self._strings[self._prefixes[index]]
+        row_number = self._rows[index]
+        if not row_number:
+            return prefix
+        return f"{prefix}{_column_letters(self._cols[index])}{row_number}"
+
+    def row_col(self, index):
+        """Return (row, column) ints of a row's cell; (0, 0) if it has no plain address."""
+        return self._rows[index], self._cols[index]
+
+    def field(self, index, field):
+        if field == 0:
+            return self.type_of(index)
+        if field == 1:
+            return self.address_of(index)
+        if field == 2:
+            return self._strings[self._formulas[index]]
+        if field == 3:
+            return self._strings[self._results[index]]
+        if field == 4:
+            return self._strings[self._texts[index]]
+        raise IndexError("FormulaRow index out of range")
+
+    def index_of(self, address):
+        """Row index of an address, or None; the lookup table is built on first use."""
+        if self._address_index is None:
+            self._address_index = {self.address_of(i): i for i in range(len(self))}
+        return self._address_index.get(address)
+
+    # --- sequence protocol ---
+
+    def __len__(self):
+        return len(self._types)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [FormulaRow(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("FormulaTable index out of range")
+        return FormulaRow(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield FormulaRow(self, index)
+
+    def _columns(self):
+        return (self._types, self._prefixes, self._rows, self._cols, self._formulas, self._results, self._texts)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            rows = [tuple(row) for row in self]
+            rows[index] = [tuple(row) for row in value]
+            self.clear()
+            self.extend(rows)
+            return
+        if index < 0:
+            index += len(self)
+        encoded = self._encode(tuple(value))
+        for column, item in zip(self._columns(), encoded):
+            column[index] = item
+        self._address_index = None
+
+    def replace_rows(self, start, stop, rows):
+        """
+        Replace the rows in [start, stop) with new rows
+
+        Only the new rows are encoded and the interning table is kept, so
+        patching a few blocks costs the size of the patch; slice assignment
+        instead rebuilds the whole table.
+        """
+        encoded = [self._encode(tuple(row)) for row in rows]
+        columns = list(zip(*encoded)) if encoded else [()] * 7
+        for column, values in zip(self._columns(), columns):
+            if isinstance(column, bytearray):
+                column[start:stop] = bytes(values)
+            else:
+                column[start:stop] = array(column.typecode, values)
+        self._address_index = None
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            rows = [tuple(row) for row in self]
+            del rows[index]
+            self.clear()
+            self.extend(rows)
+            return
+        if index < 0:
+            index += len(self)
+        for column in self._columns():
+            del column[index]
+        self._address_index = None
+
+    def insert(self, index, value):
+        encoded = self._encode(tuple(value))
+        for column, item in zip(self._columns(), encoded):
+            column.insert(index, item)
+        self._address_index = None
+
+    def append(self, value):
+        self.extend((value,))
+
+    def extend(self, values):
+        if isinstance(values, FormulaTable):
+            values = [tuple(row) for row in values]
+        # Hot path of every scan: bound methods hoisted out of the loop
+        encode = self._encode
+        types_append, prefixes_append = self._types.append, self._prefixes.append
+        rows_append, cols_append = self._rows.append, self._cols.append
+        formulas_append, results_append, texts_append = self._formulas.append, self._results.append, self._texts.append
+        for value in values:
+            type_code, prefix_id, row_number, col_number, formula_id, result_id, text_id = encode(value)
+            types_append(type_code)
+            prefixes_append(prefix_id)
+            rows_append(row_number)
+            cols_append(col_number)
+            formulas_append(formula_id)
+            results_append(result_id)
+            texts_append(text_id)
+        self._address_index = None
+
+    def clear(self):
+        for column in self._columns():
+            del column[:]
+        self._strings[1:] = []
+        self._lower[1:] = []
+        self._string_ids = {'': 0}
+        self._address_index = None
+
+    def copy(self):
+        return FormulaTable(tuple(row) for row in self)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_address_index'] = None
+        return state
+
+    # --- filtering ---
+
+    def search(self, type_flags=None, formula='', result='', display_value=''):
+        """
+        Indexes of rows whose type is enabled and whose text columns contain
+        the given lowercase substrings. Each distinct string is tested once.
+
+        Args:
+            type_flags (dict): formula_type -> bool; missing types are allowed
+            formula, result, display_value (str): Lowercase substrings, '' to skip
+
+        Returns:
+            list: Matching row indexes, in table order
+        """
+        type_flags = type_flags or {}
+        allowed = bytes(1 if type_flags.get(name, True) else 0 for name in self._type_names)
+        lower = self._lowered()
+        checks = [(column, needle, {}) for column, needle in
+                  ((self._formulas, formula), (self._results, result), (self._texts, display_value)) if needle]
+        types = self._types
+        matches = []
+        for index in range(len(types)):
+            if not allowed[types[index]]:
+                continue
+            for column, needle, memo in checks:
+                string_id = column[index]
+                found = memo.get(string_id)
+                if found is None:
+                    found = memo[string_id] = needle in lower[string_id]
+                if not found:
+                    break
+            else:
+                matches.append(index)
+        return matches
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    rows = [('formula', f"B{i}", f"=A{i}*2", str(i % 100), str(i % 100)) for i in range(1, 500001)]
+    start = time.time()
+    table = FormulaTable.from_rows(rows)
+    print(f"Built {len(table)} rows in {time.time() - start:.2f}s")
+    column_bytes = sum(sys.getsizeof(column) for column in table._columns())
+    print(f"Columns: {column_bytes / 1e6:.1f} MB, {len(table._strings)} distinct strings")
+    start = time.time()
+    hits = table.search(formula="a4999")
+    print(f"search: {len(hits)} hits in {time.time() - start:.3f}s; first {table[hits[0]]}")
+    assert list(table[10]) == list(rows[10]) and table[10] == rows[10]
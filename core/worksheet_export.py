@@ -13,6 +13,7 @@ from openpyxl.utils import get_column_letter
 import re
 from core.excel_connector import activate_excel_window
 from core.excel_scanner import refresh_data
+from core.data_processor import get_visible_rows
 import time
 
 def export_formulas_to_excel(controller):
@@ -37,8 +38,7 @@ def export_formulas_to_excel(controller):
     sheet.column_dimensions[get_column_letter(2)].number_format = '@'
     address_idx = controller.view.tree_columns.index("address")
     formula_idx = controller.view.tree_columns.index("formula")
-    for i, item_id in enumerate(controller.view.result_tree.get_children()):
-        values = controller.view.result_tree.item(item_id, "values")
+    for i, values in enumerate(get_visible_rows(controller)):
         if len(values) > max(address_idx, formula_idx):
             sheet.cell(row=i + 2, column=1, value=values[address_idx])
             sheet.cell(row=i + 2, column=2, value="'" + values[formula_idx])
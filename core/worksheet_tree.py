@@ -9,6 +9,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import os
 import re
+import bisect
 import win32com.client
 import win32gui
 import win32con
@@ -21,82 +22,158 @@ from core.graph_generator import GraphGenerator
 from core.link_analyzer import get_referenced_cell_values
 from utils.excel_io import find_matching_sheet, read_external_cell_value
 from utils.range_optimizer import parse_excel_address
+from utils.spatial_index import RectangleIndex, cell_position
+from core.xlsx_stream_scanner import split_qualified_address
+from core.models import FormulaTable
+from core.formula_regions import group_formula_regions
 from core.excel_connector import activate_excel_window, find_external_workbook_path
-from openpyxl.utils import get_column_letter, column_index_from_string
+from openpyxl.utils import get_column_letter
 
 
 _last_range_threshold = 5
 _last_max_depth = 10
 
-def apply_filter(controller, event=None):
-    controller.view.result_tree.delete(*controller.view.result_tree.get_children())
-    controller.cell_addresses.clear()
+def _parse_filters(controller):
+    """Read the filter widgets; returns (signature, address_filters, other_filters) or None if the address filter is invalid."""
     address_filter_str = controller.view.filter_entries['address'].get().strip()
-    parsed_address_filters = []
+    # Cells, ranges, whole rows and whole columns of the filter as one rectangle index
+    parsed_address_filters = RectangleIndex()
     if address_filter_str and address_filter_str != controller.placeholder_text:
         address_tokens = [token.strip() for token in address_filter_str.split(',') if token.strip()]
         if address_tokens:
             try:
                 for token in address_tokens:
-                    parsed_address_filters.append(parse_excel_address(token))
+                    _, normalized = parse_excel_address(token)
+                    parsed_address_filters.add_address(normalized)
             except Exception as e:
                 messagebox.showerror("Invalid Excel Address", str(e))
-                return
+                return None
     other_filters = {
         'type': (controller.show_formula.get(), controller.show_local_link.get(), controller.show_external_link.get()),
         'formula': controller.view.filter_entries['formula'].get().lower(),
         'result': controller.view.filter_entries['result'].get().lower(),
         'display_value': controller.view.filter_entries['display_value'].get().lower()
     }
-    filtered_formulas = []
-    for formula_data in controller.all_formulas:
-        if len(formula_data) < 5: continue
-        formula_type, address, formula_content, result_val, display_val = formula_data
-        type_map = {'formula': other_filters['type'][0], 'local link': other_filters['type'][1], 'external link': other_filters['type'][2]}
-        if not type_map.get(formula_type, True): continue
-        if other_filters['formula'] and other_filters['formula'] not in str(formula_content).lower(): continue
-        if other_filters['result'] and other_filters['result'] not in str(result_val).lower(): continue
-        if other_filters['display_value'] and other_filters['display_value'] not in str(display_val).lower(): continue
+    signature = (address_filter_str, other_filters['type'], other_filters['formula'],
+                 other_filters['result'], other_filters['display_value'])
+    return signature, parsed_address_filters, other_filters
+
+def _row_matches_filters(formula_data, parsed_address_filters, other_filters):
+    if len(formula_data) < 5: return False
+    formula_type, address, formula_content, result_val, display_val = formula_data
+    type_map = {'formula': other_filters['type'][0], 'local link': other_filters['type'][1], 'external link': other_filters['type'][2]}
+    if not type_map.get(formula_type, True): return False
+    if other_filters['formula'] and other_filters['formula'] not in str(formula_content).lower(): return False
+    if other_filters['result'] and other_filters['result'] not in str(result_val).lower(): return False
+    if other_filters['display_value'] and other_filters['display_value'] not in str(display_val).lower(): return False
+    if parsed_address_filters and not _address_matches_filters(address, parsed_address_filters): return False
+    return True
+
+def _address_matches_filters(address, parsed_address_filters):
+    # Whole-workbook scans qualify addresses with the sheet ('Sheet1!A1')
+    position = cell_position(address)
+    if position is None: return False
+    return parsed_address_filters.contains_point(*position)
+
+def _apply_filter_to_rows(controller, changed_addresses, parsed_address_filters, other_filters):
+    """
+    Update only the tree items of changed addresses after an incremental rescan.
+
+    Items of changed addresses are removed, and the new rows for those
+    addresses are inserted where they fall in controller.all_formulas order.
+    """
+    tree = controller.view.result_tree
+    order = {row[1]: index for index, row in enumerate(controller.all_formulas) if len(row) >= 5}
+    kept_positions = []
+    removed_items = []
+    first_touched = None
+    for position, item_id in enumerate(tree.get_children()):
+        address = controller.cell_addresses.get(item_id)
+        if address in changed_addresses:
+            removed_items.append(item_id)
+            controller.cell_addresses.pop(item_id, None)
+            if first_touched is None:
+                first_touched = len(kept_positions)
+        else:
+            kept_positions.append(order.get(address, len(order)))
+    if removed_items:
+        tree.delete(*removed_items)
+
+    address_index = controller.view.tree_columns.index("address")
+    for data in controller.all_formulas:
+        if len(data) < 5 or data[1] not in changed_addresses:
+            continue
+        if not _row_matches_filters(data, parsed_address_filters, other_filters):
+            continue
+        row_order = order[data[1]]
+        position = bisect.bisect(kept_positions, row_order)
+        kept_positions.insert(position, row_order)
+        item_id = tree.insert("", position, values=tuple(data))
+        if address_index < len(data):
+            controller.cell_addresses[item_id] = data[address_index]
+        if first_touched is None or position < first_touched:
+            first_touched = position
+
+    children = tree.get_children()
+    if first_touched is not None:
+        for i in range(first_touched, len(children)):
+            tree.item(children[i], tags=("evenrow" if i % 2 == 0 else "oddrow",))
+    controller.view.formula_list_label.config(text=f"Formula List ({len(children)} records):")
+
+def apply_filter(controller, event=None, changed_addresses=None):
+    parsed_filters = _parse_filters(controller)
+    if parsed_filters is None:
+        return
+    signature, parsed_address_filters, other_filters = parsed_filters
+    # An incremental rescan only touches its own rows, as long as the tree was built with the same filters and order
+    group_regions = controller.group_regions.get()
+    if (changed_addresses is not None and not controller.current_sort_column and not group_regions
+            and getattr(controller, '_filter_signature', None) == signature):
+        _apply_filter_to_rows(controller, changed_addresses, parsed_address_filters, other_filters)
+        return
+    controller.view.result_tree.delete(*controller.view.result_tree.get_children())
+    controller.cell_addresses.clear()
+    controller.cell_regions.clear()
+    if isinstance(controller.all_formulas, FormulaTable):
+        # Columnar table: text filters run on pre-lowercased, de-duplicated strings
+        table = controller.all_formulas
+        type_flags = {'formula': other_filters['type'][0], 'local link': other_filters['type'][1], 'external link': other_filters['type'][2]}
+        filtered_formulas = [table[i] for i in table.search(type_flags, other_filters['formula'], other_filters['result'], other_filters['display_value'])]
         if parsed_address_filters:
-            addr_upper = address.replace("$", "").upper()
-            current_cell_match = re.match(r"([A-Z]+)([0-9]+)", addr_upper)
-            if not current_cell_match: continue
-            cell_col_str, cell_row_str = current_cell_match.groups()
-            cell_col_idx = column_index_from_string(cell_col_str)
-            cell_row_idx = int(cell_row_str)
-            is_match = False
-            for f_type, f_val in parsed_address_filters:
-                if f_type == 'cell' and addr_upper == f_val:
-                    is_match = True; break
-                elif f_type == 'row_range':
-                    start_r, end_r = map(int, f_val.split(':'))
-                    if start_r <= cell_row_idx <= end_r:
-                        is_match = True; break
-                elif f_type == 'col_range':
-                    start_c, end_c = f_val.split(':')
-                    if column_index_from_string(start_c) <= cell_col_idx <= column_index_from_string(end_c):
-                        is_match = True; break
-                elif f_type == 'range':
-                    start_cell, end_cell = f_val.split(':')
-                    sc_str, sr_str = re.match(r"([A-Z]+)([0-9]+)", start_cell).groups()
-                    ec_str, er_str = re.match(r"([A-Z]+)([0-9]+)", end_cell).groups()
-                    if (column_index_from_string(sc_str) <= cell_col_idx <= column_index_from_string(ec_str) and
-                        int(sr_str) <= cell_row_idx <= int(er_str)):
-                        is_match = True; break
-            if not is_match: continue
-        filtered_formulas.append(formula_data)
+            filtered_formulas = [row for row in filtered_formulas if _address_matches_filters(row[1], parsed_address_filters)]
+    else:
+        filtered_formulas = []
+        for formula_data in controller.all_formulas:
+            if not _row_matches_filters(formula_data, parsed_address_filters, other_filters): continue
+            filtered_formulas.append(formula_data)
+    regions = None
+    if group_regions:
+        # One row per block of copied formulas; its first cell stands in for parsing and explosion
+        regions = group_formula_regions(filtered_formulas)
     if controller.current_sort_column:
         col_index = controller.view.tree_columns.index(controller.current_sort_column)
         sort_dir = controller.sort_directions[controller.current_sort_column]
-        filtered_formulas.sort(key=lambda x: str(x[col_index]), reverse=(sort_dir == -1))
+        if regions is not None:
+            regions.sort(key=lambda region: str(region.as_row()[col_index]), reverse=(sort_dir == -1))
+        else:
+            filtered_formulas.sort(key=lambda x: str(x[col_index]), reverse=(sort_dir == -1))
+    if regions is not None:
+        filtered_formulas = [region.as_row() for region in regions]
     count = len(filtered_formulas)
-    controller.view.formula_list_label.config(text=f"Formula List ({count} records):")
+    if regions is not None:
+        controller.view.formula_list_label.config(text=f"Formula List ({count} regions, {sum(len(region) for region in regions)} cells):")
+    else:
+        controller.view.formula_list_label.config(text=f"Formula List ({count} records):")
     for i, data in enumerate(filtered_formulas):
         tag = "evenrow" if i % 2 == 0 else "oddrow"
-        item_id = controller.view.result_tree.insert("", "end", values=data, tags=(tag,))
+        item_id = controller.view.result_tree.insert("", "end", values=tuple(data), tags=(tag,))
         address_index = controller.view.tree_columns.index("address")
-        if address_index < len(data):
+        if regions is not None:
+            controller.cell_regions[item_id] = regions[i]
+            controller.cell_addresses[item_id] = regions[i].representative_address
+        elif address_index < len(data):
             controller.cell_addresses[item_id] = data[address_index]
+    controller._filter_signature = signature
 
 def sort_column(controller, col_id):
     controller.current_sort_column = col_id
@@ -464,6 +541,17 @@ def on_select(controller, event):
                     else:
                         from tkinter import messagebox
                         messagebox.showwarning("No Selection", "Please select a cell first.")
+                elif getattr(controller, 'last_workbook_path', None):
+                    # Offline scan: no COM workbook, but the file is known and the sheet is
+                    # either the scanned one or part of the address (whole-workbook scan)
+                    selected_item = controller.view.result_tree.selection()
+                    if selected_item:
+                        current_cell_address = controller.cell_addresses.get(selected_item[0], "A1")
+                        current_sheet_name = controller.last_worksheet_name
+                        address_sheet, current_cell_address = split_qualified_address(current_cell_address)
+                        if address_sheet:
+                            current_sheet_name = address_sheet
+                        explode_dependencies_popup(controller, controller.last_workbook_path, current_sheet_name, current_cell_address, f"{current_sheet_name}!{current_cell_address}")
                 else:
                     from tkinter import messagebox
                     messagebox.showerror("Excel Not Connected", "Excel connection not available for dependency analysis.")
@@ -1257,7 +1345,7 @@ def explode_dependencies_popup(controller, workbook_path, sheet_name, cell_addre
     彈出視窗顯示公式依賴關係爆炸圖 - 增強版包含進度顯示和日誌累積
     """
     try:
-        from utils.progress_enhanced_exploder import explode_cell_dependencies_with_progress, ProgressCallback
+        from utils.progress_enhanced_exploder import explode_cell_dependencies_with_progress, ProgressCallback, build_dependency_graph_tables, iter_child_edges
         import tkinter as tk
         from tkinter import ttk, messagebox
         
@@ -1300,6 +1388,10 @@ def explode_dependencies_popup(controller, workbook_path, sheet_name, cell_addre
         toggle_log_btn = ttk.Button(button_frame, text="Hide Log", command=lambda: toggle_log_panel())
         toggle_log_btn.pack(side=tk.LEFT, padx=5)
         
+        # 建立整本活頁簿的依賴索引；檔案未修改前，分析直接由索引回答
+        build_index_btn = ttk.Button(button_frame, text="Build Index", command=lambda: build_index())
+        build_index_btn.pack(side=tk.LEFT, padx=5)
+        
         # 中間進度顯示區域 - 可變寬度
         progress_frame = ttk.Frame(control_frame)
         progress_frame.pack(side=tk.LEFT, fill='x', expand=True, padx=10)
@@ -1349,6 +1441,22 @@ def explode_dependencies_popup(controller, workbook_path, sheet_name, cell_addre
         )
         show_full_formula_cb.pack(side=tk.LEFT, padx=5)
         
+        # DAG 模式：重複引用的儲存格只展開一次，所有父節點共用
+        dag_mode_var = tk.BooleanVar(value=getattr(controller, '_saved_dag_mode', False))
+        dag_mode_cb = ttk.Checkbutton(
+            options_control_frame, 
+            text="Share Repeated Cells (DAG)", 
+            variable=dag_mode_var
+        )
+        dag_mode_cb.pack(side=tk.LEFT, padx=5)
+        
+        index_external_var = tk.BooleanVar(value=getattr(controller, '_saved_index_external', False))
+        ttk.Checkbutton(
+            options_control_frame, 
+            text="Index Linked Workbooks", 
+            variable=index_external_var
+        ).pack(side=tk.LEFT, padx=5)
+        
         # Analysis Parameters - 第二行
         params_frame = ttk.Frame(options_frame)
         params_frame.pack(fill='x', pady=(5, 0))
@@ -1389,6 +1497,42 @@ def explode_dependencies_popup(controller, workbook_path, sheet_name, cell_addre
         
         ttk.Label(params_frame, text="levels deep").pack(side=tk.LEFT, padx=2)
         
+        # 分隔符
+        ttk.Separator(params_frame, orient='vertical').pack(side=tk.LEFT, fill='y', padx=10)
+        
+        # Worker 數：大於 1 時使用逐層引擎，多個大型活頁簿且實測較快時平行讀取
+        ttk.Label(params_frame, text="Workers:").pack(side=tk.LEFT, padx=5)
+        max_workers_var = tk.IntVar(value=getattr(controller, '_saved_max_workers', 1))
+        ttk.Spinbox(
+            params_frame, 
+            from_=1, to=16, width=5,
+            textvariable=max_workers_var
+        ).pack(side=tk.LEFT, padx=2)
+        
+        # 分隔符
+        ttk.Separator(params_frame, orient='vertical').pack(side=tk.LEFT, fill='y', padx=10)
+        
+        # 分析引擎：遞歸（逐格讀取）或逐層（每張工作表批次讀取）
+        ttk.Label(params_frame, text="Engine:").pack(side=tk.LEFT, padx=5)
+        engine_labels = {"Recursive": 'recursive', "Iterative (batched by sheet)": 'iterative'}
+        engine_var = tk.StringVar(value=getattr(controller, '_saved_engine', "Recursive"))
+        ttk.Combobox(
+            params_frame, textvariable=engine_var, values=list(engine_labels),
+            state="readonly", width=26
+        ).pack(side=tk.LEFT, padx=2)
+        
+        # 分隔符
+        ttk.Separator(params_frame, orient='vertical').pack(side=tk.LEFT, fill='y', padx=10)
+        
+        # 方向：往上追引用來源，或往下追同資料夾內所有引用此儲存格的公式
+        ttk.Label(params_frame, text="Direction:").pack(side=tk.LEFT, padx=5)
+        direction_labels = {"Precedents": 'precedents', "Dependents (folder)": 'dependents'}
+        direction_var = tk.StringVar(value=getattr(controller, '_saved_direction', "Precedents"))
+        ttk.Combobox(
+            params_frame, textvariable=direction_var, values=list(direction_labels),
+            state="readonly", width=18
+        ).pack(side=tk.LEFT, padx=2)
+        
 
         def update_params_preview():
             """更新參數預覽"""
@@ -1434,8 +1578,12 @@ def explode_dependencies_popup(controller, workbook_path, sheet_name, cell_addre
                 progress_var.set("Generating graph...")
                 popup.update()
                 
-                # 1. 轉換資料
-                nodes_data, edges_data = convert_tree_to_graph_data(refresh_tree_display.tree_data)
+                # 1. 轉換資料（DAG 結果先攤平成節點表 + 邊列表）
+                if getattr(refresh_tree_display, 'dag_mode', False):
+                    graph_input = build_dependency_graph_tables(refresh_tree_display.tree_data)
+                else:
+                    graph_input = refresh_tree_display.tree_data
+                nodes_data, edges_data = convert_tree_to_graph_data(graph_input)
                 
                 if not nodes_data:
                     messagebox.showinfo("Empty Graph", "The analysis result is empty, nothing to graph.")
@@ -1545,6 +1693,35 @@ def explode_dependencies_popup(controller, workbook_path, sheet_name, cell_addre
             progress_bar.stop()
             progress_var.set("Analysis cancelled by user.")
         
+        def build_index():
+            """建立（或重建）目前活頁簿的依賴索引"""
+            from core.dependency_index import build_dependency_index
+            
+            def index_progress(message):
+                progress_var.set(message)
+                popup.update()
+            
+            try:
+                analyze_btn.config(state='disabled')
+                build_index_btn.config(state='disabled')
+                progress_bar.start(10)
+                controller._saved_index_external = index_external_var.get()
+                index = build_dependency_index(
+                    workbook_path, include_external=index_external_var.get(), progress_callback=index_progress
+                )
+                stats = index.get_stats()
+                progress_var.set(
+                    f"Index ready: {stats['formula_cells']} formulas in {stats['workbooks']} workbook(s), "
+                    f"{stats['range_rectangles']} range rectangles. Analyses now answer from the index."
+                )
+            except Exception as e:
+                messagebox.showerror("Index Error", f"Could not build the dependency index:\n{e}")
+                progress_var.set(f"Index build failed: {e}")
+            finally:
+                progress_bar.stop()
+                analyze_btn.config(state='normal')
+                build_index_btn.config(state='normal')
+        
         def start_analysis():
             """開始依賴關係分析 - 增強版包含進度顯示和日誌累積"""
             try:
@@ -1613,13 +1790,31 @@ def explode_dependencies_popup(controller, workbook_path, sheet_name, cell_addre
                 # 保存用戶設定供下次使用
                 controller._saved_range_threshold = range_threshold_var.get()
                 controller._saved_max_depth = max_depth_var.get()
+                controller._saved_dag_mode = dag_mode_var.get()
+                controller._saved_engine = engine_var.get()
+                controller._saved_max_workers = max_workers_var.get()
+                controller._saved_direction = direction_var.get()
+                
+                if direction_labels.get(direction_var.get()) == 'dependents':
+                    run_dependents_analysis(progress_callback)
+                    return
+                
+                # 索引存在且檔案未修改時，由索引回答
+                from core.dependency_index import get_dependency_index
+                dependency_index = get_dependency_index(workbook_path)
+                if dependency_index is not None:
+                    progress_callback.update_progress("使用依賴索引回答（檔案自建立索引後未修改）")
                 
                 # 執行爆炸分析 - 使用用戶設定的參數
                 dependency_tree_data, summary = explode_cell_dependencies_with_progress(
                     workbook_path, sheet_name, cell_address, 
                     max_depth=max_depth_var.get(), 
                     range_expand_threshold=range_threshold_var.get(),
-                    progress_callback=progress_callback
+                    progress_callback=progress_callback,
+                    dag_mode=dag_mode_var.get(),
+                    engine=engine_labels.get(engine_var.get(), 'recursive'),
+                    max_workers=max_workers_var.get(),
+                    dependency_index=dependency_index
                 )
                 
                 # 檢查是否被取消
@@ -1629,6 +1824,7 @@ def explode_dependencies_popup(controller, workbook_path, sheet_name, cell_addre
                 
                 # 儲存樹狀數據供刷新使用
                 refresh_tree_display.tree_data = dependency_tree_data
+                refresh_tree_display.dag_mode = summary.get('dag_mode', False)
                 
                 # 填充樹狀視圖
                 progress_var.set("Populating tree view...")
@@ -1653,6 +1849,53 @@ def explode_dependencies_popup(controller, workbook_path, sheet_name, cell_addre
                 cancel_btn.config(state='disabled')
                 progress_bar.stop()
         
+        def run_dependents_analysis(progress_callback):
+            """往下追蹤：同資料夾內直接或間接引用此儲存格的公式，每找到一層就加入樹狀視圖"""
+            from core.dependents_exploder import get_folder_index, iter_dependent_levels, summarize_dependents
+            from utils.openpyxl_resolver import read_cell_with_resolved_references
+            
+            index = get_folder_index(workbook_path, progress_callback.update_progress)
+            stats = index.get_stats()
+            progress_callback.update_progress(
+                f"資料夾索引：{stats['workbooks']} 個活頁簿，{stats['formula_cells']} 個公式"
+            )
+            
+            # 數值儲存格不在索引中，根節點的值直接讀取
+            root_value = None
+            try:
+                root_info = read_cell_with_resolved_references(workbook_path, sheet_name, cell_address.replace('$', ''))
+                root_value = root_info.get('display_value')
+            except Exception as e:
+                print(f"Could not read root value: {e}")
+            
+            # 每個節點只插入一次；已在別處列出的引用只計數，找到下一層後補在上一層節點的文字上
+            node_items = {}
+            previous_level = []
+            root = None
+            for depth, links in iter_dependent_levels(
+                    index, workbook_path, sheet_name, cell_address,
+                    max_depth=max_depth_var.get(), root_value=root_value):
+                for parent, child in links:
+                    parent_item = node_items[id(parent)] if parent is not None else ''
+                    node_items[id(child)] = populate_tree(child, parent_item, recurse=False)
+                for node in previous_level:
+                    if node.get('repeat_dependents') and node_items.get(id(node)):
+                        item_id = node_items[id(node)]
+                        dependency_tree.item(item_id, text=dependency_tree.item(item_id, 'text') + repeat_dependents_text(node))
+                previous_level = [child for _, child in links]
+                if depth == 0:
+                    root = links[0][1]
+                progress_callback.update_progress(f"第 {depth} 層：{len(links)} 個新儲存格")
+            
+            summary = summarize_dependents(root, index)
+            refresh_tree_display.tree_data = root
+            refresh_tree_display.dag_mode = False
+            show_summary(summary)
+            progress_var.set(
+                f"Dependents complete! Found {summary['total_nodes']} nodes in "
+                f"{summary['workbooks_touched']} workbook(s), max depth: {summary['max_depth']}"
+            )
+        
         def format_formula_display(formula):
             """根據顯示選項格式化公式"""
             if not formula:
@@ -1688,8 +1931,18 @@ def explode_dependencies_popup(controller, workbook_path, sheet_name, cell_addre
                 return node.get('full_address', address)
         
 
-        def populate_tree(node, parent=''):
-            """遞歸填充樹狀視圖"""
+        def repeat_dependents_text(node):
+            """往下追蹤時，已在別處列出的引用數"""
+            count = node.get('repeat_dependents')
+            return f" (+{count} shown elsewhere)" if count else ""
+
+        def populate_tree(node, parent='', shown_nodes=None, recurse=True, edge_flags=None):
+            """遞歸填充樹狀視圖；DAG 模式下共享節點的子樹只展開一次。edge_flags 為父節點指向它的邊標記。回傳插入的項目 ID"""
+            item_id = None
+            if shown_nodes is None:
+                shown_nodes = set()
+            is_repeat = id(node) in shown_nodes
+            shown_nodes.add(id(node))
             try:
                 # 準備顯示數據
                 raw_address = node.get('address', 'Unknown')
@@ -1731,10 +1984,21 @@ def explode_dependencies_popup(controller, workbook_path, sheet_name, cell_addre
                 else:
                     icon = "📄"
                 
+                # 共享節點第二次出現時只列出本身，標示子樹已在上方展開
+                display_text = f"{icon} {address}"
+                flags = edge_flags if edge_flags is not None else node
+                if flags.get('region_multiplicity'):
+                    display_text += f" x{flags['region_multiplicity']} [{flags.get('region_address', '')}]"
+                if is_repeat and node.get('children'):
+                    display_text += " (shared, expanded above)"
+                # 逐層插入（recurse=False）時數量還沒算完，由往下追蹤的流程在下一層找到後補上
+                if recurse:
+                    display_text += repeat_dependents_text(node)
+                
                 # 插入節點 - 包含resolved列
                 item_id = dependency_tree.insert(
                     parent, 'end',
-                    text=f"{icon} {address}",
+                    text=display_text,
                     values=(formula, resolved_formula, value, node_type, depth)
                 )
                 
@@ -1765,24 +2029,40 @@ def explode_dependencies_popup(controller, workbook_path, sheet_name, cell_addre
                     dependency_tree.item(item_id, tags=(basic_info,))
                 
                 # 遞歸添加子節點
-                for child in node.get('children', []):
-                    populate_tree(child, item_id)
+                if recurse and not is_repeat:
+                    for child, child_flags in iter_child_edges(node):
+                        populate_tree(child, item_id, shown_nodes, edge_flags=child_flags)
                 
                 # 展開前幾層
-                if depth < 3:
+                if depth < 3 and not is_repeat:
                     dependency_tree.item(item_id, open=True)
                     
             except Exception as e:
                 print(f"Error populating tree node: {e}")
+            return item_id
         
         def show_summary(summary):
             """顯示分析摘要"""
             summary_text.delete(1.0, tk.END)
             
+            cycle_scope_text = {
+                'workbook': " (whole workbook)",
+                'folder': " (all workbooks in folder)",
+                'explored': " (explored cells only)"
+            }.get(summary.get('cycle_scope'), "")
             summary_content = f"""Total Nodes: {summary['total_nodes']}
 Maximum Depth: {summary['max_depth']}
-Circular References: {summary['circular_references']}
-
+Circular References: {summary['circular_references']}{cycle_scope_text}
+"""
+            if summary.get('dag_mode'):
+                summary_content += f"Shared Cell Reuses (DAG): {summary.get('shared_node_hits', 0)}\n"
+            if summary.get('repeat_links'):
+                summary_content += f"Repeat Dependents (counted, not listed): {summary['repeat_links']}\n"
+            if summary.get('index_nodes'):
+                summary_content += f"Answered From Index: {summary['index_nodes']} nodes\n"
+            if summary.get('region_cells_compressed'):
+                summary_content += f"Range Cells Covered By Region Representatives: {summary['region_cells_compressed']}\n"
+            summary_content += """
 Node Type Distribution:
 """
             for node_type, count in summary['type_distribution'].items():
@@ -0,0 +1,582 @@
+# -*- coding: utf-8 -*-
+"""
+XLSX Stream Scanner Module
+
+This module scans formulas straight out of an .xlsx/.xlsm package without
+Excel. Each worksheet part (xl/worksheets/sheetN.xml) is streamed through an
+incremental XML parser and discarded row by row, so memory stays constant
+regardless of sheet size.
+
+Rows have the same shape as the COM scanner's:
+(formula_type, address, formula, display_value, cell_text)
+"""
+
+import os
+import re
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.parse import unquote
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.datetime import from_excel
+
+from core.formula_classifier import classify_formula_type
+from core.formula_area_reader import EXCEL_ERROR_TEXT, QUICK_SCAN_TEXT, local_cell_text
+from core.models import FormulaTable
+from utils.shared_formula import SharedFormulaBlock, parse_cell_address
+
+SHEET_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_CELL_TAG = f"{{{SHEET_NS}}}c"
+_ROW_TAG = f"{{{SHEET_NS}}}row"
+_FORMULA_TAG = f"{{{SHEET_NS}}}f"
+_VALUE_TAG = f"{{{SHEET_NS}}}v"
+_SHEET_DATA_TAG = f"{{{SHEET_NS}}}sheetData"
+
+_ERROR_CODES = {text: code for code, text in EXCEL_ERROR_TEXT.items()}
+_CELL_REF_PATTERN = re.compile(r"([A-Z]+)(\d+)")
+_EXTERNAL_INDEX_PATTERN = re.compile(r"'?\[(\d+)\]([^'!\[\]]*)'?!")
+_PLAIN_SHEET_NAME_PATTERN = re.compile(r"[A-Za-z_][\w.]*")
+_CELL_LIKE_NAME_PATTERN = re.compile(r"[A-Za-z]{1,3}[1-9]\d*|[Rr]\d*[Cc]\d*")
+
+
+def _read_xml(zf, part_name):
+    """Parse a small package part (workbook, rels, styles) in one go."""
+    with zf.open(part_name) as part:
+        return ET.parse(part).getroot()
+
+
+def _read_rels(zf, part_name):
+    """
+    Read the relationships of a package part.
+
+    Returns:
+        dict: Relationship id -> (target, target_mode)
+    """
+    folder, base = posixpath.split(part_name)
+    rels_name = posixpath.join(folder, "_rels", base + ".rels")
+    if rels_name not in zf.namelist():
+        return {}
+    rels = {}
+    for rel in _read_xml(zf, rels_name).iter(f"{{{PKG_REL_NS}}}Relationship"):
+        rels[rel.get("Id")] = (rel.get("Target"), rel.get("TargetMode"))
+    return rels
+
+
+def _resolve_part_target(source_part, target):
+    """Resolve a relationship target relative to its source part."""
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+
+def get_sheet_parts(zf):
+    """
+    Map worksheet names to their XML part names, in workbook order.
+
+    Args:
+        zf (zipfile.ZipFile): Open xlsx package
+
+    Returns:
+        dict: Sheet name -> part name (e.g. 'xl/worksheets/sheet1.xml')
+    """
+    workbook_part = "xl/workbook.xml"
+    rels = _read_rels(zf, workbook_part)
+    sheet_parts = {}
+    for sheet in _read_xml(zf, workbook_part).iter(f"{{{SHEET_NS}}}sheet"):
+        rel_id = sheet.get(f"{{{REL_NS}}}id")
+        if rel_id in rels:
+            sheet_parts[sheet.get("name")] = _resolve_part_target(workbook_part, rels[rel_id][0])
+    return sheet_parts
+
+
+def get_sheet_names(workbook_path):
+    """
+    List worksheet names of an xlsx/xlsm file without loading it.
+
+    Args:
+        workbook_path (str): Path to the workbook
+
+    Returns:
+        list: Worksheet names in workbook order
+    """
+    with zipfile.ZipFile(workbook_path) as zf:
+        return list(get_sheet_parts(zf).keys())
+
+
+def _external_target_to_path(target, workbook_path):
+    """Turn an externalLink relationship target into a Windows-style full path."""
+    target = unquote(target)
+    if target.startswith("file:///"):
+        target = target[len("file:///"):]
+    elif target.startswith("file:"):
+        target = target[len("file:"):]
+    if not re.match(r"^(?:[a-zA-Z]:|[\\/]{2})", target):
+        target = os.path.join(os.path.dirname(os.path.abspath(workbook_path)), target)
+    return os.path.normpath(target).replace("/", "\\")
+
+
+def get_external_link_prefixes(zf, workbook_path):
+    """
+    Map external link indexes ([1], [2], ...) to Excel-style path prefixes.
+
+    Formulas in the package store external references as [1]Sheet1!A1; COM
+    reports them as 'C:\\dir\\[book.xlsx]Sheet1'!A1. The returned prefixes
+    are (directory, file name) pairs used to rebuild that form.
+
+    Returns:
+        dict: Index string -> (directory, file_name)
+    """
+    workbook_part = "xl/workbook.xml"
+    workbook_rels = _read_rels(zf, workbook_part)
+    prefixes = {}
+    external_refs = list(_read_xml(zf, workbook_part).iter(f"{{{SHEET_NS}}}externalReference"))
+    for index, external_ref in enumerate(external_refs, 1):
+        rel_id = external_ref.get(f"{{{REL_NS}}}id")
+        if rel_id not in workbook_rels:
+            continue
+        link_part = _resolve_part_target(workbook_part, workbook_rels[rel_id][0])
+        for target, _mode in _read_rels(zf, link_part).values():
+            full_path = _external_target_to_path(target, workbook_path)
+            directory, file_name = full_path.rsplit("\\", 1) if "\\" in full_path else ("", full_path)
+            prefixes[str(index)] = (directory, file_name)
+            break
+    return prefixes
+
+
+def resolve_external_indexes(formula, external_prefixes):
+    """
+    Rewrite [n]Sheet! references into the full-path form COM reports.
+
+    Args:
+        formula (str): Formula text as stored in the package
+        external_prefixes (dict): Output of get_external_link_prefixes
+
+    Returns:
+        str: Formula with external workbook indexes replaced
+    """
+    if not external_prefixes or "[" not in formula:
+        return formula
+
+    def replace_index(match):
+        prefix = external_prefixes.get(match.group(1))
+        if prefix is None:
+            return match.group(0)
+        directory, file_name = prefix
+        sheet_name = match.group(2)
+        path_part = f"{directory}\\[{file_name}]" if directory else f"[{file_name}]"
+        if sheet_name:
+            return f"'{path_part}{sheet_name}'!"
+        # Workbook-level defined name: 'C:\dir\book.xlsx'!Name
+        return f"'{directory}\\{file_name}'!" if directory else f"'{file_name}'!"
+
+    return _EXTERNAL_INDEX_PATTERN.sub(replace_index, formula)
+
+
+def get_date_style_flags(zf):
+    """
+    Work out which cell style indexes (the s attribute) carry date formats.
+
+    Returns:
+        list: Boolean per cellXfs entry, True when the style is a date/time
+    """
+    styles_part = "xl/styles.xml"
+    if styles_part not in zf.namelist():
+        return []
+    root = _read_xml(zf, styles_part)
+    custom_formats = {}
+    for num_fmt in root.iter(f"{{{SHEET_NS}}}numFmt"):
+        custom_formats[int(num_fmt.get("numFmtId"))] = num_fmt.get("formatCode", "")
+    flags = []
+    cell_xfs = root.find(f"{{{SHEET_NS}}}cellXfs")
+    if cell_xfs is None:
+        return flags
+    for xf in cell_xfs.iter(f"{{{SHEET_NS}}}xf"):
+        num_fmt_id = int(xf.get("numFmtId", 0))
+        format_code = custom_formats.get(num_fmt_id, BUILTIN_FORMATS.get(num_fmt_id, "General"))
+        flags.append(is_date_format(format_code))
+    return flags
+
+
+def _convert_cached_value(raw_value, value_type, is_date):
+    """
+    Convert a cached <v> payload to the Python value COM's .Value returns.
+
+    Errors become the same negative integers COM uses, so display values
+    match rows produced by the COM scanner.
+    """
+    if raw_value is None:
+        return None
+    if value_type in ("str", "inlineStr", "s"):
+        return raw_value
+    if value_type == "b":
+        return raw_value == "1"
+    if value_type == "e":
+        return _ERROR_CODES.get(raw_value, raw_value)
+    try:
+        number = float(raw_value)
+    except ValueError:
+        return raw_value
+    if is_date:
+        try:
+            return from_excel(number)
+        except Exception:
+            return number
+    return number
+
+
+def _offline_cell_text(cell_value, raw_value, value_type):
+    """
+    Approximate the displayed text of a cell from its cached value.
+
+    Number formats and column widths are not rendered offline, so numbers
+    are shown in Excel's General style.
+    """
+    if value_type == "e":
+        return raw_value or ""
+    text = local_cell_text(cell_value, "General")
+    if text is not None:
+        return text
+    if isinstance(cell_value, float):
+        return f"{cell_value:.10g}"
+    return str(cell_value).strip()
+
+
+def iter_sheet_formula_cells(zf, sheet_part, progress_update_callback=None):
+    """
+    Stream the formula cells of one worksheet part.
+
+    Rows are cleared from the parse tree as soon as they are complete, so
+    memory use does not grow with the sheet. Cells covered by an array
+    formula carry no <f> element of their own; they are yielded with
+    {'t': 'array', 'anchor': <anchor address>} and no formula text.
+
+    Args:
+        zf (zipfile.ZipFile): Open xlsx package
+        sheet_part (str): Worksheet part name
+        progress_update_callback: Optional callable(bytes_read, total_bytes)
+
+    Yields:
+        tuple: (address, formula_element_attrs, formula_text, raw_value, value_type, style_index)
+    """
+    total_bytes = zf.getinfo(sheet_part).file_size or 1
+    sheet_data = None
+    current_row = 0
+    next_column = 1
+    cells_seen = 0
+    # Open array formulas: [(max_row, min_col, max_col, anchor_address), ...]
+    open_arrays = []
+
+    with zf.open(sheet_part) as stream:
+        for event, elem in ET.iterparse(stream, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag == _ROW_TAG:
+                    row_attr = elem.get("r")
+                    current_row = int(row_attr) if row_attr else current_row + 1
+                    next_column = 1
+                    if open_arrays:
+                        open_arrays = [block for block in open_arrays if block[0] >= current_row]
+                elif tag == _SHEET_DATA_TAG:
+                    sheet_data = elem
+                continue
+
+            if tag == _CELL_TAG:
+                address = elem.get("r")
+                if address:
+                    match = _CELL_REF_PATTERN.match(address)
+                    column = _column_number(match.group(1))
+                else:
+                    column = next_column
+                    address = f"{_column_letters(column)}{current_row}"
+                next_column = column + 1
+
+                formula_elem = elem.find(_FORMULA_TAG)
+                if formula_elem is not None:
+                    f_attrs = dict(formula_elem.attrib)
+                    if f_attrs.get("t") == "array" and f_attrs.get("ref", address) != address:
+                        last_row, first_col, last_col = _array_extent(f_attrs["ref"])
+                        open_arrays.append((last_row, first_col, last_col, address))
+                    f_text = formula_elem.text
+                elif open_arrays:
+                    f_attrs = None
+                    for last_row, first_col, last_col, anchor in open_arrays:
+                        if first_col <= column <= last_col:
+                            f_attrs = {"t": "array", "anchor": anchor}
+                            break
+                    f_text = None
+                else:
+                    f_attrs = None
+
+                if f_attrs is not None:
+                    value_elem = elem.find(_VALUE_TAG)
+                    yield (
+                        address,
+                        f_attrs,
+                        f_text,
+                        value_elem.text if value_elem is not None else None,
+                        elem.get("t", "n"),
+                        int(elem.get("s", 0)),
+                    )
+                cells_seen += 1
+                if progress_update_callback and cells_seen % 5000 == 0:
+                    progress_update_callback(min(stream.tell(), total_bytes), total_bytes)
+            elif tag == _ROW_TAG and sheet_data is not None:
+                # Drop the finished row (and everything before it) from the tree
+                sheet_data.clear()
+
+    if progress_update_callback:
+        progress_update_callback(total_bytes, total_bytes)
+
+
+def _array_extent(ref):
+    """Return (last_row, first_col, last_col) of an array formula ref."""
+    first, _, last = ref.replace("$", "").partition(":")
+    first_row, first_col = parse_cell_address(first)
+    last_row, last_col = parse_cell_address(last or first)
+    return max(first_row, last_row), min(first_col, last_col), max(first_col, last_col)
+
+
+def _column_number(letters):
+    number = 0
+    for char in letters:
+        number = number * 26 + (ord(char) - 64)
+    return number
+
+
+def _column_letters(number):
+    letters = ""
+    while number > 0:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def iter_sheet_formulas(workbook_path, sheet_name, scan_mode='full', progress_update_callback=None):
+    """
+    Yield scan rows for every formula cell of a worksheet in an xlsx file.
+
+    Args:
+        workbook_path (str): Path to the .xlsx/.xlsm file
+        sheet_name (str): Worksheet name
+        scan_mode (str): 'quick' skips display text, like the COM scanner
+        progress_update_callback: Optional callable(bytes_read, total_bytes)
+
+    Yields:
+        tuple: (formula_type, address, formula, display_value, cell_text)
+    """
+    with zipfile.ZipFile(workbook_path) as zf:
+        sheet_parts = get_sheet_parts(zf)
+        if sheet_name not in sheet_parts:
+            raise KeyError(f"Worksheet '{sheet_name}' not found in {os.path.basename(workbook_path)}")
+        external_prefixes = get_external_link_prefixes(zf, workbook_path)
+        date_styles = get_date_style_flags(zf)
+        # Shared formulas are compiled once per block, then rendered per cell
+        shared_blocks = {}
+        array_formulas = {}
+
+        for address, f_attrs, f_text, raw_value, value_type, style_index in iter_sheet_formula_cells(
+            zf, sheet_parts[sheet_name], progress_update_callback
+        ):
+            formula_kind = f_attrs.get("t")
+            if formula_kind == "shared":
+                shared_index = f_attrs.get("si")
+                if f_text:
+                    shared_blocks[shared_index] = SharedFormulaBlock(address, f"={f_text}", f_attrs.get("ref"))
+                    formula = f"={f_text}"
+                elif shared_index in shared_blocks:
+                    formula = shared_blocks[shared_index].formula_at(*parse_cell_address(address))
+                else:
+                    continue
+            elif formula_kind == "array":
+                if "anchor" in f_attrs:
+                    formula = array_formulas.get(f_attrs["anchor"])
+                    if formula is None:
+                        continue
+                else:
+                    formula = f"={f_text or ''}"
+                    if f_attrs.get("ref", address) != address:
+                        array_formulas[address] = formula
+            else:
+                formula = f"={f_text or ''}"
+
+            formula = resolve_external_indexes(formula, external_prefixes)
+            is_date = style_index < len(date_styles) and date_styles[style_index]
+            cell_value = _convert_cached_value(raw_value, value_type, is_date)
+            display_val = str(cell_value)[:50] if cell_value is not None else "No Value"
+            if scan_mode == 'quick':
+                cell_text = QUICK_SCAN_TEXT
+            else:
+                cell_text = _offline_cell_text(cell_value, raw_value, value_type)
+
+            yield (classify_formula_type(formula), address, formula, display_val, cell_text)
+
+
+# (normalised path, sheet) -> ((mtime, size), [SharedFormulaBlock, ...])
+_array_block_cache = {}
+
+
+def get_array_formula_blocks(workbook_path, sheet_name):
+    """
+    Get the array formula blocks of a worksheet, streamed once per file version.
+
+    openpyxl only reports an array formula on its anchor cell; the other
+    cells of the array read back as plain values. Callers resolving a
+    single cell use this to see that the cell belongs to an array.
+
+    Returns:
+        list: SharedFormulaBlock records of kind 'array'
+    """
+    stat = os.stat(workbook_path)
+    key = (os.path.normcase(os.path.abspath(workbook_path)), sheet_name)
+    stamp = (stat.st_mtime, stat.st_size)
+    cached = _array_block_cache.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    blocks = []
+    with zipfile.ZipFile(workbook_path) as zf:
+        sheet_parts = get_sheet_parts(zf)
+        if sheet_name in sheet_parts:
+            external_prefixes = get_external_link_prefixes(zf, workbook_path)
+            for address, f_attrs, f_text, _, _, _ in iter_sheet_formula_cells(zf, sheet_parts[sheet_name]):
+                if f_attrs.get("t") == "array" and f_text is not None:
+                    formula = resolve_external_indexes(f"={f_text}", external_prefixes)
+                    blocks.append(SharedFormulaBlock(address, formula, f_attrs.get("ref"), kind="array"))
+    _array_block_cache[key] = (stamp, blocks)
+    return blocks
+
+
+def array_formula_at(workbook_path, sheet_name, cell_address):
+    """
+    Return the array formula covering a cell, or None if there is none.
+    """
+    row, col = parse_cell_address(cell_address)
+    for block in get_array_formula_blocks(workbook_path, sheet_name):
+        if block.contains(row, col):
+            return block.formula_at(row, col)
+    return None
+
+
+def scan_sheet_formulas(workbook_path, sheet_name, scan_mode='full', progress_update_callback=None):
+    """
+    Scan a worksheet of an xlsx file without Excel.
+
+    Returns the same triple as excel_scanner._get_formulas_from_excel so the
+    result can be dropped into controller.all_formulas.
+
+    Args:
+        workbook_path (str): Path to the .xlsx/.xlsm file
+        sheet_name (str): Worksheet name
+        scan_mode (str): 'quick' or 'full'
+        progress_update_callback: Optional callable(bytes_read, total_bytes, formula_cells_found)
+
+    Returns:
+        tuple: (all_formulas, formula_cells_found, total_cells_processed)
+    """
+    all_formulas_local = FormulaTable()
+
+    def byte_progress(bytes_read, total_bytes):
+        if progress_update_callback:
+            progress_update_callback(bytes_read, total_bytes, len(all_formulas_local))
+
+    for row in iter_sheet_formulas(workbook_path, sheet_name, scan_mode, byte_progress):
+        all_formulas_local.append(row)
+
+    return all_formulas_local, len(all_formulas_local), len(all_formulas_local)
+
+
+def qualify_address(sheet_name, address):
+    """
+    Prefix a cell address with its sheet, quoting the name like Excel does.
+
+    Returns:
+        str: e.g. 'Sheet1!A1' or "'My Sheet'!A1"
+    """
+    if _PLAIN_SHEET_NAME_PATTERN.fullmatch(sheet_name) and not _CELL_LIKE_NAME_PATTERN.fullmatch(sheet_name):
+        return f"{sheet_name}!{address}"
+    return "'{}'!{}".format(sheet_name.replace("'", "''"), address)
+
+
+def split_qualified_address(address):
+    """
+    Split 'Sheet1!A1' / "'My Sheet'!A1" into (sheet_name, cell_address).
+
+    Returns:
+        tuple: (sheet_name or None, cell_address)
+    """
+    if "!" not in address:
+        return None, address
+    sheet_part, cell_address = address.rsplit("!", 1)
+    if sheet_part.startswith("'") and sheet_part.endswith("'"):
+        sheet_part = sheet_part[1:-1].replace("''", "'")
+    return sheet_part, cell_address
+
+
+def _scan_sheet_worker(workbook_path, sheet_name, scan_mode):
+    """Process pool entry point: scan one sheet and return its rows."""
+    rows, _, _ = scan_sheet_formulas(workbook_path, sheet_name, scan_mode)
+    return sheet_name, rows
+
+
+def scan_workbook_formulas(workbook_path, scan_mode='full', sheet_names=None, max_workers=None,
+                           progress_update_callback=None):
+    """
+    Scan every worksheet of an xlsx file, one sheet per worker process.
+
+    Each worker opens the package itself and streams its own sheet XML, so
+    nothing large crosses the process boundary except the finished rows.
+    Rows are merged in workbook sheet order, with addresses qualified by
+    sheet name (see qualify_address).
+
+    Args:
+        workbook_path (str): Path to the .xlsx/.xlsm file
+        scan_mode (str): 'quick' or 'full'
+        sheet_names (list): Sheets to scan; defaults to all worksheets
+        max_workers (int): Worker processes; defaults to min(sheets, CPU count)
+        progress_update_callback: Optional callable(sheet_name, sheets_done, total_sheets, formula_cells_found)
+
+    Returns:
+        tuple: (all_formulas, formula_cells_found, total_cells_processed)
+    """
+    if sheet_names is None:
+        sheet_names = get_sheet_names(workbook_path)
+    total_sheets = len(sheet_names)
+    rows_by_sheet = {}
+    found = 0
+
+    def sheet_done(sheet_name, rows):
+        nonlocal found
+        rows_by_sheet[sheet_name] = rows
+        found += len(rows)
+        if progress_update_callback:
+            progress_update_callback(sheet_name, len(rows_by_sheet), total_sheets, found)
+
+    workers = max_workers or min(total_sheets, os.cpu_count() or 1)
+    if workers > 1 and total_sheets > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_scan_sheet_worker, workbook_path, name, scan_mode) for name in sheet_names]
+                for future in as_completed(futures):
+                    sheet_done(*future.result())
+        except Exception as e:
+            # A broken pool (e.g. no fork/spawn support) must not lose the scan
+            print(f"Parallel workbook scan failed, scanning sheets one by one: {e}")
+            rows_by_sheet.clear()
+            found = 0
+
+    for name in sheet_names:
+        if name not in rows_by_sheet:
+            sheet_done(*_scan_sheet_worker(workbook_path, name, scan_mode))
+
+    all_formulas_local = FormulaTable()
+    for name in sheet_names:
+        all_formulas_local.extend(
+            (formula_type, qualify_address(name, address), formula, display_val, cell_text)
+            for formula_type, address, formula, display_val, cell_text in rows_by_sheet[name]
+        )
+    return all_formulas_local, len(all_formulas_local), len(all_formulas_local)
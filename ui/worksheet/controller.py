@@ -10,6 +10,7 @@ import tkinter as tk
 from ui.worksheet.tab_manager import TabManager
 from ui.worksheet.view import WorksheetView
 from ui.summary_window import SummaryWindow
+from core.models import FormulaTable
 
 class WorksheetController:
     """Manages the state and logic for a single worksheet pane."""
@@ -21,12 +22,18 @@ class WorksheetController:
         self.xl = None
         self.workbook = None
         self.worksheet = None
-        self.all_formulas = []
+        self.all_formulas = FormulaTable()
         self.cell_addresses = {}
+        self.cell_regions = {}  # tree item -> FormulaRegion while regions are grouped
         self.use_openpyxl = tk.BooleanVar(value=True)
+        self.use_bulk_scan = True  # Read formula areas as 2-D arrays instead of cell by cell
+        self.use_scan_cache = True  # Reuse on-disk scan results while the saved file is unchanged
+        self.incremental_scan = False  # Rescan only row blocks whose formulas/values changed
+        self.incremental_scan_state = None
         self.show_formula = tk.BooleanVar(value=True)
         self.show_local_link = tk.BooleanVar(value=True)
         self.show_external_link = tk.BooleanVar(value=True)
+        self.group_regions = tk.BooleanVar(value=False)  # One tree row per block of copied formulas
         self.sort_directions = {col: 1 for col in ("type", "address", "formula", "result", "display_value")}
         self.current_sort_column = None
         self.last_workbook_path = None
@@ -79,4 +86,4 @@ class WorksheetController:
                     filtered_formulas.append(formula_data)
         
         # Update the formulas list
-        self.all_formulas = filtered_formulas
+        self.all_formulas = FormulaTable.from_rows(filtered_formulas)
@@ -67,6 +67,8 @@ def create_ui_widgets(self):
     self.show_local_link_check.pack(side=tk.LEFT, padx=5)
     self.show_external_link_check = ttk.Checkbutton(filter_checkbox_frame, text="External Link", variable=self.controller.show_external_link)
     self.show_external_link_check.pack(side=tk.LEFT, padx=5)
+    self.group_regions_check = ttk.Checkbutton(filter_checkbox_frame, text="Group Regions", variable=self.controller.group_regions)
+    self.group_regions_check.pack(side=tk.LEFT, padx=5)
     self.openpyxl_check = ttk.Checkbutton(filter_checkbox_frame, text="Enable Non-GUI File Reading for Cell Results", variable=self.controller.use_openpyxl)
     self.openpyxl_check.pack(side=tk.LEFT, padx=15)
 
@@ -147,6 +149,7 @@ def bind_ui_commands(self):
     self.show_formula_check.config(command=lambda: apply_filter(self.controller))
     self.show_local_link_check.config(command=lambda: apply_filter(self.controller))
     self.show_external_link_check.config(command=lambda: apply_filter(self.controller))
+    self.group_regions_check.config(command=lambda: apply_filter(self.controller))
     self.openpyxl_check.config(command=lambda: on_select(self.controller, event=None))
 
     for col_id, entry in self.filter_entries.items():
@@ -8,7 +8,7 @@ import sys
 import os
 import traceback
 
-def resolve_indirect_core(formula, workbook_path, sheet_name, current_cell=None):
+def resolve_indirect_core(formula, workbook_path, sheet_name, current_cell=None, session=None):
     """
     核心INDIRECT解析函數 - 直接使用你的unified_indirect_resolver邏輯
     
@@ -17,6 +17,8 @@ def resolve_indirect_core(formula, workbook_path, sheet_name, current_cell=None)
         workbook_path: Excel文件路徑
         sheet_name: 工作表名稱
         current_cell: 當前儲存格地址 (例如: B32)
+        session: 可選的 IndirectSession（每次分析開一個）。提供時先以原生求值器解析，
+            結果有記憶；無法原生解析時才建立 unified_indirect_resolver
         
     Returns:
         dict: {
@@ -42,6 +44,16 @@ def resolve_indirect_core(formula, workbook_path, sheet_name, current_cell=None)
         print(f"Sheet: {sheet_name}")
         print(f"Current cell: {current_cell}")
         
+        if session is not None:
+            session_result = session.resolve_formula(formula, workbook_path, sheet_name, current_cell)
+            if session_result['resolved_references'] and not session_result['unresolved']:
+                return {
+                    'success': True,
+                    'original_formula': formula,
+                    'resolved_formula': session_result['resolved_formula'],
+                    'error': None
+                }
+        
         # === 直接使用你的unified_indirect_resolver ===
         # 添加indirect_tool路徑
         indirect_tool_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'indirect_tool')
@@ -98,7 +110,7 @@ def resolve_indirect_core(formula, workbook_path, sheet_name, current_cell=None)
         }
 
 
-def process_formula_with_indirect(formula, workbook_path, sheet_name, current_cell=None):
+def process_formula_with_indirect(formula, workbook_path, sheet_name, current_cell=None, session=None):
     """
     處理包含INDIRECT的公式 - 便捷函數
     
@@ -107,6 +119,7 @@ def process_formula_with_indirect(formula, workbook_path, sheet_name, current_ce
         workbook_path: Excel文件路徑
         sheet_name: 工作表名稱
         current_cell: 當前儲存格地址
+        session: 可選的 IndirectSession，傳給 resolve_indirect_core
         
     Returns:
         dict: {
@@ -129,7 +142,7 @@ def process_formula_with_indirect(formula, workbook_path, sheet_name, current_ce
             }
         
         # 使用核心解析器
-        result = resolve_indirect_core(formula, workbook_path, sheet_name, current_cell)
+        result = resolve_indirect_core(formula, workbook_path, sheet_name, current_cell, session)
         
         return {
             'has_indirect': True,
@@ -302,6 +302,9 @@ def convert_tree_to_graph_data(dependency_tree_data):
     """
     將從 explode_cell_dependencies 得到的樹狀資料，轉換為 pyvis 需要的格式。
     改進版本：每個主節點左邊添加小的標籤節點，避免對齊問題
+    
+    也接受 build_dependency_graph_tables 產生的節點表 + 邊列表
+    ({'root', 'nodes', 'edges'})，DAG 模式的結果不必再展開成樹。
     """
     import colorsys
     
@@ -309,10 +312,17 @@ def convert_tree_to_graph_data(dependency_tree_data):
     edges_data = []
     processed_nodes = set()
     
+    is_graph_tables = 'nodes' in dependency_tree_data and 'edges' in dependency_tree_data
+    
     # 首先收集所有檔案名稱以生成唯一顏色
     all_filenames = set()
+    collected_nodes = set()
     
     def collect_filenames(node):
+        # 共享的子節點只收集一次
+        if id(node) in collected_nodes:
+            return
+        collected_nodes.add(id(node))
         address = node.get('address', '')
         workbook_path = node.get('workbook_path', '')
         
@@ -334,14 +344,16 @@ def convert_tree_to_graph_data(dependency_tree_data):
         for child in node.get('children', []):
             collect_filenames(child)
     
-    collect_filenames(dependency_tree_data)
+    if is_graph_tables:
+        for node in dependency_tree_data['nodes'].values():
+            collect_filenames(node)
+    else:
+        collect_filenames(dependency_tree_data)
     
     # 生成唯一顏色映射
     file_colors = _generate_unique_colors_for_files(list(all_filenames))
 
-    def traverse_tree(node, parent_id=None):
-        node_id = node.get('address', str(hash(str(node))))
-        
+    def add_node(node_id, node):
         if node_id not in processed_nodes:
             processed_nodes.add(node_id)
             
@@ -402,6 +414,10 @@ def convert_tree_to_graph_data(dependency_tree_data):
             else:
                 simple_label = f"Address : <b>{short_address}</b>\n\nValue     : {formatted_value}"
             
+            # 範圍內同一相對公式的區塊：代表儲存格標示共有幾格
+            if node.get('region_multiplicity'):
+                simple_label += f"\n\nRegion    : {node['region_address']} (x{node['region_multiplicity']})"
+            
             # --- 創建增強的 tooltip ---
             enhanced_tooltip = _create_enhanced_tooltip({
                 'address': address,
@@ -427,14 +443,36 @@ def convert_tree_to_graph_data(dependency_tree_data):
                 "value_label": formatted_value,
                 # === 新增：INDIRECT相關字段 ===
                 "resolved_formula": resolved_formula,
-                "has_indirect": has_indirect
+                "has_indirect": has_indirect,
+                # 同一循環引用（強連通分量）的節點共用 cycle_id，圖中以紅框標示
+                "cycle_id": node.get('cycle_id')
             })
 
+    if is_graph_tables:
+        for node_id, node in dependency_tree_data['nodes'].items():
+            add_node(node_id, node)
+        edges_data.extend(dependency_tree_data['edges'])
+        return nodes_data, edges_data
+
+    from utils.progress_enhanced_exploder import iter_child_edges
+
+    traversed_nodes = set()
+
+    def traverse_tree(node, parent_id=None, edge_flags=None):
+        node_id = node.get('address', str(hash(str(node))))
+        # 邊標記（DAG 模式下存在父節點）併入節點資料，與樹狀結果一樣顯示區塊資訊
+        add_node(node_id, {**node, **edge_flags} if edge_flags else node)
+
         if parent_id is not None:
             edges_data.append((parent_id, node_id))
 
-        for child in node.get('children', []):
-            traverse_tree(child, parent_id=node_id)
+        # 共享節點（DAG 模式）的子樹只走一次
+        if id(node) in traversed_nodes:
+            return
+        traversed_nodes.add(id(node))
+
+        for child, child_flags in iter_child_edges(node):
+            traverse_tree(child, parent_id=node_id, edge_flags=child_flags)
 
     traverse_tree(dependency_tree_data)
     return nodes_data, edges_data
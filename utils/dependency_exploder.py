@@ -9,6 +9,8 @@ import os
 import win32com.client
 from urllib.parse import unquote
 from utils.openpyxl_resolver import read_cell_with_resolved_references
+from core.formula_tokenizer import iter_reference_tokens, CELL, RANGE
+from utils.parse_cache import get_global_parse_cache
 import traceback
 import hashlib
 
@@ -778,165 +780,76 @@ class DependencyExploder:
     def parse_formula_references(self, formula, current_workbook_path, current_sheet_name):
         """
         Enhanced formula reference parser - 修正版（保持原有邏輯）
+        結果經全域解析快取：同一公式在同一工作表只解析一次，回傳不可變的引用 tuple
         """
         if not formula or not formula.startswith('='):
             return []
+        return get_global_parse_cache().get_or_parse(
+            formula, current_workbook_path, current_sheet_name,
+            self._parse_formula_references_uncached, 'DependencyExploder', self.range_expand_threshold
+        )
+
+    def _parse_formula_references_uncached(self, formula, current_workbook_path, current_sheet_name):
+        """實際的引用解析（不經快取）"""
 
         references = []
-        processed_spans = []
-        
+
         # Normalize backslashes to handle cases with single or double backslashes
         normalized_formula = formula.replace('\\\\', '\\')
-        
-        def is_span_processed(start, end):
-            for p_start, p_end in processed_spans:
-                if start < p_end and end > p_start:
-                    return True
-            return False
-
-        def add_processed_span(start, end):
-            processed_spans.append((start, end))
-
-        # 修正後的模式匹配
-        patterns = [
-            # 1. 外部引用 - 修正版，更精確的捕獲
-            (
-                'external',
-                re.compile(
-                    r"'?([^']*)\[([^\]]+\.(?:xlsx|xls|xlsm|xlsb))\]([^']*?)'?\s*!\s*(\$?[A-Z]{1,3}\$?\d{1,7}(?::\$?[A-Z]{1,3}\$?\d{1,7})?)",
-                    re.IGNORECASE
-                )
-            ),
-            # 2. 本地引用（帶引號）
-            (
-                'local_quoted',
-                re.compile(
-                    r"'([^']+)'!(\$?[A-Z]{1,3}\$?\d{1,7}(?::\$?[A-Z]{1,3}\$?\d{1,7})?)",
-                    re.IGNORECASE
-                )
-            ),
-            # 3. 本地引用（不帶引號）
-            (
-                'local_unquoted',
-                re.compile(
-                    r"([a-zA-Z0-9_\u4e00-\u9fa5][a-zA-Z0-9_\s\.\u4e00-\u9fa5]{0,30})!(\$?[A-Z]{1,3}\$?\d{1,7}(?::\$?[A-Z]{1,3}\$?\d{1,7})?)",
-                    re.IGNORECASE
-                )
-            ),
-            # 4. 當前工作表範圍
-            (
-                'current_range',
-                re.compile(
-                    r"(?<![!'\[\]a-zA-Z0-9_\u4e00-\u9fa5])(?!\[)(\$?[A-Z]{1,3}\$?\d{1,7}:\s*\$?[A-Z]{1,3}\$?\d{1,7})(?![a-zA-Z0-9_\]])",
-                    re.IGNORECASE
-                )
-            ),
-            # 5. 當前工作表單個儲存格
-            (
-                'current_single',
-                re.compile(
-                    r"(?<![!'\[\]a-zA-Z0-9_\u4e00-\u9fa5])(?!\[)(\$?[A-Z]{1,3}\$?\d{1,7})(?![a-zA-Z0-9_:\]])",
-                    re.IGNORECASE
-                )
-            )
-        ]
-
-        all_matches = []
-        for p_type, pattern in patterns:
-            for match in pattern.finditer(normalized_formula):
-                all_matches.append({'type': p_type, 'match': match, 'span': match.span()})
-
-        # 按優先級和位置排序
-        type_priority = {'external': 0, 'local_quoted': 1, 'local_unquoted': 2, 'current_range': 3, 'current_single': 4}
-        all_matches.sort(key=lambda x: (type_priority.get(x['type'], 99), x['span'][0], x['span'][1] - x['span'][0]))
-
-        for item in all_matches:
-            match = item['match']
-            m_type = item['type']
-            start, end = item['span']
-
-            if is_span_processed(start, end):
-                continue
 
+        for token in iter_reference_tokens(normalized_formula, (CELL, RANGE)):
+            cell_ref = token.address
             try:
-                if m_type == 'external':
-                    # 修正版：正確處理外部引用路徑
-                    path_prefix, file_name, sheet_suffix, cell_ref = match.groups()
-                    
+                if token.workbook is not None:
+                    if not token.workbook.lower().endswith(('.xlsx', '.xls', '.xlsm', '.xlsb')):
+                        continue
+                    path_prefix, file_name = token.directory, token.workbook
+
                     # 組合完整檔案路徑
                     if path_prefix:
-                        # 有路徑前綴，直接組合
                         full_file_path = os.path.join(path_prefix, file_name)
                     else:
-                        # 沒有路徑前綴，檢查是否為當前檔案
                         current_file_name = os.path.basename(current_workbook_path)
                         if file_name.lower() == current_file_name.lower():
                             full_file_path = current_workbook_path
                         else:
-                            # 外部檔案，使用當前目錄
                             current_dir = os.path.dirname(current_workbook_path)
                             full_file_path = os.path.join(current_dir, file_name)
-                    
-                    # 工作表名稱處理
-                    sheet_name = sheet_suffix.strip("'") if sheet_suffix else "Sheet1"
-                    
-                    # Handle ranges vs single cells
-                    if ':' in cell_ref:
-                        range_refs = self._process_range_reference(
-                            cell_ref, full_file_path, sheet_name, 'external'
-                        )
-                        references.extend(range_refs)
-                    else:
-                        references.append({
-                            'workbook_path': full_file_path,
-                            'sheet_name': sheet_name,
-                            'cell_address': cell_ref.replace('$', ''),
-                            'type': 'external'
-                        })
 
-                elif m_type in ('local_quoted', 'local_unquoted'):
-                    sheet_name, cell_ref = match.groups()
-                    sheet_name = sheet_name.strip("'")
-                    
-                    # Skip if it looks like a file name
+                    sheet_name = token.sheet or "Sheet1"
+                    ref_type = 'external'
+                    workbook_path = full_file_path
+
+                elif token.sheet is not None:
+                    sheet_name = token.sheet
+
+                    # 跳過看起來像檔案名的工作表
                     if sheet_name.lower().endswith(('.xlsx', '.xls', '.xlsm', '.xlsb')):
                         continue
-                    
-                    # Handle ranges vs single cells
-                    if ':' in cell_ref:
-                        range_refs = self._process_range_reference(
-                            cell_ref, current_workbook_path, sheet_name, 'local'
-                        )
-                        references.extend(range_refs)
-                    else:
-                        references.append({
-                            'workbook_path': current_workbook_path,
-                            'sheet_name': sheet_name,
-                            'cell_address': cell_ref.replace('$', ''),
-                            'type': 'local'
-                        })
+                    ref_type = 'local'
+                    workbook_path = current_workbook_path
 
-                elif m_type in ('current_range', 'current_single'):
-                    cell_ref = match.group(1)
-                    
-                    # Handle ranges vs single cells
-                    if ':' in cell_ref:
-                        range_refs = self._process_range_reference(
-                            cell_ref, current_workbook_path, current_sheet_name, 'current'
-                        )
-                        references.extend(range_refs)
-                    else:
-                        references.append({
-                            'workbook_path': current_workbook_path,
-                            'sheet_name': current_sheet_name,
-                            'cell_address': cell_ref.replace('$', ''),
-                            'type': 'current'
-                        })
+                else:
+                    sheet_name = current_sheet_name
+                    ref_type = 'current'
+                    workbook_path = current_workbook_path
+
+                # 處理範圍 vs 單個儲存格
+                if token.kind == RANGE:
+                    range_refs = self._process_range_reference(
+                        cell_ref, workbook_path, sheet_name, ref_type
+                    )
+                    references.extend(range_refs)
+                else:
+                    references.append({
+                        'workbook_path': workbook_path,
+                        'sheet_name': sheet_name,
+                        'cell_address': cell_ref.replace('$', ''),
+                        'type': ref_type
+                    })
 
-                add_processed_span(start, end)
-                
             except Exception as e:
-                print(f"Warning: Could not process reference from match '{match.group(0)}': {e}")
+                print(f"Warning: Could not process reference from match '{token.text}': {e}")
                 continue
 
         return references
@@ -0,0 +1,639 @@
+# -*- coding: utf-8 -*-
+"""
+Excel Calculation Pool
+Keeps a few isolated Excel instances alive for formulas that only Excel can
+calculate, instead of starting and quitting Excel for every formula.
+
+Each worker is a dedicated thread that owns one Excel application (COM
+objects must stay on the thread that created them) and the workbooks it has
+opened read-only with manual calculation. Jobs wait in one shared queue and
+are taken by whichever worker is idle. A worker's Excel is replaced after a
+set number of jobs, when it fails a health check, or when a job hits a COM
+failure (the job is then retried once on the fresh instance).
+
+Many expressions of one workbook can be calculated in a single job: each
+sheet's expressions are written into a scratch block with one Range.Formula
+array assignment, calculated once and read back with one Value2 call.
+
+The Excel application comes from an injectable factory, so the pool can be
+driven by a stand-in application object where Excel is not available.
+"""
+
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+from utils.spatial_index import cell_position
+
+XL_CALCULATION_MANUAL = -4135
+
+# 批次計算的暫存區塊起點（與 calculate_excel_function 的 ZZ999 同一欄）
+SCRATCH_ANCHOR = "ZZ1"
+
+# 每個工作簿開啟時的安全參數（與 EnhancedDependencyExploder 相同）
+OPEN_OPTIONS = {
+    'UpdateLinks': 0,
+    'ReadOnly': True,
+    'IgnoreReadOnlyRecommended': True,
+    'Notify': False,
+    'AddToMru': False
+}
+
+_STOP = object()
+
+
+def create_isolated_excel_application():
+    """
+    Default application factory: a separate, hidden Excel process (DispatchEx)
+    with alerts, events, screen updating and link updates turned off
+    """
+    import win32com.client
+
+    excel_app = win32com.client.DispatchEx("Excel.Application")
+    excel_app.Visible = False
+    excel_app.DisplayAlerts = False
+    excel_app.EnableEvents = False
+    excel_app.ScreenUpdating = False
+    excel_app.Interactive = False
+    excel_app.AskToUpdateLinks = False
+    try:
+        excel_app.UserControl = False
+    except Exception:
+        pass
+    return excel_app
+
+
+def _com_initialize():
+    try:
+        import pythoncom
+        pythoncom.CoInitialize()
+        return pythoncom
+    except Exception:
+        return None
+
+
+class CalculationContext:
+    """
+    What a job sees on its worker: the worker's Excel application and the
+    workbook the job asked for, already open read-only in manual calculation
+    """
+
+    __slots__ = ('app', 'workbook', 'workbook_path')
+
+    def __init__(self, app, workbook, workbook_path):
+        self.app = app
+        self.workbook = workbook
+        self.workbook_path = workbook_path
+
+
+def evaluate_in_cell(context, sheet_name, cell_address, expression):
+    """
+    Calculate an expression in a cell of the worker's workbook and put the
+    cell back as it was
+
+    The formula is written into the given cell so that ROW(), COLUMN() and
+    relative references behave as in the original formula.
+
+    Returns:
+        The calculated Value2, as evaluate_block reads it (dates come back as
+        serial numbers, Excel errors as COM error codes)
+    """
+    cell = context.workbook.Worksheets(sheet_name).Range(cell_address)
+    original_formula = cell.Formula
+    try:
+        cell.Formula = _as_formula(expression)
+        cell.Calculate()
+        return cell.Value2
+    finally:
+        cell.Formula = original_formula
+
+
+# 字串常值或不帶參數的 ROW() / COLUMN()
+_POSITION_CALL_PATTERN = re.compile(r'"(?:[^"]|"")*"|(?<![\w.])(ROW|COLUMN)\(\s*\)', re.IGNORECASE)
+
+
+def _as_formula(expression):
+    return expression if expression.startswith('=') else f"={expression}"
+
+
+def pin_cell_position(expression, cell_address):
+    """
+    Replace argument-less ROW() and COLUMN() with the row and column number of
+    the cell the expression belongs to, so it can be calculated in another cell
+    """
+    position = cell_position(cell_address)
+    if position is None:
+        return expression
+
+    def replace(match):
+        if match.group(1) is None:
+            return match.group(0)
+        return str(position[0] if match.group(1).upper() == 'ROW' else position[1])
+
+    return _POSITION_CALL_PATTERN.sub(replace, expression)
+
+
+def evaluate_block(context, sheet_name, expressions, anchor=SCRATCH_ANCHOR):
+    """
+    Calculate several expressions in a scratch block of a sheet and put the
+    block back as it was
+
+    The expressions fill a one-column block starting at anchor with a single
+    Range.Formula assignment; the block is calculated once and read back with
+    a single Value2 call.
+
+    Returns:
+        list: The calculated values, in the order of expressions
+    """
+    if not expressions:
+        return []
+    block = context.workbook.Worksheets(sheet_name).Range(anchor).Resize(len(expressions), 1)
+    original_formulas = block.Formula
+    try:
+        block.Formula = tuple((_as_formula(expression),) for expression in expressions)
+        block.Calculate()
+        values = block.Value2
+    finally:
+        block.Formula = original_formulas
+    # 單一儲存格的 Value2 是純量，多個儲存格是二維 tuple
+    if len(expressions) == 1:
+        return [values]
+    return [row[0] for row in values]
+
+
+def evaluate_batch(context, items, anchor=SCRATCH_ANCHOR):
+    """
+    Calculate (expression, sheet_name, cell_address) items of one workbook,
+    one scratch block per sheet
+
+    Argument-less ROW() and COLUMN() are pinned to each item's cell first.
+    When Excel rejects a block (one bad formula fails the whole assignment),
+    that sheet's items are calculated one by one in their own cells instead.
+
+    Returns:
+        list: Values in the order of items; None where an item failed
+    """
+    by_sheet = {}
+    for position, (expression, sheet_name, cell_address) in enumerate(items):
+        by_sheet.setdefault(sheet_name, []).append((position, expression, cell_address))
+
+    results = [None] * len(items)
+    for sheet_name, sheet_items in by_sheet.items():
+        try:
+            values = evaluate_block(
+                context, sheet_name,
+                [pin_cell_position(expression, cell_address) for _, expression, cell_address in sheet_items],
+                anchor
+            )
+            for (position, _, _), value in zip(sheet_items, values):
+                results[position] = value
+            continue
+        except Exception as block_error:
+            last_error = block_error
+        failures = 0
+        for position, expression, cell_address in sheet_items:
+            try:
+                results[position] = evaluate_in_cell(context, sheet_name, cell_address, expression)
+            except Exception as error:
+                failures += 1
+                last_error = error
+        if failures == len(sheet_items):
+            # 整張工作表都失敗：多半是 Excel 本身出問題，交給 worker 換實例重試
+            raise last_error
+    return results
+
+
+class _CalculationJob:
+    __slots__ = ('workbook_path', 'task', 'future', 'attempts')
+
+    def __init__(self, workbook_path, task):
+        self.workbook_path = workbook_path
+        self.task = task
+        self.future = Future()
+        self.attempts = 0
+
+
+class _CalculationWorker:
+    """One worker thread and the Excel instance it owns."""
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.app = None
+        self.workbooks = {}  # normalised path -> (workbook, file mtime)
+        self.jobs_done = 0
+        self.thread = threading.Thread(target=self._run, name=f"excel-calc-{index}", daemon=True)
+
+    def _run(self):
+        com = _com_initialize()
+        try:
+            while True:
+                job = self.pool.jobs.get()
+                if job is _STOP:
+                    break
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                self._process(job)
+        finally:
+            self._release_app()
+            if com is not None:
+                try:
+                    com.CoUninitialize()
+                except Exception:
+                    pass
+
+    def _process(self, job):
+        while True:
+            job.attempts += 1
+            try:
+                self._ensure_app()
+                context = CalculationContext(self.app, self._open_workbook(job.workbook_path), job.workbook_path)
+                result = job.task(context)
+            except Exception as error:
+                # COM 失敗：換一個新的 Excel 重試一次
+                self.pool._count('job_failures')
+                self._release_app()
+                if job.attempts < 2:
+                    continue
+                job.future.set_exception(error)
+                return
+            self.jobs_done += 1
+            self.pool._count('jobs')
+            job.future.set_result(result)
+            if self.jobs_done >= self.pool.max_jobs_per_worker:
+                self.pool._count('recycles')
+                self._release_app()
+            return
+
+    def _ensure_app(self):
+        if self.app is not None and not self._healthy():
+            self.pool._count('health_failures')
+            self._release_app()
+        if self.app is None:
+            self.app = self.pool.app_factory()
+            self.jobs_done = 0
+            self.pool._count('apps_started')
+
+    def _healthy(self):
+        try:
+            if self.pool.health_check is not None:
+                return bool(self.pool.health_check(self.app))
+            self.app.Workbooks.Count
+            return True
+        except Exception:
+            return False
+
+    def _open_workbook(self, workbook_path):
+        key = os.path.normcase(os.path.abspath(workbook_path))
+        mtime = os.path.getmtime(workbook_path) if os.path.exists(workbook_path) else None
+        cached = self.workbooks.get(key)
+        if cached is not None:
+            workbook, opened_mtime = cached
+            if opened_mtime == mtime:
+                return workbook
+            # 檔案已被儲存：重新開啟最新版本
+            self._close_workbook(workbook)
+            del self.workbooks[key]
+        workbook = self.app.Workbooks.Open(workbook_path, **OPEN_OPTIONS)
+        try:
+            self.app.Calculation = XL_CALCULATION_MANUAL
+        except Exception:
+            pass
+        self.workbooks[key] = (workbook, mtime)
+        self.pool._count('workbooks_opened')
+        return workbook
+
+    @staticmethod
+    def _close_workbook(workbook):
+        try:
+            workbook.Saved = True
+            workbook.Close(SaveChanges=False)
+        except Exception:
+            pass
+
+    def _release_app(self):
+        for workbook, _ in self.workbooks.values():
+            self._close_workbook(workbook)
+        self.workbooks.clear()
+        if self.app is not None:
+            try:
+                self.app.Quit()
+            except Exception:
+                pass
+            self.app = None
+            self.pool._count('apps_quit')
+
+
+class ExcelCalculationPool:
+    """
+    Pool of long-lived, isolated Excel instances for formula calculation
+
+    Usage:
+        with ExcelCalculationPool(size=2) as pool:
+            value = pool.evaluate("OFFSET(A1,2,3)", path, "Sheet1", "B5")
+    """
+
+    def __init__(self, size=1, max_jobs_per_worker=200, app_factory=None, health_check=None):
+        """
+        Initialize the pool (Excel instances start on their first job)
+
+        Args:
+            size: Number of workers, i.e. Excel instances
+            max_jobs_per_worker: Jobs after which a worker's Excel is replaced
+            app_factory: Callable() -> Excel.Application-like object
+                (default: create_isolated_excel_application)
+            health_check: Optional callable(app) -> bool run before each job
+                (default: the app answers Workbooks.Count)
+        """
+        self.size = max(1, int(size))
+        self.max_jobs_per_worker = max(1, int(max_jobs_per_worker))
+        self.app_factory = app_factory or create_isolated_excel_application
+        self.health_check = health_check
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+        self._stats = {
+            'jobs': 0,
+            'job_failures': 0,
+            'apps_started': 0,
+            'apps_quit': 0,
+            'recycles': 0,
+            'health_failures': 0,
+            'workbooks_opened': 0,
+            'batches': 0,
+            'batched_expressions': 0
+        }
+        self.workers = [_CalculationWorker(self, i) for i in range(self.size)]
+        for worker in self.workers:
+            worker.thread.start()
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self._stats[name] += amount
+
+    def submit(self, workbook_path, task):
+        """
+        Queue a job for the next idle worker
+
+        Args:
+            workbook_path: Workbook the job needs open
+            task: Callable(CalculationContext) -> result, run on the worker thread
+
+        Returns:
+            concurrent.futures.Future: The job's result
+        """
+        if self.closed:
+            raise RuntimeError("Excel calculation pool is closed")
+        job = _CalculationJob(workbook_path, task)
+        self.jobs.put(job)
+        return job.future
+
+    def evaluate(self, expression, workbook_path, sheet_name, cell_address, timeout=120):
+        """
+        Calculate one expression as if it were the formula of a cell
+
+        Args:
+            expression: Formula text, with or without '='
+            workbook_path, sheet_name, cell_address: The cell to calculate in
+            timeout: Seconds to wait for a worker
+
+        Returns:
+            The calculated value
+        """
+        return self.submit(
+            workbook_path,
+            lambda context: evaluate_in_cell(context, sheet_name, cell_address, expression)
+        ).result(timeout=timeout)
+
+    def evaluate_many(self, workbook_path, items, timeout=120):
+        """
+        Calculate many expressions of one workbook in a single job
+
+        Args:
+            workbook_path: Workbook the expressions belong to
+            items: Iterable of (expression, sheet_name, cell_address)
+            timeout: Seconds to wait for a worker
+
+        Returns:
+            list: Values in the order of items; None where an item failed
+        """
+        items = list(items)
+        if not items:
+            return []
+        values = self.submit(workbook_path, lambda context: evaluate_batch(context, items)).result(timeout=timeout)
+        self._count('batches')
+        self._count('batched_expressions', len(items))
+        return values
+
+    def get_stats(self):
+        """
+        Get pool statistics
+
+        Returns:
+            dict: Jobs, failures, Excel instances started/quit, recycles, health failures, batches
+        """
+        with self.lock:
+            return {
+                'size': self.size,
+                'queued_jobs': self.jobs.qsize(),
+                'live_apps': sum(1 for worker in self.workers if worker.app is not None),
+                **self._stats
+            }
+
+    def close(self, timeout=30):
+        """
+        Finish queued jobs, then close every workbook and quit every Excel instance
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for _ in self.workers:
+            self.jobs.put(_STOP)
+        for worker in self.workers:
+            worker.thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+# Global pool instance
+_global_calculation_pool = None
+_calculation_pool_lock = threading.Lock()
+
+
+def get_global_calculation_pool():
+    """
+    Get the global calculation pool (singleton pattern), closed at interpreter exit
+
+    Returns:
+        ExcelCalculationPool: The global pool
+    """
+    global _global_calculation_pool
+    if _global_calculation_pool is None:
+        with _calculation_pool_lock:
+            if _global_calculation_pool is None:
+                import atexit
+                _global_calculation_pool = ExcelCalculationPool()
+                atexit.register(shutdown_global_calculation_pool)
+    return _global_calculation_pool
+
+
+def shutdown_global_calculation_pool():
+    """
+    Close the global calculation pool and its Excel instances
+    """
+    global _global_calculation_pool
+    with _calculation_pool_lock:
+        pool, _global_calculation_pool = _global_calculation_pool, None
+    if pool is not None:
+        pool.close()
+
+
+if __name__ == "__main__":
+    import random
+    import tempfile
+
+    from utils.spatial_index import column_letters
+
+    class _StandInRange:
+        """A one-column block of cells; a single cell reads and writes scalars."""
+
+        def __init__(self, sheet, address, rows=1):
+            self.sheet = sheet
+            self.row, self.col = cell_position(address)
+            self.addresses = [f"{column_letters(self.col)}{self.row + i}" for i in range(rows)]
+
+        def Resize(self, rows, cols):
+            assert cols == 1
+            return _StandInRange(self.sheet, self.addresses[0], rows)
+
+        def _read(self, cells):
+            values = [cells.get(address, '' if cells is self.sheet.cells else None) for address in self.addresses]
+            return values[0] if len(values) == 1 else tuple((value,) for value in values)
+
+        @property
+        def Formula(self):
+            return self._read(self.sheet.cells)
+
+        @Formula.setter
+        def Formula(self, value):
+            self.sheet.writes += 1
+            rows = [value] if isinstance(value, str) else [row[0] for row in value]
+            if len(rows) > 1 and any('len(' in formula for formula in rows):
+                raise ValueError("stand-in rejects the whole block")
+            for address, formula in zip(self.addresses, rows):
+                self.sheet.cells[address] = formula
+
+        def Calculate(self):
+            for address in self.addresses:
+                formula = self.sheet.cells.get(address, '')
+                self.sheet.values[address] = eval(formula[1:]) if formula.startswith('=') else formula
+
+        @property
+        def Value(self):
+            return self._read(self.sheet.values)
+
+        Value2 = Value
+
+    class _StandInSheet:
+        def __init__(self):
+            self.cells = {}
+            self.values = {}
+            self.writes = 0
+
+        def Range(self, address):
+            return _StandInRange(self, address)
+
+    class _StandInWorkbook:
+        def __init__(self, app):
+            self.app = app
+            self.sheets = {}
+            self.Saved = True
+            app.workbooks.append(self)
+
+        def Worksheets(self, name):
+            if self.app.crashed:
+                raise OSError("RPC server is unavailable")
+            return self.sheets.setdefault(name, _StandInSheet())
+
+        def Close(self, SaveChanges=False):
+            self.app.open_count -= 1
+
+    class _StandInWorkbooks:
+        def __init__(self, app):
+            self.app = app
+
+        @property
+        def Count(self):
+            if self.app.crashed:
+                raise OSError("RPC server is unavailable")
+            return self.app.open_count
+
+        def Open(self, path, **options):
+            assert options['ReadOnly'] and options['UpdateLinks'] == 0
+            self.app.open_count += 1
+            self.app.opens += 1
+            return _StandInWorkbook(self.app)
+
+    class _StandInApplication:
+        """Just enough of Excel.Application for the pool."""
+        started = 0
+
+        def __init__(self):
+            _StandInApplication.started += 1
+            time.sleep(0.05)  # 模擬 Excel 啟動時間
+            self.Workbooks = _StandInWorkbooks(self)
+            self.Calculation = None
+            self.open_count = 0
+            self.opens = 0
+            self.crashed = False
+            self.workbooks = []
+
+        def Quit(self):
+            pass
+
+    path = os.path.join(tempfile.mkdtemp(), "Book.xlsx")
+    open(path, 'w').close()
+
+    apps = []
+
+    def factory():
+        app = _StandInApplication()
+        apps.append(app)
+        return app
+
+    start = time.time()
+    with ExcelCalculationPool(size=3, max_jobs_per_worker=50, app_factory=factory) as pool:
+        futures = [pool.submit(path, lambda context, n=n: evaluate_in_cell(context, "Calc", "B5", f"{n}*2"))
+                   for n in range(300)]
+        assert [future.result() for future in futures] == [n * 2 for n in range(300)]
+        # 模擬其中一個 Excel 失去回應：健康檢查失敗後換新實例
+        random.choice([app for app in apps if app.open_count]).crashed = True
+        assert [pool.evaluate(f"{n}+1", path, "Calc", "B5") for n in range(30)] == [n + 1 for n in range(30)]
+        stats = pool.get_stats()
+    print(f"330 jobs in {time.time() - start:.2f}s on {stats['size']} workers: {stats}")
+    print(f"Per-call Excel would have started 330 instances; the pool started {_StandInApplication.started}")
+
+    # 批次計算：兩張工作表各一次 Formula 陣列寫入、一次計算、一次 Value2 讀取，寫入後還原
+    batch_apps = []
+    with ExcelCalculationPool(app_factory=lambda: batch_apps.append(_StandInApplication()) or batch_apps[-1]) as pool:
+        items = [(f"{n}*3", "Calc" if n % 2 else "Data", f"B{n + 1}") for n in range(500)]
+        start = time.time()
+        values = pool.evaluate_many(path, items)
+        elapsed = time.time() - start
+        assert values == [n * 3 for n in range(500)]
+        sheets = batch_apps[0].workbooks[0].sheets
+        assert sum(sheet.writes for sheet in sheets.values()) == 4  # 每張工作表：寫入 + 還原
+        assert not any(sheet.cells.get(SCRATCH_ANCHOR) for sheet in sheets.values())
+        # 區塊被拒時改為逐一在原儲存格計算
+        assert pin_cell_position('ROW()+COLUMN(A1)&"ROW()"', "C7") == '7+COLUMN(A1)&"ROW()"'
+        assert pool.evaluate_many(path, [("1+1", "Calc", "A1"), ("len('ab')", "Calc", "A2"), ("2+2", "Calc", "A3")]) == [2, 2, 4]
+        stats = pool.get_stats()
+    print(f"500 expressions in {elapsed:.3f}s with {stats['batches']} batch jobs: {stats}")
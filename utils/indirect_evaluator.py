@@ -0,0 +1,636 @@
+# -*- coding: utf-8 -*-
+"""
+Native INDIRECT Evaluator
+Evaluates the argument of INDIRECT in Python, from the cached cell values of
+the workbook cache, so that resolving a reference does not need an Excel
+instance.
+
+Only the subset that normally builds reference text is implemented:
+strings, numbers, TRUE/FALSE, cell reads (current sheet, other sheet, quoted
+sheet or external workbook), '&', arithmetic and comparisons, and the
+functions ADDRESS, ROW, COLUMN, TEXT, CHOOSE, IF and SUBSTITUTE. Anything
+else raises UnsupportedExpression, and the caller falls back to Excel.
+"""
+
+import os
+import re
+from decimal import Decimal, ROUND_HALF_UP
+
+from core.formula_tokenizer import split_external_prefix
+from utils.spatial_index import cell_position, column_letters, rectangle_from_address
+
+EXCEL_ERRORS = frozenset(('#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A',
+                          '#GETTING_DATA', '#SPILL!', '#CALC!'))
+
+_AREA = (r"(?:\$?[A-Za-z]{1,3}\$?\d{1,7}(?::\$?[A-Za-z]{1,3}\$?\d{1,7})?"
+         r"|\$?[A-Za-z]{1,3}:\$?[A-Za-z]{1,3}|\$?\d{1,7}:\$?\d{1,7})")
+
+_TOKEN_PATTERN = re.compile(rf"""
+    (?P<space>\s+)
+  | (?P<string>"(?:[^"]|"")*")
+  | (?P<qref>'(?P<qprefix>(?:[^']|'')+)'!(?P<qarea>{_AREA}))(?![\w.(])
+  | (?P<xref>(?P<xdir>(?:[A-Za-z]:)?[^\s'"\[\](),;=+\-*/&^<>!]*)\[(?P<xbook>[^\]]+)\](?P<xsheet>[^\s'"\[\](),;=+\-*/&^<>!]+)!(?P<xarea>{_AREA}))(?![\w.(])
+  | (?P<sref>(?P<ssheet>[^\W\d][\w.]*)!(?P<sarea>{_AREA}))(?![\w.(])
+  | (?P<function>[A-Za-z_][\w.]*)(?=\s*\()
+  | (?P<ref>{_AREA})(?![\w.(!])
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+  | (?P<word>[^\W\d][\w.]*)
+  | (?P<op><>|<=|>=|[-+*/^&=<>%(),])
+""", re.VERBOSE)
+
+_SHEET_NEEDS_NO_QUOTES = re.compile(r"^[^\W\d][\w.]*$")
+_LOOKS_LIKE_REFERENCE = re.compile(r"^(?:[A-Za-z]{1,3}\d+|[Rr]\d*(?:[Cc]\d*)?|[Cc]\d*)$")
+_R1C1_PART = re.compile(r"^R(\[-?\d+\]|\d+)?C(\[-?\d+\]|\d+)?$", re.IGNORECASE)
+_NUMBER_FORMAT = re.compile(r"^(?P<integer>[#0,]*)(?:\.(?P<decimals>[#0]+))?$")
+
+_COMPARISONS = {
+    '=': lambda order: order == 0,
+    '<>': lambda order: order != 0,
+    '<': lambda order: order < 0,
+    '<=': lambda order: order <= 0,
+    '>': lambda order: order > 0,
+    '>=': lambda order: order >= 0,
+}
+
+
+class UnsupportedExpression(Exception):
+    """The expression uses syntax or a function this evaluator does not implement."""
+
+
+class _FormulaError(Exception):
+    """An Excel error value (#REF!, #VALUE! ...) raised while evaluating."""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+def quote_sheet_name(sheet_name):
+    """
+    Sheet name as Excel writes it in a reference: quoted (with '' escaping)
+    when it has spaces or symbols, starts with a digit or looks like a cell.
+    """
+    if _SHEET_NEEDS_NO_QUOTES.match(sheet_name) and not _LOOKS_LIKE_REFERENCE.match(sheet_name):
+        return sheet_name
+    return "'" + sheet_name.replace("'", "''") + "'"
+
+
+def read_cached_value(workbook_path, sheet_name, cell_address):
+    """
+    Last calculated value of a cell, from the shared data-only workbook cache
+
+    Raises:
+        UnsupportedExpression: If the workbook or sheet cannot be read here
+    """
+    from utils.safe_cache import get_safe_cached_workbook
+
+    if not os.path.exists(workbook_path):
+        raise UnsupportedExpression(f"Workbook not available: {workbook_path}")
+    workbook = get_safe_cached_workbook(workbook_path, data_only=True)
+    worksheet = None
+    for name in workbook.sheetnames:
+        if name.lower() == sheet_name.lower():
+            worksheet = workbook[name]
+            break
+    if worksheet is None:
+        raise _FormulaError('#REF!')
+    return worksheet[cell_address.replace('$', '')].value
+
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    while position < len(expression):
+        match = _TOKEN_PATTERN.match(expression, position)
+        if not match:
+            raise UnsupportedExpression(f"Cannot parse '{expression[position:]}'")
+        position = match.end()
+        kind = match.lastgroup
+        if kind == 'space':
+            continue
+        if kind == 'string':
+            tokens.append(('string', match.group('string')[1:-1].replace('""', '"')))
+        elif kind == 'number':
+            text = match.group('number')
+            tokens.append(('number', float(text) if any(c in text for c in '.eE') else int(text)))
+        elif kind == 'qref':
+            directory, workbook, sheet = split_external_prefix(match.group('qprefix'))
+            tokens.append(('ref', (directory, workbook, sheet, match.group('qarea'))))
+        elif kind == 'xref':
+            tokens.append(('ref', (match.group('xdir') or '', match.group('xbook'), match.group('xsheet'), match.group('xarea'))))
+        elif kind == 'sref':
+            tokens.append(('ref', ('', None, match.group('ssheet'), match.group('sarea'))))
+        elif kind == 'ref':
+            tokens.append(('ref', ('', None, None, match.group('ref'))))
+        elif kind == 'function':
+            tokens.append(('function', match.group('function').upper()))
+        elif kind == 'word':
+            word = match.group('word').upper()
+            if word not in ('TRUE', 'FALSE'):
+                raise UnsupportedExpression(f"Defined name '{match.group('word')}' is not supported")
+            tokens.append(('bool', word == 'TRUE'))
+        else:
+            tokens.append(('op', match.group('op')))
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive-descent parser for the supported subset, producing nested tuples.
+    Precedence (low to high): comparison, &, + -, * /, ^, unary minus, %.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def expect(self, op):
+        token = self.take()
+        if token != ('op', op):
+            raise UnsupportedExpression(f"Expected '{op}'")
+
+    def arguments(self):
+        """Top-level, comma-separated arguments (INDIRECT takes ref_text and a1)."""
+        items = [self.comparison()]
+        while self.peek() == ('op', ','):
+            self.take()
+            items.append(self.comparison())
+        if self.position != len(self.tokens):
+            raise UnsupportedExpression("Unexpected trailing input")
+        return items
+
+    def comparison(self):
+        node = self.concatenation()
+        while self.peek()[0] == 'op' and self.peek()[1] in _COMPARISONS:
+            node = ('compare', self.take()[1], node, self.concatenation())
+        return node
+
+    def concatenation(self):
+        node = self.additive()
+        while self.peek() == ('op', '&'):
+            self.take()
+            node = ('concat', node, self.additive())
+        return node
+
+    def additive(self):
+        node = self.multiplicative()
+        while self.peek() in (('op', '+'), ('op', '-')):
+            node = ('arith', self.take()[1], node, self.multiplicative())
+        return node
+
+    def multiplicative(self):
+        node = self.power()
+        while self.peek() in (('op', '*'), ('op', '/')):
+            node = ('arith', self.take()[1], node, self.power())
+        return node
+
+    def power(self):
+        node = self.unary()
+        while self.peek() == ('op', '^'):
+            self.take()
+            node = ('arith', '^', node, self.unary())
+        return node
+
+    def unary(self):
+        if self.peek() in (('op', '-'), ('op', '+')):
+            sign = self.take()[1]
+            operand = self.unary()
+            return ('negate', operand) if sign == '-' else operand
+        node = self.primary()
+        while self.peek() == ('op', '%'):
+            self.take()
+            node = ('arith', '/', node, ('literal', 100))
+        return node
+
+    def primary(self):
+        kind, value = self.take()
+        if kind in ('string', 'number', 'bool'):
+            return ('literal', value)
+        if kind == 'ref':
+            return ('ref', value)
+        if kind == 'function':
+            self.expect('(')
+            args = []
+            if self.peek() != ('op', ')'):
+                args.append(self.argument())
+                while self.peek() == ('op', ','):
+                    self.take()
+                    args.append(self.argument())
+            self.expect(')')
+            return ('call', value, args)
+        if (kind, value) == ('op', '('):
+            node = self.comparison()
+            self.expect(')')
+            return node
+        raise UnsupportedExpression(f"Unexpected token {value!r}")
+
+    def argument(self):
+        # 省略的參數（例如 ADDRESS(1,2,,FALSE)）
+        if self.peek() in (('op', ','), ('op', ')')):
+            return ('missing',)
+        return self.comparison()
+
+
+def _to_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (int, float)):
+        if float(value).is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return format(value, '.15g').upper()
+    return str(value)
+
+
+def _to_number(value):
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(str(value).strip())
+    except ValueError:
+        raise _FormulaError('#VALUE!')
+
+
+def _to_bool(value):
+    if value is None:
+        return False
+    if isinstance(value, str):
+        if value.upper() in ('TRUE', 'FALSE'):
+            return value.upper() == 'TRUE'
+        raise _FormulaError('#VALUE!')
+    return bool(value)
+
+
+def _compare(left, right):
+    """Excel ordering: numbers < text < booleans; text compares case-insensitively."""
+    def rank(value):
+        if isinstance(value, bool):
+            return 2, value
+        if isinstance(value, (int, float)):
+            return 0, value
+        if value is None:
+            return -1, None
+        return 1, value.lower()
+
+    left_rank, right_rank = rank(left), rank(right)
+    if left_rank[0] == -1:
+        left_rank = rank(0 if right_rank[0] == 0 else ('' if right_rank[0] == 1 else False))
+    if right_rank[0] == -1:
+        right_rank = rank(0 if left_rank[0] == 0 else ('' if left_rank[0] == 1 else False))
+    return (left_rank > right_rank) - (left_rank < right_rank)
+
+
+def _integer(value):
+    return int(_to_number(value))
+
+
+def _format_number(value, number_format):
+    """TEXT() for plain number formats such as '0', '000', '0.00' and '#,##0'."""
+    if number_format.upper() == 'GENERAL' or number_format == '@':
+        return _to_text(value)
+    match = _NUMBER_FORMAT.match(number_format)
+    if not match or not any(char in number_format for char in '0#'):
+        raise UnsupportedExpression(f"TEXT format '{number_format}' is not supported")
+    if isinstance(value, str):
+        try:
+            value = float(value.strip())
+        except ValueError:
+            return value
+    number = Decimal(repr(float(_to_number(value))))
+    integer_part = match.group('integer') or ''
+    decimals = match.group('decimals') or ''
+    rounded = number.quantize(Decimal(1).scaleb(-len(decimals)), rounding=ROUND_HALF_UP)
+    sign = '-' if rounded < 0 else ''
+    whole, _, fraction = f"{abs(rounded):f}".partition('.')
+    whole = whole.lstrip('0')
+    whole = whole.rjust(integer_part.count('0'), '0')
+    if ',' in integer_part and whole:
+        whole = f"{int(whole):,}"
+    if decimals:
+        # '#' 小數位不補零
+        optional = len(decimals) - len(decimals.rstrip('#'))
+        fraction = fraction[:len(decimals)]
+        if optional:
+            fraction = fraction[:len(decimals) - optional] + fraction[len(decimals) - optional:].rstrip('0')
+        return f"{sign}{whole}.{fraction}" if fraction else f"{sign}{whole}."
+    return f"{sign}{whole}"
+
+
+def _address_text(row, col, abs_num, a1, sheet_text):
+    if not 1 <= row <= 1048576 or not 1 <= col <= 16384 or abs_num not in (1, 2, 3, 4):
+        raise _FormulaError('#VALUE!')
+    row_absolute = abs_num in (1, 2)
+    col_absolute = abs_num in (1, 3)
+    if a1:
+        text = f"{'$' if col_absolute else ''}{column_letters(col)}{'$' if row_absolute else ''}{row}"
+    else:
+        text = f"R{row if row_absolute else f'[{row}]'}C{col if col_absolute else f'[{col}]'}"
+    if sheet_text:
+        text = f"{quote_sheet_name(sheet_text)}!{text}"
+    return text
+
+
+def r1c1_to_a1(reference_text, row, col):
+    """
+    Convert R1C1 reference text ('R5C2', 'R[1]C[-1]', "'My Sheet'!R1C1:R2C2")
+    to A1 text, with relative parts taken from the cell at (row, col)
+    """
+    prefix, _, area = reference_text.rpartition('!')
+    corners = []
+    for corner in area.split(':'):
+        match = _R1C1_PART.match(corner.strip())
+        if not match:
+            raise _FormulaError('#REF!')
+        row_part, col_part = match.group(1), match.group(2)
+
+        def resolve(part, base):
+            if part is None:
+                return base
+            if part.startswith('['):
+                return base + int(part[1:-1])
+            return int(part)
+
+        corners.append(f"{column_letters(resolve(col_part, col))}{resolve(row_part, row)}")
+    return (prefix + '!' if prefix else '') + ':'.join(corners)
+
+
+class IndirectEvaluator:
+    """
+    Evaluates INDIRECT arguments for one cell at a time
+
+    Args:
+        value_reader: Optional callable(workbook_path, sheet_name, cell_address)
+            returning a cell's cached value (default: read_cached_value)
+    """
+
+    def __init__(self, value_reader=None):
+        self.value_reader = value_reader or read_cached_value
+
+    def evaluate(self, expression, workbook_path, sheet_name, cell_address):
+        """
+        Value of an expression as Excel would calculate it in a cell
+
+        Args:
+            expression: Formula text without '=' (e.g. 'B1&"!A"&ROW()')
+            workbook_path, sheet_name: Where the formula lives
+            cell_address: The formula's cell (for ROW() / COLUMN() and relative R1C1)
+
+        Returns:
+            Value (str, int, float or bool); Excel errors as their text ('#REF!')
+
+        Raises:
+            UnsupportedExpression: When the expression needs Excel
+        """
+        values = self._evaluate_arguments(expression, workbook_path, sheet_name, cell_address)
+        if len(values) != 1:
+            raise UnsupportedExpression("Expected a single expression")
+        return values[0]
+
+    def evaluate_reference_text(self, content, workbook_path, sheet_name, cell_address):
+        """
+        Reference text produced by INDIRECT(content), in A1 style
+
+        Args:
+            content: Everything between INDIRECT( and its closing bracket,
+                including an optional a1 argument
+
+        Returns:
+            str: Reference text, or an Excel error code
+        """
+        values = self._evaluate_arguments(content, workbook_path, sheet_name, cell_address)
+        if not 1 <= len(values) <= 2:
+            raise UnsupportedExpression("INDIRECT takes one or two arguments")
+        text = values[0] if isinstance(values[0], str) and values[0] in EXCEL_ERRORS else _to_text(values[0])
+        if text in EXCEL_ERRORS:
+            return text
+        if len(values) == 2 and values[1] is not None and not _to_bool(values[1]):
+            row, col = cell_position(cell_address) or (1, 1)
+            try:
+                return r1c1_to_a1(text, row, col)
+            except _FormulaError as error:
+                return error.code
+        return text
+
+    def _parse(self, expression, workbook_path, sheet_name, cell_address):
+        """(argument trees, evaluation context) of an expression"""
+        expression = expression.strip()
+        if expression.startswith('='):
+            expression = expression[1:]
+        tree = _Parser(_tokenize(expression)).arguments()
+        position = cell_position(cell_address) or (1, 1)
+        return tree, (workbook_path, sheet_name, position)
+
+    def _evaluate_arguments(self, expression, workbook_path, sheet_name, cell_address):
+        tree, context = self._parse(expression, workbook_path, sheet_name, cell_address)
+        results = []
+        for node in tree:
+            try:
+                results.append(self._value(node, context))
+            except _FormulaError as error:
+                results.append(error.code)
+        return results
+
+    def _value(self, node, context):
+        value = self._evaluate(node, context)
+        if isinstance(value, tuple):
+            # 引用：讀出儲存格的值
+            value = self._read_reference(value, context)
+        if isinstance(value, str) and value in EXCEL_ERRORS:
+            raise _FormulaError(value)
+        return value
+
+    def _evaluate(self, node, context):
+        kind = node[0]
+        if kind == 'literal':
+            return node[1]
+        if kind == 'missing':
+            return None
+        if kind == 'ref':
+            return node[1]
+        if kind == 'concat':
+            return _to_text(self._value(node[1], context)) + _to_text(self._value(node[2], context))
+        if kind == 'negate':
+            return -_to_number(self._value(node[1], context))
+        if kind == 'arith':
+            left = _to_number(self._value(node[2], context))
+            right = _to_number(self._value(node[3], context))
+            operator = node[1]
+            if operator == '+':
+                return left + right
+            if operator == '-':
+                return left - right
+            if operator == '*':
+                return left * right
+            if operator == '/':
+                if right == 0:
+                    raise _FormulaError('#DIV/0!')
+                return left / right
+            return left ** right
+        if kind == 'compare':
+            order = _compare(self._value(node[2], context), self._value(node[3], context))
+            return _COMPARISONS[node[1]](order)
+        if kind == 'call':
+            return self._call(node[1], node[2], context)
+        raise UnsupportedExpression(f"Unknown node {kind}")
+
+    def _reference_location(self, reference, context):
+        """(workbook_path, sheet_name) a reference points into"""
+        directory, workbook, sheet, _ = reference
+        workbook_path, sheet_name, _ = context
+        if workbook:
+            base = directory.replace('\\\\', '\\') or os.path.dirname(workbook_path)
+            workbook_path = os.path.join(base, workbook)
+        return workbook_path, sheet or sheet_name
+
+    def _read_reference(self, reference, context):
+        area = reference[3]
+        if ':' in area:
+            raise UnsupportedExpression(f"Range value '{area}' needs Excel")
+        workbook_path, sheet_name = self._reference_location(reference, context)
+        return self.value_reader(workbook_path, sheet_name, area.replace('$', ''))
+
+    def _position(self, node, context, index):
+        """Row or column (index 0 / 1) of a reference argument, or of the formula cell."""
+        if node is None or node[0] == 'missing':
+            return context[2][index]
+        reference = self._evaluate(node, context)
+        if not isinstance(reference, tuple):
+            raise _FormulaError('#VALUE!')
+        min_row, min_col, _, _ = rectangle_from_address(reference[3])
+        return (min_row, min_col)[index]
+
+    def _call(self, name, args, context):
+        def arg(position, default=None):
+            if position >= len(args) or args[position][0] == 'missing':
+                return default
+            return self._value(args[position], context)
+
+        if name == 'ROW' or name == 'COLUMN':
+            if len(args) > 1:
+                raise _FormulaError('#VALUE!')
+            return self._position(args[0] if args else None, context, 0 if name == 'ROW' else 1)
+        if name == 'ADDRESS':
+            if not 2 <= len(args) <= 5:
+                raise _FormulaError('#VALUE!')
+            sheet_text = arg(4)
+            return _address_text(_integer(arg(0)), _integer(arg(1)), _integer(arg(2, 1)),
+                                 _to_bool(arg(3, True)), _to_text(sheet_text) if sheet_text is not None else None)
+        if name == 'IF':
+            if not 2 <= len(args) <= 3:
+                raise _FormulaError('#VALUE!')
+            if _to_bool(arg(0)):
+                return arg(1, 0)
+            return arg(2, False) if len(args) > 2 else False
+        if name == 'CHOOSE':
+            if len(args) < 2:
+                raise _FormulaError('#VALUE!')
+            choice = _integer(arg(0))
+            if not 1 <= choice < len(args):
+                raise _FormulaError('#VALUE!')
+            return arg(choice, 0)
+        if name == 'TEXT':
+            if len(args) != 2:
+                raise _FormulaError('#VALUE!')
+            return _format_number(arg(0), _to_text(arg(1)))
+        if name == 'SUBSTITUTE':
+            if not 3 <= len(args) <= 4:
+                raise _FormulaError('#VALUE!')
+            text, old, new = _to_text(arg(0)), _to_text(arg(1)), _to_text(arg(2))
+            if not old:
+                return text
+            instance = arg(3)
+            if instance is None:
+                return text.replace(old, new)
+            instance = _integer(instance)
+            if instance < 1:
+                raise _FormulaError('#VALUE!')
+            position = -1
+            for _ in range(instance):
+                position = text.find(old, position + 1)
+                if position == -1:
+                    return text
+            return text[:position] + new + text[position + len(old):]
+        raise UnsupportedExpression(f"Function {name} is not supported")
+
+
+def evaluate_indirect_argument(content, workbook_path, sheet_name, cell_address, evaluator=None):
+    """
+    Resolve the argument of INDIRECT without Excel, in the result format of
+    EnhancedDependencyExploder._calculate_indirect_safely
+
+    Returns:
+        dict: {'success', 'static_reference' or 'error', 'indirect_content', 'method': 'native'}
+
+    Raises:
+        UnsupportedExpression: When the argument needs Excel
+    """
+    evaluator = evaluator or IndirectEvaluator()
+    reference_text = evaluator.evaluate_reference_text(content, workbook_path, sheet_name, cell_address).strip()
+    if not reference_text or reference_text in EXCEL_ERRORS:
+        return {
+            'success': False,
+            'error': f'計算結果無效: {reference_text or "(空字串)"}',
+            'indirect_content': content,
+            'method': 'native'
+        }
+    return {
+        'success': True,
+        'static_reference': reference_text,
+        'indirect_content': content,
+        'method': 'native'
+    }
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    from openpyxl import Workbook
+
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, "Indirect.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Main"
+    ws["A1"] = "Data Sheet"
+    ws["A2"] = 7
+    ws["A3"] = "Q1"
+    wb.create_sheet("Data Sheet")["B7"] = 42
+    wb.save(path)
+
+    evaluator = IndirectEvaluator()
+    cases = [
+        ('"\'"&A1&"\'!B"&A2', "'Data Sheet'!B7"),
+        ('ADDRESS(A2,2,4,TRUE,A1)', "'Data Sheet'!B7"),
+        ('ADDRESS(ROW(),COLUMN()+1)', "$D$5"),
+        ('"Sheet"&TEXT(A2,"00")&"!A1"', "Sheet07!A1"),
+        ('CHOOSE(2,"X!A1",A3&"!B"&(A2+1))', "Q1!B8"),
+        ('IF(A3="q1",SUBSTITUTE(A1," ","_"),"none")&"!C1"', "Data_Sheet!C1"),
+        ('"R[1]C[-1]",FALSE', "B6"),
+    ]
+    for content, expected in cases:
+        result = evaluator.evaluate_reference_text(content, path, "Main", "C5")
+        print(f"  {'OK ' if result == expected else 'BAD'} {content:<48} -> {result}")
+    print("  VLOOKUP raises:", end=" ")
+    try:
+        evaluator.evaluate_reference_text('VLOOKUP(A3,B:C,2,0)', path, "Main", "C5")
+    except UnsupportedExpression as error:
+        print(error)
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        evaluator.evaluate_reference_text(cases[0][0], path, "Main", "C5")
+    print(f"1000 evaluations in {time.perf_counter() - start:.2f}s (an Excel instance takes >1s each)")
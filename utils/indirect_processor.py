@@ -11,12 +11,15 @@ import openpyxl
 import sys
 import traceback
 
+from utils.indirect_session import find_indirect_calls
+
 class IndirectProcessor:
     """INDIRECT函數處理器"""
     
-    def __init__(self, workbook_path, sheet_name):
+    def __init__(self, workbook_path, sheet_name, session=None):
         self.workbook_path = workbook_path
         self.sheet_name = sheet_name
+        self.session = session  # 可選的 IndirectSession：共用工作簿與外部連結映射，不必每次重新掃描
         self.workbook = None
         self.worksheet = None
         self.external_links_map = {}
@@ -25,6 +28,11 @@ class IndirectProcessor:
     def load_workbook(self):
         """載入工作簿"""
         try:
+            if self.session is not None:
+                self.workbook = self.session.workbook(self.workbook_path)
+                self.worksheet = self.workbook[self.sheet_name]
+                self.external_links_map = self.session.external_links(self.workbook_path)
+                return
             self.workbook = openpyxl.load_workbook(self.workbook_path, data_only=False)
             self.worksheet = self.workbook[self.sheet_name]
             self.get_external_links_from_openpyxl()
@@ -496,7 +504,7 @@ class IndirectProcessor:
             return original_formula
 
 
-def process_indirect_in_formula(formula, workbook_path, sheet_name, context_cell=None):
+def process_indirect_in_formula(formula, workbook_path, sheet_name, context_cell=None, session=None):
     """
     便捷函數：處理公式中的INDIRECT函數 - 使用你的unified_indirect_resolver
     
@@ -505,6 +513,8 @@ def process_indirect_in_formula(formula, workbook_path, sheet_name, context_cell
         workbook_path: Excel文件路徑
         sheet_name: 工作表名稱
         context_cell: 公式所在的儲存格地址（用於ROW/COLUMN函數）
+        session: 可選的 IndirectSession（每次分析開一個）。提供時先以原生求值器解析，
+            結果有記憶；無法原生解析時才建立 unified_indirect_resolver
         
     Returns:
         dict: {
@@ -524,6 +534,19 @@ def process_indirect_in_formula(formula, workbook_path, sheet_name, context_cell
                 'resolved_formula': formula
             }
         
+        if session is not None:
+            session_result = session.resolve_formula(formula, workbook_path, sheet_name, context_cell)
+            if session_result['resolved_references'] and not session_result['unresolved']:
+                return {
+                    'has_indirect': True,
+                    'indirect_functions': [
+                        {'original': full_function, 'content': content}
+                        for full_function, content in find_indirect_calls(formula)
+                    ],
+                    'resolved_references': session_result['resolved_references'],
+                    'resolved_formula': session_result['resolved_formula']
+                }
+        
         # === 使用你的unified_indirect_resolver ===
         import sys
         import os
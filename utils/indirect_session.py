@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+"""
+INDIRECT Resolver Session
+One object per analysis that every INDIRECT resolver shares, instead of each
+one loading the workbook in full mode and rescanning its external links for
+every formula:
+
+- workbooks: formula workbooks are loaded once and reused (reloaded when the
+  file is saved)
+- external links: the [n] -> path map of each workbook is read once
+- results: INDIRECT results are memoised by (argument text, context cell,
+  fingerprint of the input cells' values). The input cells of an argument are
+  the cells the native evaluator read the first time, so a repeated argument
+  is only evaluated again when one of them has changed. Arguments the native
+  evaluator cannot follow are fingerprinted by the modification times of the
+  workbook and of every source file in its external link map.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import unquote
+
+from utils.indirect_evaluator import UnsupportedExpression, evaluate_indirect_argument
+from utils.index_resolver import IndexResolver, get_global_lookup_cache
+
+# 推斷外部連結時找的常見檔名（與舊版解析器相同）
+COMMON_LINK_FILES = (
+    "Link1.xlsx", "Link2.xlsx", "Link3.xlsx",
+    "File1.xlsx", "File2.xlsx", "File3.xlsx",
+    "Data.xlsx", "GDP.xlsx", "Test.xlsx"
+)
+
+# openpyxl 原始公式中的外部連結編號引用：[1]Sheet!A1 或 '[1]My Sheet'!A1
+_LINK_INDEX_PATTERN = re.compile(r"'?\[(\d+)\]((?:[^'!]|'')*)'?!")
+
+
+def read_external_links_map(workbook, workbook_path):
+    """
+    External link numbers of a workbook mapped to file paths
+
+    Read from the workbook's external link parts; when it has none, common
+    link file names next to the workbook are used instead.
+
+    Returns:
+        dict: {'1': path, ...}
+    """
+    external_links_map = {}
+    try:
+        for i, link in enumerate(getattr(workbook, '_external_links', None) or [], 1):
+            file_link = getattr(link, 'file_link', None)
+            if file_link is not None and file_link.Target:
+                decoded_path = unquote(file_link.Target)
+                if decoded_path.startswith('file:///'):
+                    decoded_path = decoded_path[8:]
+                elif decoded_path.startswith('file://'):
+                    decoded_path = decoded_path[7:]
+                external_links_map[str(i)] = decoded_path
+
+        # 如果沒有找到，推斷常見的外部連結
+        if not external_links_map:
+            base_dir = os.path.dirname(workbook_path)
+            index = 1
+            for filename in COMMON_LINK_FILES:
+                full_path = os.path.join(base_dir, filename)
+                if os.path.exists(full_path):
+                    external_links_map[str(index)] = full_path
+                    index += 1
+    except Exception as e:
+        print(f"Error getting external links: {e}")
+    return external_links_map
+
+
+def find_indirect_calls(formula):
+    """
+    Outer INDIRECT calls of a formula, skipping text in quotes
+
+    Returns:
+        list: (full_function, content) in formula order
+    """
+    calls = []
+    upper = formula.upper()
+    position = 0
+    in_string = in_sheet = False
+    while position < len(formula):
+        char = formula[position]
+        if char == '"' and not in_sheet:
+            in_string = not in_string
+        elif char == "'" and not in_string:
+            in_sheet = not in_sheet
+        elif not (in_string or in_sheet) and upper.startswith('INDIRECT(', position) and \
+                (position == 0 or not (formula[position - 1].isalnum() or formula[position - 1] in '_.')):
+            start = position + len('INDIRECT(')
+            end = _closing_bracket(formula, start)
+            if end is None:
+                break
+            calls.append((formula[position:end + 1], formula[start:end]))
+            position = end
+        position += 1
+    return calls
+
+
+def _closing_bracket(formula, start):
+    depth = 1
+    in_string = in_sheet = False
+    for position in range(start, len(formula)):
+        char = formula[position]
+        if char == '"' and not in_sheet:
+            in_string = not in_string
+        elif char == "'" and not in_string:
+            in_sheet = not in_sheet
+        elif in_string or in_sheet:
+            continue
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return position
+    return None
+
+
+class _InputRecorder:
+    """
+    LookupCache stand-in for the session's evaluator: reads go to the shared
+    lookup cache, and while a recording is active the cells and lookup ranges
+    read are noted as the evaluation's inputs
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.inputs = None
+
+    def read_value(self, workbook_path, sheet_name, cell_address):
+        value = self.cache.read_value(workbook_path, sheet_name, cell_address)
+        if self.inputs is not None:
+            self.inputs[('cell', workbook_path, sheet_name, cell_address)] = None
+        return value
+
+    def vector(self, workbook_path, sheet_name, rectangle):
+        if self.inputs is not None:
+            # 查找範圍以檔案修改時間代表（範圍太大，不逐格比對）
+            self.inputs[('file', workbook_path)] = None
+        return self.cache.vector(workbook_path, sheet_name, rectangle)
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+
+class IndirectSession:
+    """
+    Shared INDIRECT resolution state for one analysis
+
+    Usage:
+        with IndirectSession() as session:
+            result = session.evaluate('B1&"!A"&ROW()', path, "Sheet1", "C5")
+            resolved = session.resolve_formula(formula, path, "Sheet1", "C5")
+    """
+
+    def __init__(self, lookup_cache=None, max_workbooks=8, max_results=100000):
+        """
+        Initialize the session
+
+        Args:
+            lookup_cache: LookupCache for cell values (default: the global one)
+            max_workbooks: Maximum number of formula workbooks kept loaded
+            max_results: Maximum number of memoised INDIRECT results
+        """
+        self.recorder = _InputRecorder(lookup_cache or get_global_lookup_cache())
+        self.evaluator = IndexResolver(self.recorder)
+        self.max_workbooks = max_workbooks
+        self.max_results = max_results
+        self.workbooks = OrderedDict()  # 正規化路徑 -> (修改時間, 工作簿)
+        self.external_links_maps = {}  # 正規化路徑 -> (修改時間, 外部連結映射)
+        self.inputs = {}  # (參數, 儲存格) -> 輸入項目
+        self.results = OrderedDict()  # (參數, 儲存格, 指紋) -> 結果或 UnsupportedExpression
+        self.lock = threading.RLock()
+        self._stats = {
+            'workbooks_loaded': 0,
+            'workbook_hits': 0,
+            'link_maps_read': 0,
+            'evaluations': 0,
+            'memo_hits': 0,
+            'fallbacks': 0
+        }
+
+    @staticmethod
+    def _file_key(workbook_path):
+        return os.path.normcase(os.path.abspath(workbook_path)), os.path.getmtime(workbook_path)
+
+    def workbook(self, workbook_path):
+        """
+        Formula workbook (openpyxl, data_only=False), loaded once per session
+        and again only after the file has been saved
+        """
+        import openpyxl
+
+        path_key, mtime = self._file_key(workbook_path)
+        with self.lock:
+            cached = self.workbooks.get(path_key)
+            if cached is not None and cached[0] == mtime:
+                self.workbooks.move_to_end(path_key)
+                self._stats['workbook_hits'] += 1
+                return cached[1]
+            workbook = openpyxl.load_workbook(workbook_path, data_only=False)
+            self.workbooks[path_key] = (mtime, workbook)
+            self.workbooks.move_to_end(path_key)
+            self._stats['workbooks_loaded'] += 1
+            while len(self.workbooks) > self.max_workbooks:
+                self.workbooks.popitem(last=False)
+            return workbook
+
+    def worksheet(self, workbook_path, sheet_name):
+        """Worksheet of the session's formula workbook."""
+        return self.workbook(workbook_path)[sheet_name]
+
+    def external_links(self, workbook_path):
+        """External link map of a workbook (see read_external_links_map), read once per session."""
+        path_key, mtime = self._file_key(workbook_path)
+        with self.lock:
+            cached = self.external_links_maps.get(path_key)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            links = read_external_links_map(self.workbook(workbook_path), workbook_path)
+            self.external_links_maps[path_key] = (mtime, links)
+            self._stats['link_maps_read'] += 1
+            return links
+
+    def expand_external_links(self, formula, workbook_path):
+        """
+        Replace [n] external link numbers with the linked file's full path
+        ("[1]Data!A1" -> "'C:\\Links\\[Link1.xlsx]Data'!A1")
+        """
+        if not _LINK_INDEX_PATTERN.search(formula):
+            return formula
+        links = self.external_links(workbook_path)
+
+        def replace(match):
+            linked_path = links.get(match.group(1))
+            if not linked_path:
+                return match.group(0)
+            directory, filename = os.path.split(linked_path)
+            sheet = match.group(2).replace("''", "'")
+            prefix = f"{directory}{os.sep if directory else ''}[{filename}]{sheet}"
+            return "'" + prefix.replace("'", "''") + "'!"
+
+        return _LINK_INDEX_PATTERN.sub(replace, formula)
+
+    def _fingerprint(self, inputs):
+        values = []
+        for item in inputs:
+            try:
+                if item[0] == 'cell':
+                    values.append(self.recorder.cache.read_value(*item[1:]))
+                else:
+                    values.append(os.path.getmtime(item[1]))
+            except Exception:
+                return None
+        return tuple(values)
+
+    def _store(self, key, result):
+        self.results[key] = result
+        self.results.move_to_end(key)
+        while len(self.results) > self.max_results:
+            self.results.popitem(last=False)
+
+    def evaluate(self, argument, workbook_path, sheet_name, cell_address, fallback=None):
+        """
+        Resolve the argument of INDIRECT natively, memoised
+
+        Args:
+            argument: Everything between INDIRECT( and its closing bracket
+            workbook_path, sheet_name, cell_address: The formula's cell
+            fallback: Optional callable() -> result dict, used (and memoised)
+                when the native evaluator does not support the argument, e.g.
+                a calculation in Excel. It runs outside the session lock, and
+                a fallback that raises is not memoised.
+
+        Returns:
+            dict: The evaluate_indirect_argument result format
+
+        Raises:
+            UnsupportedExpression: When the argument needs Excel and there is no fallback
+        """
+        memo_key = (argument, (workbook_path, sheet_name, cell_address))
+        with self.lock:
+            inputs = self.inputs.get(memo_key)
+            fingerprint = self._fingerprint(inputs) if inputs is not None else None
+            if fingerprint is not None:
+                cached = self.results.get(memo_key + (fingerprint,))
+                if cached is not None and not (isinstance(cached, UnsupportedExpression) and fallback is not None):
+                    self.results.move_to_end(memo_key + (fingerprint,))
+                    self._stats['memo_hits'] += 1
+                    if isinstance(cached, UnsupportedExpression):
+                        raise cached
+                    return dict(cached)
+
+            self._stats['evaluations'] += 1
+            self.recorder.inputs = OrderedDict()
+            memoisable = True
+            try:
+                result = evaluate_indirect_argument(argument, workbook_path, sheet_name, cell_address, self.evaluator)
+            except UnsupportedExpression as unsupported:
+                result = unsupported
+                # 原生求值器讀不完輸入：以公式所在活頁簿及其外部連結來源檔的修改時間補上
+                self.recorder.inputs[('file', workbook_path)] = None
+                try:
+                    for linked_path in self.external_links(workbook_path).values():
+                        self.recorder.inputs[('file', linked_path)] = None
+                except Exception:
+                    # 不知道來源檔就無法判斷結果何時過期，不做記憶
+                    memoisable = False
+            finally:
+                inputs, self.recorder.inputs = tuple(self.recorder.inputs), None
+            # 指紋在 fallback 之前取得：計算期間若輸入被修改，這筆結果就不會再被命中
+            fingerprint = self._fingerprint(inputs) if memoisable else None
+            use_fallback = isinstance(result, UnsupportedExpression) and fallback is not None
+            if use_fallback:
+                self._stats['fallbacks'] += 1
+
+        if use_fallback:
+            # Excel 的同步計算可能很久，不佔用鎖
+            result = fallback()
+        if fingerprint is not None:
+            with self.lock:
+                self.inputs[memo_key] = inputs
+                self._store(memo_key + (fingerprint,), result)
+        if isinstance(result, UnsupportedExpression):
+            raise result
+        return dict(result)
+
+    def remember(self, argument, workbook_path, sheet_name, cell_address, result):
+        """
+        Memoise a result calculated elsewhere (e.g. a batch in Excel) for an
+        argument the native evaluator does not support
+
+        Only stored once evaluate() has seen the argument, since that is what
+        records its input cells.
+        """
+        with self.lock:
+            memo_key = (argument, (workbook_path, sheet_name, cell_address))
+            inputs = self.inputs.get(memo_key)
+            fingerprint = self._fingerprint(inputs) if inputs is not None else None
+            if fingerprint is not None:
+                self._store(memo_key + (fingerprint,), dict(result))
+
+    def resolve_formula(self, formula, workbook_path, sheet_name, cell_address=None):
+        """
+        Replace every INDIRECT call of a formula with the reference it resolves to
+
+        External link numbers ([1]) are expanded first with the session's link map.
+
+        Returns:
+            dict: {
+                'resolved_formula': str,
+                'resolved_references': list of the references put in,
+                'unresolved': list of the INDIRECT calls left as they were
+            }
+        """
+        resolved_formula = formula
+        resolved_references = []
+        unresolved = []
+        for full_function, argument in find_indirect_calls(formula):
+            try:
+                expanded = self.expand_external_links(argument, workbook_path)
+                result = self.evaluate(expanded, workbook_path, sheet_name, cell_address or 'A1')
+            except UnsupportedExpression:
+                result = None
+            except Exception as e:
+                print(f"Error resolving INDIRECT in session: {e}")
+                result = None
+            if not result or not result.get('success'):
+                unresolved.append(full_function)
+                continue
+            resolved_formula = resolved_formula.replace(full_function, result['static_reference'], 1)
+            resolved_references.append(result['static_reference'])
+        return {
+            'resolved_formula': resolved_formula,
+            'resolved_references': resolved_references,
+            'unresolved': unresolved
+        }
+
+    def get_stats(self):
+        """
+        Get session statistics
+
+        Returns:
+            dict: Workbooks loaded/reused, link maps read, evaluations, memo hits
+        """
+        with self.lock:
+            return {
+                'workbooks': len(self.workbooks),
+                'memoised_results': len(self.results),
+                **self._stats
+            }
+
+    def close(self):
+        """
+        Release the loaded workbooks, link maps and memo (the session can be used again)
+        """
+        with self.lock:
+            self.workbooks.clear()
+            self.external_links_maps.clear()
+            self.inputs.clear()
+            self.results.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import time
+
+    from openpyxl import Workbook
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    path = os.path.join(tempfile.mkdtemp(), "Session.xlsx")
+
+    def save(sheet_choice):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Main"
+        ws["A1"] = sheet_choice
+        for row in range(1, rows + 1):
+            ws[f"B{row}"] = row
+            ws[f"C{row}"] = f'=INDIRECT($A$1&"!D"&B{row})'
+        data = wb.create_sheet("Data")
+        data["D1"] = 1
+        wb.create_sheet("Backup")
+        wb.save(path)
+
+    save("Data")
+    arguments = [(f'$A$1&"!D"&B{row}', f"C{row}") for row in range(1, rows + 1)]
+
+    with IndirectSession() as session:
+        for label in ("first pass", "second pass (memo)"):
+            start = time.time()
+            references = [session.evaluate(argument, path, "Main", cell)['static_reference'] for argument, cell in arguments]
+            print(f"{label}: {rows} INDIRECT arguments in {time.time() - start:.3f}s")
+        assert references[-1] == f"Data!D{rows}"
+
+        # 輸入值改變（檔案重新儲存）後才重新計算
+        time.sleep(1.1)
+        save("Backup")
+        assert session.evaluate(arguments[0][0], path, "Main", arguments[0][1])['static_reference'] == "Backup!D1"
+
+        start = time.time()
+        for _ in range(20):
+            session.worksheet(path, "Main")
+            session.external_links(path)
+        print(f"20 resolver set-ups sharing the session's workbook in {time.time() - start:.3f}s")
+        print(f"Session stats: {session.get_stats()}")
@@ -8,6 +8,7 @@ import openpyxl
 import os
 import re
 from .safe_cache import get_safe_cached_workbook
+from .spatial_index import rectangle_from_address, column_letters
 import traceback
 
 # 輔助函數：從工作簿中獲取外部連結映射
@@ -314,6 +315,68 @@ def load_resolved_workbook(file_path, use_cache=True):
     return ResolvedWorkbookView(workbook)
 
 
+def _array_formula_for_cell(file_path, sheet_name, cell_address):
+    """
+    查詢儲存格是否屬於某個陣列公式（非左上角），返回公式或 None
+    """
+    try:
+        from core.xlsx_stream_scanner import array_formula_at
+        return array_formula_at(file_path, sheet_name, cell_address.replace('$', ''))
+    except Exception:
+        return None
+
+
+def _load_data_only_workbook(file_path, use_cache):
+    if use_cache:
+        from .safe_cache import get_safe_cached_workbook
+        return get_safe_cached_workbook(file_path, data_only=True)
+    return openpyxl.load_workbook(file_path, data_only=True)
+
+
+def _formula_cell_info(formula, calculated_value):
+    display_value = str(calculated_value) if calculated_value is not None else "N/A"
+    return {
+        'formula': formula,
+        'calculated_value': calculated_value,
+        'display_value': display_value,
+        'cell_type': 'formula',
+        'has_external_references': '[' in formula and ']' in formula
+    }
+
+
+def _non_formula_cell_info(file_path, sheet_name, cell_address, resolved_value):
+    # 陣列公式只記錄在左上角儲存格，其餘儲存格在 openpyxl 中看起來是普通數值
+    array_formula = _array_formula_for_cell(file_path, sheet_name, cell_address)
+    if array_formula:
+        return {
+            'formula': array_formula,
+            'calculated_value': resolved_value,
+            'display_value': str(resolved_value) if resolved_value is not None else "N/A",
+            'cell_type': 'formula',
+            'has_external_references': '[' in array_formula and ']' in array_formula
+        }
+
+    # 非公式 cell
+    return {
+        'formula': None,
+        'calculated_value': resolved_value,
+        'display_value': str(resolved_value) if resolved_value is not None else "",
+        'cell_type': 'value',
+        'has_external_references': False
+    }
+
+
+def _error_cell_info(error):
+    return {
+        'error': str(error),
+        'formula': None,
+        'calculated_value': None,
+        'display_value': None,
+        'cell_type': 'error',
+        'has_external_references': False
+    }
+
+
 def read_cell_with_resolved_references(file_path, sheet_name, cell_address, use_cache=True):
     """
     使用 ResolvedWorkbookView 讀取指定 cell 的資訊
@@ -326,8 +389,7 @@ def read_cell_with_resolved_references(file_path, sheet_name, cell_address, use_
         resolved_sheet = resolved_wb[sheet_name]
         resolved_cell = resolved_sheet[cell_address]
         
-        # 獲取原始和解析後的值
-        original_value = resolved_cell._cell.value
+        # 獲取解析後的值
         resolved_value = resolved_cell.value
         cell_type = resolved_cell.data_type
         
@@ -337,48 +399,174 @@ def read_cell_with_resolved_references(file_path, sheet_name, cell_address, use_
             
             # 嘗試獲取計算值 (使用 data_only=True with cache)
             try:
-                if use_cache:
-                    from .safe_cache import get_safe_cached_workbook
-                    data_wb = get_safe_cached_workbook(file_path, data_only=True)
-                else:
-                    data_wb = openpyxl.load_workbook(file_path, data_only=True)
-                
-                data_sheet = data_wb[sheet_name]
-                data_cell = data_sheet[cell_address]
-                calculated_value = data_cell.value
+                data_wb = _load_data_only_workbook(file_path, use_cache)
+                calculated_value = data_wb[sheet_name][cell_address].value
             except:
                 calculated_value = "Cannot calculate"
             
-            display_value = str(calculated_value) if calculated_value is not None else "N/A"
-            
-            # 檢查是否仍有未解析的 external references
-            has_unresolved_refs = '[' in formula and ']' in formula and any(f'[{i}]' in formula for i in range(1, 10))
-            
-            return {
-                'formula': formula,
-                'calculated_value': calculated_value,
-                'display_value': display_value,
-                'cell_type': 'formula',
-                'has_external_references': '[' in formula and ']' in formula
-            }
+            return _formula_cell_info(formula, calculated_value)
         else:
-            # 非公式 cell
-            return {
-                'formula': None,
-                'calculated_value': resolved_value,
-                'display_value': str(resolved_value) if resolved_value is not None else "",
-                'cell_type': 'value',
-                'has_external_references': False
-            }
+            return _non_formula_cell_info(file_path, sheet_name, cell_address, resolved_value)
             
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return {
-            'error': str(e),
-            'formula': None,
-            'calculated_value': None,
-            'display_value': None,
-            'cell_type': 'error',
-            'has_external_references': False
-        }
\ No newline at end of file
+        return _error_cell_info(e)
+
+
+def _cell_position(cell_address):
+    """'$B$12' -> (12, 2)"""
+    match = re.match(r"^\$?([A-Za-z]{1,3})\$?(\d+)$", cell_address)
+    if not match:
+        raise ValueError(f"Invalid cell address: {cell_address}")
+    column = 0
+    for char in match.group(1).upper():
+        column = column * 26 + (ord(char) - 64)
+    return int(match.group(2)), column
+
+
+def _stream_cells(sheet, positions):
+    """
+    以一次 iter_rows 串流讀出多個儲存格
+
+    唯讀工作表每次 sheet['A1'] 都要從頭解析 XML，這裡只走一次包住所有
+    儲存格的矩形範圍，並挑出需要的位置。
+
+    Returns:
+        dict: (row, column) -> openpyxl cell（不存在的儲存格不在結果中）
+    """
+    wanted = set(positions)
+    min_row = min(row for row, _ in wanted)
+    max_row = max(row for row, _ in wanted)
+    min_col = min(col for _, col in wanted)
+    max_col = max(col for _, col in wanted)
+    cells = {}
+    for row_offset, row in enumerate(sheet.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col)):
+        row_number = min_row + row_offset
+        for col_offset, cell in enumerate(row):
+            position = (row_number, min_col + col_offset)
+            if position in wanted:
+                cells[position] = cell
+    return cells
+
+
+def read_cells_with_resolved_references(file_path, sheet_name, cell_addresses, use_cache=True, workbook_loader=None):
+    """
+    一次讀取同一工作表的多個儲存格，結果與逐一呼叫
+    read_cell_with_resolved_references 相同
+
+    公式活頁簿與計算值活頁簿各只串流一次（計算值只在有公式儲存格時讀取）。
+
+    Args:
+        file_path: Excel 檔案路徑
+        sheet_name: 工作表名稱
+        cell_addresses: 儲存格地址（可重複、可含 $）
+        use_cache: 是否使用快取系統 (預設: True)
+        workbook_loader: 可選 callable(file_path, data_only) -> openpyxl 活頁簿；
+            由呼叫者自行持有活頁簿（例如每個執行緒各自開啟）時使用，取代快取系統
+
+    Returns:
+        dict: 儲存格地址 -> 與 read_cell_with_resolved_references 相同格式的資訊
+    """
+    results = {}
+    positions = {}
+    for cell_address in cell_addresses:
+        if cell_address in positions or cell_address in results:
+            continue
+        try:
+            positions[cell_address] = _cell_position(cell_address)
+        except ValueError as e:
+            results[cell_address] = _error_cell_info(e)
+    if not positions:
+        return results
+
+    try:
+        if workbook_loader is not None:
+            resolved_wb = ResolvedWorkbookView(workbook_loader(file_path, False))
+        else:
+            resolved_wb = load_resolved_workbook(file_path, use_cache=use_cache)
+        resolved_sheet = resolved_wb[sheet_name]
+        cells = _stream_cells(resolved_sheet._sheet, positions.values())
+    except Exception as e:
+        traceback.print_exc()
+        for cell_address in positions:
+            results[cell_address] = _error_cell_info(e)
+        return results
+
+    _fill_cell_infos(results, file_path, sheet_name, positions, cells, resolved_wb._external_link_map,
+                     use_cache, workbook_loader)
+    return results
+
+
+def _fill_cell_infos(results, file_path, sheet_name, positions, cells, link_map, use_cache, workbook_loader):
+    """由已串流的公式儲存格填入結果；計算值只在有公式儲存格時串流一次"""
+    formula_addresses = []
+    for cell_address, position in positions.items():
+        cell = cells.get(position)
+        if cell is not None and cell.data_type == 'f':
+            formula_addresses.append(cell_address)
+        else:
+            resolved_value = cell.value if cell is not None else None
+            results[cell_address] = _non_formula_cell_info(file_path, sheet_name, cell_address, resolved_value)
+
+    if formula_addresses:
+        try:
+            if workbook_loader is not None:
+                data_wb = workbook_loader(file_path, True)
+            else:
+                data_wb = _load_data_only_workbook(file_path, use_cache)
+            data_cells = _stream_cells(data_wb[sheet_name], [positions[a] for a in formula_addresses])
+        except:
+            data_cells = None
+        for cell_address in formula_addresses:
+            formula = _resolve_formula_string(cells[positions[cell_address]].value, link_map)
+            if data_cells is None:
+                calculated_value = "Cannot calculate"
+            else:
+                data_cell = data_cells.get(positions[cell_address])
+                calculated_value = data_cell.value if data_cell is not None else None
+            results[cell_address] = _formula_cell_info(formula, calculated_value)
+
+
+def read_range_cells(file_path, sheet_name, range_address, use_cache=True, workbook_loader=None):
+    """
+    串流讀取範圍內所有非空儲存格；整欄、整列範圍裁切到工作表實際使用的大小
+
+    Args:
+        file_path: Excel 檔案路徑
+        sheet_name: 工作表名稱
+        range_address: 'A1:B50000'、'C:C'、'5:5' 等範圍地址
+        use_cache: 是否使用快取系統 (預設: True)
+        workbook_loader: 同 read_cells_with_resolved_references
+
+    Returns:
+        dict: 儲存格地址 -> 與 read_cell_with_resolved_references 相同格式的資訊，依列、欄順序
+    """
+    min_row, min_col, max_row, max_col = rectangle_from_address(range_address)
+    if workbook_loader is not None:
+        resolved_wb = ResolvedWorkbookView(workbook_loader(file_path, False))
+    else:
+        resolved_wb = load_resolved_workbook(file_path, use_cache=use_cache)
+    sheet = resolved_wb[sheet_name]._sheet
+    if sheet.max_row:
+        max_row = min(max_row, sheet.max_row)
+    if sheet.max_column:
+        max_col = min(max_col, sheet.max_column)
+    if min_row > max_row or min_col > max_col:
+        return {}
+
+    positions = {}
+    cells = {}
+    for row_offset, row in enumerate(sheet.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col)):
+        row_number = min_row + row_offset
+        for col_offset, cell in enumerate(row):
+            if cell.value is None:
+                continue
+            position = (row_number, min_col + col_offset)
+            positions[f"{column_letters(position[1])}{row_number}"] = position
+            cells[position] = cell
+
+    results = {}
+    _fill_cell_infos(results, file_path, sheet_name, positions, cells, resolved_wb._external_link_map,
+                     use_cache, workbook_loader)
+    return {cell_address: results[cell_address] for cell_address in positions}
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Reference Parse Cache for Excel Tools
+Memoises formula reference extraction so a formula text is parsed once per context
+"""
+
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+
+def freeze_references(references):
+    """
+    Turn a parser's list of reference dicts into an immutable tuple.
+
+    Each reference becomes a read-only mapping, so callers that index
+    ref['cell_address'] keep working but cannot change the cached copy.
+    Tuples (e.g. tokens) are already immutable and are kept as they are.
+    """
+    return tuple(
+        MappingProxyType(dict(reference)) if isinstance(reference, dict) else reference
+        for reference in references
+    )
+
+
+class ReferenceParseCache:
+    """
+    Bounded LRU cache of parsed formula references
+
+    Keyed by (formula text, current workbook, current sheet) plus any extra
+    key parts the parser depends on (e.g. its range expansion threshold).
+    The same formula in another workbook or sheet resolves its unqualified
+    references differently, so it is a different entry.
+    """
+
+    def __init__(self, max_size=20000):
+        """
+        Initialize the parse cache
+
+        Args:
+            max_size: Maximum number of cached formulas
+        """
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.lock = threading.RLock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'errors': 0
+        }
+
+    def get_or_parse(self, formula, workbook_path, sheet_name, parse_func, *extra_key):
+        """
+        Get the cached references of a formula, parsing it on a miss
+
+        Args:
+            formula: Formula text
+            workbook_path: Workbook the formula lives in
+            sheet_name: Sheet the formula lives in
+            parse_func: Callable(formula, workbook_path, sheet_name) -> iterable of references
+            *extra_key: Other values the parse result depends on
+
+        Returns:
+            tuple: Immutable references (read-only mappings or tokens)
+        """
+        cache_key = (formula, workbook_path, sheet_name) + extra_key
+        with self.lock:
+            references = self.cache.get(cache_key)
+            if references is not None:
+                self.cache.move_to_end(cache_key)
+                self._stats['hits'] += 1
+                return references
+            self._stats['misses'] += 1
+
+        try:
+            references = freeze_references(parse_func(formula, workbook_path, sheet_name))
+        except Exception:
+            with self.lock:
+                self._stats['errors'] += 1
+            raise
+
+        with self.lock:
+            self.cache[cache_key] = references
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+                self._stats['evictions'] += 1
+        return references
+
+    def clear(self):
+        """
+        Clear all cached parses
+        """
+        with self.lock:
+            self.cache.clear()
+
+    def get_stats(self):
+        """
+        Get cache statistics
+
+        Returns:
+            dict: Cache statistics including hits, misses, etc.
+        """
+        with self.lock:
+            total_requests = self._stats['hits'] + self._stats['misses']
+            hit_rate = (self._stats['hits'] / total_requests * 100) if total_requests > 0 else 0
+
+            return {
+                'cache_size': len(self.cache),
+                'max_size': self.max_size,
+                'hits': self._stats['hits'],
+                'misses': self._stats['misses'],
+                'evictions': self._stats['evictions'],
+                'errors': self._stats['errors'],
+                'hit_rate_percent': round(hit_rate, 2)
+            }
+
+    def print_stats(self):
+        """
+        Print cache statistics to console
+        """
+        stats = self.get_stats()
+        print("\n=== Reference Parse Cache Statistics ===")
+        print(f"Cache Size: {stats['cache_size']}/{stats['max_size']}")
+        print(f"Hit Rate: {stats['hit_rate_percent']}%")
+        print(f"Hits: {stats['hits']}, Misses: {stats['misses']}")
+        print(f"Evictions: {stats['evictions']}, Errors: {stats['errors']}")
+        print("========================================\n")
+
+
+# Global cache instance
+_global_parse_cache = None
+_parse_cache_lock = threading.Lock()
+
+
+def get_global_parse_cache():
+    """
+    Get the global parse cache instance (singleton pattern)
+
+    Returns:
+        ReferenceParseCache: The global parse cache instance
+    """
+    global _global_parse_cache
+    if _global_parse_cache is None:
+        with _parse_cache_lock:
+            if _global_parse_cache is None:
+                _global_parse_cache = ReferenceParseCache()
+    return _global_parse_cache
+
+
+def clear_parse_cache():
+    """
+    Clear the global parse cache
+    """
+    if _global_parse_cache is not None:
+        _global_parse_cache.clear()
+
+
+def print_parse_cache_stats():
+    """
+    Print statistics of the global parse cache
+    """
+    get_global_parse_cache().print_stats()
+
+
+if __name__ == "__main__":
+    import time
+
+    calls = []
+
+    def slow_parse(formula, workbook_path, sheet_name):
+        calls.append(formula)
+        time.sleep(0.001)
+        return [{'workbook_path': workbook_path, 'sheet_name': sheet_name, 'cell_address': 'A1', 'type': 'current'}]
+
+    cache = ReferenceParseCache(max_size=2)
+    start = time.time()
+    for _ in range(1000):
+        refs = cache.get_or_parse("=A1*2", "Book.xlsx", "Sheet1", slow_parse)
+    print(f"1000 lookups, {len(calls)} parse(s), {time.time() - start:.3f}s")
+    try:
+        refs[0]['cell_address'] = 'B2'
+    except TypeError:
+        print("Cached references are read-only")
+    cache.get_or_parse("=B1", "Book.xlsx", "Sheet1", slow_parse)
+    cache.get_or_parse("=C1", "Book.xlsx", "Sheet1", slow_parse)
+    cache.print_stats()
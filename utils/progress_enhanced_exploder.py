@@ -8,18 +8,32 @@ User: ckcm0210
 
 import re
 import os
-import win32com.client
-import pythoncom
 import time
 import psutil
 from urllib.parse import unquote
-from utils.openpyxl_resolver import read_cell_with_resolved_references
+from utils.openpyxl_resolver import read_cell_with_resolved_references, read_cells_with_resolved_references, read_range_cells
 from utils.range_processor import range_processor, process_formula_ranges
+from core.formula_tokenizer import iter_reference_tokens, CELL, RANGE
+from utils.parse_cache import get_global_parse_cache
+from utils.workbook_reader_pool import get_global_reader_pool
+from core.dependency_index import cell_key, get_dependency_index, build_dependency_index, INDEXABLE_EXTENSIONS
+from core.cycle_analysis import find_index_cycles, find_graph_cycles, describe_cycle, mark_cycle_nodes
+from utils.spatial_index import rectangle_from_address, rectangle_cell_count, iter_rectangle_cells
+from core.formula_regions import group_formula_regions
+from utils.indirect_evaluator import UnsupportedExpression, EXCEL_ERRORS
+from utils.indirect_session import IndirectSession
+from utils.excel_calc_pool import ExcelCalculationPool, create_isolated_excel_application, _com_initialize
 import datetime
 import gc
 import traceback
 import hashlib
-import uuid
+
+# INDEX 及其他回傳儲存格位置的函數（外層優先，巢狀的由原生解析器一併處理）
+REFERENCE_FUNCTION_PATTERN = re.compile(r"(?<![\w.])(INDEX|OFFSET|VLOOKUP|HLOOKUP|XLOOKUP)\s*\(", re.IGNORECASE)
+
+# 描述「父節點怎麼引用子節點」的邊標記；DAG 模式下存在父節點的 edge_flags，不寫進共享的子節點
+EDGE_FLAG_KEYS = ('from_indirect_internal', 'from_index_internal', 'from_indirect_resolved',
+                  'from_index_resolved', 'region_multiplicity', 'region_address')
 
 class ProgressCallback:
     """進度回調接口 - 支持實時訊息和累積日誌"""
@@ -77,24 +91,48 @@ class ProgressCallback:
 class EnhancedDependencyExploder:
     """超安全版公式依賴鏈爆炸分析器 - 完全避免檔案鎖定 + INDEX支援"""
     
-    def __init__(self, max_depth=10, range_expand_threshold=5, progress_callback=None):
+    def __init__(self, max_depth=10, range_expand_threshold=5, progress_callback=None, dag_mode=False, max_workers=1, cycle_scan=True, excel_pool=None, indirect_session=None):
         self.max_depth = max_depth
         self.range_expand_threshold = range_expand_threshold
-        self.visited_cells = set()
+        self.visited_cells = set()  # 目前路徑上的儲存格，只用於循環檢測
+        # DAG 模式：已完整展開的儲存格 cell_id -> (節點, 展開時剩餘深度)，跨父節點共享
+        self.dag_mode = dag_mode
+        self.node_memo = {}
+        self.memo_hits = 0
+        # 逐層引擎：同一層中不同活頁簿的儲存格交給 worker pool 平行讀取
+        self.max_workers = max(1, int(max_workers or 1))
         self.circular_refs = []
+        # 循環引用以強連通分量（SCC）分析：cycle_scan 時涵蓋整本活頁簿，否則只看已展開的圖
+        self.cycle_scan = cycle_scan
+        self.cycles = []
+        self.cycle_scope = None
+        self.path_circular_refs = []
+        self.dependency_index = None
         self.progress_callback = progress_callback or ProgressCallback()
         self.processed_count = 0
         # 記錄創建的 Excel 實例和 PID
         self.our_excel_instances = {}
+        # 需要 Excel 計算的公式交給常駐的計算池（utils.excel_calc_pool），不再每次開關 Excel
+        self.excel_pool = excel_pool
+        self._owns_excel_pool = False
+        self.excel_pool_stats = None
         self.excel_process_pids = set()  # 記錄我們創建的 Excel 程序 PID
         self.indirect_resolution_log = []
         self.index_resolution_log = []  # 新增：INDEX解析日誌
-        
-        # 初始化 COM
-        try:
-            pythoncom.CoInitialize()
-        except:
-            pass
+        # INDIRECT 參數與 INDEX/MATCH/查找函數先用原生求值器計算，只有不支援的函數才開 Excel；
+        # 求值器、載入的活頁簿、外部連結與 INDIRECT 結果記憶都在整個分析共用的 session（可由外部傳入）
+        self.indirect_session = indirect_session or IndirectSession()
+        self.indirect_evaluator = self.indirect_session.evaluator
+        self.indirect_evaluations = {'native': 0, 'excel': 0}
+        self.index_evaluations = {'native': 0, 'excel': 0}
+        # 逐層引擎預先算好的整層動態參數：(活頁簿, 工作表, 地址, 參數) -> 計算結果
+        self.level_calculations = {}
+        # 同一層 INDEX/OFFSET/查找函數的原生解析結果：(活頁簿, 工作表, 地址, 函數) -> 靜態引用或 None
+        self.level_references = {}
+        self.excel_batches = 0
+        
+        # 初始化 COM（沒有 pywin32 的環境為 None）
+        self._pythoncom = _com_initialize()
     
     def __del__(self):
         """析構函數：超安全清理"""
@@ -104,7 +142,8 @@ class EnhancedDependencyExploder:
             pass
         finally:
             try:
-                pythoncom.CoUninitialize()
+                if getattr(self, '_pythoncom', None) is not None:
+                    self._pythoncom.CoUninitialize()
             except:
                 pass
     
@@ -148,6 +187,13 @@ class EnhancedDependencyExploder:
         
         # 清空記錄
         self.our_excel_instances.clear()
+        self._close_excel_pool()
+        
+        if not instance_keys and not self.excel_process_pids and not self.indirect_evaluations['excel']:
+            # 全程沒有開過 Excel：不需要等待程序結束與檔案釋放
+            self._reset_run_state()
+            self.progress_callback.update_progress("[ULTRA-SAFE] ✓ 未使用 Excel 實例，略過程序清理")
+            return
         
         # 第二階段：強制垃圾回收
         self.progress_callback.update_progress("[ULTRA-SAFE] 執行強制垃圾回收...")
@@ -166,15 +212,20 @@ class EnhancedDependencyExploder:
         self.progress_callback.update_progress("[ULTRA-SAFE] 等待檔案系統完全釋放...")
         time.sleep(1.0)  # 給檔案系統更多時間釋放鎖定
         
-        # 重置內部狀態
+        self._reset_run_state()
+        
+        self.progress_callback.update_progress("[ULTRA-SAFE] ✓ 超安全清理完成，檔案已完全釋放")
+    
+    def _reset_run_state(self):
+        """重置內部狀態"""
         self.visited_cells.clear()
         self.circular_refs.clear()
         self.indirect_resolution_log.clear()
         self.index_resolution_log.clear()  # 新增：清理INDEX日誌
         self.processed_count = 0
         self.excel_process_pids.clear()
-        
-        self.progress_callback.update_progress("[ULTRA-SAFE] ✓ 超安全清理完成，檔案已完全釋放")
+        self.level_calculations.clear()
+        self.level_references.clear()
     
     def _cleanup_single_instance(self, instance_key):
         """清理單個 Excel 實例"""
@@ -276,156 +327,33 @@ class EnhancedDependencyExploder:
         
         return terminated_pids
     
-    def _open_workbook_for_calculation(self, workbook_path):
-        """開啟工作簿 - 超安全版本"""
-        import uuid
-        
-        # 記錄執行前的 Excel 程序
+    def _create_tracked_excel_app(self):
+        """計算池的 Excel 工廠：建立隔離實例並記錄新程序 PID（在 worker 執行緒中執行，不更新 UI）"""
         before_pids = self._get_excel_processes_before()
-        
-        # 創建唯一實例標識
-        instance_key = f"{workbook_path}_{int(time.time())}_{uuid.uuid4().hex[:8]}"
-        
-        if instance_key in self.our_excel_instances:
-            return self.our_excel_instances[instance_key]
-        
-        excel_app = None
-        wb = None
-        
-        try:
-            self.progress_callback.update_progress(f"[ULTRA-SAFE] 創建完全隔離的 Excel 實例: {os.path.basename(workbook_path)}")
-            
-            # 使用 DispatchEx 創建完全獨立的實例
-            excel_app = win32com.client.DispatchEx("Excel.Application")
-            
-            # 記錄新創建的 Excel 程序
-            time.sleep(0.5)  # 給程序啟動一點時間
-            new_pids = self._get_new_excel_processes(before_pids)
-            self.excel_process_pids.update(new_pids)
-            if new_pids:
-                self.progress_callback.update_progress(f"[ULTRA-SAFE] 記錄新 Excel 程序 PID: {new_pids}")
-            
-            # 設置為完全隔離模式
-            excel_app.Visible = False
-            excel_app.DisplayAlerts = False
-            excel_app.EnableEvents = False
-            excel_app.ScreenUpdating = False
-            excel_app.Interactive = False
-            excel_app.AskToUpdateLinks = False
-            
-            # 額外的隔離設置
-            try:
-                excel_app.ShowWindowsInTaskbar = False
-                excel_app.WindowState = -4140  # xlMinimized
-                excel_app.UserControl = False  # 重要：設置為非用戶控制
-            except:
-                pass
-            
-            self.progress_callback.update_progress(f"[ULTRA-SAFE] 隔離設置完成，開啟工作簿...")
-            
-            # 以唯讀模式開啟，使用更嚴格的參數
-            wb = excel_app.Workbooks.Open(
-                workbook_path,
-                UpdateLinks=0,          # 不更新連結
-                ReadOnly=True,          # 唯讀模式
-                Format=5,               # 自動格式
-                Password="",            # 無密碼
-                WriteResPassword="",    # 無寫入密碼
-                IgnoreReadOnlyRecommended=True,  # 忽略唯讀建議
-                Origin=1,               # 原始格式
-                Delimiter="",           # 無分隔符
-                Editable=False,         # 不可編輯
-                Notify=False,           # 不通知
-                Converter=0,            # 無轉換器
-                AddToMru=False,         # 不加入最近使用清單
-                Local=False,            # 非本地化
-                CorruptLoad=0           # 不載入損壞檔案
-            )
-            
-            # 設置計算模式為手動
-            try:
-                excel_app.Calculation = -4135  # xlCalculationManual
-                wb.Application.Calculation = -4135
-            except:
-                pass
-            
-            # 禁用所有可能的互動
-            try:
-                excel_app.CutCopyMode = False
-                excel_app.StatusBar = False
-            except:
-                pass
-            
-            # 記錄實例信息
-            instance_info = {
-                'app': excel_app,
-                'workbook': wb,
-                'instance_id': instance_key,
-                'workbook_name': wb.Name,
-                'created_time': time.time(),
-                'file_path': workbook_path,
-                'process_pids': new_pids.copy()
-            }
-            
-            self.our_excel_instances[instance_key] = instance_info
-            
-            self.progress_callback.update_progress(f"[ULTRA-SAFE] 隔離實例創建成功: {wb.Name}")
-            return instance_info
-            
-        except Exception as e:
-            self.progress_callback.update_progress(f"[ULTRA-SAFE] 創建隔離實例失敗: {e}")
-            
-            # 清理失敗的實例
-            try:
-                if wb:
-                    wb.Close(SaveChanges=False)
-                    del wb
-            except:
-                pass
-            
-            try:
-                if excel_app:
-                    excel_app.Quit()
-                    del excel_app
-            except:
-                pass
-            
-            # 清理可能創建的程序
-            new_pids = self._get_new_excel_processes(before_pids)
-            for pid in new_pids:
-                try:
-                    proc = psutil.Process(pid)
-                    proc.terminate()
-                except:
-                    pass
-            
-            raise e
+        excel_app = create_isolated_excel_application()
+        time.sleep(0.5)  # 給程序啟動一點時間
+        self.excel_process_pids.update(self._get_new_excel_processes(before_pids))
+        return excel_app
     
-    def _close_specific_instance(self, instance_key):
-        """關閉特定實例 - 超安全版本"""
-        if instance_key not in self.our_excel_instances:
-            return
-        
-        self.progress_callback.update_progress(f"[ULTRA-SAFE] 開始關閉實例: {instance_key}")
-        
-        try:
-            self._cleanup_single_instance(instance_key)
-            
-            # 額外等待時間確保完全釋放
-            time.sleep(0.5)
-            
-            self.progress_callback.update_progress(f"[ULTRA-SAFE] 實例已安全關閉: {instance_key}")
-            
-        except Exception as e:
-            self.progress_callback.update_progress(f"[ULTRA-SAFE] 關閉實例失敗: {e}")
+    def _get_excel_pool(self):
+        """取得 Excel 計算池；未注入時第一次需要 Excel 才建立，分析結束時關閉"""
+        if self.excel_pool is None:
+            self.progress_callback.update_progress("[ULTRA-SAFE] 啟動 Excel 計算池（整個分析共用）")
+            self.excel_pool = ExcelCalculationPool(size=1, app_factory=self._create_tracked_excel_app)
+            self._owns_excel_pool = True
+        return self.excel_pool
+    
+    def _close_excel_pool(self):
+        """關閉自己建立的 Excel 計算池（注入的共用池由呼叫者管理）"""
+        if self.excel_pool is not None and self._owns_excel_pool:
+            self.excel_pool.close()
+            self.excel_pool_stats = self.excel_pool.get_stats()
+            self.progress_callback.update_progress(f"[ULTRA-SAFE] Excel 計算池已關閉: {self.excel_pool_stats}")
+            self.excel_pool = None
+            self._owns_excel_pool = False
     
     def _calculate_indirect_safely(self, indirect_content, workbook_path, sheet_name, cell_address):
-        """安全計算 INDIRECT - 使用完全隔離的實例"""
-        temp_instance = None
-        temp_cell = None
-        original_value = None
-        original_formula = None
-        
+        """安全計算 INDIRECT - 先原生計算，必要時使用計算池中的隔離 Excel 實例"""
         try:
             self.progress_callback.update_progress(f"[ULTRA-SAFE-CALC] 開始安全計算: {indirect_content}")
             
@@ -437,124 +365,170 @@ class EnhancedDependencyExploder:
                     'indirect_content': indirect_content
                 }
             
-            # 為計算創建臨時的完全隔離實例
-            temp_instance = self._open_workbook_for_calculation(workbook_path)
+            # 逐層引擎已整層批次計算過的參數
+            prefetched = self.level_calculations.get((workbook_path, sheet_name, cell_address, indirect_content))
+            if prefetched is not None:
+                self.indirect_evaluations['native' if prefetched.get('method') == 'native' else 'excel'] += 1
+                self.progress_callback.update_progress(f"[BATCH-CALC] 使用整層批次計算結果: {prefetched.get('static_reference', prefetched.get('error'))}")
+                return dict(prefetched)
             
-            wb = temp_instance['workbook']
-            excel_app = temp_instance['app']
-            instance_key = temp_instance['instance_id']
-            
-            # 定位目標儲存格
-            try:
-                ws = wb.Worksheets(sheet_name)
-                temp_cell = ws.Range(cell_address)
-            except Exception as e:
-                return {
-                    'success': False,
-                    'error': f'無法定位工作表或儲存格: {e}',
-                    'indirect_content': indirect_content
-                }
-            
-            # 備份原始內容
-            try:
-                original_value = temp_cell.Value
-                original_formula = temp_cell.Formula
-            except:
-                pass
+            # 先用快取的儲存格值原生計算，不支援時才開 Excel；結果由分析共用的 session 記憶，
+            # 同一參數在同一儲存格、輸入值未變時不再重算
+            excel_attempts = []
             
-            # 執行計算
-            test_formula = f"={indirect_content}"
-            calculation_result = None
-            old_calculation = None
+            def calculate_in_excel():
+                excel_attempts.append(indirect_content)
+                self.progress_callback.update_progress("[NATIVE-CALC] 原生求值器不支援，改用 Excel 計算")
+                return self._calculate_in_excel_pool(indirect_content, workbook_path, sheet_name, cell_address)
             
             try:
-                # 暫時啟用自動計算
-                try:
-                    old_calculation = excel_app.Calculation
-                    excel_app.Calculation = -4105  # xlCalculationAutomatic
-                except:
-                    pass
-                
-                # 設置公式並計算
-                temp_cell.Formula = test_formula
-                temp_cell.Calculate()
-                
-                # 獲取結果
-                calculation_result = temp_cell.Value
-                self.progress_callback.update_progress(f"[ULTRA-SAFE-CALC] 計算完成，結果: '{calculation_result}'")
-                
-            except Exception as calc_error:
-                self.progress_callback.update_progress(f"[ULTRA-SAFE-CALC] 計算失敗: {calc_error}")
-                return {
-                    'success': False,
-                    'error': f'計算失敗: {calc_error}',
-                    'indirect_content': indirect_content
-                }
-            
-            finally:
-                # 還原計算模式
-                if old_calculation is not None:
-                    try:
-                        excel_app.Calculation = old_calculation
-                    except:
-                        pass
-                
-                # 還原儲存格內容
-                try:
-                    if original_formula:
-                        temp_cell.Formula = original_formula
-                    elif original_value is not None:
-                        temp_cell.Value = original_value
-                    else:
-                        temp_cell.Clear()
-                except:
-                    pass
-                
-                # 立即關閉臨時實例
+                result = self.indirect_session.evaluate(
+                    indirect_content, workbook_path, sheet_name, cell_address, fallback=calculate_in_excel
+                )
+            except Exception as error:
+                if excel_attempts:
+                    self.indirect_evaluations['excel'] += 1
+                    self.progress_callback.update_progress(f"[ULTRA-SAFE-CALC] 計算失敗: {error}")
+                    return {
+                        'success': False,
+                        'error': f'計算失敗: {error}',
+                        'indirect_content': indirect_content
+                    }
+                self.progress_callback.update_progress(f"[NATIVE-CALC] 原生計算失敗，改用 Excel: {error}")
+                self.indirect_evaluations['excel'] += 1
                 try:
-                    self._close_specific_instance(instance_key)
-                    self.progress_callback.update_progress(f"[ULTRA-SAFE-CALC] 臨時實例已安全關閉")
-                except:
-                    pass
-            
-            # 處理計算結果
-            if calculation_result is None or self._is_excel_error(calculation_result):
-                return {
-                    'success': False,
-                    'error': f'Excel計算返回錯誤: {calculation_result}',
-                    'indirect_content': indirect_content
-                }
-            
-            static_reference = str(calculation_result).strip()
-            if not static_reference:
-                return {
-                    'success': False,
-                    'error': '計算結果為空字串',
-                    'indirect_content': indirect_content
-                }
+                    return self._calculate_in_excel_pool(indirect_content, workbook_path, sheet_name, cell_address)
+                except Exception as calc_error:
+                    self.progress_callback.update_progress(f"[ULTRA-SAFE-CALC] 計算失敗: {calc_error}")
+                    return {
+                        'success': False,
+                        'error': f'計算失敗: {calc_error}',
+                        'indirect_content': indirect_content
+                    }
             
-            return {
-                'success': True,
-                'static_reference': static_reference,
-                'indirect_content': indirect_content
-            }
+            method = 'native' if result.get('method') == 'native' else 'excel'
+            self.indirect_evaluations[method] += 1
+            if method == 'native':
+                self.progress_callback.update_progress(
+                    f"[NATIVE-CALC] 計算完成，結果: '{result.get('static_reference', result.get('error'))}'"
+                )
+            return result
             
         except Exception as e:
             self.progress_callback.update_progress(f"[ULTRA-SAFE-CALC] 計算異常: {e}")
             
-            # 異常情況下的清理
-            if temp_instance:
-                try:
-                    self._close_specific_instance(temp_instance['instance_id'])
-                except:
-                    pass
-            
             return {
                 'success': False,
                 'error': str(e),
                 'indirect_content': indirect_content
             }
 
+    def _calculate_in_excel_pool(self, indirect_content, workbook_path, sheet_name, cell_address):
+        """交給計算池中常駐的隔離 Excel 計算（活頁簿保持唯讀開啟、手動計算）；計算池失敗時拋出例外"""
+        calculation_result = self._get_excel_pool().evaluate(
+            indirect_content, workbook_path, sheet_name, cell_address
+        )
+        self.progress_callback.update_progress(f"[ULTRA-SAFE-CALC] 計算完成，結果: '{calculation_result}'")
+        return self._excel_calculation_result(indirect_content, calculation_result)
+
+    def _excel_calculation_result(self, indirect_content, calculation_result):
+        """把 Excel 計算出的值轉成 _calculate_indirect_safely 的結果格式"""
+        if calculation_result is None or self._is_excel_error(calculation_result):
+            return {
+                'success': False,
+                'error': f'Excel計算返回錯誤: {calculation_result}',
+                'indirect_content': indirect_content
+            }
+        
+        if isinstance(calculation_result, float) and calculation_result.is_integer():
+            # Value2 把整數也讀成浮點數
+            calculation_result = int(calculation_result)
+        static_reference = str(calculation_result).strip()
+        if not static_reference:
+            return {
+                'success': False,
+                'error': '計算結果為空字串',
+                'indirect_content': indirect_content
+            }
+        
+        return {
+            'success': True,
+            'static_reference': static_reference,
+            'indirect_content': indirect_content,
+            'method': 'excel'
+        }
+
+    def _prefetch_level_calculations(self, level_cells):
+        """
+        整層批次計算動態參數（逐層引擎在建立該層節點前呼叫）
+        
+        收集這一層所有公式的 INDIRECT 參數，以及無法原生解析的 INDEX 的列/欄參數，
+        先原生計算；原生不支援的依活頁簿分組，每個活頁簿交給計算池一次批次計算
+        （每張工作表一次 Formula 陣列寫入、一次計算、一次 Value2 讀取）。結果存入
+        level_calculations，之後 _calculate_indirect_safely 直接取用。
+        
+        Args:
+            level_cells: 這一層的 (活頁簿, 工作表, 地址, cell_info)
+        """
+        self.level_calculations.clear()
+        self.level_references.clear()
+        excel_items = {}  # 活頁簿 -> {key: (參數, 工作表, 地址)}
+        
+        for wb_path, sh_name, address, cell_info in level_cells:
+            original_formula = cell_info.get('formula') if cell_info else None
+            if not original_formula or 'error' in cell_info:
+                continue
+            formula = self._clean_formula(original_formula)
+            for content in self._dynamic_arguments(formula, wb_path, sh_name, address):
+                key = (wb_path, sh_name, address, content)
+                if key in self.level_calculations or key in excel_items.get(wb_path, {}):
+                    continue
+                try:
+                    self.level_calculations[key] = self.indirect_session.evaluate(content, wb_path, sh_name, address)
+                except Exception:
+                    excel_items.setdefault(wb_path, {})[key] = (content, sh_name, address)
+        
+        for wb_path, items in excel_items.items():
+            if not os.path.exists(wb_path):
+                continue
+            self.progress_callback.update_progress(
+                f"[BATCH-CALC] {os.path.basename(wb_path)}: 整層 {len(items)} 個動態參數交給 Excel 一次計算"
+            )
+            try:
+                values = self._get_excel_pool().evaluate_many(wb_path, items.values())
+            except Exception as e:
+                # 批次失敗時不預存結果，各儲存格照常逐一計算
+                self.progress_callback.update_progress(f"[BATCH-CALC] 批次計算失敗，改為逐一計算: {e}")
+                continue
+            self.excel_batches += 1
+            for key, value in zip(items, values):
+                result = self.level_calculations[key] = self._excel_calculation_result(key[3], value)
+                if value is not None:
+                    self.indirect_session.remember(key[3], key[0], key[1], key[2], result)
+
+    def _dynamic_arguments(self, formula, workbook_path, sheet_name, cell_address):
+        """公式中需要計算的 INDIRECT 參數與 INDEX 的列/欄參數（與解析時的順序相同）"""
+        arguments = []
+        if 'INDIRECT' in formula.upper():
+            arguments.extend(func['content'] for func in self._extract_all_indirect_functions(formula))
+        if REFERENCE_FUNCTION_PATTERN.search(formula):
+            for index_func in self._extract_all_index_functions_debug(formula):
+                if index_func['name'] != 'INDEX':
+                    continue
+                key = (workbook_path, sheet_name, cell_address, index_func['full_function'])
+                if key not in self.level_references:
+                    self.level_references[key] = self._native_reference(
+                        index_func['full_function'], workbook_path, sheet_name, cell_address
+                    )
+                if self.level_references[key] is not None:
+                    continue
+                params = self._extract_index_parameters_accurate_debug(index_func['content'])
+                if not params['success']:
+                    continue
+                if not (self._is_simple_number(params['row']) and self._is_simple_number(params['column'])):
+                    arguments.extend((params['row'], params['column']))
+        return arguments
+
     # === INDEX 解析方法（來自debug版本）===
     def _resolve_index_with_excel_corrected_simple(self, formula, workbook_path, sheet_name, cell_address):
         """正確的INDEX解析 - 簡化版本"""
@@ -570,10 +544,34 @@ class EnhancedDependencyExploder:
             static_references = []
             calculation_details = []
             internal_references = []
+            internal_ranges = []
             
             # 2. 逐個解析 INDEX 函數
             for i, index_func in enumerate(index_functions):
-                self.progress_callback.update_progress(f"[INDEX-SIMPLE] 處理INDEX#{i+1}: {index_func['content']}")
+                self.progress_callback.update_progress(f"[INDEX-SIMPLE] 處理{index_func['name']}#{i+1}: {index_func['content']}")
+                
+                # 原生解析（MATCH / OFFSET / 查找函數以快取的查找索引計算）
+                native_ref = self._resolve_reference_function_natively(index_func, workbook_path, sheet_name, cell_address)
+                if native_ref:
+                    resolved_formula = resolved_formula.replace(index_func['full_function'], native_ref)
+                    self.progress_callback.update_progress(f"[INDEX-NATIVE] 替換: {index_func['full_function']} -> {native_ref}")
+                    cell_references, range_references = self._split_internal_references(
+                        index_func['content'], workbook_path, sheet_name
+                    )
+                    internal_references.extend(cell_references)
+                    internal_ranges.extend(range_references)
+                    static_references.append(native_ref)
+                    calculation_details.append({
+                        'original_function': index_func['full_function'],
+                        'content': index_func['content'],
+                        'static_reference': native_ref,
+                        'method': 'native'
+                    })
+                    continue
+                if index_func['name'] != 'INDEX':
+                    # 其他查找函數沒有 Excel 後備：保留原公式中的範圍引用
+                    continue
+                self.index_evaluations['excel'] += 1
                 
                 # 3. 解析參數
                 params_result = self._extract_index_parameters_accurate_debug(index_func['content'])
@@ -587,8 +585,9 @@ class EnhancedDependencyExploder:
                 self.progress_callback.update_progress(f"[INDEX-SIMPLE] 參數: array='{array_param}', row='{row_param}', col='{col_param}'")
                 
                 # 4. 分析array範圍的內部引用
-                temp_references = self._parse_formula_references_accurate(f"={array_param}", workbook_path, sheet_name)
-                internal_references.extend(temp_references)
+                cell_references, range_references = self._split_internal_references(array_param, workbook_path, sheet_name)
+                internal_references.extend(cell_references)
+                internal_ranges.extend(range_references)
                 
                 # 5. 檢查row和col是否為簡單數字
                 try:
@@ -642,13 +641,52 @@ class EnhancedDependencyExploder:
                 'static_references': static_references,
                 'calculation_details': calculation_details,
                 'original_formula': formula,
-                'internal_references': internal_references
+                'internal_references': internal_references,
+                'internal_ranges': internal_ranges,
+                'lookup_only': all(index_func['name'] != 'INDEX' for index_func in index_functions)
             }
             
         except Exception as e:
             self.progress_callback.update_progress(f"[INDEX-SIMPLE] 解析異常: {e}")
             return {'success': False, 'error': str(e), 'original_formula': formula, 'internal_references': []}
 
+    def _split_internal_references(self, expression, workbook_path, sheet_name):
+        """函數參數中的引用分成單一儲存格（逐一展開）與範圍（process_formula_ranges 的範圍資訊，建立範圍節點）"""
+        formula = f"={expression}"
+        cell_references = [
+            ref for ref in self._parse_formula_references_accurate(formula, workbook_path, sheet_name)
+            if ':' not in ref['cell_address'] and not ref.get('original_range')
+        ]
+        return cell_references, process_formula_ranges(formula, workbook_path, sheet_name)
+
+    def _resolve_reference_function_natively(self, index_func, workbook_path, sheet_name, cell_address):
+        """原生解析 INDEX/OFFSET/VLOOKUP/HLOOKUP/XLOOKUP 指向的儲存格，失敗或需要 Excel 時返回 None"""
+        key = (workbook_path, sheet_name, cell_address, index_func['full_function'])
+        if key in self.level_references:
+            static_ref = self.level_references[key]
+        else:
+            static_ref = self._native_reference(index_func['full_function'], workbook_path, sheet_name, cell_address)
+        if static_ref is not None:
+            self.index_evaluations['native'] += 1
+        return static_ref
+
+    def _native_reference(self, full_function, workbook_path, sheet_name, cell_address):
+        """原生解析單一函數指向的儲存格（不計數），失敗或需要 Excel 時返回 None"""
+        try:
+            static_ref = self.indirect_evaluator.resolve_reference(
+                full_function, workbook_path, sheet_name, cell_address
+            )
+        except UnsupportedExpression as unsupported:
+            self.progress_callback.update_progress(f"[INDEX-NATIVE] 無法原生解析: {unsupported}")
+            return None
+        except Exception as e:
+            self.progress_callback.update_progress(f"[INDEX-NATIVE] 原生解析失敗: {e}")
+            return None
+        if static_ref in EXCEL_ERRORS:
+            self.progress_callback.update_progress(f"[INDEX-NATIVE] 計算結果為錯誤值: {static_ref}")
+            return None
+        return static_ref
+
     def _is_simple_number(self, param):
         """檢查是否為簡單數字"""
         try:
@@ -697,16 +735,17 @@ class EnhancedDependencyExploder:
             return {'success': False, 'error': error_msg}
     
     def _extract_all_index_functions_debug(self, formula):
-        """提取公式中所有的 INDEX 函數"""
+        """提取公式中所有外層的 INDEX / OFFSET / VLOOKUP / HLOOKUP / XLOOKUP 函數"""
         index_functions = []
         search_start = 0
         
         while True:
-            index_pos = formula.upper().find('INDEX(', search_start)
-            if index_pos == -1:
+            match = REFERENCE_FUNCTION_PATTERN.search(formula, search_start)
+            if not match:
                 break
             
-            start_pos = index_pos + len('INDEX(')
+            index_pos = match.start()
+            start_pos = match.end()
             bracket_count = 1
             current_pos = start_pos
             
@@ -723,6 +762,7 @@ class EnhancedDependencyExploder:
                 full_function = formula[index_pos:current_pos]
                 
                 index_functions.append({
+                    'name': match.group(1).upper(),
                     'full_function': full_function,
                     'content': content,
                     'start_pos': index_pos,
@@ -862,6 +902,8 @@ class EnhancedDependencyExploder:
         if current_depth == 0:
             self.progress_callback.update_progress("正在初始化依賴關係分析...")
             self.processed_count = 0
+            self.node_memo.clear()
+            self.memo_hits = 0
         
         self.processed_count += 1
         
@@ -886,8 +928,18 @@ class EnhancedDependencyExploder:
             self.progress_callback.update_progress(f"警告：檢測到循環引用 {current_ref}")
             return self._create_circular_node(workbook_path, sheet_name, cell_address, current_depth, root_workbook_path)
         
+        # DAG 模式：已展開過（且當時剩餘深度不少於現在）的儲存格直接共用同一節點；
+        # 子樹含循環標記的節點不會存入共用表（標記只在當時的路徑上成立）
+        remaining_depth = self.max_depth - current_depth
+        if self.dag_mode:
+            memo = self.node_memo.get(cell_id)
+            if memo is not None and memo[1] >= remaining_depth:
+                self.memo_hits += 1
+                return memo[0]
+        
         # 標記為已訪問
         self.visited_cells.add(cell_id)
+        circular_before = len(self.circular_refs)
         
         try:
             # 檢查是否為範圍引用，如果是則跳過openpyxl讀取
@@ -903,234 +955,35 @@ class EnhancedDependencyExploder:
                 self.progress_callback.update_progress(f"錯誤：無法讀取 {current_ref} - {cell_info['error']}")
                 return self._create_error_node(workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, cell_info['error'])
             
-            # 處理公式清理和動態函數解析
-            original_formula = cell_info.get('formula')
-            fixed_formula = None
-            resolved_formula = None
-            indirect_info = None
-            index_info = None
-            
-            if original_formula:
-                self.progress_callback.update_progress(f"正在處理公式: {current_ref}")
-                fixed_formula = self._clean_formula(original_formula)
-                resolved_formula = fixed_formula  # 默認等於fixed_formula
-                
-                # INDIRECT 處理
-                if 'INDIRECT' in fixed_formula.upper():
-                    self.progress_callback.update_progress(f"正在解析INDIRECT函數: {current_ref}")
-                    try:
-                        resolved_result = self._resolve_indirect_with_excel(
-                            fixed_formula, workbook_path, sheet_name, cell_address
-                        )
-                        if resolved_result and resolved_result['success']:
-                            resolved_formula = resolved_result['resolved_formula']
-                            indirect_info = {
-                                'has_indirect': True,
-                                'success': True,
-                                'resolved_formula': resolved_formula,
-                                'details': resolved_result,
-                                'internal_references': resolved_result.get('internal_references', [])
-                            }
-                            self.progress_callback.update_progress(f"INDIRECT解析完成，resolved: {resolved_formula}")
-                            
-                            # 記錄解析日誌
-                            self.indirect_resolution_log.append({
-                                'cell': f"{sheet_name}!{cell_address}",
-                                'original': original_formula,
-                                'resolved': resolved_formula,
-                                'details': resolved_result
-                            })
-                        else:
-                            indirect_info = {
-                                'has_indirect': True,
-                                'success': False,
-                                'error': resolved_result.get('error', 'Unknown error'),
-                                'internal_references': []
-                            }
-                            self.progress_callback.update_progress(f"INDIRECT解析失敗: {indirect_info['error']}")
-                    except Exception as e:
-                        indirect_info = {
-                            'has_indirect': True,
-                            'success': False,
-                            'error': str(e),
-                            'internal_references': []
-                        }
-                        self.progress_callback.update_progress(f"INDIRECT解析異常: {str(e)}")
-                
-                # INDEX 處理
-                if 'INDEX(' in fixed_formula.upper():
-                    self.progress_callback.update_progress(f"正在解析INDEX函數: {current_ref}")
-                    try:
-                        index_result = self._resolve_index_with_excel_corrected_simple(
-                            resolved_formula, workbook_path, sheet_name, cell_address
-                        )
-                        if index_result and index_result['success']:
-                            resolved_formula = index_result['resolved_formula']
-                            index_info = {
-                                'has_index': True,
-                                'success': True,
-                                'resolved_formula': resolved_formula,
-                                'details': index_result,
-                                'internal_references': index_result.get('internal_references', [])
-                            }
-                            self.progress_callback.update_progress(f"INDEX解析完成，resolved: {resolved_formula}")
-                            
-                            # 記錄INDEX解析日誌
-                            self.index_resolution_log.append({
-                                'cell': f"{sheet_name}!{cell_address}",
-                                'original': original_formula,
-                                'resolved': resolved_formula,
-                                'details': index_result
-                            })
-                        else:
-                            index_info = {
-                                'has_index': True,
-                                'success': False,
-                                'error': index_result.get('error', 'Unknown error'),
-                                'internal_references': []
-                            }
-                            self.progress_callback.update_progress(f"INDEX解析失敗: {index_info['error']}")
-                    except Exception as e:
-                        index_info = {
-                            'has_index': True,
-                            'success': False,
-                            'error': str(e),
-                            'internal_references': []
-                        }
-                        self.progress_callback.update_progress(f"INDEX解析異常: {str(e)}")
-
-            # 創建節點
-            node = self._create_node_with_dynamic_functions(
-                workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, 
-                cell_info, fixed_formula, resolved_formula, indirect_info, index_info
-            )
+            node, child_specs = self._build_node(workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, cell_info)
             
-            # 如果是公式，解析依賴關係
-            if cell_info.get('cell_type') == 'formula' and cell_info.get('formula'):
-                self.progress_callback.update_progress(f"正在解析公式依賴關係: {current_ref}")
-                
-                # 處理 INDIRECT 內部的引用
-                if indirect_info and indirect_info.get('internal_references'):
-                    self.progress_callback.update_progress(f"找到 {len(indirect_info['internal_references'])} 個 INDIRECT 內部引用，正在分析...")
-                    
-                    for i, internal_ref in enumerate(indirect_info['internal_references'], 1):
-                        try:
-                            ref_display = f"{os.path.basename(internal_ref['workbook_path'])}!{internal_ref['sheet_name']}!{internal_ref['cell_address']}"
-                            self.progress_callback.update_progress(f"正在處理 INDIRECT 內部引用 {i}/{len(indirect_info['internal_references'])}: {ref_display}")
-                            
-                            child_node = self.explode_dependencies(
-                                internal_ref['workbook_path'],
-                                internal_ref['sheet_name'],
-                                internal_ref['cell_address'],
-                                current_depth + 1,
-                                root_workbook_path or workbook_path
-                            )
-                            child_node['from_indirect_internal'] = True
-                            node['children'].append(child_node)
-                        except Exception as e:
-                            self.progress_callback.update_progress(f"錯誤：處理 INDIRECT 內部引用失敗 {ref_display} - {str(e)}")
-                
-                # 處理 INDEX 內部的引用
-                if index_info and index_info.get('internal_references'):
-                    self.progress_callback.update_progress(f"找到 {len(index_info['internal_references'])} 個 INDEX 內部引用，正在分析...")
-                    
-                    for i, internal_ref in enumerate(index_info['internal_references'], 1):
-                        try:
-                            ref_display = f"{os.path.basename(internal_ref['workbook_path'])}!{internal_ref['sheet_name']}!{internal_ref['cell_address']}"
-                            self.progress_callback.update_progress(f"正在處理 INDEX 內部引用 {i}/{len(index_info['internal_references'])}: {ref_display}")
-                            
-                            child_node = self.explode_dependencies(
-                                internal_ref['workbook_path'],
-                                internal_ref['sheet_name'],
-                                internal_ref['cell_address'],
-                                current_depth + 1,
-                                root_workbook_path or workbook_path
-                            )
-                            child_node['from_index_internal'] = True
-                            node['children'].append(child_node)
-                        except Exception as e:
-                            self.progress_callback.update_progress(f"錯誤：處理 INDEX 內部引用失敗 {ref_display} - {str(e)}")
-                
-                # 處理範圍地址
-                formula_for_ranges = resolved_formula if resolved_formula else cell_info['formula']
-                ranges = process_formula_ranges(formula_for_ranges, workbook_path, sheet_name)
-                if ranges:
-                    self.progress_callback.update_progress(f"找到 {len(ranges)} 個範圍，正在處理...")
-                    
-                    for i, range_info in enumerate(ranges, 1):
-                        try:
-                            range_display = f"{os.path.basename(range_info['workbook_path'])}!{range_info['sheet_name']}!{range_info['address']}"
-                            self.progress_callback.update_progress(f"正在處理範圍 {i}/{len(ranges)}: {range_display}")
-                            
-                            range_node = self._create_range_node(range_info, current_depth + 1, root_workbook_path)
-                            node['children'].append(range_node)
-                            
-                        except Exception as e:
-                            self.progress_callback.update_progress(f"錯誤：處理範圍失敗 {range_display} - {str(e)}")
-                            error_node = self._create_error_node(
-                                range_info['workbook_path'], range_info['sheet_name'], range_info['address'], 
-                                current_depth + 1, root_workbook_path, str(e)
-                            )
-                            node['children'].append(error_node)
-                
-                # 處理單個儲存格引用
-                formula_to_parse = resolved_formula if resolved_formula else cell_info['formula']
-                references = self._parse_formula_references_accurate(formula_to_parse, workbook_path, sheet_name)
-                
-                if references:
-                    self.progress_callback.update_progress(f"找到 {len(references)} 個儲存格引用，正在遞歸分析...")
-                    
-                    for i, ref in enumerate(references, 1):
-                        try:
-                            # 檢查是否為範圍引用，如果是則跳過直接讀取
-                            if ':' in ref['cell_address']:
-                                self.progress_callback.update_progress(f"跳過範圍引用: {ref['cell_address']}")
-                                continue
-                                
-                            ref_display = f"{os.path.basename(ref['workbook_path'])}!{ref['sheet_name']}!{ref['cell_address']}"
-                            self.progress_callback.update_progress(f"正在處理引用 {i}/{len(references)}: {ref_display}")
-                            
-                            child_node = self.explode_dependencies(
-                                ref['workbook_path'],
-                                ref['sheet_name'],
-                                ref['cell_address'],
-                                current_depth + 1,
-                                root_workbook_path or workbook_path
-                            )
-                            if resolved_formula != fixed_formula:
-                                if indirect_info and indirect_info.get('success'):
-                                    child_node['from_indirect_resolved'] = True
-                                if index_info and index_info.get('success'):
-                                    child_node['from_index_resolved'] = True
-                            node['children'].append(child_node)
-                        except Exception as e:
-                            self.progress_callback.update_progress(f"錯誤：處理引用失敗 {ref_display} - {str(e)}")
-                            error_node = self._create_error_node(
-                                ref['workbook_path'], ref['sheet_name'], ref['cell_address'], 
-                                current_depth + 1, root_workbook_path, str(e)
-                            )
-                            node['children'].append(error_node)
+            # 依序遞歸展開子儲存格
+            for spec in child_specs:
+                if spec['node'] is not None:
+                    node['children'].append(spec['node'])
+                    continue
+                ref = spec['ref']
+                try:
+                    self.progress_callback.update_progress(spec['message'])
+                    child_node = self.explode_dependencies(
+                        ref['workbook_path'],
+                        ref['sheet_name'],
+                        ref['cell_address'],
+                        current_depth + 1,
+                        root_workbook_path or workbook_path
+                    )
+                    self._attach_spec_child(node, spec, child_node)
+                except Exception as e:
+                    self._handle_child_error(spec['parent'] or node, spec, e, current_depth, root_workbook_path)
             
             # 移除已訪問標記
             self.visited_cells.discard(cell_id)
+            if self.dag_mode and len(self.circular_refs) == circular_before:
+                self.node_memo[cell_id] = (node, remaining_depth)
             
             # 在根節點完成時超安全清理
             if current_depth == 0:
-                total_nodes = self._count_nodes(node)
-                max_depth = self._get_max_depth(node)
-                indirect_count = len([log for log in self.indirect_resolution_log if log.get('resolved')])
-                index_count = len([log for log in self.index_resolution_log if log.get('resolved')])
-                self.progress_callback.update_progress(
-                    f"分析完成！共處理 {self.processed_count} 次，生成 {total_nodes} 個節點，最大深度: {max_depth}，成功解析 {indirect_count} 個 INDIRECT，{index_count} 個 INDEX"
-                )
-                
-                # 超安全清理（只清理我們的實例）
-                self.progress_callback.update_progress("[ULTRA-SAFE] 正在超安全釋放資源...")
-                try:
-                    self._ultra_safe_cleanup()
-                    self.progress_callback.update_progress("[ULTRA-SAFE] ✓ 資源超安全釋放完成，您的Excel檔案完全不受影響")
-                except Exception as cleanup_error:
-                    self.progress_callback.update_progress(f"[ULTRA-SAFE] 超安全清理過程出錯: {cleanup_error}")
+                self._finish_analysis(node)
             
             return node
             
@@ -1145,6 +998,724 @@ class EnhancedDependencyExploder:
             self.progress_callback.update_progress(f"錯誤：處理 {current_ref} 時發生異常 - {str(e)}")
             return self._create_error_node(workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, str(e))
 
+    def explode_dependencies_iterative(self, workbook_path, sheet_name, cell_address, dependency_index=None):
+        """
+        不使用遞歸展開公式依賴鏈，結果與 explode_dependencies 相同（含 DAG 模式的共用節點、深度與邊標記）
+        
+        分兩個階段：
+        1. 逐層讀取（_read_levels）：每一層收集尚未讀取的儲存格，依 (活頁簿, 工作表) 分組，
+           每張工作表用 read_cells_with_resolved_references 串流讀取一次；整層的
+           INDIRECT / INDEX 參數在建立節點前一起計算，需要 Excel 的每個活頁簿只批次
+           計算一次。每個儲存格只讀一次，並在最淺的深度建立節點以找出下一層。
+        2. 組裝（_assemble_tree）：以明確的堆疊依遞歸引擎的深度優先順序走訪，循環檢測、
+           深度限制與 DAG 共用都在走訪當下以同樣的規則判斷，儲存格內容取自第一階段。
+           長依賴鏈也不會碰到 Python 的遞歸深度限制。
+        
+        提供 dependency_index（core.dependency_index）時，索引內不含動態函數的
+        公式儲存格直接由索引建立節點與子項，不再讀取和解析；其餘儲存格照常讀取。
+        """
+        self.progress_callback.update_progress("正在初始化依賴關係分析...")
+        self.processed_count = 0
+        self.node_memo.clear()
+        self.memo_hits = 0
+        self.dependency_index = dependency_index
+        
+        try:
+            cell_infos, level_builds = self._read_levels(workbook_path, sheet_name, cell_address, dependency_index)
+            root_node = self._assemble_tree(workbook_path, sheet_name, cell_address, dependency_index, cell_infos, level_builds)
+            self._finish_analysis(root_node)
+            return root_node
+            
+        except Exception as e:
+            try:
+                self._ultra_safe_cleanup()
+            except:
+                pass
+            self.visited_cells.clear()
+            self.progress_callback.update_progress(f"錯誤：逐層分析時發生異常 - {str(e)}")
+            return self._create_error_node(workbook_path, sheet_name, cell_address, 0, None, str(e))
+
+    def _read_levels(self, workbook_path, sheet_name, cell_address, dependency_index):
+        """
+        逐層引擎第一階段：依最淺深度逐層讀取可到達的儲存格
+        
+        Returns:
+            tuple: (cell_infos, level_builds)
+                cell_infos: cell_id -> 讀取結果（由依賴索引建立的儲存格不讀取）
+                level_builds: cell_id -> (深度, 節點, child_specs)，在該儲存格最淺的深度建立
+        """
+        cell_infos = {}
+        level_builds = {}
+        seen = {f"{workbook_path}|{sheet_name}|{cell_address}"}
+        # 每層項目：(活頁簿, 工作表, 地址, root_workbook_path)
+        level = [(workbook_path, sheet_name, cell_address, None)]
+        current_depth = 0
+        
+        # 常駐的全域 reader pool：只有多個大型活頁簿且實測較快時才分派給 worker
+        reader_pool = get_global_reader_pool(self.max_workers) if self.max_workers > 1 else None
+        
+        try:
+            while level and current_depth < self.max_depth:
+                sheet_requests = {}
+                for wb_path, sh_name, address, _ in level:
+                    if ':' not in address and self._indexed_formula(dependency_index, wb_path, sh_name, address) is None:
+                        sheet_requests.setdefault((wb_path, sh_name), []).append(address)
+                
+                # 每張工作表只串流讀取一次；reader pool 自行決定逐一或平行讀取
+                sheet_cells = {}
+                if reader_pool is not None and sheet_requests:
+                    workbook_count = len({wb_path for wb_path, _ in sheet_requests})
+                    self.progress_callback.update_progress(
+                        f"正在讀取 {workbook_count} 個活頁簿的 {len(sheet_requests)} 張工作表 (workers: {self.max_workers})"
+                    )
+                    try:
+                        sheet_cells = reader_pool.read_sheets(
+                            sheet_requests,
+                            lambda done, total: self.progress_callback.update_progress(f"讀取進度: {done}/{total} 張工作表")
+                        )
+                    except Exception as e:
+                        self.progress_callback.update_progress(f"批次讀取失敗，改為逐一讀取: {e}")
+                        reader_pool.release_workbooks()
+                        reader_pool = None
+                        sheet_cells = {}
+                for (wb_path, sh_name), addresses in sheet_requests.items():
+                    if (wb_path, sh_name) not in sheet_cells:
+                        self.progress_callback.update_progress(
+                            f"正在讀取儲存格內容: {os.path.basename(wb_path)}!{sh_name} ({len(addresses)} 個儲存格)"
+                        )
+                        sheet_cells[(wb_path, sh_name)] = read_cells_with_resolved_references(wb_path, sh_name, addresses)
+                    for address, cell_info in sheet_cells[(wb_path, sh_name)].items():
+                        cell_infos[f"{wb_path}|{sh_name}|{address}"] = cell_info
+                
+                # 整層的 INDIRECT / INDEX 參數先批次計算，需要 Excel 的每個活頁簿只交給計算池一次
+                self._prefetch_level_calculations([
+                    (wb_path, sh_name, address, cell_infos.get(f"{wb_path}|{sh_name}|{address}"))
+                    for wb_path, sh_name, address, _ in level
+                ])
+                
+                next_level = []
+                for wb_path, sh_name, address, root_wb in level:
+                    cell_id = f"{wb_path}|{sh_name}|{address}"
+                    if ':' in address:
+                        continue
+                    cell_info = cell_infos.get(cell_id)
+                    if self._indexed_formula(dependency_index, wb_path, sh_name, address) is None and (cell_info is None or 'error' in cell_info):
+                        continue
+                    try:
+                        node, child_specs = self._build_cell(
+                            wb_path, sh_name, address, current_depth, root_wb, cell_info, dependency_index
+                        )
+                    except Exception:
+                        # 組裝時重新建立，得到與遞歸引擎相同的錯誤節點
+                        continue
+                    level_builds[cell_id] = (current_depth, node, child_specs)
+                    for spec in child_specs:
+                        if spec['node'] is not None:
+                            continue
+                        ref = spec['ref']
+                        child_id = f"{ref['workbook_path']}|{ref['sheet_name']}|{ref['cell_address']}"
+                        if child_id not in seen:
+                            seen.add(child_id)
+                            next_level.append((ref['workbook_path'], ref['sheet_name'], ref['cell_address'], root_wb or wb_path))
+                
+                level = next_level
+                current_depth += 1
+        finally:
+            # worker 保持常駐，只關閉本次開啟的活頁簿，分析結束後不再鎖住檔案
+            if reader_pool is not None:
+                reader_pool.release_workbooks()
+        
+        return cell_infos, level_builds
+
+    def _assemble_tree(self, workbook_path, sheet_name, cell_address, dependency_index, cell_infos, level_builds):
+        """
+        逐層引擎第二階段：以明確的堆疊依 explode_dependencies 的順序組裝樹
+        
+        每個堆疊框架對應遞歸引擎中一次尚未返回的 explode_dependencies 呼叫，
+        子項依序處理完才彈出、移除路徑標記並存入 DAG 共用表（子樹含循環標記時不存）。
+        """
+        root_node, frame = self._enter_cell(workbook_path, sheet_name, cell_address, 0, None, dependency_index, cell_infos, level_builds)
+        stack = [frame] if frame is not None else []
+        while stack:
+            frame = stack[-1]
+            node = frame['node']
+            if frame['position'] == len(frame['child_specs']):
+                stack.pop()
+                self.visited_cells.discard(frame['cell_id'])
+                if self.dag_mode and len(self.circular_refs) == frame['circular_before']:
+                    self.node_memo[frame['cell_id']] = (node, self.max_depth - frame['depth'])
+                if stack:
+                    self._attach_spec_child(stack[-1]['node'], frame['spec'], node)
+                else:
+                    root_node = node
+                continue
+            
+            spec = frame['child_specs'][frame['position']]
+            frame['position'] += 1
+            if spec['node'] is not None:
+                node['children'].append(spec['node'])
+                continue
+            ref = spec['ref']
+            self.progress_callback.update_progress(spec['message'])
+            child_node, child_frame = self._enter_cell(
+                ref['workbook_path'], ref['sheet_name'], ref['cell_address'], frame['depth'] + 1,
+                frame['root_workbook_path'] or frame['workbook_path'], dependency_index, cell_infos, level_builds
+            )
+            if child_frame is None:
+                self._attach_spec_child(node, spec, child_node)
+            else:
+                child_frame['spec'] = spec
+                stack.append(child_frame)
+        return root_node
+
+    def _enter_cell(self, workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, dependency_index, cell_infos, level_builds):
+        """
+        組裝時走訪一個儲存格，判斷順序與 explode_dependencies 相同
+        
+        Returns:
+            tuple: (node, frame)。深度限制、循環、DAG 共用與錯誤直接返回節點（frame 為 None）；
+            需要展開子項時 node 為 None，frame 是待處理子項的堆疊框架。
+        """
+        self.processed_count += 1
+        cell_id = f"{workbook_path}|{sheet_name}|{cell_address}"
+        current_ref = f"{os.path.basename(workbook_path)}!{sheet_name}!{cell_address}"
+        self.progress_callback.update_progress(
+            f"正在分析 {current_ref} (深度: {current_depth}/{self.max_depth}, 已處理: {self.processed_count})"
+        )
+        
+        if current_depth >= self.max_depth:
+            self.progress_callback.update_progress(f"警告：達到最大遞歸深度限制 ({self.max_depth})")
+            return self._create_limit_node(workbook_path, sheet_name, cell_address, current_depth, root_workbook_path), None
+        
+        if cell_id in self.visited_cells:
+            self.circular_refs.append(cell_id)
+            self.progress_callback.update_progress(f"警告：檢測到循環引用 {current_ref}")
+            return self._create_circular_node(workbook_path, sheet_name, cell_address, current_depth, root_workbook_path), None
+        
+        if self.dag_mode:
+            memo = self.node_memo.get(cell_id)
+            if memo is not None and memo[1] >= self.max_depth - current_depth:
+                self.memo_hits += 1
+                return memo[0], None
+        
+        if ':' in cell_address:
+            self.progress_callback.update_progress(f"檢測到範圍引用，跳過讀取: {current_ref}")
+            return self._create_error_node(workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, "範圍引用不支持直接讀取"), None
+        
+        try:
+            build = level_builds.get(cell_id)
+            if build is not None and build[0] == current_depth:
+                # 第一階段在同一深度建立的節點只用一次，之後的展開重新建立
+                del level_builds[cell_id]
+                node, child_specs = build[1], build[2]
+            else:
+                cell_info = None
+                if self._indexed_formula(dependency_index, workbook_path, sheet_name, cell_address) is None:
+                    cell_info = cell_infos.get(cell_id)
+                    if cell_info is None:
+                        cell_info = cell_infos[cell_id] = read_cell_with_resolved_references(workbook_path, sheet_name, cell_address)
+                    if 'error' in cell_info:
+                        self.progress_callback.update_progress(f"錯誤：無法讀取 {current_ref} - {cell_info['error']}")
+                        return self._create_error_node(workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, cell_info['error']), None
+                node, child_specs = self._build_cell(
+                    workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, cell_info, dependency_index
+                )
+        except Exception as e:
+            self.progress_callback.update_progress(f"錯誤：處理 {current_ref} 時發生異常 - {str(e)}")
+            return self._create_error_node(workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, str(e)), None
+        
+        self.visited_cells.add(cell_id)
+        return None, {
+            'node': node,
+            'child_specs': child_specs,
+            'position': 0,
+            'cell_id': cell_id,
+            'workbook_path': workbook_path,
+            'depth': current_depth,
+            'root_workbook_path': root_workbook_path,
+            'circular_before': len(self.circular_refs),
+            'spec': None
+        }
+
+    def _build_cell(self, workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, cell_info, dependency_index):
+        """由依賴索引（索引內的靜態公式）或已讀取的儲存格資訊建立節點與 child_specs"""
+        indexed = self._indexed_formula(dependency_index, workbook_path, sheet_name, cell_address)
+        if indexed is not None:
+            return self._build_node_from_index(
+                workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, indexed, dependency_index
+            )
+        return self._build_node(workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, cell_info)
+
+    @staticmethod
+    def _indexed_formula(dependency_index, workbook_path, sheet_name, cell_address):
+        """索引中不含動態函數的公式 (formula, display_value)；需要讀取時返回 None"""
+        if dependency_index is None or not dependency_index.is_indexed(workbook_path):
+            return None
+        key = cell_key(workbook_path, sheet_name, cell_address)
+        if key in dependency_index.dynamic_cells:
+            return None
+        return dependency_index.formulas.get(key)
+
+    def _build_node_from_index(self, workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, indexed, dependency_index):
+        """
+        由依賴索引建立公式節點與子項，不讀取活頁簿
+
+        子項順序與 _build_node 相同：先是每個範圍的範圍節點（其下為範圍內的
+        公式區塊代表，小範圍再逐格列出非公式儲存格），再依公式順序列出儲存格
+        引用。範圍節點只有維度，不計算內容雜湊。
+        """
+        formula, display_value = indexed
+        references = dependency_index.precedents_of(workbook_path, sheet_name, cell_address)
+        fixed_formula = self._clean_formula(formula)
+        cell_info = {
+            'formula': formula,
+            'calculated_value': display_value,
+            'display_value': display_value,
+            'cell_type': 'formula'
+        }
+        node = self._create_node_with_dynamic_functions(
+            workbook_path, sheet_name, cell_address, current_depth, root_workbook_path,
+            cell_info, fixed_formula, fixed_formula
+        )
+        node['from_index'] = True
+        
+        child_specs = []
+        for reference in references:
+            if reference.is_cell:
+                continue
+            range_info = {
+                'workbook_path': reference.workbook_path,
+                'sheet_name': reference.sheet_name,
+                'address': reference.address,
+                'rows': reference.max_row - reference.min_row + 1,
+                'columns': reference.max_col - reference.min_col + 1,
+                'total_cells': reference.cell_count,
+                'content_summary': '依賴索引（未讀取內容）'
+            }
+            range_node = self._create_range_node(range_info, current_depth + 1, root_workbook_path)
+            child_specs.append({'node': range_node})
+            rectangle = (reference.min_row, reference.min_col, reference.max_row, reference.max_col)
+            formula_cells = dependency_index.formulas_in(reference.workbook_path, reference.sheet_name, rectangle)
+            value_addresses = None
+            if reference.cell_count <= self.range_expand_threshold:
+                formula_addresses = {address for address, _, _ in formula_cells}
+                value_addresses = [address for address in reference.iter_cells() if address not in formula_addresses]
+            child_specs.extend(self._range_region_specs(range_node, formula_cells, value_addresses))
+        
+        for reference in references:
+            if not reference.is_cell:
+                continue
+            ref = {'workbook_path': reference.workbook_path, 'sheet_name': reference.sheet_name, 'cell_address': reference.address}
+            child_specs.append(self._child_spec(ref, {}, "正在處理索引引用: {display}", "處理引用", 'node'))
+        
+        return node, child_specs
+
+    def _range_region_specs_from_file(self, range_node):
+        """讀取範圍內的儲存格，交給 _range_region_specs 依公式區塊分組"""
+        cells = read_range_cells(range_node['workbook_path'], range_node['sheet_name'], range_node['cell_address'])
+        formula_cells = [
+            (address, info['formula'], info.get('display_value'))
+            for address, info in cells.items() if info.get('cell_type') == 'formula'
+        ]
+        value_addresses = None
+        rectangle = rectangle_from_address(range_node['cell_address'])
+        if rectangle_cell_count(rectangle) <= self.range_expand_threshold:
+            formula_addresses = {address for address, _, _ in formula_cells}
+            value_addresses = [address for address in iter_rectangle_cells(rectangle) if address not in formula_addresses]
+        else:
+            range_node['range_info']['value_cells'] = sum(
+                1 for info in cells.values() if info.get('cell_type') == 'value'
+            )
+        return self._range_region_specs(range_node, formula_cells, value_addresses)
+
+    def _range_region_specs(self, range_node, formula_cells, value_addresses=None):
+        """
+        範圍節點的子項：範圍內的公式依相對 R1C1 形式分組，每組只展開一個代表儲存格
+        
+        Args:
+            range_node: 範圍節點（子項掛在它下面，與範圍同一層深度）
+            formula_cells: 範圍內公式儲存格 [(地址, 公式, 顯示值), ...]，依列、欄順序
+            value_addresses: 小範圍時要逐一列出的非公式儲存格地址；大範圍為 None
+        
+        Returns:
+            list: child specs；代表儲存格標記 region_multiplicity（同組儲存格數）和 region_address
+        """
+        rows = [('formula', address, formula, display_value, display_value)
+                for address, formula, display_value in formula_cells]
+        regions = group_formula_regions(rows)
+        range_node['range_info']['formula_cells'] = len(rows)
+        range_node['range_info']['formula_regions'] = len(regions)
+        
+        workbook_path = range_node['workbook_path']
+        sheet_name = range_node['sheet_name']
+        specs = []
+        for region in regions:
+            flags = {}
+            if len(region) > 1:
+                flags = {'region_multiplicity': len(region), 'region_address': region.display_address()}
+            ref = {'workbook_path': workbook_path, 'sheet_name': sheet_name, 'cell_address': region.representative_address}
+            specs.append(self._child_spec(
+                ref, flags, f"正在處理範圍公式區塊 ({len(region)} 個儲存格): {{display}}",
+                "處理範圍公式區塊", 'node', parent=range_node
+            ))
+        for address in value_addresses or ():
+            ref = {'workbook_path': workbook_path, 'sheet_name': sheet_name, 'cell_address': address}
+            specs.append(self._child_spec(
+                ref, {}, "正在處理範圍儲存格: {display}", "處理範圍儲存格", 'node', parent=range_node
+            ))
+        if len(regions) < len(rows):
+            self.progress_callback.update_progress(
+                f"範圍 {range_node['address']}：{len(rows)} 個公式壓縮為 {len(regions)} 個區塊"
+            )
+        return specs
+
+    def _finish_analysis(self, root_node):
+        """根節點完成：輸出統計並超安全清理"""
+        total_nodes = self._count_nodes(root_node)
+        max_depth = self._get_max_depth(root_node)
+        indirect_count = len([log for log in self.indirect_resolution_log if log.get('resolved')])
+        index_count = len([log for log in self.index_resolution_log if log.get('resolved')])
+        shared_text = f"，共用節點命中 {self.memo_hits} 次" if self.dag_mode else ""
+        self.progress_callback.update_progress(
+            f"分析完成！共處理 {self.processed_count} 次，生成 {total_nodes} 個節點，最大深度: {max_depth}，成功解析 {indirect_count} 個 INDIRECT，{index_count} 個 INDEX{shared_text}"
+        )
+        self._analyze_cycles(root_node)
+        
+        # 超安全清理（只清理我們的實例）
+        self.progress_callback.update_progress("[ULTRA-SAFE] 正在超安全釋放資源...")
+        try:
+            self._ultra_safe_cleanup()
+            self.progress_callback.update_progress("[ULTRA-SAFE] ✓ 資源超安全釋放完成，您的Excel檔案完全不受影響")
+        except Exception as cleanup_error:
+            self.progress_callback.update_progress(f"[ULTRA-SAFE] 超安全清理過程出錯: {cleanup_error}")
+
+    def _analyze_cycles(self, root_node):
+        """
+        以 SCC 找出每個循環引用（每個循環只報告一次），並在樹中標記成員節點的 cycle_id
+        
+        有（或可建立）根活頁簿的依賴索引時分析整本活頁簿的公式圖；
+        否則（.xls/.xlsb 或關閉 cycle_scan）只分析已展開的節點。
+        """
+        self.cycles = []
+        self.cycle_scope = None
+        # 路徑上遇到的循環在清理時會被清空，先保留一份給摘要
+        self.path_circular_refs = list(self.circular_refs)
+        if not root_node or not root_node.get('workbook_path'):
+            return
+        root_workbook_path = root_node['workbook_path']
+        
+        index = None
+        if self.cycle_scan:
+            index = self.dependency_index
+            if index is None or not index.is_indexed(root_workbook_path):
+                index = get_dependency_index(root_workbook_path)
+            if index is None and root_workbook_path.lower().endswith(INDEXABLE_EXTENSIONS):
+                self.progress_callback.update_progress("正在建立依賴索引，以分析整本活頁簿的循環引用...")
+                try:
+                    index = build_dependency_index(root_workbook_path, progress_callback=self.progress_callback.update_progress)
+                except Exception as e:
+                    if "cancelled" in str(e).lower():
+                        raise
+                    self.progress_callback.update_progress(f"無法建立依賴索引，只分析已展開的節點: {e}")
+                    index = None
+        
+        if index is not None:
+            self.cycles = find_index_cycles(index)
+            self.cycle_scope = 'workbook'
+        else:
+            self.cycles = self._explored_graph_cycles(root_node)
+            self.cycle_scope = 'explored'
+        
+        tagged = mark_cycle_nodes(iter_unique_nodes(root_node), self.cycles)
+        scope_text = "整本活頁簿" if self.cycle_scope == 'workbook' else "已展開的節點"
+        self.progress_callback.update_progress(
+            f"循環引用分析（{scope_text}）：找到 {len(self.cycles)} 個循環，樹中 {tagged} 個節點屬於循環"
+        )
+
+    @staticmethod
+    def _explored_graph_cycles(root_node):
+        """已展開節點之間的循環；範圍節點只是分組，邊穿過它直接連到範圍內的儲存格"""
+        members = {}
+        edges = []
+        for node in iter_unique_nodes(root_node):
+            if node.get('type') == 'range' or not node.get('cell_address'):
+                continue
+            key = cell_key(node['workbook_path'], node['sheet_name'], node['cell_address'])
+            members[key] = (node['workbook_path'], node['sheet_name'], key[2])
+            for child in node.get('children', []):
+                targets = child.get('children', []) if child.get('type') == 'range' else [child]
+                for target in targets:
+                    if target.get('cell_address') and target.get('type') != 'range':
+                        edges.append((key, cell_key(target['workbook_path'], target['sheet_name'], target['cell_address'])))
+        return [sorted(members[key] for key in component if key in members)
+                for component in find_graph_cycles(edges)]
+
+    def _set_edge_flags(self, parent, position, flags):
+        """
+        記錄 parent['children'][position] 這條邊的標記
+        
+        DAG 模式下子節點可能被其他父節點共享，標記存在父節點的 edge_flags
+        （位置 -> 標記），避免出現在無關的父節點底下；一般樹狀結果直接寫在子節點上。
+        讀取時用 iter_child_edges。
+        """
+        if not flags:
+            return
+        if self.dag_mode:
+            parent.setdefault('edge_flags', {})[position] = dict(flags)
+        else:
+            parent['children'][position].update(flags)
+
+    def _attach_spec_child(self, node, spec, child_node):
+        """把展開好的子儲存格掛到 spec 指定的父節點（範圍節點或 node 本身），並記錄邊標記"""
+        parent = spec['parent'] or node
+        parent['children'].append(child_node)
+        self._set_edge_flags(parent, len(parent['children']) - 1, spec['flags'])
+
+    def _handle_child_error(self, node, spec, error, current_depth, root_workbook_path):
+        """子儲存格展開失敗：INDIRECT/INDEX 內部引用只記錄，一般引用改掛錯誤節點"""
+        ref = spec['ref']
+        self.progress_callback.update_progress(f"錯誤：{spec['error_label']}失敗 {spec['display']} - {str(error)}")
+        if spec['on_error'] == 'node':
+            node['children'].append(self._create_error_node(
+                ref['workbook_path'], ref['sheet_name'], ref['cell_address'],
+                current_depth + 1, root_workbook_path, str(error)
+            ))
+
+    def _child_spec(self, ref, flags, message, error_label, on_error, parent=None):
+        display = f"{os.path.basename(ref['workbook_path'])}!{ref['sheet_name']}!{ref['cell_address']}"
+        return {
+            'node': None,
+            'parent': parent,
+            'ref': ref,
+            'flags': flags,
+            'message': message.format(display=display),
+            'display': display,
+            'error_label': error_label,
+            'on_error': on_error
+        }
+
+    def _build_node(self, workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, cell_info):
+        """
+        由已讀取的儲存格資訊建立節點，並列出它的子項（兩種引擎共用）
+        
+        Returns:
+            tuple: (node, child_specs)。child_specs 依子節點順序排列；
+            'node' 不為 None 的是已建立好的範圍/錯誤節點，其餘是待展開的
+            儲存格引用（'ref'），展開後要加上 'flags' 標記。
+        """
+        current_ref = f"{os.path.basename(workbook_path)}!{sheet_name}!{cell_address}"
+        
+        # 處理公式清理和動態函數解析
+        original_formula = cell_info.get('formula')
+        fixed_formula = None
+        resolved_formula = None
+        indirect_info = None
+        index_info = None
+        
+        if original_formula:
+            self.progress_callback.update_progress(f"正在處理公式: {current_ref}")
+            fixed_formula, resolved_formula, indirect_info, index_info = self._resolve_dynamic_functions(
+                original_formula, workbook_path, sheet_name, cell_address, current_ref
+            )
+
+        # 創建節點
+        node = self._create_node_with_dynamic_functions(
+            workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, 
+            cell_info, fixed_formula, resolved_formula, indirect_info, index_info
+        )
+        
+        child_specs = []
+        
+        # 如果是公式，解析依賴關係
+        if cell_info.get('cell_type') == 'formula' and cell_info.get('formula'):
+            self.progress_callback.update_progress(f"正在解析公式依賴關係: {current_ref}")
+            
+            # 處理 INDIRECT 內部的引用
+            if indirect_info and indirect_info.get('internal_references'):
+                internal_refs = indirect_info['internal_references']
+                self.progress_callback.update_progress(f"找到 {len(internal_refs)} 個 INDIRECT 內部引用，正在分析...")
+                for i, internal_ref in enumerate(internal_refs, 1):
+                    child_specs.append(self._child_spec(
+                        internal_ref, {'from_indirect_internal': True},
+                        f"正在處理 INDIRECT 內部引用 {i}/{len(internal_refs)}: {{display}}",
+                        "處理 INDIRECT 內部引用", 'skip'
+                    ))
+            
+            # 處理 INDEX 內部的引用
+            if index_info and index_info.get('internal_references'):
+                internal_refs = index_info['internal_references']
+                self.progress_callback.update_progress(f"找到 {len(internal_refs)} 個 INDEX 內部引用，正在分析...")
+                for i, internal_ref in enumerate(internal_refs, 1):
+                    child_specs.append(self._child_spec(
+                        internal_ref, {'from_index_internal': True},
+                        f"正在處理 INDEX 內部引用 {i}/{len(internal_refs)}: {{display}}",
+                        "處理 INDEX 內部引用", 'skip'
+                    ))
+            
+            # INDEX / 查找函數參數中的範圍（查找表、MATCH 範圍）建立範圍節點，不當作儲存格讀取
+            if index_info and index_info.get('internal_ranges'):
+                internal_ranges = index_info['internal_ranges']
+                self.progress_callback.update_progress(f"找到 {len(internal_ranges)} 個 INDEX 內部範圍，正在處理...")
+                child_specs.extend(self._range_child_specs(
+                    internal_ranges, current_depth, root_workbook_path, {'from_index_internal': True}
+                ))
+            
+            # 處理範圍地址
+            formula_for_ranges = resolved_formula if resolved_formula else cell_info['formula']
+            ranges = process_formula_ranges(formula_for_ranges, workbook_path, sheet_name)
+            if ranges:
+                self.progress_callback.update_progress(f"找到 {len(ranges)} 個範圍，正在處理...")
+                child_specs.extend(self._range_child_specs(ranges, current_depth, root_workbook_path))
+            
+            # 處理單個儲存格引用
+            formula_to_parse = resolved_formula if resolved_formula else cell_info['formula']
+            references = self._parse_formula_references_accurate(formula_to_parse, workbook_path, sheet_name)
+            
+            if references:
+                self.progress_callback.update_progress(f"找到 {len(references)} 個儲存格引用，正在遞歸分析...")
+                
+                flags = {}
+                if resolved_formula != fixed_formula:
+                    if indirect_info and indirect_info.get('success'):
+                        flags['from_indirect_resolved'] = True
+                    if index_info and index_info.get('success'):
+                        flags['from_index_resolved'] = True
+                
+                for i, ref in enumerate(references, 1):
+                    # 檢查是否為範圍引用，如果是則跳過直接讀取
+                    if ':' in ref['cell_address']:
+                        self.progress_callback.update_progress(f"跳過範圍引用: {ref['cell_address']}")
+                        continue
+                    # 範圍內的儲存格已由範圍節點依公式區塊展開
+                    if ref.get('original_range'):
+                        continue
+                    child_specs.append(self._child_spec(
+                        ref, flags,
+                        f"正在處理引用 {i}/{len(references)}: {{display}}",
+                        "處理引用", 'node'
+                    ))
+        
+        return node, child_specs
+
+    def _range_child_specs(self, ranges, current_depth, root_workbook_path, flags=None):
+        """每個範圍一個範圍節點（flags 直接標在新建的範圍節點上），其後是範圍內依公式區塊展開的子項"""
+        child_specs = []
+        for i, range_info in enumerate(ranges, 1):
+            range_display = f"{os.path.basename(range_info['workbook_path'])}!{range_info['sheet_name']}!{range_info['address']}"
+            try:
+                self.progress_callback.update_progress(f"正在處理範圍 {i}/{len(ranges)}: {range_display}")
+                
+                range_node = self._create_range_node(range_info, current_depth + 1, root_workbook_path)
+                region_specs = self._range_region_specs_from_file(range_node)
+            except Exception as e:
+                self.progress_callback.update_progress(f"錯誤：處理範圍失敗 {range_display} - {str(e)}")
+                range_node = self._create_error_node(
+                    range_info['workbook_path'], range_info['sheet_name'], range_info['address'], 
+                    current_depth + 1, root_workbook_path, str(e)
+                )
+                region_specs = []
+            range_node.update(flags or {})
+            child_specs.append({'node': range_node})
+            child_specs.extend(region_specs)
+        return child_specs
+
+    def _resolve_dynamic_functions(self, original_formula, workbook_path, sheet_name, cell_address, current_ref):
+        """清理公式並解析 INDIRECT / INDEX，返回 (fixed_formula, resolved_formula, indirect_info, index_info)"""
+        fixed_formula = self._clean_formula(original_formula)
+        resolved_formula = fixed_formula  # 默認等於fixed_formula
+        indirect_info = None
+        index_info = None
+        
+        # INDIRECT 處理
+        if 'INDIRECT' in fixed_formula.upper():
+            self.progress_callback.update_progress(f"正在解析INDIRECT函數: {current_ref}")
+            try:
+                resolved_result = self._resolve_indirect_with_excel(
+                    fixed_formula, workbook_path, sheet_name, cell_address
+                )
+                if resolved_result and resolved_result['success']:
+                    resolved_formula = resolved_result['resolved_formula']
+                    indirect_info = {
+                        'has_indirect': True,
+                        'success': True,
+                        'resolved_formula': resolved_formula,
+                        'details': resolved_result,
+                        'internal_references': resolved_result.get('internal_references', [])
+                    }
+                    self.progress_callback.update_progress(f"INDIRECT解析完成，resolved: {resolved_formula}")
+                    
+                    # 記錄解析日誌
+                    self.indirect_resolution_log.append({
+                        'cell': f"{sheet_name}!{cell_address}",
+                        'original': original_formula,
+                        'resolved': resolved_formula,
+                        'details': resolved_result
+                    })
+                else:
+                    indirect_info = {
+                        'has_indirect': True,
+                        'success': False,
+                        'error': resolved_result.get('error', 'Unknown error'),
+                        'internal_references': []
+                    }
+                    self.progress_callback.update_progress(f"INDIRECT解析失敗: {indirect_info['error']}")
+            except Exception as e:
+                indirect_info = {
+                    'has_indirect': True,
+                    'success': False,
+                    'error': str(e),
+                    'internal_references': []
+                }
+                self.progress_callback.update_progress(f"INDIRECT解析異常: {str(e)}")
+        
+        # INDEX 處理（含 OFFSET 與查找函數）
+        if REFERENCE_FUNCTION_PATTERN.search(fixed_formula):
+            self.progress_callback.update_progress(f"正在解析INDEX函數: {current_ref}")
+            try:
+                index_result = self._resolve_index_with_excel_corrected_simple(
+                    resolved_formula, workbook_path, sheet_name, cell_address
+                )
+                if index_result and index_result['success']:
+                    resolved_formula = index_result['resolved_formula']
+                    index_info = {
+                        'has_index': True,
+                        'success': True,
+                        'resolved_formula': resolved_formula,
+                        'details': index_result,
+                        'internal_references': index_result.get('internal_references', []),
+                        'internal_ranges': index_result.get('internal_ranges', [])
+                    }
+                    self.progress_callback.update_progress(f"INDEX解析完成，resolved: {resolved_formula}")
+                    
+                    # 記錄INDEX解析日誌
+                    self.index_resolution_log.append({
+                        'cell': f"{sheet_name}!{cell_address}",
+                        'original': original_formula,
+                        'resolved': resolved_formula,
+                        'details': index_result
+                    })
+                elif index_result.get('lookup_only'):
+                    # 只有查找函數且無法解析：照一般公式處理，不標記為 INDEX
+                    self.progress_callback.update_progress("查找函數無法解析，保留原公式引用")
+                else:
+                    index_info = {
+                        'has_index': True,
+                        'success': False,
+                        'error': index_result.get('error', 'Unknown error'),
+                        'internal_references': []
+                    }
+                    self.progress_callback.update_progress(f"INDEX解析失敗: {index_info['error']}")
+            except Exception as e:
+                index_info = {
+                    'has_index': True,
+                    'success': False,
+                    'error': str(e),
+                    'internal_references': []
+                }
+                self.progress_callback.update_progress(f"INDEX解析異常: {str(e)}")
+        
+        return fixed_formula, resolved_formula, indirect_info, index_info
+
     def _create_node_with_dynamic_functions(self, workbook_path, sheet_name, cell_address, current_depth, root_workbook_path, cell_info, fixed_formula, resolved_formula=None, indirect_info=None, index_info=None):
         """創建支持動態函數的節點"""
         filename = os.path.basename(workbook_path)
@@ -1218,90 +1789,30 @@ class EnhancedDependencyExploder:
         self.progress_callback.update_progress("[USER] 超安全清理完成，檔案已完全釋放")
 
     def _parse_formula_references_accurate(self, formula, current_workbook_path, current_sheet_name):
-        """最準確的公式引用解析器"""
+        """最準確的公式引用解析器（經全域解析快取，回傳不可變的引用 tuple）"""
         if not formula or not formula.startswith('='):
             return []
+        return get_global_parse_cache().get_or_parse(
+            formula, current_workbook_path, current_sheet_name,
+            self._parse_formula_references_uncached, 'EnhancedDependencyExploder', self.range_expand_threshold
+        )
+
+    def _parse_formula_references_uncached(self, formula, current_workbook_path, current_sheet_name):
+        """實際的引用解析（不經快取）"""
 
         references = []
-        processed_spans = []
-        
+
         # 標準化反斜線
         normalized_formula = formula.replace('\\\\', '\\')
-        
-        def is_span_processed(start, end):
-            for p_start, p_end in processed_spans:
-                if start < p_end and end > p_start:
-                    return True
-            return False
-
-        def add_processed_span(start, end):
-            processed_spans.append((start, end))
-
-        # 精確的模式匹配
-        patterns = [
-            # 外部引用
-            (
-                'external',
-                re.compile(
-                    r"'?([^']*)\[([^\]]+\.(?:xlsx|xls|xlsm|xlsb))\]([^']*?)'?\s*!\s*(\$?[A-Z]{1,3}\$?\d{1,7}(?::\$?[A-Z]{1,3}\$?\d{1,7})?)",
-                    re.IGNORECASE
-                )
-            ),
-            # 本地引用（帶引號）
-            (
-                'local_quoted',
-                re.compile(
-                    r"'([^']+)'!(\$?[A-Z]{1,3}\$?\d{1,7}(?::\$?[A-Z]{1,3}\$?\d{1,7})?)",
-                    re.IGNORECASE
-                )
-            ),
-            # 本地引用（不帶引號）
-            (
-                'local_unquoted',
-                re.compile(
-                    r"([a-zA-Z0-9_\u4e00-\u9fa5][a-zA-Z0-9_\s\.\u4e00-\u9fa5]{0,30})!(\$?[A-Z]{1,3}\$?\d{1,7}(?::\$?[A-Z]{1,3}\$?\d{1,7})?)",
-                    re.IGNORECASE
-                )
-            ),
-            # 當前工作表範圍
-            (
-                'current_range',
-                re.compile(
-                    r"(?<![!'\[\]a-zA-Z0-9_\u4e00-\u9fa5])(?!\[)(\$?[A-Z]{1,3}\$?\d{1,7}:\s*\$?[A-Z]{1,3}\$?\d{1,7})(?![a-zA-Z0-9_\]])",
-                    re.IGNORECASE
-                )
-            ),
-            # 當前工作表單個儲存格
-            (
-                'current_single',
-                re.compile(
-                    r"(?<![!'\[\]a-zA-Z0-9_\u4e00-\u9fa5])(?!\[)(\$?[A-Z]{1,3}\$?\d{1,7})(?![a-zA-Z0-9_:\]])",
-                    re.IGNORECASE
-                )
-            )
-        ]
-
-        all_matches = []
-        for p_type, pattern in patterns:
-            for match in pattern.finditer(normalized_formula):
-                all_matches.append({'type': p_type, 'match': match, 'span': match.span()})
-
-        # 按優先級和位置排序
-        type_priority = {'external': 0, 'local_quoted': 1, 'local_unquoted': 2, 'current_range': 3, 'current_single': 4}
-        all_matches.sort(key=lambda x: (type_priority.get(x['type'], 99), x['span'][0], x['span'][1] - x['span'][0]))
-
-        for item in all_matches:
-            match = item['match']
-            m_type = item['type']
-            start, end = item['span']
-
-            if is_span_processed(start, end):
-                continue
 
+        for token in iter_reference_tokens(normalized_formula, (CELL, RANGE)):
+            cell_ref = token.address
             try:
-                if m_type == 'external':
-                    path_prefix, file_name, sheet_suffix, cell_ref = match.groups()
-                    
+                if token.workbook is not None:
+                    if not token.workbook.lower().endswith(('.xlsx', '.xls', '.xlsm', '.xlsb')):
+                        continue
+                    path_prefix, file_name = token.directory, token.workbook
+
                     # 組合完整檔案路徑
                     if path_prefix:
                         full_file_path = os.path.join(path_prefix, file_name)
@@ -1312,64 +1823,41 @@ class EnhancedDependencyExploder:
                         else:
                             current_dir = os.path.dirname(current_workbook_path)
                             full_file_path = os.path.join(current_dir, file_name)
-                    
-                    sheet_name = sheet_suffix.strip("'") if sheet_suffix else "Sheet1"
-                    
-                    # 處理範圍 vs 單個儲存格
-                    if ':' in cell_ref:
-                        range_refs = self._process_range_reference(
-                            cell_ref, full_file_path, sheet_name, 'external'
-                        )
-                        references.extend(range_refs)
-                    else:
-                        references.append({
-                            'workbook_path': full_file_path,
-                            'sheet_name': sheet_name,
-                            'cell_address': cell_ref.replace('$', ''),
-                            'type': 'external'
-                        })
-
-                elif m_type in ('local_quoted', 'local_unquoted'):
-                    sheet_name, cell_ref = match.groups()
-                    sheet_name = sheet_name.strip("'")
-                    
+
+                    sheet_name = token.sheet or "Sheet1"
+                    ref_type = 'external'
+                    workbook_path = full_file_path
+
+                elif token.sheet is not None:
+                    sheet_name = token.sheet
+
                     # 跳過看起來像檔案名的工作表
                     if sheet_name.lower().endswith(('.xlsx', '.xls', '.xlsm', '.xlsb')):
                         continue
-                    
-                    if ':' in cell_ref:
-                        range_refs = self._process_range_reference(
-                            cell_ref, current_workbook_path, sheet_name, 'local'
-                        )
-                        references.extend(range_refs)
-                    else:
-                        references.append({
-                            'workbook_path': current_workbook_path,
-                            'sheet_name': sheet_name,
-                            'cell_address': cell_ref.replace('$', ''),
-                            'type': 'local'
-                        })
-
-                elif m_type in ('current_range', 'current_single'):
-                    cell_ref = match.group(1)
-                    
-                    if ':' in cell_ref:
-                        range_refs = self._process_range_reference(
-                            cell_ref, current_workbook_path, current_sheet_name, 'current'
-                        )
-                        references.extend(range_refs)
-                    else:
-                        references.append({
-                            'workbook_path': current_workbook_path,
-                            'sheet_name': current_sheet_name,
-                            'cell_address': cell_ref.replace('$', ''),
-                            'type': 'current'
-                        })
-
-                add_processed_span(start, end)
-                
+                    ref_type = 'local'
+                    workbook_path = current_workbook_path
+
+                else:
+                    sheet_name = current_sheet_name
+                    ref_type = 'current'
+                    workbook_path = current_workbook_path
+
+                # 處理範圍 vs 單個儲存格
+                if token.kind == RANGE:
+                    range_refs = self._process_range_reference(
+                        cell_ref, workbook_path, sheet_name, ref_type
+                    )
+                    references.extend(range_refs)
+                else:
+                    references.append({
+                        'workbook_path': workbook_path,
+                        'sheet_name': sheet_name,
+                        'cell_address': cell_ref.replace('$', ''),
+                        'type': ref_type
+                    })
+
             except Exception as e:
-                self.progress_callback.update_progress(f"Warning: Could not process reference from match '{match.group(0)}': {e}")
+                self.progress_callback.update_progress(f"Warning: Could not process reference from match '{token.text}': {e}")
                 continue
 
         return references
@@ -1396,18 +1884,9 @@ class EnhancedDependencyExploder:
             }]
     
     def _calculate_range_size(self, range_ref):
-        """計算範圍包含的儲存格數量"""
+        """計算範圍包含的儲存格數量（整欄、整列範圍也可計算）"""
         try:
-            clean_range = range_ref.replace('$', '').strip()
-            start_cell, end_cell = clean_range.split(':')
-            
-            start_col, start_row = self._parse_cell_address(start_cell.strip())
-            end_col, end_row = self._parse_cell_address(end_cell.strip())
-            
-            row_count = abs(end_row - start_row) + 1
-            col_count = abs(end_col - start_col) + 1
-            
-            return row_count * col_count
+            return rectangle_cell_count(rectangle_from_address(range_ref))
             
         except Exception as e:
             self.progress_callback.update_progress(f"Warning: Could not calculate range size for {range_ref}: {e}")
@@ -1431,30 +1910,13 @@ class EnhancedDependencyExploder:
     def _expand_range_to_cells(self, range_ref, workbook_path, sheet_name, ref_type):
         """將範圍展開為個別儲存格引用"""
         try:
-            clean_range = range_ref.replace('$', '').strip()
-            start_cell, end_cell = clean_range.split(':')
-            
-            start_col, start_row = self._parse_cell_address(start_cell.strip())
-            end_col, end_row = self._parse_cell_address(end_cell.strip())
-            
-            min_col, max_col = min(start_col, end_col), max(start_col, end_col)
-            min_row, max_row = min(start_row, end_row), max(start_row, end_row)
-            
-            references = []
-            for row in range(min_row, max_row + 1):
-                for col in range(min_col, max_col + 1):
-                    col_letters = self._col_num_to_letters(col)
-                    cell_address = f"{col_letters}{row}"
-                    
-                    references.append({
-                        'workbook_path': workbook_path,
-                        'sheet_name': sheet_name,
-                        'cell_address': cell_address,
-                        'type': f'{ref_type}_from_range',
-                        'original_range': range_ref
-                    })
-            
-            return references
+            return [{
+                'workbook_path': workbook_path,
+                'sheet_name': sheet_name,
+                'cell_address': cell_address,
+                'type': f'{ref_type}_from_range',
+                'original_range': range_ref
+            } for cell_address in iter_rectangle_cells(rectangle_from_address(range_ref))]
             
         except Exception as e:
             self.progress_callback.update_progress(f"Warning: Could not expand range {range_ref}: {e}")
@@ -1746,115 +2208,202 @@ class EnhancedDependencyExploder:
             return f"{sheet_name}!{cell_address}"
     
     def _count_nodes(self, node):
-        """計算節點總數"""
-        count = 1
-        for child in node.get('children', []):
-            count += self._count_nodes(child)
-        return count
+        """計算節點總數（共享節點只算一次）"""
+        return sum(1 for _ in iter_unique_nodes(node))
     
     def _get_max_depth(self, node):
         """獲取最大深度"""
-        if not node.get('children'):
-            return node.get('depth', 0)
-        return max(self._get_max_depth(child) for child in node['children'])
+        return max(n.get('depth', 0) for n in iter_unique_nodes(node) if not n.get('children'))
     
     def get_explosion_summary(self, root_node):
         """獲取爆炸分析摘要 - 支援INDEX統計"""
-        def count_nodes(node):
-            count = 1
-            for child in node.get('children', []):
-                count += count_nodes(child)
-            return count
+        unique_nodes = list(iter_unique_nodes(root_node))
         
-        def get_max_depth(node):
-            if not node.get('children'):
-                return node.get('depth', 0)
-            return max(get_max_depth(child) for child in node['children'])
-        
-        def count_by_type(node, type_counts=None):
-            if type_counts is None:
-                type_counts = {}
-            
-            node_type = node.get('type', 'unknown')
-            type_counts[node_type] = type_counts.get(node_type, 0) + 1
-            
-            for child in node.get('children', []):
-                count_by_type(child, type_counts)
-            
+        def count_by_type(nodes):
+            type_counts = {}
+            for node in nodes:
+                node_type = node.get('type', 'unknown')
+                type_counts[node_type] = type_counts.get(node_type, 0) + 1
             return type_counts
         
-        def count_dynamic_function_nodes(node, dynamic_stats=None):
-            if dynamic_stats is None:
-                dynamic_stats = {
-                    'total_indirect_nodes': 0,
-                    'successful_indirect_resolutions': 0,
-                    'failed_indirect_resolutions': 0,
-                    'internal_references': 0,
-                    'indirect_resolved_references': 0,
-                    'total_index_nodes': 0,
-                    'successful_index_resolutions': 0,
-                    'failed_index_resolutions': 0,
-                    'index_resolved_references': 0,
-                    'index_internal_references': 0
-                }
-            
-            # INDIRECT 統計
-            if node.get('has_indirect'):
-                dynamic_stats['total_indirect_nodes'] += 1
-                if node.get('indirect_details'):
-                    dynamic_stats['successful_indirect_resolutions'] += 1
-                    dynamic_stats['internal_references'] += node.get('internal_references_count', 0)
-                else:
-                    dynamic_stats['failed_indirect_resolutions'] += 1
-            
-            if node.get('from_indirect_resolved'):
-                dynamic_stats['indirect_resolved_references'] += 1
-            
-            # INDEX 統計
-            if node.get('has_index'):
-                dynamic_stats['total_index_nodes'] += 1
-                if node.get('index_details'):
-                    dynamic_stats['successful_index_resolutions'] += 1
-                    dynamic_stats['index_internal_references'] += node.get('index_internal_references_count', 0)
-                else:
-                    dynamic_stats['failed_index_resolutions'] += 1
-            
-            if node.get('from_index_resolved'):
-                dynamic_stats['index_resolved_references'] += 1
+        def count_dynamic_function_nodes(nodes):
+            dynamic_stats = {
+                'total_indirect_nodes': 0,
+                'successful_indirect_resolutions': 0,
+                'failed_indirect_resolutions': 0,
+                'internal_references': 0,
+                'indirect_resolved_references': 0,
+                'total_index_nodes': 0,
+                'successful_index_resolutions': 0,
+                'failed_index_resolutions': 0,
+                'index_resolved_references': 0,
+                'index_internal_references': 0
+            }
             
-            for child in node.get('children', []):
-                count_dynamic_function_nodes(child, dynamic_stats)
+            for node in nodes:
+                # INDIRECT 統計
+                if node.get('has_indirect'):
+                    dynamic_stats['total_indirect_nodes'] += 1
+                    if node.get('indirect_details'):
+                        dynamic_stats['successful_indirect_resolutions'] += 1
+                        dynamic_stats['internal_references'] += node.get('internal_references_count', 0)
+                    else:
+                        dynamic_stats['failed_indirect_resolutions'] += 1
+                
+                # INDEX 統計
+                if node.get('has_index'):
+                    dynamic_stats['total_index_nodes'] += 1
+                    if node.get('index_details'):
+                        dynamic_stats['successful_index_resolutions'] += 1
+                        dynamic_stats['index_internal_references'] += node.get('index_internal_references_count', 0)
+                    else:
+                        dynamic_stats['failed_index_resolutions'] += 1
+                
+                # 解析後的引用以邊計算（DAG 模式下同一子節點可被多個父節點引用）
+                for _, flags in iter_child_edges(node):
+                    if flags.get('from_indirect_resolved'):
+                        dynamic_stats['indirect_resolved_references'] += 1
+                    if flags.get('from_index_resolved'):
+                        dynamic_stats['index_resolved_references'] += 1
             
             return dynamic_stats
         
         basic_stats = {
-            'total_nodes': count_nodes(root_node),
-            'max_depth': get_max_depth(root_node),
-            'type_distribution': count_by_type(root_node),
-            'circular_references': len(self.circular_refs),
-            'circular_ref_list': self.circular_refs
+            'total_nodes': len(unique_nodes),
+            'max_depth': max(node.get('depth', 0) for node in unique_nodes if not node.get('children')),
+            'type_distribution': count_by_type(unique_nodes),
+            'circular_references': len(self.cycles),
+            'circular_ref_list': [describe_cycle(members) for members in self.cycles],
+            'cycles': self.cycles,
+            'cycle_scope': self.cycle_scope,
+            'path_circular_refs': self.path_circular_refs
         }
         
-        dynamic_stats = count_dynamic_function_nodes(root_node)
+        dynamic_stats = count_dynamic_function_nodes(unique_nodes)
         
         return {
             **basic_stats,
             'dynamic_function_resolution': dynamic_stats,
             'indirect_resolution_log': self.indirect_resolution_log,
             'index_resolution_log': self.index_resolution_log,
-            'our_instances_count': len(self.our_excel_instances)
+            'our_instances_count': len(self.our_excel_instances),
+            'excel_pool': self.excel_pool.get_stats() if self.excel_pool is not None else self.excel_pool_stats,
+            'indirect_evaluations': dict(self.indirect_evaluations),
+            'indirect_session': self.indirect_session.get_stats(),
+            'excel_batches': self.excel_batches,
+            'index_evaluations': dict(self.index_evaluations),
+            'dag_mode': self.dag_mode,
+            'shared_node_hits': self.memo_hits,
+            'index_nodes': sum(1 for node in unique_nodes if node.get('from_index')),
+            'region_cells_compressed': sum(
+                flags.get('region_multiplicity', 1) - 1 for node in unique_nodes for _, flags in iter_child_edges(node)
+            )
+        }
+
+
+def iter_unique_nodes(root_node):
+    """
+    依前序走訪依賴樹，每個節點物件只產出一次
+
+    DAG 模式下同一個子節點會掛在多個父節點底下；逐層遞迴會重複走訪
+    （甚至呈指數成長），這裡用物件 id 去重。一般樹狀結果不受影響。
+    """
+    seen = set()
+    stack = [root_node]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        yield node
+        stack.extend(reversed(node.get('children', [])))
+
+
+def iter_child_edges(node):
+    """
+    依序產出 (子節點, 這條邊的標記)
+
+    邊標記見 EDGE_FLAG_KEYS。一般樹狀結果的標記寫在子節點上；DAG 模式下
+    共享的子節點不帶邊標記，標記存在父節點的 edge_flags（子節點位置 -> 標記）。
+    """
+    edge_flags = node.get('edge_flags') or {}
+    for position, child in enumerate(node.get('children', [])):
+        flags = {key: child[key] for key in EDGE_FLAG_KEYS if key in child}
+        flags.update(edge_flags.get(position, ()))
+        yield child, flags
+
+
+def build_dependency_graph_tables(root_node):
+    """
+    把依賴樹（可含共享節點）攤平成節點表與邊列表
+
+    Args:
+        root_node: explode_dependencies 回傳的根節點
+
+    Returns:
+        dict: {
+            'root': 根節點 id,
+            'nodes': {節點 id: 不含 children 的節點資料}（依前序排列）,
+            'edges': [(parent_id, child_id), ...]（不重複）
         }
+        節點 id 與 convert_tree_to_graph_data 一致，使用節點的 address；
+        此結果可直接傳給 convert_tree_to_graph_data。節點資料附上第一條
+        指向它的邊的標記（例如範圍公式區塊的 region_multiplicity）。
+    """
+    nodes = {}
+    edges = []
+    seen_edges = set()
+    first_edge_flags = {}
+    for node in iter_unique_nodes(root_node):
+        node_id = node.get('address', str(id(node)))
+        existing = nodes.get(node_id)
+        # 同一位址可能同時有深度限制/循環的佔位節點與真正展開的節點，保留後者
+        if existing is None or (existing.get('type') in ('limit_reached', 'circular_ref') and node.get('children')):
+            entry = {key: value for key, value in node.items() if key not in ('children', 'edge_flags')}
+            entry.update(first_edge_flags.get(node_id, ()))
+            nodes[node_id] = entry
+        for child, flags in iter_child_edges(node):
+            child_id = child.get('address', str(id(child)))
+            first_edge_flags.setdefault(child_id, flags)
+            edge = (node_id, child_id)
+            if edge not in seen_edges:
+                seen_edges.add(edge)
+                edges.append(edge)
+    return {
+        'root': root_node.get('address', str(id(root_node))),
+        'nodes': nodes,
+        'edges': edges
+    }
 
 
-def explode_cell_dependencies_with_progress(workbook_path, sheet_name, cell_address, max_depth=10, range_expand_threshold=5, progress_callback=None):
+def explode_cell_dependencies_with_progress(workbook_path, sheet_name, cell_address, max_depth=10, range_expand_threshold=5, progress_callback=None, dag_mode=False, engine='recursive', max_workers=1, dependency_index=None, cycle_scan=True, excel_pool=None, indirect_session=None):
     """
     便捷函數：爆炸分析指定儲存格的依賴關係 - 超安全版本 + INDEX支援 (完整版本)
+    
+    dag_mode=True 時，重複被引用的儲存格只展開一次並由所有父節點共享；
+    用 build_dependency_graph_tables 可把結果轉成節點表 + 邊列表。
+    engine='iterative' 改用逐層、按工作表批次讀取的引擎（結果相同）。
+    max_workers > 1 時使用常駐的全域 reader pool，同一層涉及多個大型活頁簿且實測
+    平行較快時才平行讀取，否則逐一讀取；遞歸引擎一次只讀一格，沒有可分派的工作，
+    因此會自動改用逐層引擎。
+    dependency_index（core.dependency_index.DependencyIndex）同樣只用於逐層引擎，
+    提供時會自動改用。
+    cycle_scan=True 時摘要中的循環引用涵蓋整本活頁簿（必要時建立並快取依賴索引）。
+    excel_pool（utils.excel_calc_pool.ExcelCalculationPool）可跨多次分析共用常駐的
+    Excel 實例；未提供時本次分析在第一次需要 Excel 時自建一個，結束時關閉。
+    indirect_session（utils.indirect_session.IndirectSession）保存 INDIRECT 結果記憶、
+    載入的活頁簿與外部連結；未提供時每次分析各開一個。
     """
-    exploder = EnhancedDependencyExploder(max_depth=max_depth, range_expand_threshold=range_expand_threshold, progress_callback=progress_callback)
+    exploder = EnhancedDependencyExploder(max_depth=max_depth, range_expand_threshold=range_expand_threshold, progress_callback=progress_callback, dag_mode=dag_mode, max_workers=max_workers, cycle_scan=cycle_scan, excel_pool=excel_pool, indirect_session=indirect_session)
+    if exploder.max_workers > 1 or dependency_index is not None:
+        engine = 'iterative'
     
     try:
         # 執行分析
-        dependency_tree = exploder.explode_dependencies(workbook_path, sheet_name, cell_address)
+        if engine == 'iterative':
+            dependency_tree = exploder.explode_dependencies_iterative(workbook_path, sheet_name, cell_address, dependency_index)
+        else:
+            dependency_tree = exploder.explode_dependencies(workbook_path, sheet_name, cell_address)
         summary = exploder.get_explosion_summary(dependency_tree)
         
         # 分析完成後超安全清理
@@ -1920,4 +2469,78 @@ if __name__ == "__main__":
         print(f"測試失敗: {e}")
         import traceback
         traceback.print_exc()
-                    
\ No newline at end of file
+                    
+    # 引擎一致性：逐層引擎（含 DAG 模式）的樹、深度與邊標記必須與遞歸引擎相同
+    import json
+    import tempfile
+    from openpyxl import Workbook
+
+    class _QuietCallback(ProgressCallback):
+        def update_progress(self, message, step=None):
+            pass
+
+    def _tree_snapshot(root_node):
+        def walk(node, flags):
+            return {
+                'address': node.get('address'),
+                'type': node.get('type'),
+                'depth': node.get('depth'),
+                'flags': flags,
+                'children': [walk(child, child_flags) for child, child_flags in iter_child_edges(node)]
+            }
+        return json.dumps(walk(root_node, {}), sort_keys=True, default=str)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        parity_workbook = os.path.join(temp_dir, 'parity.xlsx')
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'S'
+        ws['X1'] = '=SUM(A1:A3)+C1'
+        ws['A1'] = '=B1'
+        ws['B1'] = '=D1'
+        ws['D1'] = '=E1&F1'
+        ws['E1'] = 'G1'
+        ws['F1'] = '=X1'
+        ws['A2'] = '=D1+1'
+        ws['A3'] = '=INDIRECT(E1)'
+        ws['C1'] = '=A1*2+INDEX(G1:G3,2)'
+        for row in range(1, 4):
+            ws[f'G{row}'] = row * 10
+        wb.save(parity_workbook)
+
+        for dag_mode in (False, True):
+            for max_depth in (3, 4, 10):
+                snapshots = []
+                for engine in ('recursive', 'iterative'):
+                    exploder = EnhancedDependencyExploder(
+                        max_depth=max_depth, progress_callback=_QuietCallback(), dag_mode=dag_mode, cycle_scan=False
+                    )
+                    if engine == 'recursive':
+                        root = exploder.explode_dependencies(parity_workbook, 'S', 'X1')
+                    else:
+                        root = exploder.explode_dependencies_iterative(parity_workbook, 'S', 'X1')
+                    snapshots.append((_tree_snapshot(root), exploder._count_nodes(root), exploder.memo_hits))
+                assert snapshots[0] == snapshots[1], f"dag_mode={dag_mode}, max_depth={max_depth}: 兩種引擎結果不同"
+                print(f"engine parity dag_mode={dag_mode!s:<5} max_depth={max_depth:<2}: "
+                      f"{snapshots[0][1]} nodes, {snapshots[0][2]} shared hits")
+
+        # DAG 共用不可帶出循環標記：Q1 在 P1 底下時 P1 是祖先，直接從 R1 展開時不是
+        cycle_workbook = os.path.join(temp_dir, 'cycle.xlsx')
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'S'
+        ws['R1'] = '=P1+Q1'
+        ws['P1'] = '=Q1'
+        ws['Q1'] = '=P1'
+        wb.save(cycle_workbook)
+        for engine in ('recursive', 'iterative'):
+            snapshots = []
+            for dag_mode in (False, True):
+                exploder = EnhancedDependencyExploder(progress_callback=_QuietCallback(), dag_mode=dag_mode, cycle_scan=False)
+                if engine == 'recursive':
+                    root = exploder.explode_dependencies(cycle_workbook, 'S', 'R1')
+                else:
+                    root = exploder.explode_dependencies_iterative(cycle_workbook, 'S', 'R1')
+                snapshots.append(_tree_snapshot(root))
+            assert snapshots[0] == snapshots[1], f"{engine}: DAG 模式共用了含循環標記的節點"
+        print("circular stubs are not shared in DAG mode")
@@ -8,9 +8,11 @@ import re
 import os
 import openpyxl
 from urllib.parse import unquote
-import win32com.client as win32
 
-def resolve_indirect_pure(indirect_content, workbook_path, sheet_name, current_cell=None):
+from utils.excel_calc_pool import evaluate_in_cell, get_global_calculation_pool
+from utils.indirect_session import read_external_links_map
+
+def resolve_indirect_pure(indirect_content, workbook_path, sheet_name, current_cell=None, session=None):
     """
     純INDIRECT解析邏輯 - 提取自你的unified_indirect_resolver
     
@@ -19,6 +21,7 @@ def resolve_indirect_pure(indirect_content, workbook_path, sheet_name, current_c
         workbook_path: Excel文件路徑
         sheet_name: 工作表名稱
         current_cell: 當前儲存格 (例如: B32)
+        session: 可選的 IndirectSession，共用已載入的工作簿與外部連結映射
         
     Returns:
         str: 解析後的引用 (例如: 工作表2!A8)
@@ -32,13 +35,19 @@ def resolve_indirect_pure(indirect_content, workbook_path, sheet_name, current_c
         
         # 載入工作簿
         print(f"🔍 [INDIRECT-CALC-2] 正在載入Excel工作簿...")
-        workbook = openpyxl.load_workbook(workbook_path, data_only=False)
+        if session is not None:
+            workbook = session.workbook(workbook_path)
+        else:
+            workbook = openpyxl.load_workbook(workbook_path, data_only=False)
         worksheet = workbook[sheet_name]
         print(f"✅ [INDIRECT-CALC-2] 成功載入工作簿和工作表")
         
         # 獲取外部連結映射
         print(f"🔍 [INDIRECT-CALC-3] 正在獲取外部連結映射...")
-        external_links_map = get_external_links_map(workbook, workbook_path)
+        if session is not None:
+            external_links_map = session.external_links(workbook_path)
+        else:
+            external_links_map = get_external_links_map(workbook, workbook_path)
         print(f"✅ [INDIRECT-CALC-3] 外部連結映射: {external_links_map}")
         
         # 修復外部引用
@@ -75,44 +84,7 @@ def resolve_indirect_pure(indirect_content, workbook_path, sheet_name, current_c
 
 def get_external_links_map(workbook, workbook_path):
     """獲取外部連結映射 - 提取自你的邏輯"""
-    external_links_map = {}
-    
-    try:
-        if hasattr(workbook, '_external_links'):
-            external_links = workbook._external_links
-            if external_links:
-                for i, link in enumerate(external_links, 1):
-                    if hasattr(link, 'file_link') and link.file_link:
-                        file_path = link.file_link.Target
-                        if file_path:
-                            decoded_path = unquote(file_path)
-                            if decoded_path.startswith('file:///'):
-                                decoded_path = decoded_path[8:]
-                            elif decoded_path.startswith('file://'):
-                                decoded_path = decoded_path[7:]
-                            
-                            external_links_map[str(i)] = decoded_path
-        
-        # 如果沒有找到，推斷常見的外部連結
-        if not external_links_map:
-            base_dir = os.path.dirname(workbook_path)
-            common_files = [
-                "Link1.xlsx", "Link2.xlsx", "Link3.xlsx",
-                "File1.xlsx", "File2.xlsx", "File3.xlsx",
-                "Data.xlsx", "GDP.xlsx", "Test.xlsx"
-            ]
-            
-            index = 1
-            for filename in common_files:
-                full_path = os.path.join(base_dir, filename)
-                if os.path.exists(full_path):
-                    external_links_map[str(index)] = full_path
-                    index += 1
-                    
-    except Exception as e:
-        print(f"Error getting external links: {e}")
-    
-    return external_links_map
+    return read_external_links_map(workbook, workbook_path)
 
 def fix_external_references(content, external_links_map):
     """修復外部引用 - 提取自你的邏輯"""
@@ -238,144 +210,62 @@ def resolve_concatenation(content, worksheet, current_cell=None, workbook_path=N
         return content
 
 def calculate_excel_function(function_str, worksheet, current_cell=None, workbook_path=None):
-    """使用Excel COM計算複雜函數（如OFFSET）"""
-    xl = None
-    excel_workbook = None
-    
+    """使用Excel COM計算複雜函數（如OFFSET），透過共用的 Excel 計算池"""
     try:
         print(f"            🔍 [EXCEL-CALC-1] 開始Excel COM計算")
         print(f"                函數: {function_str}")
         print(f"                當前儲存格: {current_cell}")
         print(f"                工作簿路徑: {workbook_path}")
-        
-        # 嘗試導入Excel COM
-        try:
-            import win32com.client as win32
-        except ImportError:
-            print(f"            ❌ [EXCEL-CALC-2] Excel COM不可用")
-            return None
-        
-        # 連接Excel
-        try:
-            xl = win32.Dispatch("Excel.Application")
-            xl.Visible = False
-            xl.DisplayAlerts = False
-            print(f"            ✅ [EXCEL-CALC-2] 創建Excel實例")
-        except Exception as e:
-            print(f"            ❌ [EXCEL-CALC-2] 無法連接Excel: {e}")
+
+        if not (workbook_path and os.path.exists(workbook_path)):
+            print(f"            ❌ [EXCEL-CALC-3] 工作簿路徑無效: {workbook_path}")
             return None
-        
-        # 獲取當前工作簿和工作表
-        try:
-            if workbook_path and os.path.exists(workbook_path):
-                excel_workbook = xl.Workbooks.Open(workbook_path, UpdateLinks=0, ReadOnly=True)
-                excel_ws = excel_workbook.Worksheets(worksheet.title)
-                print(f"            ✅ [EXCEL-CALC-3] 打開工作簿: {workbook_path}")
-                print(f"            ✅ [EXCEL-CALC-3] 獲取工作表: {worksheet.title}")
+
+        sheet_name = worksheet.title
+
+        def task(context):
+            # 在ZZ999計算函數（計算池的工作簿已是唯讀、手動計算模式）
+            result_value = evaluate_in_cell(context, sheet_name, "ZZ999", function_str)
+            address_result = None
+            if isinstance(result_value, (int, float)) and not isinstance(result_value, bool):
+                # 對於OFFSET函數，結果通常是儲存格的值，不是地址，嘗試獲取公式引用的地址
+                try:
+                    address_result = evaluate_in_cell(
+                        context, sheet_name, "ZZ999",
+                        f"ADDRESS(ROW({function_str}),COLUMN({function_str}))"
+                    )
+                except Exception:
+                    pass
+            return result_value, address_result
+
+        print(f"            🔍 [EXCEL-CALC-2] 提交到Excel計算池")
+        result_value, address_result = get_global_calculation_pool().submit(workbook_path, task).result(timeout=120)
+        print(f"            ✅ [EXCEL-CALC-5] Excel計算結果: {result_value} (類型: {type(result_value)})")
+
+        # 處理結果
+        if result_value is not None:
+            # 如果是字串且看起來像儲存格地址
+            if isinstance(result_value, str) and ('!' in result_value or re.match(r'^[A-Z]+\d+$', result_value)):
+                print(f"            ✅ [EXCEL-CALC-6] 識別為儲存格地址: {result_value}")
+                return result_value
+            # 如果是數字，優先使用公式引用的地址
+            elif isinstance(result_value, (int, float)):
+                if address_result and isinstance(address_result, str):
+                    print(f"            ✅ [EXCEL-CALC-6] 轉換為地址: {address_result}")
+                    return address_result
+
+                # 如果無法獲取地址，返回值本身
+                print(f"            ⚠️ [EXCEL-CALC-6] 返回計算值: {result_value}")
+                return str(result_value)
             else:
-                print(f"            ❌ [EXCEL-CALC-3] 工作簿路徑無效: {workbook_path}")
-                return None
-        except Exception as e:
-            print(f"            ❌ [EXCEL-CALC-3] 獲取工作表失敗: {e}")
-            return None
-        
-        # 找一個空白儲存格進行計算
-        test_cell = excel_ws.Range("ZZ999")  # 使用ZZ999作為測試儲存格
-        
-        # 保存原始狀態
-        original_formula = test_cell.Formula
-        original_calculation = xl.Calculation
-        original_events = xl.EnableEvents
-        original_screen_updating = xl.ScreenUpdating
-        
-        try:
-            print(f"            🔍 [EXCEL-CALC-4] 設置保護模式並計算函數")
-            
-            # 設置保護模式
-            xl.Calculation = -4135  # xlCalculationManual
-            xl.EnableEvents = False
-            xl.ScreenUpdating = False
-            
-            # 在Excel中計算函數
-            test_formula = f"={function_str}"
-            test_cell.Formula = test_formula
-            test_cell.Calculate()
-            
-            # 獲取計算結果
-            result_value = test_cell.Value
-            print(f"            ✅ [EXCEL-CALC-5] Excel計算結果: {result_value} (類型: {type(result_value)})")
-            
-            # 處理結果
-            if result_value is not None:
-                # 如果是字串且看起來像儲存格地址
-                if isinstance(result_value, str) and ('!' in result_value or re.match(r'^[A-Z]+\d+$', result_value)):
-                    print(f"            ✅ [EXCEL-CALC-6] 識別為儲存格地址: {result_value}")
-                    return result_value
-                # 如果是數字，可能是儲存格的值，需要轉換為地址
-                elif isinstance(result_value, (int, float)):
-                    # 對於OFFSET函數，結果通常是儲存格的值，不是地址
-                    # 但我們需要的是地址，所以嘗試獲取公式的地址
-                    try:
-                        # 嘗試獲取公式引用的地址
-                        address_formula = f"=ADDRESS(ROW({function_str}),COLUMN({function_str}))"
-                        test_cell.Formula = address_formula
-                        test_cell.Calculate()
-                        address_result = test_cell.Value
-                        if address_result and isinstance(address_result, str):
-                            print(f"            ✅ [EXCEL-CALC-6] 轉換為地址: {address_result}")
-                            return address_result
-                    except:
-                        pass
-                    
-                    # 如果無法獲取地址，返回值本身
-                    print(f"            ⚠️ [EXCEL-CALC-6] 返回計算值: {result_value}")
-                    return str(result_value)
-                else:
-                    print(f"            ⚠️ [EXCEL-CALC-6] 未知結果類型，轉為字串: {result_value}")
-                    return str(result_value)
-            
-            print(f"            ❌ [EXCEL-CALC-6] 計算結果為None")
-            return None
-            
-        finally:
-            # 恢復所有狀態
-            try:
-                test_cell.Formula = original_formula
-                xl.Calculation = original_calculation
-                xl.EnableEvents = original_events
-                xl.ScreenUpdating = original_screen_updating
-                print(f"            ✅ [EXCEL-CALC-7] 恢復Excel狀態")
-            except Exception as e:
-                print(f"            ⚠️ [EXCEL-CALC-7] 恢復狀態時出錯: {e}")
-            
-            # 關閉工作簿
-            try:
-                if excel_workbook:
-                    excel_workbook.Close(SaveChanges=False)
-                    print(f"            ✅ [EXCEL-CALC-8] 關閉工作簿")
-            except Exception as e:
-                print(f"            ⚠️ [EXCEL-CALC-8] 關閉工作簿時出錯: {e}")
-            
-            # 退出Excel
-            try:
-                if xl:
-                    xl.Quit()
-                    print(f"            ✅ [EXCEL-CALC-9] 退出Excel")
-            except Exception as e:
-                print(f"            ⚠️ [EXCEL-CALC-9] 退出Excel時出錯: {e}")
-            
+                print(f"            ⚠️ [EXCEL-CALC-6] 未知結果類型，轉為字串: {result_value}")
+                return str(result_value)
+
+        print(f"            ❌ [EXCEL-CALC-6] 計算結果為None")
+        return None
+
     except Exception as e:
         print(f"            ❌ [EXCEL-CALC-ERROR] Excel計算錯誤: {e}")
-        
-        # 緊急清理
-        try:
-            if excel_workbook:
-                excel_workbook.Close(SaveChanges=False)
-            if xl:
-                xl.Quit()
-        except:
-            pass
-            
         return None
 
 def smart_split_by_ampersand(content):
@@ -418,7 +308,7 @@ def smart_split_by_ampersand(content):
         print(f"Error in smart split: {e}")
         return [content]
 
-def process_formula_with_pure_indirect(formula, workbook_path, sheet_name, current_cell=None):
+def process_formula_with_pure_indirect(formula, workbook_path, sheet_name, current_cell=None, session=None):
     """
     使用純邏輯處理包含INDIRECT的公式
     
@@ -427,6 +317,8 @@ def process_formula_with_pure_indirect(formula, workbook_path, sheet_name, curre
         workbook_path: Excel文件路徑
         sheet_name: 工作表名稱
         current_cell: 當前儲存格地址
+        session: 可選的 IndirectSession（每次分析開一個）。提供時先以原生求值器解析，
+            結果有記憶；無法原生解析時才走純邏輯，並共用 session 載入的工作簿
         
     Returns:
         dict: {
@@ -450,6 +342,18 @@ def process_formula_with_pure_indirect(formula, workbook_path, sheet_name, curre
         
         print(f"Processing formula with pure INDIRECT logic: {formula}")
         
+        if session is not None:
+            session_result = session.resolve_formula(formula, workbook_path, sheet_name, current_cell)
+            if session_result['resolved_references'] and not session_result['unresolved']:
+                print(f"✅ [SESSION] 原生解析完成: {session_result['resolved_formula']}")
+                return {
+                    'has_indirect': True,
+                    'original_formula': formula,
+                    'resolved_formula': session_result['resolved_formula'],
+                    'success': True,
+                    'error': None
+                }
+        
         # === 修復：正確提取INDIRECT函數內容，處理嵌套括號 ===
         def extract_indirect_content_fixed(formula):
             """正確提取INDIRECT內容，處理嵌套括號"""
@@ -508,7 +412,7 @@ def process_formula_with_pure_indirect(formula, workbook_path, sheet_name, curre
         
         print(f"🔍 [FINAL-1] 開始使用純邏輯解析INDIRECT...")
         # 使用純邏輯解析
-        resolved_ref = resolve_indirect_pure(indirect_content, workbook_path, sheet_name, current_cell)
+        resolved_ref = resolve_indirect_pure(indirect_content, workbook_path, sheet_name, current_cell, session)
         
         print(f"🔍 [FINAL-2] 純邏輯解析完成")
         print(f"    解析結果: {resolved_ref}")
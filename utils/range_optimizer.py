@@ -171,6 +171,57 @@ def optimize_ranges(parsed_addresses):
             rect_ranges.append(format_range(current_start, current_end))
     return rect_ranges
 
+def cells_to_rectangles(cells):
+    """
+    Cover a set of (row, col) cells with non-overlapping rectangles.
+
+    Each column is cut into runs of consecutive rows; a run is then merged
+    with the run of identical rows in the column to its left, so a filled
+    block becomes one rectangle in O(n log n) instead of the pairwise search
+    of optimize_ranges.
+
+    Returns:
+        list: [(min_row, min_col, max_row, max_col), ...] sorted by position
+    """
+    rows_by_col = collections.defaultdict(list)
+    for row, col in cells:
+        rows_by_col[col].append(row)
+
+    rectangles = []
+    open_runs = {}  # (first_row, last_row) -> [min_row, min_col, max_row, max_col] still growing to the right
+    previous_col = None
+    for col in sorted(rows_by_col):
+        rows = sorted(set(rows_by_col[col]))
+        runs = []
+        run_start = run_end = rows[0]
+        for row in rows[1:]:
+            if row == run_end + 1:
+                run_end = row
+            else:
+                runs.append((run_start, run_end))
+                run_start = run_end = row
+        runs.append((run_start, run_end))
+
+        adjacent = previous_col is not None and col == previous_col + 1
+        next_runs = {}
+        for run in runs:
+            rectangle = open_runs.pop(run, None) if adjacent else None
+            if rectangle is None:
+                rectangle = [run[0], col, run[1], col]
+            else:
+                rectangle[3] = col
+            next_runs[run] = rectangle
+        rectangles.extend(open_runs.values())
+        open_runs = next_runs
+        previous_col = col
+    rectangles.extend(open_runs.values())
+    return sorted(tuple(rectangle) for rectangle in rectangles)
+
+def format_rectangle(rectangle):
+    """Format (min_row, min_col, max_row, max_col) as 'D5:D5004' (or 'D5' for one cell)."""
+    min_row, min_col, max_row, max_col = rectangle
+    return format_range(f"{get_column_letter(min_col)}{min_row}", f"{get_column_letter(max_col)}{max_row}")
+
 def smart_range_display(addresses):
     if not addresses:
         return ""
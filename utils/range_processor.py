@@ -9,6 +9,8 @@ import openpyxl
 from openpyxl.utils import range_boundaries
 import os
 
+from core.formula_tokenizer import iter_reference_tokens, RANGE, COLUMN_RANGE, ROW_RANGE
+
 class RangeProcessor:
     """Excel範圍處理器"""
     
@@ -29,36 +31,21 @@ class RangeProcessor:
             return []
         
         ranges = []
-        
-        # 範圍模式：A1:B10, A:B, 1:5 等
-        range_patterns = [
-            r"([A-Z]+\d+):([A-Z]+\d+)",  # A1:B10 (儲存格範圍)
-            r"([A-Z]+):([A-Z]+)",        # A:B (整列範圍)
-            r"(\d+):(\d+)"               # 1:5 (整行範圍)
-        ]
-        
-        for pattern in range_patterns:
-            matches = re.findall(pattern, formula)
-            for match in matches:
-                start, end = match
-                range_address = f"{start}:{end}"
-                
-                # 判斷範圍類型
-                if re.match(r"[A-Z]+\d+", start) and re.match(r"[A-Z]+\d+", end):
-                    range_type = "cell_range"
-                elif re.match(r"[A-Z]+", start) and re.match(r"[A-Z]+", end):
-                    range_type = "column_range"
-                elif re.match(r"\d+", start) and re.match(r"\d+", end):
-                    range_type = "row_range"
-                else:
-                    continue
-                
-                ranges.append({
-                    'address': range_address,
-                    'start': start,
-                    'end': end,
-                    'type': range_type
-                })
+        range_types = {RANGE: 'cell_range', COLUMN_RANGE: 'column_range', ROW_RANGE: 'row_range'}
+
+        # 單次掃描的 tokenizer：A1:B10、A:B、1:5，含工作表/外部活頁簿前綴的範圍
+        for token in iter_reference_tokens(formula, (RANGE, COLUMN_RANGE, ROW_RANGE)):
+            range_address = token.address.replace('$', '').upper()
+            start, end = range_address.split(':')
+            ranges.append({
+                'address': range_address,
+                'start': start,
+                'end': end,
+                'type': range_types[token.kind],
+                'sheet': token.sheet,
+                'directory': token.directory,
+                'workbook': token.workbook
+            })
         
         return ranges
     
@@ -273,8 +260,16 @@ def process_formula_ranges(formula, workbook_path, sheet_name):
     processed_ranges = []
     
     for range_info in ranges:
+        # 範圍所在的活頁簿與工作表：'Sheet2'!A1:B5、'C:\dir\[Book.xlsx]Sheet1'!A:A
+        target_workbook = workbook_path
+        if range_info.get('workbook'):
+            if range_info.get('directory'):
+                target_workbook = os.path.join(range_info['directory'], range_info['workbook'])
+            elif range_info['workbook'].lower() != os.path.basename(workbook_path).lower():
+                target_workbook = os.path.join(os.path.dirname(workbook_path), range_info['workbook'])
+        target_sheet = range_info.get('sheet') or sheet_name
         processed = range_processor.process_range(
-            workbook_path, sheet_name, range_info['address']
+            target_workbook, target_sheet, range_info['address']
         )
         processed_ranges.append(processed)
     
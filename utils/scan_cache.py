@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Scan Result Cache for Excel Tools
+Persists formula scan results on disk so an unchanged workbook is not rescanned
+"""
+
+import os
+import struct
+import hashlib
+import threading
+import zlib
+
+CACHE_MAGIC = b"XSC1"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".excel_tools", "scan_cache")
+CACHE_FILE_EXTENSION = ".scan"
+
+_SECTION_LENGTH = struct.Struct("<I")
+
+
+def _pack_sections(sections):
+    """Join byte sections, each prefixed with its length."""
+    return b"".join(_SECTION_LENGTH.pack(len(section)) + section for section in sections)
+
+
+def _unpack_sections(payload):
+    sections = []
+    offset = 0
+    while offset < len(payload):
+        (length,) = _SECTION_LENGTH.unpack_from(payload, offset)
+        offset += _SECTION_LENGTH.size
+        sections.append(payload[offset:offset + length])
+        offset += length
+    return sections
+
+
+def encode_scan_rows(rows):
+    """
+    Encode scan rows into the columnar cache format.
+
+    The formula type column is stored as one byte per row (index into a small
+    type table); the other four columns are NUL-joined UTF-8 strings, which
+    split back into lists in a single call. Excel cell content cannot contain
+    NUL, so it is safe as a separator.
+
+    Args:
+        rows: List of (formula_type, address, formula, display_value, cell_text)
+
+    Returns:
+        bytes: Compressed cache file content
+    """
+    type_table = []
+    type_index = {}
+    type_codes = bytearray()
+    for row in rows:
+        code = type_index.get(row[0])
+        if code is None:
+            code = type_index[row[0]] = len(type_table)
+            type_table.append(row[0])
+        type_codes.append(code)
+
+    sections = [
+        struct.pack("<I", len(rows)),
+        "\x00".join(type_table).encode("utf-8"),
+        bytes(type_codes),
+    ]
+    for column in range(1, 5):
+        sections.append("\x00".join(str(row[column]) for row in rows).encode("utf-8"))
+    return CACHE_MAGIC + zlib.compress(_pack_sections(sections), 1)
+
+
+def decode_scan_rows(data):
+    """
+    Decode cache file content produced by encode_scan_rows.
+
+    Returns:
+        list: Scan rows as 5-tuples
+
+    Raises:
+        ValueError: If the content is not a scan cache file
+    """
+    if not data.startswith(CACHE_MAGIC):
+        raise ValueError("Not a scan cache file")
+    sections = _unpack_sections(zlib.decompress(data[len(CACHE_MAGIC):]))
+    (row_count,) = struct.unpack("<I", sections[0])
+    if row_count == 0:
+        return []
+    type_table = sections[1].decode("utf-8").split("\x00")
+    types = [type_table[code] for code in sections[2]]
+    columns = [section.decode("utf-8").split("\x00") for section in sections[3:7]]
+    if any(len(column) != row_count for column in columns) or len(types) != row_count:
+        raise ValueError("Scan cache file is truncated")
+    return list(zip(types, *columns))
+
+
+class ScanResultCache:
+    """
+    Persistent LRU cache of scan results, bounded by total bytes on disk
+
+    Entries are keyed by file identity (normalised path, size, mtime) plus the
+    sheet, scan range and scan mode, so any change to the file misses.
+    Recency is tracked with the entry file's mtime.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=200 * 1024 * 1024):
+        """
+        Initialize the scan cache
+
+        Args:
+            cache_dir: Directory holding the cache files
+            max_bytes: Maximum total size of all cache files
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'errors': 0
+        }
+
+    def _entry_path(self, file_path, sheet_name, scan_range, scan_mode):
+        """
+        Build the cache file path for a scan, or None if the file is missing
+        """
+        normalized_path = os.path.normcase(os.path.normpath(os.path.abspath(file_path)))
+        try:
+            stat = os.stat(normalized_path)
+        except OSError:
+            return None
+        identity = f"{normalized_path}|{stat.st_size}|{stat.st_mtime_ns}|{sheet_name}|{scan_range}|{scan_mode}"
+        digest = hashlib.sha1(identity.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + CACHE_FILE_EXTENSION)
+
+    def get(self, file_path, sheet_name, scan_range, scan_mode):
+        """
+        Get cached scan rows
+
+        Returns:
+            list or None: Scan rows, or None on a miss
+        """
+        entry_path = self._entry_path(file_path, sheet_name, scan_range, scan_mode)
+        with self.lock:
+            if entry_path is None or not os.path.exists(entry_path):
+                self._stats['misses'] += 1
+                return None
+            try:
+                with open(entry_path, "rb") as f:
+                    rows = decode_scan_rows(f.read())
+                os.utime(entry_path, None)
+                self._stats['hits'] += 1
+                print(f"Scan cache HIT: {os.path.basename(file_path)} [{sheet_name}] {scan_range}")
+                return rows
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"Scan cache ERROR reading {entry_path}: {e}")
+                self._remove_file(entry_path)
+                return None
+
+    def put(self, file_path, sheet_name, scan_range, scan_mode, rows):
+        """
+        Store scan rows and evict least recently used entries over the byte limit
+
+        Returns:
+            bool: True if the rows were stored
+        """
+        entry_path = self._entry_path(file_path, sheet_name, scan_range, scan_mode)
+        if entry_path is None:
+            return False
+        with self.lock:
+            try:
+                data = encode_scan_rows(rows)
+                if len(data) > self.max_bytes:
+                    return False
+                os.makedirs(self.cache_dir, exist_ok=True)
+                temp_path = entry_path + ".tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, entry_path)
+                self._enforce_size_limit()
+                return True
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"Scan cache ERROR writing {os.path.basename(file_path)}: {e}")
+                return False
+
+    def _list_entries(self):
+        """Return [(mtime, size, path), ...] for all cache files, oldest first."""
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(CACHE_FILE_EXTENSION):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def _enforce_size_limit(self):
+        """
+        Remove least recently used cache files until the total fits max_bytes
+        """
+        entries = self._list_entries()
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if self._remove_file(path):
+                total_bytes -= size
+                self._stats['evictions'] += 1
+                print(f"Scan cache EVICTED: {os.path.basename(path)}")
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def clear(self):
+        """
+        Delete all cache files
+        """
+        with self.lock:
+            for _, _, path in self._list_entries():
+                self._remove_file(path)
+            print("Scan cache CLEARED")
+
+    def get_stats(self):
+        """
+        Get cache statistics
+
+        Returns:
+            dict: Cache statistics including hits, misses, etc.
+        """
+        with self.lock:
+            entries = self._list_entries()
+            total_requests = self._stats['hits'] + self._stats['misses']
+            hit_rate = (self._stats['hits'] / total_requests * 100) if total_requests > 0 else 0
+
+            return {
+                'cache_size': len(entries),
+                'total_bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+                'hits': self._stats['hits'],
+                'misses': self._stats['misses'],
+                'evictions': self._stats['evictions'],
+                'errors': self._stats['errors'],
+                'hit_rate_percent': round(hit_rate, 2),
+                'cache_dir': self.cache_dir
+            }
+
+    def print_stats(self):
+        """
+        Print cache statistics to console
+        """
+        stats = self.get_stats()
+        print("\n=== Scan Cache Statistics ===")
+        print(f"Cache Size: {stats['cache_size']} files, {stats['total_bytes']}/{stats['max_bytes']} bytes")
+        print(f"Hit Rate: {stats['hit_rate_percent']}%")
+        print(f"Hits: {stats['hits']}, Misses: {stats['misses']}")
+        print(f"Evictions: {stats['evictions']}, Errors: {stats['errors']}")
+        print("=============================\n")
+
+
+# Global cache instance
+_global_scan_cache = None
+_scan_cache_lock = threading.Lock()
+
+
+def get_global_scan_cache():
+    """
+    Get the global scan cache instance (singleton pattern)
+
+    Returns:
+        ScanResultCache: The global scan cache instance
+    """
+    global _global_scan_cache
+    if _global_scan_cache is None:
+        with _scan_cache_lock:
+            if _global_scan_cache is None:
+                _global_scan_cache = ScanResultCache()
+    return _global_scan_cache
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    rows = [("formula", f"B{i}", f"=A{i}*2", str(i * 2), str(i * 2)) for i in range(1, 200001)]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, "book.xlsx")
+        with open(source, "wb") as f:
+            f.write(b"x")
+        cache = ScanResultCache(cache_dir=os.path.join(temp_dir, "cache"))
+        cache.put(source, "Sheet1", "A1:B200000", "full", rows)
+        start = time.time()
+        assert cache.get(source, "Sheet1", "A1:B200000", "full") == rows
+        print(f"Loaded {len(rows)} rows in {time.time() - start:.3f}s")
+        cache.print_stats()
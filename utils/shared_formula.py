@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Shared Formula Translator - 展開 xlsx 共用公式與陣列公式
+
+A filled-down block is stored in xlsx once, as a shared formula on its
+anchor cell (<f t="shared" ref="B1:B1000" si="0">A1*2</f>); every other
+cell only carries <f t="shared" si="0"/>. The anchor formula is compiled
+once into a template of literal text and reference parts, and each
+dependent cell's formula is rendered by shifting the relative parts.
+
+Array formulas (<f t="array" ref="...">) are stored on the anchor only,
+and every cell of the array reports the same formula text.
+"""
+
+import re
+
+from openpyxl.utils import get_column_letter, range_boundaries
+
+MAX_ROW = 1048576
+MAX_COLUMN = 16384
+
+# 依序比對：字串、引號工作表名、中括號（外部活頁簿/表格）、整欄、整列、儲存格、名稱/函數
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<string>"(?:[^"]|"")*")
+  | (?P<quoted>'(?:[^']|'')*')
+  | (?P<bracket>\[[^\]]*\])
+  | (?P<colrange>(?<![\w.$])(?P<c1abs>\$?)(?P<c1>[A-Za-z]{1,3}):(?P<c2abs>\$?)(?P<c2>[A-Za-z]{1,3})(?![\w.(]))
+  | (?P<rowrange>(?<![\w.$])(?P<r1abs>\$?)(?P<r1>\d+):(?P<r2abs>\$?)(?P<r2>\d+)(?![\w.(]))
+  | (?P<cell>(?<![\w.$])(?P<colabs>\$?)(?P<col>[A-Za-z]{1,3})(?P<rowabs>\$?)(?P<row>\d+)(?![\w.(!]))
+  | (?P<word>[A-Za-z_\\][\w.]*)
+""", re.VERBOSE)
+
+_CELL_ADDRESS_PATTERN = re.compile(r"([A-Za-z]+)(\d+)")
+
+
+def _column_number(letters):
+    number = 0
+    for char in letters.upper():
+        number = number * 26 + (ord(char) - 64)
+    return number
+
+
+def parse_cell_address(address):
+    """
+    Parse 'B12' into (row, column).
+
+    Raises:
+        ValueError: If the address is not a single A1 cell
+    """
+    match = _CELL_ADDRESS_PATTERN.fullmatch(address.replace('$', ''))
+    if not match:
+        raise ValueError(f"Invalid cell address: {address}")
+    return int(match.group(2)), _column_number(match.group(1))
+
+
+class FormulaTemplate:
+    """
+    一條公式編譯後的樣板：文字片段 + 可平移的引用片段。
+
+    Parts are either plain strings or tuples:
+        ('cell', row, col, row_abs, col_abs)
+        ('rows', row1, row2, abs1, abs2)
+        ('cols', col1, col2, abs1, abs2)
+    with row/col numbers taken at the origin cell.
+    """
+
+    __slots__ = ('formula', 'origin_row', 'origin_col', 'parts', 'has_relative_refs')
+
+    def __init__(self, formula, origin_row, origin_col):
+        self.formula = formula
+        self.origin_row = origin_row
+        self.origin_col = origin_col
+        self.parts = []
+        self.has_relative_refs = False
+        self._compile()
+
+    def _compile(self):
+        parts = self.parts
+        literal_start = 0
+        for match in _TOKEN_PATTERN.finditer(self.formula):
+            kind = match.lastgroup
+            if kind in ('string', 'quoted', 'bracket', 'word'):
+                continue
+            if match.group('cell'):
+                part = ('cell', int(match.group('row')), _column_number(match.group('col')),
+                        bool(match.group('rowabs')), bool(match.group('colabs')))
+                relative = not (part[3] and part[4])
+            elif match.group('rowrange'):
+                part = ('rows', int(match.group('r1')), int(match.group('r2')),
+                        bool(match.group('r1abs')), bool(match.group('r2abs')))
+                relative = not (part[3] and part[4])
+            elif match.group('colrange'):
+                part = ('cols', _column_number(match.group('c1')), _column_number(match.group('c2')),
+                        bool(match.group('c1abs')), bool(match.group('c2abs')))
+                relative = not (part[3] and part[4])
+            else:
+                continue
+            if match.start() > literal_start:
+                parts.append(self.formula[literal_start:match.start()])
+            parts.append(part)
+            literal_start = match.end()
+            self.has_relative_refs = self.has_relative_refs or relative
+        if literal_start < len(self.formula):
+            parts.append(self.formula[literal_start:])
+
+    def render(self, row, col):
+        """
+        Render the formula as it reads in the cell at (row, col).
+
+        References that fall off the sheet become #REF!, as in Excel.
+        """
+        if not self.has_relative_refs:
+            return self.formula
+        return self.render_offset(row - self.origin_row, col - self.origin_col)
+
+    def render_offset(self, row_offset, col_offset):
+        """Render the formula shifted by (row_offset, col_offset)."""
+        pieces = []
+        append = pieces.append
+        for part in self.parts:
+            if part.__class__ is str:
+                append(part)
+                continue
+            kind, first, second, first_abs, second_abs = part
+            if kind == 'cell':
+                new_row = first if first_abs else first + row_offset
+                new_col = second if second_abs else second + col_offset
+                if not (1 <= new_row <= MAX_ROW and 1 <= new_col <= MAX_COLUMN):
+                    append("#REF!")
+                    continue
+                append(f"{'$' if second_abs else ''}{get_column_letter(new_col)}{'$' if first_abs else ''}{new_row}")
+            elif kind == 'rows':
+                new_first = first if first_abs else first + row_offset
+                new_second = second if second_abs else second + row_offset
+                if not (1 <= new_first <= MAX_ROW and 1 <= new_second <= MAX_ROW):
+                    append("#REF!")
+                    continue
+                append(f"{'$' if first_abs else ''}{new_first}:{'$' if second_abs else ''}{new_second}")
+            else:
+                new_first = first if first_abs else first + col_offset
+                new_second = second if second_abs else second + col_offset
+                if not (1 <= new_first <= MAX_COLUMN and 1 <= new_second <= MAX_COLUMN):
+                    append("#REF!")
+                    continue
+                append(f"{'$' if first_abs else ''}{get_column_letter(new_first)}:{'$' if second_abs else ''}{get_column_letter(new_second)}")
+        return ''.join(pieces)
+
+    def r1c1_key(self):
+        """
+        The formula in relative R1C1 notation, as seen from the origin cell.
+
+        Cells filled from one formula give the same key ('=B2*2' in C2 and
+        '=B3*2' in C3 both become '=RC[-1]*2'), so the key groups copies of
+        one formula regardless of where they sit.
+        """
+        pieces = []
+        append = pieces.append
+        origin_row, origin_col = self.origin_row, self.origin_col
+        for part in self.parts:
+            if part.__class__ is str:
+                append(part)
+                continue
+            kind, first, second, first_abs, second_abs = part
+            if kind == 'cell':
+                append(_r1c1_row(first, first_abs, origin_row) + _r1c1_col(second, second_abs, origin_col))
+            elif kind == 'rows':
+                append(f"{_r1c1_row(first, first_abs, origin_row)}:{_r1c1_row(second, second_abs, origin_row)}")
+            else:
+                append(f"{_r1c1_col(first, first_abs, origin_col)}:{_r1c1_col(second, second_abs, origin_col)}")
+        return ''.join(pieces)
+
+
+def _r1c1_row(row, absolute, origin_row):
+    if absolute:
+        return f"R{row}"
+    return f"R[{row - origin_row}]" if row != origin_row else "R"
+
+
+def _r1c1_col(col, absolute, origin_col):
+    if absolute:
+        return f"C{col}"
+    return f"C[{col - origin_col}]" if col != origin_col else "C"
+
+
+def relative_r1c1_key(formula, address):
+    """
+    便捷函數：把 A1 公式轉成以所在儲存格為準的相對 R1C1 鍵
+
+    Args:
+        formula (str): Formula text, e.g. '=B5*$A$1'
+        address (str): Cell holding the formula, e.g. 'D5'
+
+    Returns:
+        str: e.g. '=RC[-2]*R1C1'
+    """
+    row, col = parse_cell_address(address)
+    return FormulaTemplate(formula, row, col).r1c1_key()
+
+
+class SharedFormulaBlock:
+    """
+    共用公式區塊（延遲模式）：整個區塊只保存一筆紀錄，
+    直到個別儲存格被查詢時才產生該格的公式。
+    """
+
+    __slots__ = ('anchor', 'ref', 'template', 'min_row', 'min_col', 'max_row', 'max_col', 'kind')
+
+    def __init__(self, anchor_address, formula, ref=None, kind='shared'):
+        anchor_row, anchor_col = parse_cell_address(anchor_address)
+        self.anchor = anchor_address
+        self.ref = ref or anchor_address
+        self.kind = kind
+        self.template = FormulaTemplate(formula, anchor_row, anchor_col)
+        self.min_col, self.min_row, self.max_col, self.max_row = range_boundaries(self.ref.replace('$', ''))
+
+    def __len__(self):
+        return (self.max_row - self.min_row + 1) * (self.max_col - self.min_col + 1)
+
+    def contains(self, row, col):
+        return self.min_row <= row <= self.max_row and self.min_col <= col <= self.max_col
+
+    def formula_at(self, row, col):
+        """Formula of one cell in the block, rendered on demand."""
+        if self.kind == 'array':
+            return self.template.formula
+        return self.template.render(row, col)
+
+    def expand(self, cells=None):
+        """
+        Render the formulas of the whole block (or the given cells) in one pass.
+
+        Args:
+            cells: Optional iterable of (row, col); defaults to every cell of ref
+
+        Returns:
+            list: [(address, formula), ...] in row-major order
+        """
+        if cells is None:
+            cells = ((row, col) for row in range(self.min_row, self.max_row + 1)
+                     for col in range(self.min_col, self.max_col + 1))
+        template = self.template
+        if self.kind == 'array' or not template.has_relative_refs:
+            return [(f"{get_column_letter(col)}{row}", template.formula) for row, col in cells]
+
+        letters = {}
+        expanded = []
+        origin_row, origin_col = template.origin_row, template.origin_col
+        render_offset = template.render_offset
+        for row, col in cells:
+            letter = letters.get(col)
+            if letter is None:
+                letter = letters[col] = get_column_letter(col)
+            expanded.append((f"{letter}{row}", render_offset(row - origin_row, col - origin_col)))
+        return expanded
+
+
+def translate_shared_formula(formula, anchor_address, target_address):
+    """
+    便捷函數：把共用公式從錨點儲存格平移到目標儲存格
+
+    Args:
+        formula (str): Anchor formula, with or without leading '='
+        anchor_address (str): Anchor cell, e.g. 'B1'
+        target_address (str): Dependent cell, e.g. 'B7'
+
+    Returns:
+        str: Formula as it reads in target_address
+    """
+    anchor_row, anchor_col = parse_cell_address(anchor_address)
+    target_row, target_col = parse_cell_address(target_address)
+    return FormulaTemplate(formula, anchor_row, anchor_col).render(target_row, target_col)
+
+
+def expand_shared_formula(formula, anchor_address, ref):
+    """
+    便捷函數：一次展開整個共用公式區塊
+
+    Returns:
+        list: [(address, formula), ...] for every cell of ref
+    """
+    return SharedFormulaBlock(anchor_address, formula, ref).expand()
+
+
+# 測試函數
+if __name__ == "__main__":
+    print(translate_shared_formula("=A1*2+$A$1+SUM(B:B)+'My Sheet'!C3+\"A1\"", "B1", "C5"))
+    block = SharedFormulaBlock("D5", "=C5+D4", "D5:D100004")
+    import time
+    start = time.time()
+    rows = block.expand()
+    print(f"Expanded {len(rows)} cells in {time.time() - start:.3f}s; last: {rows[-1]}")
+    assert relative_r1c1_key("=C5+D4", "D5") == relative_r1c1_key("=C900+D899", "D900") == "=RC[-1]+R[-1]C"
+    print(relative_r1c1_key("=SUM($B$2:B7)+A:A+3:$4", "C7"))
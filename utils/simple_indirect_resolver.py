@@ -13,9 +13,10 @@ import win32com.client as win32
 class SimpleIndirectResolver:
     """簡單的INDIRECT解析器 - 只處理INDIRECT函數替換"""
     
-    def __init__(self, workbook_path, sheet_name):
+    def __init__(self, workbook_path, sheet_name, session=None):
         self.workbook_path = workbook_path
         self.sheet_name = sheet_name
+        self.session = session  # 可選的 IndirectSession：共用工作簿與外部連結映射
         self.workbook = None
         self.worksheet = None
         self.external_links_map = {}
@@ -24,6 +25,11 @@ class SimpleIndirectResolver:
     def load_workbook(self):
         """載入工作簿"""
         try:
+            if self.session is not None:
+                self.workbook = self.session.workbook(self.workbook_path)
+                self.worksheet = self.workbook[self.sheet_name]
+                self.external_links_map = self.session.external_links(self.workbook_path)
+                return
             self.workbook = openpyxl.load_workbook(self.workbook_path, data_only=False)
             self.worksheet = self.workbook[self.sheet_name]
             self.get_external_links()
@@ -441,7 +447,7 @@ class SimpleIndirectResolver:
             return formula
 
 
-def resolve_indirect_in_formula(formula, workbook_path, sheet_name, context_cell=None):
+def resolve_indirect_in_formula(formula, workbook_path, sheet_name, context_cell=None, session=None):
     """
     便捷函數：解析公式中的INDIRECT函數
     
@@ -450,6 +456,8 @@ def resolve_indirect_in_formula(formula, workbook_path, sheet_name, context_cell
         workbook_path: Excel文件路徑
         sheet_name: 工作表名稱
         context_cell: 公式所在的儲存格地址
+        session: 可選的 IndirectSession（每次分析開一個）。提供時先以原生求值器解析，
+            結果有記憶；無法原生解析時才用 SimpleIndirectResolver，並共用 session 載入的工作簿
         
     Returns:
         dict: {
@@ -466,7 +474,16 @@ def resolve_indirect_in_formula(formula, workbook_path, sheet_name, context_cell
                 'resolved_formula': formula
             }
         
-        resolver = SimpleIndirectResolver(workbook_path, sheet_name)
+        if session is not None:
+            session_result = session.resolve_formula(formula, workbook_path, sheet_name, context_cell)
+            if session_result['resolved_references'] and not session_result['unresolved']:
+                return {
+                    'has_indirect': True,
+                    'original_formula': formula,
+                    'resolved_formula': session_result['resolved_formula']
+                }
+        
+        resolver = SimpleIndirectResolver(workbook_path, sheet_name, session)
         resolved_formula = resolver.resolve_formula_indirect(formula, context_cell)
         
         return {
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+Workbook Reader Pool for Excel Tools
+Reads cells of many workbooks, in parallel only when that is measured to be faster
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from openpyxl import load_workbook
+
+from utils.openpyxl_resolver import read_cells_with_resolved_references
+
+
+# 平行讀取的門檻：至少這麼多個、每個至少這麼大的活頁簿才值得分派給 worker
+PARALLEL_MIN_WORKBOOKS = 3
+PARALLEL_MIN_WORKBOOK_BYTES = 2 * 1024 * 1024
+
+# 每個 worker（專屬執行緒或專屬子程序）自己開啟的唯讀活頁簿
+_worker_state = threading.local()
+
+
+def _worker_workbooks():
+    workbooks = getattr(_worker_state, 'workbooks', None)
+    if workbooks is None:
+        workbooks = _worker_state.workbooks = {}
+    return workbooks
+
+
+def _open_worker_workbook(file_path, data_only):
+    workbooks = _worker_workbooks()
+    key = (os.path.normcase(os.path.abspath(file_path)), data_only)
+    workbook = workbooks.get(key)
+    if workbook is None:
+        # 與 SafeWorkbookCache 相同的安全參數
+        workbook = load_workbook(
+            filename=file_path,
+            read_only=True,
+            data_only=data_only,
+            keep_vba=False,
+            keep_links=True
+        )
+        workbooks[key] = workbook
+    return workbook
+
+
+def _read_in_worker(file_path, sheet_name, cell_addresses):
+    """Worker entry point: read one sheet with this worker's own workbook handles."""
+    return read_cells_with_resolved_references(
+        file_path, sheet_name, cell_addresses, workbook_loader=_open_worker_workbook
+    )
+
+
+def _close_worker_workbooks():
+    workbooks = _worker_workbooks()
+    for workbook in workbooks.values():
+        try:
+            workbook.close()
+        except Exception:
+            pass
+    workbooks.clear()
+
+
+def _file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+class _WorkbookWorker:
+    """
+    One worker (a thread or a process) and the read-only workbooks it has opened.
+
+    openpyxl read-only workbooks keep an open file and a parser position, so
+    they must never be shared between threads. Every workbook handled by this
+    worker is opened, read and closed inside the worker itself.
+    """
+
+    def __init__(self, index, use_processes):
+        self.index = index
+        if use_processes:
+            self.executor = ProcessPoolExecutor(max_workers=1)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"workbook-reader-{index}")
+        self.workbook_count = 0
+
+    def submit(self, file_path, sheet_name, cell_addresses):
+        return self.executor.submit(_read_in_worker, file_path, sheet_name, cell_addresses)
+
+    def release(self):
+        """Close the workbooks this worker opened, keeping the worker alive."""
+        self.executor.submit(_close_worker_workbooks).result()
+        self.workbook_count = 0
+
+    def close(self):
+        try:
+            self.executor.submit(_close_worker_workbooks).result()
+        except RuntimeError:
+            # 直譯器結束時執行緒池已不接受新工作，worker 結束時檔案隨之關閉
+            pass
+        finally:
+            self.executor.shutdown(wait=True)
+
+
+class WorkbookReaderPool:
+    """
+    Long-lived pool of workbook readers with fixed workbook ownership
+
+    A batch goes to the workers only when it touches at least
+    PARALLEL_MIN_WORKBOOKS workbooks of at least PARALLEL_MIN_WORKBOOK_BYTES
+    each; anything smaller is read serially on the calling thread, where the
+    workbook cache is shared with the rest of the analysis. For eligible
+    batches the pool measures its own throughput (bytes of workbooks read per
+    second): the first one is read serially, the next one in parallel, and
+    after that every eligible batch uses whichever mode has been faster.
+
+    The workers are started on the first parallel read and kept for the life
+    of the pool. The first time a workbook is sent to them it is assigned to
+    the worker that owns the fewest workbooks, and every later read of that
+    workbook goes to the same worker, so each file is opened once until
+    release_workbooks() is called.
+
+    Thread workers are the default: openpyxl parsing holds the GIL, so they
+    only overlap file I/O (which is what helps on network shares), but they
+    start instantly. Process workers parse in parallel but pay for process
+    start-up and for pickling every result.
+    """
+
+    def __init__(self, max_workers=4, use_processes=False,
+                 min_parallel_workbooks=PARALLEL_MIN_WORKBOOKS, min_parallel_bytes=PARALLEL_MIN_WORKBOOK_BYTES):
+        """
+        Initialize the pool (no worker is started yet)
+
+        Args:
+            max_workers: Number of workers
+            use_processes: Use one process per worker instead of one thread
+            min_parallel_workbooks: Large workbooks a batch needs before it may be read in parallel
+            min_parallel_bytes: File size from which a workbook counts as large
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.use_processes = use_processes
+        self.min_parallel_workbooks = max(2, int(min_parallel_workbooks))
+        self.min_parallel_bytes = min_parallel_bytes
+        self.workers = []
+        self.owners = {}
+        self.lock = threading.Lock()
+        # 模式 -> [讀取的位元組, 秒數, 批次數]，只統計符合平行門檻的批次
+        self.measurements = {'serial': [0, 0.0, 0], 'parallel': [0, 0.0, 0]}
+        self.small_batches = 0
+        self.last_mode = None
+
+    def _worker_for(self, file_path):
+        key = os.path.normcase(os.path.abspath(file_path))
+        with self.lock:
+            if not self.workers:
+                self.workers = [_WorkbookWorker(i, self.use_processes) for i in range(self.max_workers)]
+            worker = self.owners.get(key)
+            if worker is None:
+                worker = min(self.workers, key=lambda w: (w.workbook_count, w.index))
+                worker.workbook_count += 1
+                self.owners[key] = worker
+            return worker
+
+    def _throughput(self, mode):
+        size, seconds, _batches = self.measurements[mode]
+        return size / seconds if seconds > 0 else float('inf')
+
+    def _choose_mode(self, workbook_sizes):
+        large = [size for size in workbook_sizes.values() if size >= self.min_parallel_bytes]
+        if self.max_workers < 2 or len(large) < self.min_parallel_workbooks:
+            return None
+        if self.measurements['serial'][2] == 0:
+            return 'serial'
+        if self.measurements['parallel'][2] == 0:
+            return 'parallel'
+        return 'parallel' if self._throughput('parallel') > self._throughput('serial') else 'serial'
+
+    def read_sheets(self, sheet_requests, progress_callback=None, poll_interval=0.2):
+        """
+        Read many sheets at once, in parallel across workbooks when that pays off
+
+        Args:
+            sheet_requests: Dict of (workbook_path, sheet_name) -> list of cell addresses
+            progress_callback: Optional callable(sheets_done, total_sheets), called on the
+                calling thread while waiting (keeps a Tk window responsive)
+            poll_interval: Seconds between progress callbacks
+
+        Returns:
+            dict: (workbook_path, sheet_name) -> {cell_address: cell info}, in request order
+        """
+        workbook_sizes = {}
+        for file_path, _sheet_name in sheet_requests:
+            if file_path not in workbook_sizes:
+                workbook_sizes[file_path] = _file_size(file_path)
+
+        mode = self._choose_mode(workbook_sizes)
+        self.last_mode = mode or 'serial'
+        start = time.perf_counter()
+        if mode == 'parallel':
+            results = self._read_parallel(sheet_requests, progress_callback, poll_interval)
+        else:
+            results = self._read_serial(sheet_requests, progress_callback)
+        if mode is None:
+            self.small_batches += 1
+        else:
+            measurement = self.measurements[mode]
+            measurement[0] += sum(workbook_sizes.values())
+            measurement[1] += time.perf_counter() - start
+            measurement[2] += 1
+        return results
+
+    def _read_serial(self, sheet_requests, progress_callback):
+        results = {}
+        for (file_path, sheet_name), cell_addresses in sheet_requests.items():
+            results[(file_path, sheet_name)] = read_cells_with_resolved_references(file_path, sheet_name, cell_addresses)
+            if progress_callback:
+                progress_callback(len(results), len(sheet_requests))
+        return results
+
+    def _read_parallel(self, sheet_requests, progress_callback, poll_interval):
+        futures = {}
+        for (file_path, sheet_name), cell_addresses in sheet_requests.items():
+            futures[(file_path, sheet_name)] = self._worker_for(file_path).submit(file_path, sheet_name, cell_addresses)
+
+        pending = set(futures.values())
+        while pending:
+            _, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            if progress_callback:
+                progress_callback(len(futures) - len(pending), len(futures))
+
+        # 依請求順序合併，結果與執行緒完成順序無關
+        return {key: future.result() for key, future in futures.items()}
+
+    def release_workbooks(self):
+        """
+        Close the workbooks the workers opened (so no file stays locked between
+        analyses) while keeping the workers and the measurements
+        """
+        with self.lock:
+            workers = list(self.workers)
+            self.owners.clear()
+        for worker in workers:
+            try:
+                worker.release()
+            except Exception as e:
+                print(f"Workbook reader {worker.index} release error: {e}")
+
+    def get_stats(self):
+        """
+        Get statistics
+
+        Returns:
+            dict: Statistics
+        """
+        stats = {
+            'max_workers': self.max_workers,
+            'use_processes': self.use_processes,
+            'workers_started': len(self.workers),
+            'open_workbooks': len(self.owners),
+            'small_batches': self.small_batches,
+            'last_mode': self.last_mode
+        }
+        for mode, (size, seconds, batches) in self.measurements.items():
+            stats[f'{mode}_batches'] = batches
+            stats[f'{mode}_mb_per_second'] = round(size / seconds / 1024 / 1024, 2) if seconds > 0 else None
+        return stats
+
+    def close(self):
+        """
+        Close every workbook and stop the workers
+        """
+        with self.lock:
+            workers, self.workers = self.workers, []
+            self.owners.clear()
+        for worker in workers:
+            try:
+                worker.close()
+            except Exception as e:
+                print(f"Workbook reader {worker.index} close error: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+# Global pool instance
+_global_reader_pool = None
+_reader_pool_lock = threading.Lock()
+
+
+def get_global_reader_pool(max_workers=4):
+    """
+    Get the global reader pool (singleton pattern), closed at interpreter exit
+
+    The pool and its measurements are kept across analyses; asking for a
+    different number of workers replaces it.
+
+    Args:
+        max_workers: Number of workers
+
+    Returns:
+        WorkbookReaderPool: The global pool
+    """
+    global _global_reader_pool
+    max_workers = max(1, int(max_workers))
+    pool = _global_reader_pool
+    if pool is None or pool.max_workers != max_workers:
+        with _reader_pool_lock:
+            pool = _global_reader_pool
+            if pool is None or pool.max_workers != max_workers:
+                if pool is None:
+                    import atexit
+                    atexit.register(shutdown_global_reader_pool)
+                else:
+                    pool.close()
+                pool = _global_reader_pool = WorkbookReaderPool(max_workers)
+    return pool
+
+
+def shutdown_global_reader_pool():
+    """
+    Close the global reader pool and its workers
+    """
+    global _global_reader_pool
+    with _reader_pool_lock:
+        pool, _global_reader_pool = _global_reader_pool, None
+    if pool is not None:
+        pool.close()
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    from openpyxl import Workbook
+
+    # 多個外部檔案，各自讀一批儲存格
+    folder = tempfile.mkdtemp()
+    requests = {}
+    for book in range(int(sys.argv[1]) if len(sys.argv) > 1 else 12):
+        path = os.path.join(folder, f"Book{book}.xlsx")
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Data"
+        for row in range(1, 3001):
+            ws[f"A{row}"] = row
+            ws[f"B{row}"] = f"=A{row}*2"
+        wb.save(path)
+        requests[(path, "Data")] = [f"B{row}" for row in range(1, 3001, 7)]
+
+    start = time.time()
+    serial = {key: read_cells_with_resolved_references(key[0], key[1], addresses, use_cache=False)
+              for key, addresses in requests.items()}
+    serial_time = time.time() - start
+
+    # 預設門檻下這些小檔案一律逐一讀取，不會啟動 worker
+    with WorkbookReaderPool(max_workers=4) as pool:
+        assert pool.read_sheets(requests) == serial
+        assert pool.get_stats()['small_batches'] == 1 and pool.get_stats()['workers_started'] == 0
+
+    for use_processes in (False, True):
+        kind = "processes" if use_processes else "threads"
+        start = time.time()
+        with WorkbookReaderPool(max_workers=4, use_processes=use_processes, min_parallel_bytes=0) as pool:
+            modes = []
+            for _ in range(4):
+                batch_start = time.time()
+                result = pool.read_sheets(requests)
+                assert result == serial and list(result) == list(requests)
+                modes.append(f"{pool.last_mode} {time.time() - batch_start:.2f}s")
+                pool.release_workbooks()
+            stats = pool.get_stats()
+        print(f"{len(requests)} workbooks, serial {serial_time:.2f}s; adaptive pool with 4 {kind}: {', '.join(modes)}")
+        print(f"  {stats}")